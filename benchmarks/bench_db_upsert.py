@@ -0,0 +1,114 @@
+"""LikeDB/MediaDB の upsert のベンチマーク
+
+一時ファイルの DB に対して、レコード数ごとに INSERT のみ・UPDATE のみの upsert を計測し、rows/sec を表示する
+比較用として、1レコードずつ SELECT してから ORM で追加・更新する従来方式も計測する
+
+python ./benchmarks/bench_db_upsert.py [--num 10000 100000] [--skip-legacy]
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm.exc import NoResultFound
+
+from bluesky_crawler.db.like_db import LikeDB
+from bluesky_crawler.db.media_db import MediaDB
+from bluesky_crawler.db.model import Like, Media
+
+
+def make_like_list(num: int, suffix: str = "") -> list[Like]:
+    return [
+        Like.create({
+            "post_id": f"post_id_{i}",
+            "user_id": f"user_id_{i % 100}",
+            "url": f"https://bsky.app/profile/username_{i % 100}.bsky.social/post/post_id_{i}",
+            "text": f"text_{i}{suffix}",
+            "created_at": "2024-03-23T21:34:56.897000",
+            "registered_at": f"2024-03-24T12:34:56.000000{suffix}",
+        })
+        for i in range(num)
+    ]
+
+
+def make_media_list(num: int, suffix: str = "") -> list[Media]:
+    return [
+        Media.create({
+            "post_id": f"post_id_{i // 4}",
+            "media_id": f"media_id_{i}",
+            "media_index": i % 4 + 1,
+            "username": f"username_{i % 100}.bsky.social",
+            "alt_text": f"alt_text_{i}{suffix}",
+            "mime_type": "image/jpeg",
+            "size": 100000 + i,
+            "url": f"https://cdn.bsky.app/img/feed_fullsize/plain/did:plc:dummy/media_id_{i}@jpeg",
+            "created_at": "2024-03-23T21:34:56.897000",
+            "registered_at": f"2024-03-24T12:34:56.000000{suffix}",
+        })
+        for i in range(num)
+    ]
+
+
+def legacy_upsert(db: LikeDB | MediaDB, model: type, key_name: str, record_list: list) -> list[int]:
+    """1レコードずつ SELECT してから ORM で追加・更新する従来方式"""
+    result: list[int] = []
+    Session = sessionmaker(bind=db.engine, autoflush=False)
+    session = Session()
+    column_name_list = [c.name for c in model.__table__.columns if not c.primary_key]
+    for r in record_list:
+        try:
+            q = session.query(model).filter(getattr(model, key_name) == getattr(r, key_name)).with_for_update()
+            p = q.one()
+        except NoResultFound:
+            session.add(r)
+            result.append(0)
+        else:
+            for name in column_name_list:
+                setattr(p, name, getattr(r, name))
+            result.append(1)
+    session.commit()
+    session.close()
+    return result
+
+
+def measure(label: str, num: int, func) -> None:
+    start_time = time.perf_counter()
+    func()
+    elapsed_time = time.perf_counter() - start_time
+    print(f"{label:<32} {num:>8} rows  {elapsed_time:>8.3f} [sec]  {num / elapsed_time:>10.0f} rows/sec")
+
+
+def run(num: int, is_skip_legacy: bool) -> None:
+    targets = [
+        ("Like", LikeDB, Like, "post_id", make_like_list),
+        ("Media", MediaDB, Media, "media_id", make_media_list),
+    ]
+    for name, db_class, model, key_name, make_list in targets:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db = db_class(db_path=str(Path(tmp_dir) / "bench.db"))
+            measure(f"{name} bulk upsert (insert)", num, lambda: db.upsert(make_list(num)))
+            measure(f"{name} bulk upsert (update)", num, lambda: db.upsert(make_list(num, "_updated")))
+            db.engine.dispose()
+
+        if is_skip_legacy:
+            continue
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db = db_class(db_path=str(Path(tmp_dir) / "bench.db"))
+            measure(f"{name} legacy upsert (insert)", num, lambda: legacy_upsert(db, model, key_name, make_list(num)))
+            measure(
+                f"{name} legacy upsert (update)",
+                num,
+                lambda: legacy_upsert(db, model, key_name, make_list(num, "_updated")),
+            )
+            db.engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="upsert benchmark")
+    parser.add_argument("--num", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--skip-legacy", action="store_true")
+    args = parser.parse_args()
+    for num in args.num:
+        run(num, args.skip_legacy)
@@ -0,0 +1,115 @@
+"""Downloader の HTTP クライアント共有のベンチマーク
+
+ローカルにスタブの HTTP サーバを立て、画像 DL を以下の2方式で計測する
+    legacy : 画像ごとに httpx.AsyncClient を作成する従来方式
+    shared : Downloader.excute（1回の excute で接続プールを共有する）
+スタブサーバは新規接続の最初のリクエストに --handshake-delay 秒の遅延を入れ、
+TLS ハンドシェイクなど接続確立にかかる往復時間を模擬する
+
+python ./benchmarks/bench_downloader_client.py [--num 300] [--size 200000] [--handshake-delay 0.05]
+"""
+
+import argparse
+import asyncio
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import httpx
+import orjson
+
+from bluesky_crawler.crawler.downloader import Downloader
+from bluesky_crawler.db.model import Media
+
+
+def start_stub_server(body_size: int, handshake_delay: float) -> ThreadingHTTPServer:
+    body = b"\0" * body_size
+
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        is_first_request = True
+
+        def do_GET(self):
+            if self.is_first_request:
+                # 接続確立のコストを模擬する
+                time.sleep(handshake_delay)
+                self.is_first_request = False
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def make_media_list(num: int, base_url: str) -> list[Media]:
+    return [
+        Media.create({
+            "post_id": f"post_id_{i}",
+            "media_id": f"media_id_{i}",
+            "media_index": 1,
+            "username": "username.bsky.social",
+            "alt_text": "",
+            "mime_type": "image/jpeg",
+            "size": 0,
+            "url": f"{base_url}/img/media_id_{i}@jpeg",
+            "created_at": "",
+            "registered_at": "",
+        })
+        for i in range(num)
+    ]
+
+
+async def legacy_excute(save_base_path: Path, media_list: list[Media]) -> None:
+    """画像ごとにクライアントを作成する従来方式"""
+
+    async def worker(media: Media) -> None:
+        transport = httpx.AsyncHTTPTransport(retries=3)
+        async with httpx.AsyncClient(timeout=httpx.Timeout(5, read=60), transport=transport) as client:
+            filepath = save_base_path / media.get_filename()
+            response = await client.get(media.url)
+            response.raise_for_status()
+            filepath.write_bytes(response.content)
+
+    await asyncio.gather(*[worker(media) for media in media_list])
+
+
+def measure(label: str, num: int, func) -> None:
+    start_time = time.perf_counter()
+    func()
+    elapsed_time = time.perf_counter() - start_time
+    print(f"{label:<8} {num:>6} files  {elapsed_time:>8.3f} [sec]  {num / elapsed_time:>8.1f} files/sec")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="downloader client benchmark")
+    parser.add_argument("--num", type=int, default=300)
+    parser.add_argument("--size", type=int, default=200000)
+    parser.add_argument("--handshake-delay", type=float, default=0.05)
+    args = parser.parse_args()
+
+    server = start_stub_server(args.size, args.handshake_delay)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    media_list = make_media_list(args.num, base_url)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        legacy_path = Path(tmp_dir) / "legacy"
+        legacy_path.mkdir()
+        measure("legacy", args.num, lambda: asyncio.run(legacy_excute(legacy_path, media_list)))
+
+        config_path = Path(tmp_dir) / "config.json"
+        config_dict = {"general": {"save_base_path": str(Path(tmp_dir) / "shared"), "save_num": 300}}
+        config_path.write_bytes(orjson.dumps(config_dict))
+        downloader = Downloader(config_path)
+        measure("shared", args.num, lambda: asyncio.run(downloader.excute(media_list)))
+
+    server.shutdown()
@@ -0,0 +1,86 @@
+"""fetch 結果のキャッシュ形式のベンチマーク
+
+1回の実行で --num 件のエントリを取得することを --run 回繰り返した場合について、
+キャッシュの書き込み時間、ディスク使用量、すべてのエントリの読み込み時間と読み込み時のピークメモリを
+以下の方式で計測する
+    legacy : 1回の取得結果ごとにインデント付きの JSON ファイルを作成する従来方式
+    gzip   : FeedCache（gzip 圧縮の JSON Lines セグメントに追記する）
+    zstd   : FeedCache（zstd 圧縮、zstandard がインストールされている場合のみ）
+
+python ./benchmarks/bench_feed_cache.py [--num 100] [--run 300]
+"""
+
+import argparse
+import importlib.util
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import orjson
+from bench_fetched_info import make_entry_list
+
+from bluesky_crawler.crawler.feed_cache import FeedCache
+
+
+def legacy_write(cache_path: Path, run_index: int, entry_list: list[dict]) -> None:
+    save_path = cache_path / f"2024{run_index:010d}_bluesky.json"
+    save_path.write_bytes(orjson.dumps({"result": {"feed": entry_list}}, option=orjson.OPT_INDENT_2))
+
+
+def legacy_replay(cache_path: Path):
+    for load_path in sorted(cache_path.glob("*_bluesky.json")):
+        yield from orjson.loads(load_path.read_bytes())["result"]["feed"]
+
+
+def measure(label: str, cache_path: Path, run_list: list[list[dict]], write, replay) -> None:
+    start_time = time.perf_counter()
+    for run_index, entry_list in enumerate(run_list):
+        write(run_index, entry_list)
+    write_time = time.perf_counter() - start_time
+    disk_size = sum(path.stat().st_size for path in cache_path.iterdir())
+
+    start_time = time.perf_counter()
+    entry_num = sum(1 for _ in replay())
+    replay_time = time.perf_counter() - start_time
+    # tracemalloc は処理時間に影響するため、ピークメモリは別に計測する
+    tracemalloc.start()
+    sum(1 for _ in replay())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{label:<6} write {write_time:>7.3f} [sec]  disk {disk_size / 1024 / 1024:>8.2f} [MiB]  "
+        f"replay {entry_num:>7} entries {replay_time:>7.3f} [sec]  peak {peak / 1024 / 1024:>7.2f} [MiB]"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="feed cache benchmark")
+    parser.add_argument("--num", type=int, default=100, help="1回の取得でのエントリ数")
+    parser.add_argument("--run", type=int, default=300)
+    args = parser.parse_args()
+
+    entry_list = make_entry_list(args.num * args.run)
+    run_list = [entry_list[i : i + args.num] for i in range(0, len(entry_list), args.num)]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache_path = Path(tmp_dir) / "legacy"
+        cache_path.mkdir()
+        measure(
+            "legacy",
+            cache_path,
+            run_list,
+            lambda run_index, entry_list: legacy_write(cache_path, run_index, entry_list),
+            lambda: legacy_replay(cache_path),
+        )
+
+        codec_list = ["gzip"] + (["zstd"] if importlib.util.find_spec("zstandard") else [])
+        for codec in codec_list:
+            feed_cache = FeedCache(Path(tmp_dir) / codec, {"codec": codec, "retention_days": 0})
+            measure(
+                codec,
+                feed_cache.cache_path,
+                run_list,
+                lambda run_index, entry_list: feed_cache.append(entry_list),
+                feed_cache.replay,
+            )
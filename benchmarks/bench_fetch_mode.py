@@ -0,0 +1,152 @@
+"""ふぁぼ一覧取得時のデコード方式（fetch_mode）のベンチマーク
+
+getActorLikes のレスポンス bytes を合成し、辞書にして FeedEntry を取り出すまでを以下の2方式で計測する
+    validated : atproto の pydantic モデルを作成して model_dump する（従来方式）
+    raw       : orjson でデコードし、 FeedEntry の作成に必要な値のみに絞り込んだ辞書から取り出す
+処理時間と、各方式を別プロセスで実行したときの最大 RSS の増分を表示する
+（pydantic-core は Python のメモリアロケータを経由しないため tracemalloc では計測できない）
+get_actor_likes と同じく、取得した全ページの辞書を保持したまま計測する
+
+python ./benchmarks/bench_fetch_mode.py [--num 100] [--page 50]
+"""
+
+import argparse
+import multiprocessing
+import resource
+import time
+
+import orjson
+from atproto import models
+from atproto_client.models.utils import get_or_create
+from pydantic_core import from_json
+
+from bluesky_crawler.crawler.valueobject.feed_entry import FeedEntry, prune_raw_entry
+
+CID = "bafyreie5737gdxlw5i64vzichcalba3z2v5n6icifvx5xytvske7mr3hpm"
+
+
+def make_page_bytes(num: int) -> bytes:
+    feed = []
+    for i in range(num):
+        did = f"did:plc:user{i % 100:020d}"
+        post_dict = {
+            "uri": f"at://{did}/app.bsky.feed.post/post{i:010d}",
+            "cid": CID,
+            "author": {
+                "did": did,
+                "handle": f"username{i % 100}.bsky.social",
+                "displayName": f"display_name_{i % 100}",
+                "avatar": f"https://cdn.bsky.app/img/avatar/plain/{did}/{CID}@jpeg",
+                "labels": [],
+                "viewer": {"blockedBy": False, "muted": False},
+                "createdAt": "2024-01-01T00:00:00.000Z",
+            },
+            "indexedAt": "2024-03-23T12:34:56.897Z",
+            "likeCount": i,
+            "repostCount": 0,
+            "replyCount": 0,
+            "labels": [],
+            "viewer": {"like": f"at://did:plc:me/app.bsky.feed.like/like{i:010d}"},
+        }
+        record_dict = {
+            "$type": "app.bsky.feed.post",
+            "createdAt": "2024-03-23T12:34:56.897Z",
+            "text": f"text_{i}",
+            "langs": ["ja"],
+        }
+        if i % 10 == 0:
+            post_dict["embed"] = {
+                "$type": "app.bsky.embed.video#view",
+                "cid": CID,
+                "playlist": f"https://video.bsky.app/watch/{did}/{CID}/playlist.m3u8",
+                "thumbnail": f"https://video.bsky.app/watch/{did}/{CID}/thumbnail.jpg",
+                "aspectRatio": {"height": 1080, "width": 1920},
+            }
+            record_dict["embed"] = {
+                "$type": "app.bsky.embed.video",
+                "aspectRatio": {"height": 1080, "width": 1920},
+                "video": {"$type": "blob", "ref": {"$link": CID}, "mimeType": "video/mp4", "size": 5000000},
+            }
+        else:
+            post_dict["embed"] = {
+                "$type": "app.bsky.embed.images#view",
+                "images": [
+                    {
+                        "alt": f"alt_{i}_{j}",
+                        "fullsize": f"https://cdn.bsky.app/img/feed_fullsize/plain/{did}/{CID}@jpeg",
+                        "thumb": f"https://cdn.bsky.app/img/feed_thumbnail/plain/{did}/{CID}@jpeg",
+                        "aspectRatio": {"height": 1080, "width": 1920},
+                    }
+                    for j in range(4)
+                ],
+            }
+            record_dict["embed"] = {
+                "$type": "app.bsky.embed.images",
+                "images": [
+                    {
+                        "alt": f"alt_{i}_{j}",
+                        "aspectRatio": {"height": 1080, "width": 1920},
+                        "image": {"$type": "blob", "ref": {"$link": CID}, "mimeType": "image/jpeg", "size": 500000},
+                    }
+                    for j in range(4)
+                ],
+            }
+        post_dict["record"] = record_dict
+        feed.append({"post": post_dict})
+    return orjson.dumps({"feed": feed, "cursor": "next_cursor"})
+
+
+def validated_decode(body: bytes) -> dict:
+    """atproto の Client と同じく pydantic モデルを作成してから model_dump する従来方式"""
+    response = get_or_create(from_json(body), models.AppBskyFeedGetActorLikes.Response, strict=True)
+    return response.model_dump()
+
+
+def raw_decode(body: bytes) -> dict:
+    """Manager.get_actor_likes_page_raw と同じく、エントリごとに必要な値のみに絞り込む方式"""
+    response_dict = orjson.loads(body)
+    feed_list = [prune_raw_entry(entry) for entry in response_dict.get("feed") or []]
+    return {"feed": feed_list, "cursor": response_dict.get("cursor")}
+
+
+def run(mode: str, num: int, page: int) -> tuple[list[FeedEntry], float, int]:
+    decode = validated_decode if mode == "validated" else raw_decode
+    body_list = [make_page_bytes(num) for _ in range(page)]
+    # ウォームアップ（モデルクラスの初期化などを計測から除く）
+    decode(body_list[0])
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start_time = time.perf_counter()
+    feed_list = []
+    for body in body_list:
+        # 1ページ分ずつデコードし、取得したエントリは保持しておく
+        feed_list.extend(decode(body)["feed"])
+    result = [FeedEntry.create(entry) for entry in feed_list]
+    elapsed_time = time.perf_counter() - start_time
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - base_rss
+    return result, elapsed_time, peak_rss
+
+
+def measure(mode: str, num: int, page: int) -> list[FeedEntry]:
+    # 最大 RSS を方式ごとに計測するため、別プロセスで実行する
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        result, elapsed_time, peak_rss = pool.apply(run, (mode, num, page))
+    entry_num = len(result)
+    print(
+        f"{mode:<10} {entry_num:>8} entries  {elapsed_time:>8.3f} [sec]  "
+        f"{entry_num / elapsed_time:>10.0f} entries/sec  peak RSS +{peak_rss / 1024:>8.1f} [MiB]"
+    )
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="fetch mode benchmark")
+    parser.add_argument("--num", type=int, default=100, help="1ページあたりのエントリ数")
+    parser.add_argument("--page", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{args.page} pages, {len(make_page_bytes(args.num)) / 1024:.1f} [KiB] / page")
+
+    validated_result = measure("validated", args.num, args.page)
+    raw_result = measure("raw", args.num, args.page)
+    print(f"Same result : {validated_result == raw_result}")
@@ -0,0 +1,274 @@
+"""FetchedInfo.create のベンチマーク
+
+保存済のキャッシュ (./cache/) のエントリについて、
+FetchedInfo の作成を計測し entries/sec を表示する
+比較用として、 find_values でエントリを何度も走査する従来方式も計測する
+キャッシュファイルがない場合は、画像と動画のエントリを合成して計測する
+--workers を指定した場合は、 Fetcher.create_fetched_info_list の serial / process の両モードも計測する
+
+python ./benchmarks/bench_fetched_info.py [--cache-path ./cache/] [--num 10000] [--repeat 5] [--workers 4]
+"""
+
+import argparse
+import re
+import time
+from datetime import datetime
+from pathlib import Path
+
+from bluesky_crawler.crawler.feed_cache import FeedCache
+from bluesky_crawler.crawler.fetcher import DEFAULT_PARSE_CONFIG, Fetcher
+from bluesky_crawler.crawler.valueobject.feed_entry import FeedEntry
+from bluesky_crawler.crawler.valueobject.fetched_info import FetchedInfo
+from bluesky_crawler.db.model import Like, Media, User
+from bluesky_crawler.util import find_values, to_jst
+
+
+def legacy_create(fetched_dict: dict) -> FetchedInfo:
+    """find_values でエントリを何度も走査する従来方式"""
+
+    def normalize_date_at(date_at_str: str) -> str:
+        result = to_jst(datetime.fromisoformat(date_at_str)).isoformat()
+        if result.endswith("+00:00"):
+            result = result[:-6]
+        return result
+
+    # 採用する登録日時を取得
+    registered_at = datetime.now().isoformat()
+    # fetch データの辞書解析
+    post_dict = find_values(fetched_dict, "post", True, [""])
+    author_dict = find_values(post_dict, "author", True, [""])
+    record_dict = find_values(post_dict, "record", True, [""])
+
+    # メディアが含まれる部分を抽出する
+    embed_dict, record_embed_dict = {}, {}
+    media_list_1, media_list_2 = [], []
+    is_no_image, is_no_video = False, False
+    try:
+        # 画像を含むか調べる
+        # post 直下の embed (直リンクとaltテキストが含まれる)と
+        # record 配下の embed (mime_type と size が含まれる)がそれぞれ存在するか確認する
+        embed_dict = find_values(post_dict, "embed", True, [""])
+        record_embed_dict = find_values(record_dict, "embed", True, [""])
+        media_list_1 = find_values(embed_dict, "images", True, [""])
+        media_list_2 = find_values(record_embed_dict, "images", True, [""])
+    except ValueError:
+        # 画像は含まれていなかった
+        is_no_image = True
+
+    if is_no_image:
+        # 動画を含むか調べる
+        try:
+            # post 直下の embed
+            embed_dict = find_values(post_dict, "embed", True, [""])
+            record_embed_dict = find_values(record_dict, "embed", True, [""])
+            playlist = find_values(embed_dict, "playlist", True, [""])
+            alt_text = find_values(embed_dict, "alt", True, [""])
+            mime_type = find_values(record_embed_dict, "mime_type", True, ["video"])
+            size = find_values(record_embed_dict, "size", True, ["video"])
+
+            alt_text = alt_text if alt_text else ""
+            media_list_1 = [{"fullsize": playlist, "alt": alt_text}]
+            media_list_2 = [{"mime_type": mime_type, "size": size}]
+        except ValueError:
+            # 動画は含まれていなかった
+            is_no_video = True
+
+    if is_no_image and is_no_video:
+        # メディアが含まれていなかった → エラー
+        raise ValueError("Like entry has no media.")
+
+    # post 情報から post_id と created_at を抽出する
+    uri: str = find_values(post_dict, "uri", True, [""])
+    post_id = uri.split(r"/")[-1]
+    post_created_at = normalize_date_at(find_values(record_dict, "created_at", True, [""]))
+
+    # author 情報から username を抽出する
+    user_username = find_values(author_dict, "handle", True, [""])
+
+    # media_list 作成
+    media_list = []
+    zipped_media_list = zip(media_list_1, media_list_2)
+    for index, zipped_media in enumerate(zipped_media_list):
+        media_dict_1, media_dict_2 = zipped_media
+        media_url: str = find_values(media_dict_1, "fullsize", True, [""])
+        media_alt_text = find_values(media_dict_1, "alt", True, [""])
+        media_id = (
+            re.findall(r"^.*/(.+)/playlist.m3u8$", media_url)
+            if "playlist.m3u8" in media_url
+            else re.findall(r"^.*/(.+)@.*?$", media_url)
+        )
+        media_id = media_id[0]
+        media_mime_type = find_values(media_dict_2, "mime_type", True)
+        media_size = find_values(media_dict_2, "size", True)
+        media_created_at = post_created_at
+        media = Media.create({
+            "post_id": post_id,
+            "media_id": media_id,
+            "media_index": index + 1,
+            "username": user_username,
+            "alt_text": media_alt_text,
+            "mime_type": media_mime_type,
+            "size": media_size,
+            "url": media_url,
+            "created_at": media_created_at,
+            "registered_at": registered_at,
+        })
+        media_list.append(media)
+
+    # like 作成
+    user_id = find_values(author_dict, "did", True, [""])
+    post_url = f"https://bsky.app/profile/{user_username}/post/{post_id}"
+    post_text = find_values(record_dict, "text", True, [""])
+    like = Like.create({
+        "post_id": post_id,
+        "user_id": user_id,
+        "url": post_url,
+        "text": post_text,
+        "created_at": post_created_at,
+        "registered_at": registered_at,
+    })
+
+    # user 作成
+    user_name = find_values(author_dict, "display_name", True, [""]) or user_username
+    user_avatar_url = find_values(author_dict, "avatar", True, [""])
+    user = User.create({
+        "user_id": user_id,
+        "name": user_name,
+        "username": user_username,
+        "avatar_url": user_avatar_url,
+        "registered_at": registered_at,
+    })
+
+    return FetchedInfo(like, user, media_list)
+
+
+def make_entry_list(num: int) -> list[dict]:
+    entry_list = []
+    for i in range(num):
+        post_dict = {
+            "author": {
+                "did": f"did:plc:user_id_{i % 100}",
+                "handle": f"username_{i % 100}.bsky.social",
+                "avatar": "https://cdn.bsky.app/img/avatar/plain/did:plc:dummy/avatar_cid@jpeg",
+                "display_name": f"display_name_{i % 100}",
+                "labels": [],
+                "viewer": {"blocked_by": False, "muted": False},
+            },
+            "cid": f"post_cid_{i}",
+            "indexed_at": "2024-03-23T12:34:56.897Z",
+            "like_count": i,
+            "labels": [],
+            "uri": f"at://did:plc:user_id_{i % 100}/app.bsky.feed.post/post_id_{i}",
+            "viewer": {"like": f"at://did:plc:me/app.bsky.feed.like/like_{i}"},
+        }
+        record_dict = {"created_at": "2024-03-23T12:34:56.897Z", "text": f"text_{i}", "langs": ["ja"]}
+        if i % 10 == 0:
+            post_dict["embed"] = {
+                "alt": None,
+                "cid": f"video_cid_{i}",
+                "playlist": f"https://video.bsky.app/watch/did:plc:dummy/video_cid_{i}/playlist.m3u8",
+                "thumbnail": f"https://video.bsky.app/watch/did:plc:dummy/video_cid_{i}/thumbnail.jpg",
+            }
+            record_dict["embed"] = {
+                "aspect_ratio": {"height": 1080, "width": 1920},
+                "video": {"mime_type": "video/mp4", "size": 5000000, "ref": {"link": f"video_cid_{i}"}},
+            }
+        else:
+            post_dict["embed"] = {
+                "images": [
+                    {
+                        "alt": f"alt_{i}_{j}",
+                        "fullsize": f"https://cdn.bsky.app/img/feed_fullsize/plain/did:plc:dummy/cid_{i}_{j}@jpeg",
+                        "thumb": f"https://cdn.bsky.app/img/feed_thumbnail/plain/did:plc:dummy/cid_{i}_{j}@jpeg",
+                        "aspect_ratio": {"height": 1080, "width": 1920},
+                    }
+                    for j in range(4)
+                ]
+            }
+            record_dict["embed"] = {
+                "images": [
+                    {
+                        "alt": f"alt_{i}_{j}",
+                        "aspect_ratio": {"height": 1080, "width": 1920},
+                        "image": {"mime_type": "image/jpeg", "size": 500000, "ref": {"link": f"cid_{i}_{j}"}},
+                    }
+                    for j in range(4)
+                ]
+            }
+        post_dict["record"] = record_dict
+        entry_list.append({"post": post_dict, "reason": None, "reply": None})
+    return entry_list
+
+
+def load_entry_list(cache_path: Path) -> list[dict]:
+    if not cache_path.is_dir():
+        return []
+    return list(FeedCache(cache_path).replay())
+
+
+def measure(label: str, entry_list: list[dict], repeat: int, create) -> list:
+    result = []
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        result = []
+        for entry in entry_list:
+            try:
+                result.append(create(entry))
+            except Exception:
+                result.append(None)
+    elapsed_time = time.perf_counter() - start_time
+    num = len(entry_list) * repeat
+    print(f"{label:<8} {num:>8} entries  {elapsed_time:>8.3f} [sec]  {num / elapsed_time:>10.0f} entries/sec")
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FetchedInfo.create benchmark")
+    parser.add_argument("--cache-path", type=Path, default=Path("./cache/"))
+    parser.add_argument("--num", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=0, help="0 の場合は executor の計測を行わない")
+    args = parser.parse_args()
+
+    entry_list = load_entry_list(args.cache_path)
+    if len(entry_list) == 0:
+        print(f"No cache file in {args.cache_path}, use {args.num} synthesized entries.")
+        entry_list = make_entry_list(args.num)
+    else:
+        print(f"Loaded {len(entry_list)} entries from {args.cache_path}.")
+
+    legacy_result = measure("legacy", entry_list, args.repeat, legacy_create)
+    current_result = measure("current", entry_list, args.repeat, FetchedInfo.create)
+    # 参考: 値の取り出しのみ（残りは Like/User/Media の ORM インスタンスの作成）
+    measure("extract", entry_list, args.repeat, FeedEntry.create)
+
+    # 両方式の結果が一致することを確認する（registered_at は実行時刻のため除く）
+    def to_comparable(fetched_info: FetchedInfo | None):
+        if fetched_info is None:
+            return None
+        return (
+            fetched_info.like,
+            fetched_info.user,
+            [media.to_dict() | {"registered_at": ""} for media in fetched_info.media_list],
+        )
+
+    is_same = [to_comparable(r) for r in legacy_result] == [to_comparable(r) for r in current_result]
+    print(f"Same result : {is_same}")
+
+    if args.workers > 0:
+        # Fetcher の初期化はログインを伴うため、 create_fetched_info_list に必要な設定のみ与える
+        fetcher = object.__new__(Fetcher)
+        for executor in ["serial", "process"]:
+            fetcher.parse_config = DEFAULT_PARSE_CONFIG | {
+                "executor": executor,
+                "max_workers": args.workers,
+                "min_batch_size": 0,
+            }
+            start_time = time.perf_counter()
+            for _ in range(args.repeat):
+                fetcher.create_fetched_info_list(entry_list)
+            elapsed_time = time.perf_counter() - start_time
+            num = len(entry_list) * args.repeat
+            print(
+                f"{executor:<8} {num:>8} entries  {elapsed_time:>8.3f} [sec]  {num / elapsed_time:>10.0f} entries/sec"
+            )
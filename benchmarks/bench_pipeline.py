@@ -0,0 +1,129 @@
+"""Crawler.run のパイプライン化のベンチマーク
+
+ふぁぼ一覧の取得、DL、DB 登録をそれぞれ一定時間待機するスタブに置き換え、
+--page ページ分を処理する時間を以下の2方式で計測する
+    sequential : すべてのページを取得してから、まとめて DL し、まとめて DB 登録する従来方式
+    pipeline   : Crawler.run_pipeline（ページ単位で各ステージを並行して行う）
+エントリの解析とレコードの取り出しは実際の処理を行う
+
+python ./benchmarks/bench_pipeline.py [--page 20] [--fetch 0.3] [--download 0.5] [--commit 0.05]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import time
+
+from bench_fetched_info import make_entry_list
+
+from bluesky_crawler.crawler.crawler import DEFAULT_PIPELINE_CONFIG, Crawler
+from bluesky_crawler.crawler.fetcher import parse_entry_list
+from bluesky_crawler.crawler.valueobject.fetched_info import FetchedInfo
+from bluesky_crawler.db.model import Media
+
+
+class StubFetcher:
+    def __init__(self, page_list: list[list[dict]], fetch_time: float) -> None:
+        self.page_list = page_list
+        self.fetch_time = fetch_time
+        self.latest_post_uri = None
+
+    def fetch_iter(self, last_post_uri: str | None = None):
+        for page in self.page_list:
+            time.sleep(self.fetch_time)
+            yield page
+
+    def get_parse_batch_size(self) -> int:
+        return 1
+
+    def reuse_process_pool(self):
+        return contextlib.nullcontext()
+
+    def create_fetched_info_list(self, post_list: list[dict]) -> list[FetchedInfo]:
+        parsed_list = parse_entry_list(list(reversed(post_list)))
+        return [FetchedInfo.build(parsed) for parsed in parsed_list if not isinstance(parsed, str)]
+
+
+class StubDownloader:
+    def __init__(self, download_time: float) -> None:
+        self.download_time = download_time
+
+    def create_client(self):
+        return contextlib.nullcontext(None)
+
+    async def excute(self, media_list: list[Media], client=None) -> list[Media]:
+        await asyncio.sleep(self.download_time)
+        return []
+
+    def download(self, media_list: list[Media]) -> list[Media]:
+        time.sleep(self.download_time)
+        return []
+
+
+class StubDB:
+    def __init__(self, commit_time: float) -> None:
+        self.commit_time = commit_time
+
+    def select_exist_media_id(self, media_id_list: list[str]) -> set[str]:
+        return set()
+
+    def upsert(self, record_list: list, session=None) -> None:
+        time.sleep(self.commit_time / 3)
+
+    @contextlib.contextmanager
+    def transaction(self):
+        yield None
+
+
+class StubFailedMediaDB:
+    def delete(self, media_id_list: list[str]) -> int:
+        return 0
+
+    def add_attempt(self, media_list: list) -> dict[str, int]:
+        return {media.media_id: 1 for media in media_list}
+
+
+def make_crawler(page_list: list[list[dict]], args: argparse.Namespace) -> Crawler:
+    crawler = Crawler.__new__(Crawler)
+    crawler.fetcher_dict = {"handle_name": StubFetcher(page_list, args.fetch)}
+    crawler.downloader = StubDownloader(args.download)
+    crawler.like_db = crawler.user_db = crawler.media_db = StubDB(args.commit)
+    crawler.failed_media_db = StubFailedMediaDB()
+    crawler.pipeline_config = dict(DEFAULT_PIPELINE_CONFIG)
+    return crawler
+
+
+def run_sequential(crawler: Crawler) -> int:
+    fetcher = crawler.fetcher_dict["handle_name"]
+    post_list = [post for page in fetcher.fetch_iter() for post in page]
+    fetched_list = fetcher.create_fetched_info_list(post_list)
+    # 従来方式は全ページ分を1回で DL・DB 登録する（スタブの待機時間はページ数分とする）
+    crawler.downloader.download_time *= len(fetcher.page_list)
+    crawler.like_db.commit_time *= len(fetcher.page_list)
+    media_num, _ = crawler.store(fetched_list)
+    return media_num
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="crawler pipeline benchmark")
+    parser.add_argument("--page", type=int, default=20)
+    parser.add_argument("--num", type=int, default=100, help="1ページあたりのエントリ数")
+    parser.add_argument("--fetch", type=float, default=0.3, help="1ページの取得時間 [sec]")
+    parser.add_argument("--download", type=float, default=0.5, help="1ページ分の DL 時間 [sec]")
+    parser.add_argument("--commit", type=float, default=0.05, help="1ページ分の DB 登録時間 [sec]")
+    args = parser.parse_args()
+
+    entry_list = make_entry_list(args.page * args.num)
+    page_list = [entry_list[i : i + args.num] for i in range(0, len(entry_list), args.num)]
+    stage_sum = args.page * (args.fetch + args.download + args.commit)
+    print(f"{args.page} pages, sum of stub stages {stage_sum:.2f} [sec]")
+
+    for label, run in [
+        ("sequential", run_sequential),
+        ("pipeline", lambda crawler: asyncio.run(crawler.run_pipeline())[0]),
+    ]:
+        crawler = make_crawler(page_list, args)
+        start_time = time.perf_counter()
+        media_num = run(crawler)
+        elapsed_time = time.perf_counter() - start_time
+        print(f"{label:<10} {media_num:>7} media  {elapsed_time:>7.3f} [sec]")
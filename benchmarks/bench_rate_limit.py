@@ -0,0 +1,106 @@
+"""getActorLikes のレート制限対応（RateLimiter）のベンチマーク
+
+期間 --window 秒あたり --limit 回までのレート制限をかけたローカルの XRPC サーバに対して、
+--page ページ分の取得を以下の方式で行い、取得できたページ数、429 の回数、処理時間を計測する
+    none    : 制限なしで連続して送り、429 になった時点で失敗とする従来方式
+    headers : RateLimiter の rate / burst を十分大きくし、ratelimit-* ヘッダのみに従って間隔を空け・待機・再試行する
+    limiter : RateLimiter（既定の設定、トークンバケットでも間隔を空ける）
+
+python ./benchmarks/bench_rate_limit.py [--page 60] [--limit 20] [--window 2]
+"""
+
+import argparse
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import orjson
+
+from bluesky_crawler.manager.manager import GET_ACTOR_LIKES_NSID, RateLimiter
+
+
+class RateLimitedServer:
+    def __init__(self, limit: int, window: float) -> None:
+        self.limit = limit
+        self.window = window
+        self.window_start = time.time()
+        self.count = 0
+        self.rate_limited_num = 0
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                status_code, headers = server.count_request()
+                body = orjson.dumps({"feed": [], "cursor": "cursor"} if status_code == 200 else {"error": "RateLimit"})
+                self.send_response(status_code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args) -> None:
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}/xrpc/{GET_ACTOR_LIKES_NSID}"
+
+    def count_request(self) -> tuple[int, dict]:
+        with self.lock:
+            now = time.time()
+            if now - self.window_start >= self.window:
+                self.window_start, self.count = now, 0
+            self.count += 1
+            headers = {
+                "ratelimit-limit": str(self.limit),
+                "ratelimit-remaining": str(max(self.limit - self.count, 0)),
+                # 実際の PDS と同じく秒単位の UNIX 時間（切り上げ）で通知する
+                "ratelimit-reset": str(math.ceil(self.window_start + self.window)),
+                "ratelimit-policy": f"{self.limit};w={self.window:g}",
+            }
+            if self.count > self.limit:
+                self.rate_limited_num += 1
+                return 429, headers
+            return 200, headers
+
+
+def run(label: str, args: argparse.Namespace, rate_limit_config: dict | None) -> None:
+    server = RateLimitedServer(args.limit, args.window)
+    start_time = time.perf_counter()
+    page_num = 0
+    rate_limiter = RateLimiter(rate_limit_config) if rate_limit_config is not None else None
+    with httpx.Client() as client:
+        for _ in range(args.page):
+            if rate_limiter is None:
+                response = client.get(server.url)
+            else:
+                response = rate_limiter.call(GET_ACTOR_LIKES_NSID, lambda: client.get(server.url))
+            if response.status_code != 200:
+                break
+            page_num += 1
+    elapsed_time = time.perf_counter() - start_time
+    server.server.shutdown()
+    print(
+        f"{label:<8} {page_num:>4}/{args.page} pages  429 {server.rate_limited_num:>3} times  "
+        f"{elapsed_time:>7.3f} [sec]"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="rate limiter benchmark")
+    parser.add_argument("--page", type=int, default=60)
+    parser.add_argument("--limit", type=int, default=20, help="期間あたりのリクエスト数の上限")
+    parser.add_argument("--window", type=float, default=2, help="レート制限の期間 [sec]")
+    args = parser.parse_args()
+
+    run("none", args, None)
+    run("headers", args, {"rate": 1000, "burst": 1000})
+    run("limiter", args, {})
@@ -1,86 +1,551 @@
+import asyncio
+import contextlib
 import time
+from concurrent.futures import ThreadPoolExecutor
 from logging import INFO, getLogger
 from pathlib import Path
 
+import httpx
+import orjson
+
 from bluesky_crawler.crawler.downloader import Downloader
 from bluesky_crawler.crawler.fetcher import Fetcher
 from bluesky_crawler.crawler.valueobject.fetched_info import FetchedInfo
+from bluesky_crawler.db.crawl_state_db import CrawlStateDB
+from bluesky_crawler.db.failed_media_db import FailedMediaDB
 from bluesky_crawler.db.like_db import LikeDB
 from bluesky_crawler.db.media_db import MediaDB
+from bluesky_crawler.db.model import Like, Media, User
 from bluesky_crawler.db.user_db import UserDB
+from bluesky_crawler.manager.manager import RateLimitBudget, get_account_list
 
 logger = getLogger(__name__)
 logger.setLevel(INFO)
 
+# run のパイプライン設定
+# queue_size          : ステージ間のキューに保持するページ数の上限、後段が詰まった場合は前段が待機する
+# max_failed_attempts : DL に失敗したメディアのエントリの登録を見送る回数、
+#                       この回数失敗したメディアはエントリを登録して再取得リストに移し、以降の crawl で再取得する
+DEFAULT_PIPELINE_CONFIG = {
+    "queue_size": 4,
+    "max_failed_attempts": 3,
+}
+
 
 class Crawler:
-    fetcher: Fetcher
+    fetcher_dict: dict[str, Fetcher]
     downloader: Downloader
     like_db: LikeDB
     user_db: UserDB
     media_db: MediaDB
+    crawl_state_db: CrawlStateDB
+    failed_media_db: FailedMediaDB
+    pipeline_config: dict
     config_path: Path = Path("./config/config.json")
+    LATEST_POST_URI_KEY = "latest_post_uri"
+    BACKFILL_CURSOR_KEY = "backfill_cursor"
 
     def __init__(self) -> None:
         logger.info("Crawler init -> start")
-        self.fetcher = Fetcher(self.config_path)
+        config_dict = orjson.loads(self.config_path.read_bytes())
+        pragma_dict = config_dict["general"].get("sqlite_pragma")
+        self.pipeline_config = DEFAULT_PIPELINE_CONFIG | config_dict["general"].get("pipeline", {})
+        if int(self.pipeline_config["queue_size"]) < 1:
+            raise ValueError(f"pipeline queue_size '{self.pipeline_config['queue_size']}' is invalid.")
+        if int(self.pipeline_config["max_failed_attempts"]) < 1:
+            max_failed_attempts = self.pipeline_config["max_failed_attempts"]
+            raise ValueError(f"pipeline max_failed_attempts '{max_failed_attempts}' is invalid.")
+        # アカウントごとに Fetcher（セッション）を分け、Downloader と DB は共有する
+        self.fetcher_dict = {
+            account["handle_name"]: Fetcher(self.config_path, handle_name=account["handle_name"])
+            for account in get_account_list(config_dict)
+        }
         self.downloader = Downloader(self.config_path)
-        self.like_db = LikeDB()
-        self.user_db = UserDB()
-        self.media_db = MediaDB()
+        self.like_db = LikeDB(pragma_dict=pragma_dict)
+        self.user_db = UserDB(pragma_dict=pragma_dict)
+        self.media_db = MediaDB(pragma_dict=pragma_dict)
+        self.crawl_state_db = CrawlStateDB(pragma_dict=pragma_dict)
+        self.failed_media_db = FailedMediaDB(pragma_dict=pragma_dict)
         logger.info("Crawler init -> done")
 
-    def run(self) -> None:
-        logger.info("Crawler run -> start")
+    def get_state_key(self, key: str, handle_name: str) -> str:
+        """アカウントごとの取得状態のキーを返す
 
-        # fetch
-        start_time = time.time()
-        fetched_list: list[FetchedInfo] = self.fetcher.fetch()
-        elapsed_time = time.time() - start_time
-        logger.info(f"Fetching : {elapsed_time} [sec].")
+        Args:
+            key (str): 取得状態の種類（LATEST_POST_URI_KEY など）
+            handle_name (str): アカウントの handle_name
+
+        Returns:
+            str: CrawlStateDB のキー
+        """
+        return f"{key}:{handle_name}"
+
+    def get_account_state(self, key: str, handle_name: str) -> str | None:
+        """アカウントごとの取得状態を返す
+
+        最初のアカウントについてアカウントごとの値がない場合は、
+        複数アカウント対応前に保存した値をアカウントごとの値に移して返す
+
+        Args:
+            key (str): 取得状態の種類（LATEST_POST_URI_KEY など）
+            handle_name (str): アカウントの handle_name
+
+        Returns:
+            str | None: 保存されている値、ない場合は None
+        """
+        value = self.crawl_state_db.get_value(self.get_state_key(key, handle_name))
+        if value is None and handle_name == next(iter(self.fetcher_dict)):
+            value = self.crawl_state_db.get_value(key)
+            if value is not None:
+                self.crawl_state_db.set_value(self.get_state_key(key, handle_name), value)
+                self.crawl_state_db.set_value(key, None)
+        return value
 
-        # 直近1000件の取得済メディアと比較し、存在しないメディアのみをDL対象とする
-        # あくまで連続DLを防ぐための荒いチェックのため、厳密ではない
-        DB_LIMIT_MEDIA_NUM = 1000
-        in_db_media = self.media_db.select()
-        if (n := len(in_db_media)) > DB_LIMIT_MEDIA_NUM:
-            in_db_media = in_db_media[n - DB_LIMIT_MEDIA_NUM :]
-        in_db_media_id = [m.media_id for m in in_db_media]
+    def set_account_state(self, key: str, handle_name: str, value: str | None) -> None:
+        """アカウントごとの取得状態を保存する
+
+        Args:
+            key (str): 取得状態の種類（LATEST_POST_URI_KEY など）
+            handle_name (str): アカウントの handle_name
+            value (str | None): 保存する値
+        """
+        self.crawl_state_db.set_value(self.get_state_key(key, handle_name), value)
+
+    def update_latest_post_uri(self, handle_name: str) -> None:
+        """今回取得した最新エントリの post uri を次回取得時の基準として保存する
+
+        Args:
+            handle_name (str): アカウントの handle_name
+        """
+        latest_post_uri = self.fetcher_dict[handle_name].latest_post_uri
+        if latest_post_uri:
+            self.set_account_state(self.LATEST_POST_URI_KEY, handle_name, latest_post_uri)
+
+    def get_rate_limit_budget_list(self) -> list[RateLimitBudget]:
+        """各アカウントのふぁぼ一覧の取得（getActorLikes）のレート制限の残りを返す
+
+        Returns:
+            list[RateLimitBudget]: レート制限の残りのリスト、サーバから通知されていないアカウントは含まない
+        """
+        budget_list = [fetcher.manager.get_rate_limit_budget() for fetcher in self.fetcher_dict.values()]
+        return [budget for budget in budget_list if budget is not None]
+
+    def select_new_records(
+        self, fetched_list: list[FetchedInfo], skip_media_id_set: set[str] | None = None
+    ) -> tuple[list[Like], list[User], list[Media]]:
+        """FetchedInfo のリストから DB に未登録のレコードを取り出す
+
+        Args:
+            fetched_list (list[FetchedInfo]): 処理対象
+            skip_media_id_set (set[str] | None): DB に未登録でも対象外とする media_id
+                                                 （処理中のメディアとの重複を避ける場合に指定する）
+
+        Returns:
+            tuple[list[Like], list[User], list[Media]]: (Like のリスト, User のリスト, DL 対象の Media のリスト)
+        """
+        # 取得済メディアを DB に問い合わせ、存在しないメディアのみをDL対象とする
+        candidate_media_id_list = [media.media_id for fetched in fetched_list for media in fetched.media_list]
+        in_db_media_id = self.media_db.select_exist_media_id(candidate_media_id_list)
+        if skip_media_id_set:
+            in_db_media_id = set(in_db_media_id) | skip_media_id_set
 
         # FetchedInfo をそれぞれのリストに分解
-        like_list, user_list, media_list = [], [], []
+        # 重複排除はキーによる辞書で行う（挿入順は保持される）
+        like_dict: dict[str, Like] = {}
+        user_dict: dict[str, User] = {}
+        media_dict: dict[tuple[str, str], Media] = {}
         for fetched_record in fetched_list:
             records = fetched_record.get_records()
             for record in records:
                 like, user, media = record
                 if media.media_id in in_db_media_id:
                     continue
-                if like not in like_list:
-                    like_list.append(like)
-                if user not in user_list:
-                    user_list.append(user)
-                if media not in media_list:
-                    media_list.append(media)
+                like_dict.setdefault(like.post_id, like)
+                user_dict.setdefault(user.user_id, user)
+                media_dict.setdefault((media.post_id, media.media_id), media)
+        return list(like_dict.values()), list(user_dict.values()), list(media_dict.values())
+
+    def update_failed_media(self, media_list: list[Media], failed_media_list: list[Media]) -> list[Media]:
+        """DL の結果に従って、メディアごとの DL に失敗した回数の記録を更新する
 
+        DL に成功したメディアは記録を削除し、失敗したメディアは失敗した回数を1増やす
+        max_failed_attempts 回失敗したメディアはエントリの登録を見送らず、再取得リストに残す（retry_failed_media）
+
+        Args:
+            media_list (list[Media]): DL 対象のメディア
+            failed_media_list (list[Media]): DL に失敗したメディア
+
+        Returns:
+            list[Media]: DL に失敗したメディアのうち、エントリの登録を見送るメディア
+        """
+        failed_media_set = set(failed_media_list)
+        self.failed_media_db.delete([media.media_id for media in media_list if media not in failed_media_set])
+        if not failed_media_list:
+            return []
+
+        max_failed_attempts = int(self.pipeline_config["max_failed_attempts"])
+        attempt_num_dict = self.failed_media_db.add_attempt(failed_media_list)
+        blocking_media_list = []
+        for media in failed_media_list:
+            if attempt_num_dict[media.media_id] < max_failed_attempts:
+                blocking_media_list.append(media)
+            else:
+                logger.warning(f"Media failed {max_failed_attempts} times, keep it in retry list : {media.url}.")
+        return blocking_media_list
+
+    def exclude_failed_records(
+        self,
+        like_list: list[Like],
+        user_list: list[User],
+        media_list: list[Media],
+        failed_media_list: list[Media],
+        blocking_media_list: list[Media] | None = None,
+    ) -> tuple[list[Like], list[User], list[Media]]:
+        """DL に失敗したメディアと、登録を見送るメディアを含むエントリの Like/User を除外する
+
+        DL に失敗したメディアは DB に登録せず、次回以降に再取得する
+        Like は登録を見送るメディアがないエントリのみ登録し、 User は登録する Like から参照されるもののみ残す
+
+        Args:
+            like_list (list[Like]): 登録対象の Like
+            user_list (list[User]): 登録対象の User
+            media_list (list[Media]): DL 対象のメディア
+            failed_media_list (list[Media]): DL に失敗したメディア
+            blocking_media_list (list[Media] | None): DL に失敗したメディアのうちエントリの登録を見送るメディア、
+                                                      None の場合は failed_media_list のすべて
+
+        Returns:
+            tuple[list[Like], list[User], list[Media]]: (Like のリスト, User のリスト, DL に成功した Media のリスト)
+        """
+        if not failed_media_list:
+            return like_list, user_list, media_list
+        if blocking_media_list is None:
+            blocking_media_list = failed_media_list
+        failed_media_set = set(failed_media_list)
+        failed_post_id_set = {media.post_id for media in blocking_media_list}
+        like_list = [like for like in like_list if like.post_id not in failed_post_id_set]
+        user_id_set = {like.user_id for like in like_list}
+        user_list = [user for user in user_list if user.user_id in user_id_set]
+        media_list = [media for media in media_list if media not in failed_media_set]
+        return like_list, user_list, media_list
+
+    def commit_records(self, like_list: list[Like], user_list: list[User], media_list: list[Media]) -> None:
+        """Like/User/Media を1つのトランザクションでまとめてコミットする
+
+        Args:
+            like_list (list[Like]): 登録対象の Like
+            user_list (list[User]): 登録対象の User
+            media_list (list[Media]): 登録対象の Media
+        """
+        logger.info("DB control -> start.")
+        with self.media_db.transaction() as session:
+            self.like_db.upsert(like_list, session)
+            self.user_db.upsert(user_list, session)
+            self.media_db.upsert(media_list, session)
+        logger.info("DB control -> done.")
+
+    def store(self, fetched_list: list[FetchedInfo]) -> tuple[int, int]:
+        """FetchedInfo のリストについてメディアのDLとDBへの登録を行う
+
+        Args:
+            fetched_list (list[FetchedInfo]): 処理対象
+
+        Returns:
+            tuple[int, int]: (新規にDLしたメディアの数, DL に失敗しエントリの登録を見送ったメディアの数)
+        """
+        like_list, user_list, media_list = self.select_new_records(fetched_list)
         if len(media_list) == 0:
-            logger.info("No liked post from last crawl.")
-            logger.info("Crawler run -> done")
-            return
+            return 0, 0
 
         # メディアダウンロード・保存
         logger.info(f"Num of new media is {len(media_list)}.")
         start_time = time.time()
-        self.downloader.download(media_list)
+        failed_media_list = self.downloader.download(media_list)
         elapsed_time = time.time() - start_time
         logger.info(f"Download : {elapsed_time} [sec].")
+        if failed_media_list:
+            logger.warning(f"Num of failed media is {len(failed_media_list)}.")
+        blocking_media_list = self.update_failed_media(media_list, failed_media_list)
+        like_list, user_list, media_list = self.exclude_failed_records(
+            like_list, user_list, media_list, failed_media_list, blocking_media_list
+        )
 
         # DB操作
-        logger.info("DB control -> start.")
-        self.like_db.upsert(like_list)
-        self.user_db.upsert(user_list)
-        self.media_db.upsert(media_list)
-        logger.info("DB control -> done.")
+        self.commit_records(like_list, user_list, media_list)
+        return len(media_list), len(blocking_media_list)
+
+    async def retry_failed_media(self, client: httpx.AsyncClient | None = None) -> int:
+        """再取得リストのメディア（max_failed_attempts 回以上 DL に失敗したメディア）を再取得する
+
+        エントリの Like/User は登録済のため、 DL に成功したメディアのみ DB に登録して再取得リストから取り除く
+        失敗したメディアは再取得リストに残し、次回の crawl で再取得する
+
+        Args:
+            client (httpx.AsyncClient | None): DL に使用するクライアント、 None の場合はこの呼び出しの間だけ作成する
+
+        Returns:
+            int: DL に成功したメディアの数
+        """
+        media_list = self.failed_media_db.select_retry(int(self.pipeline_config["max_failed_attempts"]))
+        if len(media_list) == 0:
+            return 0
+        logger.info(f"Num of media to retry is {len(media_list)}.")
+        failed_media_list = await self.downloader.excute(media_list, client)
+        self.update_failed_media(media_list, failed_media_list)
+        failed_media_set = set(failed_media_list)
+        media_list = [media for media in media_list if media not in failed_media_set]
+        if media_list:
+            self.media_db.upsert(media_list)
+        logger.info(f"Num of retried media is {len(media_list)}.")
+        return len(media_list)
+
+    async def run_pipeline(
+        self, last_post_uri_dict: dict[str, str | None] | None = None, client: httpx.AsyncClient | None = None
+    ) -> tuple[int, set[str]]:
+        """fetch → 解析 → DL → DB 登録をページ単位のパイプラインで行う
+
+        各ステージは queue_size を上限とするキューでつながり、
+        後段が詰まった場合は前段が待機する（取得済のページをメモリに溜め込まない）
+        1ページ分のメディアの DL が終わった時点で、そのページのレコードをコミットする
+        fetch と解析はイベントループを止めないよう別スレッドで行う
+        解析をワーカープロセスで行う設定の場合は、アカウントごとに min_batch_size 件までページをまとめてから解析する
+        DB 操作はすべて1つのスレッドで順に行う（エンジンは1つの接続を共有しているため）
+        複数アカウントの場合は各アカウントの fetch を並行して行い、以降のステージは共有する
+        複数のアカウントでふぁぼをつけたメディアは1回だけ DL する
+        DL に失敗しエントリの登録を見送ったメディアがあったアカウントは、
+        呼び出し元で最新エントリを更新しないよう返り値で通知する
+
+        Args:
+            last_post_uri_dict (dict[str, str | None] | None): handle_name ごとの前回取得時の最新エントリの post uri
+            client (httpx.AsyncClient | None): DL に使用するクライアント、 None の場合はこの呼び出しの間だけ作成する
+
+        Returns:
+            tuple[int, set[str]]: (新規にDLしたメディアの数, 登録を見送ったメディアがあったアカウントの handle_name)
+        """
+        queue_size = int(self.pipeline_config["queue_size"])
+        post_queue: asyncio.Queue[tuple[str, Fetcher, list[dict]] | None] = asyncio.Queue(maxsize=queue_size)
+        record_queue: asyncio.Queue[tuple[str, list[Like], list[User], list[Media]] | None] = asyncio.Queue(
+            maxsize=queue_size
+        )
+        commit_queue: asyncio.Queue[tuple[list[Like], list[User], list[Media]] | None] = asyncio.Queue(
+            maxsize=queue_size
+        )
+        last_post_uri_dict = last_post_uri_dict or {}
+        loop = asyncio.get_running_loop()
+        stored_media_num = 0
+        failed_handle_name_set: set[str] = set()
+
+        async def fetch_account_stage(handle_name: str, fetcher: Fetcher, last_post_uri: str | None) -> None:
+            page_iter = fetcher.fetch_iter(last_post_uri)
+            while (post_list := await asyncio.to_thread(next, page_iter, None)) is not None:
+                await post_queue.put((handle_name, fetcher, post_list))
+
+        async def fetch_stage() -> None:
+            async with asyncio.TaskGroup() as task_group:
+                for handle_name, fetcher in self.fetcher_dict.items():
+                    task_group.create_task(
+                        fetch_account_stage(handle_name, fetcher, last_post_uri_dict.get(handle_name))
+                    )
+            await post_queue.put(None)
+
+        async def parse_stage(db_executor: ThreadPoolExecutor) -> None:
+            # DL 待ちのメディアは DB に未登録のため、後続のページ・他のアカウントで重複して DL しないよう保持する
+            queued_media_id_set: set[str] = set()
+            # まとめて解析するためにアカウントごとに保持しているエントリ（新しい順）
+            pending_post_dict: dict[str, tuple[Fetcher, list[dict]]] = {}
+
+            async def parse_posts(handle_name: str, fetcher: Fetcher, post_list: list[dict]) -> None:
+                fetched_list = await asyncio.to_thread(fetcher.create_fetched_info_list, post_list)
+                records = await loop.run_in_executor(
+                    db_executor, self.select_new_records, fetched_list, queued_media_id_set
+                )
+                queued_media_id_set.update(media.media_id for media in records[2])
+                if len(records[2]) > 0:
+                    await record_queue.put((handle_name, *records))
+
+            while (fetched_page := await post_queue.get()) is not None:
+                handle_name, fetcher, post_list = fetched_page
+                _, pending_post_list = pending_post_dict.setdefault(handle_name, (fetcher, []))
+                pending_post_list.extend(post_list)
+                if len(pending_post_list) >= fetcher.get_parse_batch_size():
+                    del pending_post_dict[handle_name]
+                    await parse_posts(handle_name, fetcher, pending_post_list)
+            for handle_name, (fetcher, pending_post_list) in pending_post_dict.items():
+                await parse_posts(handle_name, fetcher, pending_post_list)
+            await record_queue.put(None)
+
+        async def download_stage(db_executor: ThreadPoolExecutor) -> None:
+            # ページをまたいで接続プールを共有する
+            client_context = self.downloader.create_client() if client is None else contextlib.nullcontext(client)
+            async with client_context as download_client:
+                while (records := await record_queue.get()) is not None:
+                    handle_name, like_list, user_list, media_list = records
+                    logger.info(f"Num of new media is {len(media_list)}.")
+                    failed_media_list = await self.downloader.excute(media_list, download_client)
+                    if failed_media_list:
+                        logger.warning(f"Num of failed media is {len(failed_media_list)}.")
+                    blocking_media_list = await loop.run_in_executor(
+                        db_executor, self.update_failed_media, media_list, failed_media_list
+                    )
+                    if blocking_media_list:
+                        failed_handle_name_set.add(handle_name)
+                    records = self.exclude_failed_records(
+                        like_list, user_list, media_list, failed_media_list, blocking_media_list
+                    )
+                    await commit_queue.put(records)
+            await commit_queue.put(None)
+
+        async def commit_stage(db_executor: ThreadPoolExecutor) -> None:
+            nonlocal stored_media_num
+            while (records := await commit_queue.get()) is not None:
+                await loop.run_in_executor(db_executor, self.commit_records, *records)
+                stored_media_num += len(records[2])
+
+        with (
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix="db") as db_executor,
+            contextlib.ExitStack() as stack,
+        ):
+            # 解析をワーカープロセスで行う場合は、パイプラインの間プールを使い回す
+            for fetcher in self.fetcher_dict.values():
+                stack.enter_context(fetcher.reuse_process_pool())
+            try:
+                async with asyncio.TaskGroup() as task_group:
+                    task_group.create_task(fetch_stage())
+                    task_group.create_task(parse_stage(db_executor))
+                    task_group.create_task(download_stage(db_executor))
+                    task_group.create_task(commit_stage(db_executor))
+            except ExceptionGroup as e:
+                # 最初に発生した例外をそのまま呼び出し元に伝える
+                exception: BaseException = e
+                while isinstance(exception, ExceptionGroup):
+                    exception = exception.exceptions[0]
+                raise exception from e
+        return stored_media_num, failed_handle_name_set
+
+    async def crawl(self, client: httpx.AsyncClient | None = None) -> int:
+        """前回取得した最新エントリ以降のふぁぼについて、メディアのDLとDBへの登録を行う
+
+        最新エントリの更新はすべてのページを登録し終えてから行う（途中で中断した場合は次回に再取得する）
+        保存済ファイルの索引は crawl ごとに作り直す（常駐時に実行の間に変更されたファイルを反映する）
+        DL に失敗したメディアがあったアカウントは最新エントリを更新せず、次回に前回の位置から再取得する
+        （DB に登録済のメディアは DL 対象にならないため、失敗したメディアのみを再取得する）
+        max_failed_attempts 回失敗したメディアは最新エントリの更新を妨げず、再取得リストから crawl ごとに再取得する
+
+        Args:
+            client (httpx.AsyncClient | None): DL に使用するクライアント、 None の場合はこの呼び出しの間だけ作成する
+
+        Returns:
+            int: 新規にDLしたメディアの数
+        """
+        start_time = time.time()
+        self.downloader.clear_file_index()
+        last_post_uri_dict = {
+            handle_name: self.get_account_state(self.LATEST_POST_URI_KEY, handle_name)
+            for handle_name in self.fetcher_dict
+        }
+        retried_media_num = await self.retry_failed_media(client)
+        media_num, failed_handle_name_set = await self.run_pipeline(last_post_uri_dict, client)
+        media_num += retried_media_num
+        if media_num == 0:
+            logger.info("No liked post from last crawl.")
+        elapsed_time = time.time() - start_time
+        logger.info(f"Pipeline : {elapsed_time} [sec].")
+        for handle_name in self.fetcher_dict:
+            if handle_name in failed_handle_name_set:
+                logger.warning(f"Some media of {handle_name} failed to download, retry them next time.")
+                continue
+            self.update_latest_post_uri(handle_name)
+        return media_num
+
+    def run(self) -> int:
+        """前回取得した最新エントリ以降のふぁぼについて、メディアのDLとDBへの登録を行う
+
+        Returns:
+            int: 新規にDLしたメディアの数
+        """
+        logger.info("Crawler run -> start")
+        media_num = asyncio.run(self.crawl())
         logger.info("Crawler run -> done")
+        return media_num
+
+    def backfill(self) -> None:
+        """ふぁぼの全履歴をさかのぼってメディアのDLとDBへの登録を行う
+
+        複数アカウントの場合はアカウントごとに順に行う
+        1ページ取得するごとにDL・DB登録まで行い、次のページの cursor を保存する
+        中断した場合は、次回の backfill 実行時に保存した cursor から再開する
+        DL に失敗したメディアがあった場合は、以降のページも取得するが cursor はそのページのまま進めず、
+        次回の backfill 実行時にそのページから再取得する（max_failed_attempts 回失敗したメディアは除く）
+        """
+        logger.info("Crawler backfill -> start")
+        for handle_name, fetcher in self.fetcher_dict.items():
+            cursor = self.get_account_state(self.BACKFILL_CURSOR_KEY, handle_name)
+            if cursor:
+                logger.info(f"Resume backfill of {handle_name} from cursor : {cursor}.")
+
+            page_num, media_num = 0, 0
+            is_failed = False
+            while True:
+                fetched_list, next_cursor = fetcher.fetch_page(cursor)
+                stored_media_num, failed_media_num = self.store(fetched_list)
+                media_num += stored_media_num
+                page_num += 1
+                if failed_media_num > 0 and not is_failed:
+                    logger.warning(f"Some media of {handle_name} page {page_num} failed, resume from this page.")
+                    is_failed = True
+                if cursor is None and not is_failed:
+                    # 最新のページから開始した場合は通常実行時の基準も更新する
+                    self.update_latest_post_uri(handle_name)
+                logger.info(f"Backfill {handle_name} page {page_num} -> done (total media : {media_num}).")
+
+                if not next_cursor:
+                    break
+                if not is_failed:
+                    self.set_account_state(self.BACKFILL_CURSOR_KEY, handle_name, next_cursor)
+                cursor = next_cursor
+
+            # 最後まで到達したので再開用の cursor を消去する（DL に失敗したページがあった場合は残す）
+            if not is_failed:
+                self.set_account_state(self.BACKFILL_CURSOR_KEY, handle_name, None)
+        logger.info("Crawler backfill -> done")
+
+    def verify(self) -> None:
+        """DBに登録済で未検証のメディアについて、保存済ファイルの検証を行う
+
+        検証に成功したファイルは再取得せずに検証済として登録する
+        破損・欠落していたファイルのみ再取得する
+        検証済のメディアは以降の verify で対象にならない
+        verify_size / verify_cid が無効な場合（動画も）はファイルの存在のみ確認し、検証済にはしない
+        CDN から保存した画像は元の blob と一致しないため、検証に失敗して元の blob で取得し直す
+        """
+        logger.info("Crawler verify -> start")
+        download_config = self.downloader.download_config
+        if not download_config["verify_size"] and not download_config["verify_cid"]:
+            logger.warning("verify_size and verify_cid are disabled, only check that files exist.")
+        media_list = self.media_db.select_unverified()
+        logger.info(f"Num of unverified media is {len(media_list)}.")
+        if len(media_list) == 0:
+            logger.info("Crawler verify -> done")
+            return
+
+        failed_media_set = set(self.downloader.download(media_list))
+        verified_media_list = [media for media in media_list if media not in failed_media_set and media.verified]
+        if verified_media_list:
+            self.media_db.upsert(verified_media_list)
+        logger.info(f"Num of verified media is {len(verified_media_list)}.")
+        logger.info("Crawler verify -> done")
+
+    def migrate_layout(self) -> None:
+        """保存済のメディアを、設定された保存先フォルダの分け方に従って移動する
+
+        DBにはファイルのパスを保持していないため、DBの更新は不要
+        """
+        logger.info("Crawler migrate layout -> start")
+        media_list = self.media_db.select()
+        logger.info(f"Layout : {self.downloader.download_config['layout']}.")
+        moved_num = self.downloader.relocate(media_list)
+        logger.info(f"Num of moved files is {moved_num}.")
+        logger.info("Crawler migrate layout -> done")
 
 
 if __name__ == "__main__":
@@ -1,72 +1,905 @@
 import asyncio
+import contextlib
+import hashlib
+import importlib.util
+import os
+import re
+import shutil
+from datetime import datetime
 from logging import INFO, getLogger
 from pathlib import Path
+from urllib.parse import unquote, urlencode, urlparse
 
 import httpx
 import orjson
 
+from bluesky_crawler.crawler.valueobject.hls_playlist import HlsPlaylist
 from bluesky_crawler.db.model import Media
+from bluesky_crawler.util import to_raw_cid
 
 logger = getLogger(__name__)
 logger.setLevel(INFO)
 
+# DL 設定の既定値
+# config.json の general.download で項目ごとに上書きできる
+DEFAULT_DOWNLOAD_CONFIG = {
+    "max_connections": 20,
+    "max_keepalive_connections": 20,
+    "max_connections_per_host": 8,
+    "keepalive_expiry": 30,
+    "http2": True,
+    "image_concurrency": 8,
+    "video_concurrency": 2,
+    "chunk_size": 65536,
+    "fsync": "file",
+    "resume_retries": 3,
+    "verify_size": False,
+    "verify_cid": False,
+    "plc_directory": "https://plc.directory",
+    "video_downloader": "native",
+    "video_rendition": "highest",
+    "segment_concurrency": 4,
+    "content_addressed": False,
+    "link_mode": "hardlink",
+    "layout": "flat",
+}
+
+# DL 完了時の fsync の方針
+#   none      : fsync しない（OS のキャッシュに任せる）
+#   file      : リネーム前にファイルを fsync する
+#   directory : ファイルに加えてリネーム後に保存先ディレクトリも fsync する
+FSYNC_POLICY_LIST = ["none", "file", "directory"]
+
+# 動画の DL 方式
+#   native : HLS のセグメントをプロセス内で並行して取得して連結する、失敗した場合は ffmpeg で取得し直す
+#   ffmpeg : ffmpeg に HLS の取得と mp4 への変換を任せる
+VIDEO_DOWNLOADER_LIST = ["native", "ffmpeg"]
+
+# content_addressed が有効な場合に、 CID ごとに1つだけ保存した実体を各ファイル名から参照する方式
+#   hardlink : ハードリンク
+#   symlink  : 相対パスのシンボリックリンク
+# リンクを作成できない場合はコピーする
+LINK_MODE_LIST = ["hardlink", "symlink"]
+
+# save_base_path 配下の保存先フォルダの分け方
+#   flat     : 分けない（save_base_path 直下に保存する）
+#   username : 投稿者のハンドルごと
+#   date     : 投稿日時の年/月ごと
+#   cid      : CID (media_id) の末尾2文字ごと、 CID の先頭はコーデック等を表し偏るため末尾を使う
+# flat 以外の場合は、 content_addressed の実体も CID の末尾2文字ごとに分ける
+LAYOUT_LIST = ["flat", "username", "date", "cid"]
+
 
 class Downloader:
     save_base_path: Path
     save_num: int
+    download_config: dict
+    host_semaphore_dict: dict[str, asyncio.Semaphore]
+    blob_lock_dict: dict[str, asyncio.Lock]
+    file_index: set[Path] | None
+    indexed_directory_set: set[Path]
+    pds_endpoint_dict: dict[str, str]
+    BLOB_DIRECTORY_NAME = "blobs"
 
     def __init__(self, config_path: Path) -> None:
         logger.info("Downloader init -> start")
         config_dict = orjson.loads(config_path.read_bytes())
         self.save_base_path = Path(config_dict["general"]["save_base_path"])
         self.save_num = int(config_dict["general"]["save_num"])
+        self.download_config = DEFAULT_DOWNLOAD_CONFIG | config_dict["general"].get("download", {})
+        self.host_semaphore_dict = {}
+        self.blob_lock_dict = {}
+        self.file_index = None
+        self.indexed_directory_set = set()
+        self.pds_endpoint_dict = {}
+        if self.download_config["fsync"] not in FSYNC_POLICY_LIST:
+            raise ValueError(f"fsync policy '{self.download_config['fsync']}' is invalid.")
+        if self.download_config["video_downloader"] not in VIDEO_DOWNLOADER_LIST:
+            raise ValueError(f"video downloader '{self.download_config['video_downloader']}' is invalid.")
+        if self.download_config["link_mode"] not in LINK_MODE_LIST:
+            raise ValueError(f"link mode '{self.download_config['link_mode']}' is invalid.")
+        if self.download_config["layout"] not in LAYOUT_LIST:
+            raise ValueError(f"layout '{self.download_config['layout']}' is invalid.")
 
         self.save_base_path.mkdir(parents=True, exist_ok=True)
+        if self.download_config["content_addressed"]:
+            (self.save_base_path / self.BLOB_DIRECTORY_NAME).mkdir(parents=True, exist_ok=True)
         logger.info("Downloader init -> done")
 
-    async def worker(self, media: Media) -> None:
-        if "image" in media.mime_type:
-            transport = httpx.AsyncHTTPTransport(retries=3)
-            async with httpx.AsyncClient(timeout=httpx.Timeout(5, read=60), transport=transport) as client:
-                url = media.url
-                filename = media.get_filename()
-                filepath = self.save_base_path / filename
-                if filepath.exists():
+    def create_client(self) -> httpx.AsyncClient:
+        """DL に使う HTTP クライアントを作成する
+
+        接続はプールされ、 excute の間は同じホストへの接続を使い回す
+        HTTP/2 は設定が有効かつ h2 パッケージがインストールされている場合のみ使う
+
+        Returns:
+            httpx.AsyncClient: HTTP クライアント
+        """
+        is_http2 = bool(self.download_config["http2"]) and importlib.util.find_spec("h2") is not None
+        limits = httpx.Limits(
+            max_connections=int(self.download_config["max_connections"]),
+            max_keepalive_connections=int(self.download_config["max_keepalive_connections"]),
+            keepalive_expiry=float(self.download_config["keepalive_expiry"]),
+        )
+        transport = httpx.AsyncHTTPTransport(retries=3, http2=is_http2, limits=limits)
+        return httpx.AsyncClient(timeout=httpx.Timeout(5, read=60), transport=transport)
+
+    def get_host_semaphore(self, url: str) -> asyncio.Semaphore:
+        """url のホストごとの同時接続数を制限するセマフォを取得する
+
+        Args:
+            url (str): 接続先の url
+
+        Returns:
+            asyncio.Semaphore: ホストごとのセマフォ
+        """
+        host = urlparse(url).netloc
+        if host not in self.host_semaphore_dict:
+            max_connections_per_host = int(self.download_config["max_connections_per_host"])
+            self.host_semaphore_dict[host] = asyncio.Semaphore(max_connections_per_host)
+        return self.host_semaphore_dict[host]
+
+    def get_temp_path(self, filepath: Path) -> Path:
+        """DL 中に書き込む一時ファイルのパスを取得する
+
+        ffmpeg が出力形式を拡張子から判定できるよう、拡張子は元のまま残す
+        一時ファイルは完了時に filepath にリネームされるため、
+        filepath が存在すれば DL は完了している
+
+        Args:
+            filepath (Path): 保存先のパス
+
+        Returns:
+            Path: 一時ファイルのパス
+        """
+        return filepath.with_name(f"{filepath.stem}.part{filepath.suffix}")
+
+    def fsync_file(self, path: Path) -> None:
+        """path を fsync する、ディレクトリも指定可能
+
+        Args:
+            path (Path): 対象のパス
+        """
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def update_file_index(self, media_list: list[Media]) -> None:
+        """media_list の保存先フォルダにある既存ファイルを索引に追加する
+
+        メディアごとに exists() を呼ぶ代わりに、保存先フォルダごとに1回だけ os.scandir で列挙する
+        索引は clear_file_index を呼ぶまで保持し、列挙済のフォルダは再度列挙しない
+        （以降に保存したファイルは add_file_index で索引に追加する）
+        保存先フォルダが存在しない場合は作成する
+
+        Args:
+            media_list (list[Media]): 対象のメディア
+        """
+        if self.file_index is None:
+            self.file_index = set()
+            self.indexed_directory_set = set()
+
+        directory_set: set[Path] = set()
+        for media in media_list:
+            if "image" not in media.mime_type and "video" not in media.mime_type:
+                continue
+            try:
+                directory_set.add(self.get_save_path(media).parent)
+                if self.download_config["content_addressed"]:
+                    directory_set.add(self.get_blob_path(media).parent)
+            except ValueError:
+                # ファイル名を決められないメディアは worker で失敗として扱う
+                continue
+
+        for directory in directory_set - self.indexed_directory_set:
+            directory.mkdir(parents=True, exist_ok=True)
+            with os.scandir(directory) as it:
+                # リンク切れのシンボリックリンクは存在しないものとして扱う
+                self.file_index.update(directory / entry.name for entry in it if entry.is_file())
+            self.indexed_directory_set.add(directory)
+
+    def clear_file_index(self) -> None:
+        """索引を破棄し、以降はファイルシステムに問い合わせる（次回の excute で列挙し直す）"""
+        self.file_index = None
+        self.indexed_directory_set = set()
+
+    def is_exist_file(self, filepath: Path) -> bool:
+        """filepath が存在するか
+
+        索引がある場合は索引を参照し、ない場合はファイルシステムに問い合わせる
+
+        Args:
+            filepath (Path): 対象のパス
+
+        Returns:
+            bool: 存在するなら True
+        """
+        if self.file_index is None:
+            return filepath.exists()
+        return filepath in self.file_index
+
+    def add_file_index(self, filepath: Path) -> None:
+        """保存したファイルを索引に追加する
+
+        Args:
+            filepath (Path): 保存したファイルのパス
+        """
+        if self.file_index is not None:
+            self.file_index.add(filepath)
+
+    def remove_file(self, filepath: Path) -> None:
+        """ファイルを削除し、索引からも取り除く
+
+        Args:
+            filepath (Path): 削除するファイルのパス
+        """
+        filepath.unlink(missing_ok=True)
+        if self.file_index is not None:
+            self.file_index.discard(filepath)
+
+    async def commit_file(self, temp_path: Path, filepath: Path) -> None:
+        """書き込みが完了した一時ファイルを保存先にリネームする
+
+        fsync の方針に従って fsync してから os.replace で置き換える
+
+        Args:
+            temp_path (Path): 書き込みが完了した一時ファイルのパス
+            filepath (Path): 保存先のパス
+        """
+        fsync_policy = self.download_config["fsync"]
+        if fsync_policy in ["file", "directory"]:
+            await asyncio.to_thread(self.fsync_file, temp_path)
+        os.replace(temp_path, filepath)
+        self.add_file_index(filepath)
+        if fsync_policy == "directory" and os.name != "nt":
+            # Windows はディレクトリを開けないため、ディレクトリの fsync は行わない
+            await asyncio.to_thread(self.fsync_file, filepath.parent)
+
+    def get_file_cid(self, filepath: Path) -> str:
+        """filepath の内容から CIDv1 (raw) を計算する
+
+        Args:
+            filepath (Path): 対象のファイルパス
+
+        Returns:
+            str: CIDv1 文字列
+        """
+        chunk_size = int(self.download_config["chunk_size"])
+        sha256 = hashlib.sha256()
+        with filepath.open("rb") as fin:
+            while chunk := fin.read(chunk_size):
+                sha256.update(chunk)
+        return to_raw_cid(sha256.digest())
+
+    def is_verifiable(self, media: Media) -> bool:
+        """verify_file で media に対して実際に検証（サイズ・CID の比較）が行われるかを返す
+
+        Args:
+            media (Media): 対象のメディア
+
+        Returns:
+            bool: verify_size / verify_cid のいずれかの検証が行われる場合 True
+        """
+        if "image" not in media.mime_type:
+            return False
+        if self.download_config["verify_size"]:
+            return True
+        return bool(self.download_config["verify_cid"]) and media.media_id.startswith("bafkrei")
+
+    def get_did(self, media: Media) -> str:
+        """メディアの url から投稿者の DID を取得する
+
+        Args:
+            media (Media): 対象のメディア
+
+        Returns:
+            str: 投稿者の DID
+        """
+        match = re.search(r"/(did:[a-z]+:[^/@]+)/", media.url)
+        if not match:
+            raise ValueError(f"DID is not found in url : {media.url}.")
+        return match.group(1)
+
+    async def resolve_pds_endpoint(self, did: str, client: httpx.AsyncClient) -> str:
+        """DID ドキュメントから投稿者の PDS の url を取得する
+
+        did:plc は plc_directory から、 did:web はドメインの /.well-known/did.json から DID ドキュメントを取得する
+        取得した url は DID ごとに保持し、以降は再取得しない
+
+        Args:
+            did (str): 投稿者の DID
+            client (httpx.AsyncClient): HTTP クライアント
+
+        Returns:
+            str: PDS の url
+        """
+        if did in self.pds_endpoint_dict:
+            return self.pds_endpoint_dict[did]
+        if did.startswith("did:plc:"):
+            url = f"{self.download_config['plc_directory'].rstrip('/')}/{did}"
+        elif did.startswith("did:web:"):
+            url = f"https://{unquote(did.removeprefix('did:web:'))}/.well-known/did.json"
+        else:
+            raise ValueError(f"DID method is not supported : {did}.")
+        async with self.get_host_semaphore(url):
+            response = await client.get(url)
+        response.raise_for_status()
+        did_document = orjson.loads(response.content)
+        for service in did_document.get("service") or []:
+            if service.get("id", "").endswith("#atproto_pds") and service.get("serviceEndpoint"):
+                self.pds_endpoint_dict[did] = service["serviceEndpoint"].rstrip("/")
+                return self.pds_endpoint_dict[did]
+        raise ValueError(f"PDS endpoint is not found in DID document : {did}.")
+
+    async def get_image_url(self, media: Media, client: httpx.AsyncClient) -> str:
+        """画像の DL 元の url を取得する
+
+        CDN (media.url) は画像を再エンコードして配信するため、サイズ・CID が元の blob と一致しない
+        検証が行われる場合は、投稿者の PDS から元の blob を com.atproto.sync.getBlob で取得する
+
+        Args:
+            media (Media): 対象のメディア
+            client (httpx.AsyncClient): HTTP クライアント
+
+        Returns:
+            str: DL 元の url
+        """
+        if not self.is_verifiable(media):
+            return media.url
+        did = self.get_did(media)
+        pds_endpoint = await self.resolve_pds_endpoint(did, client)
+        query = urlencode({"did": did, "cid": media.media_id})
+        return f"{pds_endpoint}/xrpc/com.atproto.sync.getBlob?{query}"
+
+    async def verify_file(self, media: Media, filepath: Path) -> bool:
+        """DL したファイルが media の情報と一致するか検証する
+
+        verify_size が有効な場合はファイルサイズを Media.size と比較する
+        verify_cid が有効な場合はファイル内容から計算した CID を Media.media_id と比較する
+        どちらも元の blob の値のため、検証が行われる画像は CDN ではなく元の blob を DL する（get_image_url）
+        動画は HLS から変換して保存するため、どちらの検証も対象外とする
+
+        Args:
+            media (Media): 検証対象のメディア
+            filepath (Path): DL したファイルのパス
+
+        Returns:
+            bool: 検証に成功したか、有効な検証がない場合は True
+        """
+        if "image" not in media.mime_type:
+            return True
+        if self.download_config["verify_size"]:
+            file_size = filepath.stat().st_size
+            if file_size != media.size:
+                logger.warning(f"Size mismatch : {filepath.name} ({file_size} != {media.size}).")
+                return False
+        if self.download_config["verify_cid"] and media.media_id.startswith("bafkrei"):
+            # raw コーデックの CIDv1 以外は計算できないため検証しない
+            file_cid = await asyncio.to_thread(self.get_file_cid, filepath)
+            if file_cid != media.media_id:
+                logger.warning(f"CID mismatch : {filepath.name} ({file_cid}).")
+                return False
+        return True
+
+    async def download_image(self, media: Media, client: httpx.AsyncClient, filepath: Path) -> None:
+        """画像を一時ファイルに DL し、完了後に filepath にリネームする
+
+        本文はメモリに溜めずにチャンクごとに一時ファイルへ書き込む
+        通信が途中で切れた場合は一時ファイルを残し、
+        Range リクエストで続きから再開する（最大 resume_retries 回）
+        再開しきれなかった一時ファイルは次回の DL 時に続きから再開する
+        検証が行われる場合は CDN ではなく元の blob を DL する
+
+        Args:
+            media (Media): DL 対象のメディア
+            client (httpx.AsyncClient): HTTP クライアント
+            filepath (Path): 保存先のパス
+        """
+        url = await self.get_image_url(media, client)
+        temp_path = self.get_temp_path(filepath)
+        chunk_size = int(self.download_config["chunk_size"])
+        resume_retries = int(self.download_config["resume_retries"])
+        for retry_count in range(resume_retries + 1):
+            offset = temp_path.stat().st_size if temp_path.exists() else 0
+            headers = {"Range": f"bytes={offset}-"} if offset > 0 else {}
+            try:
+                async with self.get_host_semaphore(url):
+                    async with client.stream("GET", url, headers=headers) as response:
+                        # 416 など一時ファイルと合わない応答の場合は、一時ファイルを消して次回は最初から取り直す
+                        response.raise_for_status()
+                        if offset > 0:
+                            content_range = response.headers.get("Content-Range", "")
+                            if response.status_code == 206:
+                                if not re.match(rf"^bytes {offset}-", content_range):
+                                    raise ValueError(f"unexpected Content-Range : {content_range}.")
+                                logger.info(f"Resume download from {offset} bytes : {filepath.name}.")
+                            else:
+                                # Range に対応していない場合は最初から書き直す
+                                offset = 0
+                        with temp_path.open("ab" if offset > 0 else "wb") as fout:
+                            async for chunk in response.aiter_bytes(chunk_size):
+                                fout.write(chunk)
+                break
+            except httpx.TransportError:
+                # 一時ファイルは再開のために残す
+                if retry_count >= resume_retries:
+                    raise
+            except Exception:
+                temp_path.unlink(missing_ok=True)
+                raise
+
+        if not await self.verify_file(media, temp_path):
+            temp_path.unlink(missing_ok=True)
+            raise ValueError(f"downloaded file is corrupt : {filepath.name}.")
+        await self.commit_file(temp_path, filepath)
+
+    async def run_ffmpeg(self, source: str | Path, output_path: Path) -> None:
+        """ffmpeg で source をストリームコピーして mp4 にする
+
+        Args:
+            source (str | Path): 入力、 HLS の url またはローカルのファイルパス
+            output_path (Path): 出力先のパス
+        """
+        command = [
+            "ffmpeg",
+            "-y",
+            "-i",
+            source,
+            "-loglevel",
+            "fatal",
+            "-c",
+            "copy",
+            "-bsf:a",
+            "aac_adtstoasc",
+            output_path,
+        ]
+        result = await asyncio.create_subprocess_exec(*command)
+        await result.communicate()
+        if result.returncode != 0:
+            # 途中まで書き込まれたファイルは残さない
+            output_path.unlink(missing_ok=True)
+            raise ValueError(f"ffmpeg exited with code {result.returncode}.")
+
+    async def fetch_playlist(self, url: str, client: httpx.AsyncClient) -> HlsPlaylist:
+        """HLS のプレイリストを取得する
+
+        マスタープレイリストの場合は video_rendition に従ってレンディションを選択し、
+        そのメディアプレイリストを取得する
+
+        Args:
+            url (str): プレイリストの url
+            client (httpx.AsyncClient): HTTP クライアント
+
+        Returns:
+            HlsPlaylist: メディアプレイリスト
+        """
+        async with self.get_host_semaphore(url):
+            response = await client.get(url)
+        response.raise_for_status()
+        playlist = HlsPlaylist.create(response.text, str(response.url))
+        if not playlist.is_master():
+            return playlist
+
+        variant = playlist.select_variant(self.download_config["video_rendition"])
+        async with self.get_host_semaphore(variant.url):
+            response = await client.get(variant.url)
+        response.raise_for_status()
+        playlist = HlsPlaylist.create(response.text, str(response.url))
+        if playlist.is_master():
+            raise ValueError("Nested master playlist is not supported.")
+        return playlist
+
+    async def fetch_segment(self, url: str, client: httpx.AsyncClient) -> bytes:
+        """HLS のセグメントを取得する
+
+        Args:
+            url (str): セグメントの url
+            client (httpx.AsyncClient): HTTP クライアント
+
+        Returns:
+            bytes: セグメントの内容
+        """
+        async with self.get_host_semaphore(url):
+            response = await client.get(url)
+        response.raise_for_status()
+        return response.content
+
+    async def download_hls(self, url: str, client: httpx.AsyncClient, output_path: Path) -> bool:
+        """HLS のセグメントを並行して取得し、順に連結して output_path に書き込む
+
+        セグメントは segment_concurrency 個ずつ先読みし、取得した順ではなくプレイリストの順に書き込む
+        メモリに保持するセグメントは先読みの分のみ
+
+        Args:
+            url (str): プレイリストの url
+            client (httpx.AsyncClient): HTTP クライアント
+            output_path (Path): 出力先のパス
+
+        Returns:
+            bool: セグメントが fMP4 なら True、 MPEG-TS なら False
+        """
+        playlist = await self.fetch_playlist(url, client)
+        segment_url_list = playlist.segment_url_list
+        if playlist.is_fmp4():
+            segment_url_list = [playlist.init_url] + segment_url_list
+
+        segment_concurrency = max(int(self.download_config["segment_concurrency"]), 1)
+        segment_url_iter = iter(segment_url_list)
+        pending_list: list[asyncio.Task[bytes]] = []
+        try:
+            with output_path.open("wb") as fout:
+                for segment_url in segment_url_iter:
+                    pending_list.append(asyncio.create_task(self.fetch_segment(segment_url, client)))
+                    if len(pending_list) >= segment_concurrency:
+                        break
+                while pending_list:
+                    fout.write(await pending_list.pop(0))
+                    if (segment_url := next(segment_url_iter, None)) is not None:
+                        pending_list.append(asyncio.create_task(self.fetch_segment(segment_url, client)))
+        finally:
+            for task in pending_list:
+                task.cancel()
+        return playlist.is_fmp4()
+
+    async def download_video(self, media: Media, client: httpx.AsyncClient, filepath: Path) -> None:
+        """動画を一時ファイルに DL し、完了後に filepath にリネームする
+
+        video_downloader が native の場合は HLS のセグメントをプロセス内で取得する
+        セグメントが MPEG-TS の場合は、 ffmpeg があればローカルで mp4 に変換し、
+        なければ MPEG-TS のまま拡張子を .ts にして保存する（get_ts_path）
+        native での DL に失敗した場合は、 ffmpeg があれば ffmpeg で取得し直す
+
+        Args:
+            media (Media): DL 対象のメディア
+            client (httpx.AsyncClient): HTTP クライアント
+            filepath (Path): 保存先のパス
+        """
+        temp_path = self.get_temp_path(filepath)
+        is_ffmpeg_available = shutil.which("ffmpeg") is not None
+        if self.download_config["video_downloader"] == "native":
+            segment_path = self.get_temp_path(self.get_ts_path(filepath))
+            try:
+                is_fmp4 = await self.download_hls(media.url, client, segment_path)
+                if is_fmp4:
+                    await self.commit_file(segment_path, filepath)
                     return
+                if not is_ffmpeg_available:
+                    ts_path = self.get_ts_path(filepath)
+                    logger.warning(f"ffmpeg is not found, save as MPEG-TS : {ts_path.name}.")
+                    await self.commit_file(segment_path, ts_path)
+                    return
+                await self.run_ffmpeg(segment_path, temp_path)
+                await self.commit_file(temp_path, filepath)
+                return
+            except Exception as e:
+                if not is_ffmpeg_available:
+                    raise
+                logger.warning(f"Native HLS download failed, fallback to ffmpeg : {media.url} ({e!r}).")
+            finally:
+                segment_path.unlink(missing_ok=True)
+
+        await self.run_ffmpeg(media.url, temp_path)
+        await self.commit_file(temp_path, filepath)
+
+    def get_ts_path(self, filepath: Path) -> Path:
+        """ffmpeg がない場合に MPEG-TS のまま保存する動画のパスを取得する
+
+        Args:
+            filepath (Path): 動画の保存先パス
+
+        Returns:
+            Path: 拡張子を .ts にしたパス
+        """
+        return filepath.with_suffix(".ts")
+
+    def resolve_saved_path(self, media: Media, filepath: Path) -> Path:
+        """保存済のファイルのパスを取得する
+
+        動画は MPEG-TS のまま .ts で保存している場合があるため、
+        filepath がなく .ts のファイルがある場合は .ts のパスを返す
+
+        Args:
+            media (Media): 対象のメディア
+            filepath (Path): 保存先のパス（get_save_path / get_blob_path）
+
+        Returns:
+            Path: 保存済のファイルのパス、どちらもない場合は filepath
+        """
+        if "video" not in media.mime_type or self.is_exist_file(filepath):
+            return filepath
+        ts_path = self.get_ts_path(filepath)
+        return ts_path if self.is_exist_file(ts_path) else filepath
+
+    def get_shard_directory(self, media: Media, layout: str) -> Path:
+        """layout に従った、メディアの保存先フォルダの save_base_path からの相対パスを取得する
+
+        Args:
+            media (Media): 対象のメディア
+            layout (str): 保存先フォルダの分け方
+
+        Returns:
+            Path: save_base_path からの相対パス
+        """
+        match layout:
+            case "flat":
+                return Path()
+            case "username":
+                return Path(media.username)
+            case "date":
+                try:
+                    created_at = datetime.fromisoformat(media.created_at)
+                except (TypeError, ValueError):
+                    return Path("unknown")
+                return Path(f"{created_at.year:04}") / f"{created_at.month:02}"
+            case "cid":
+                return Path(media.media_id[-2:])
+            case _:
+                raise ValueError(f"layout '{layout}' is invalid.")
+
+    def get_save_path(self, media: Media, layout: str | None = None) -> Path:
+        """メディアの保存先パスを取得する
+
+        Args:
+            media (Media): 対象のメディア
+            layout (str | None): 保存先フォルダの分け方、 None の場合は設定値を使う
+
+        Returns:
+            Path: 保存先パス
+        """
+        layout = layout or self.download_config["layout"]
+        return self.save_base_path / self.get_shard_directory(media, layout) / media.get_filename()
+
+    def get_blob_path(self, media: Media, layout: str | None = None) -> Path:
+        """content_addressed が有効な場合の、メディアの実体の保存先パスを取得する
+
+        実体は CID (media_id) ごとに1つだけ保存する
+        layout が flat 以外の場合は CID の末尾2文字ごとのフォルダに分ける
+
+        Args:
+            media (Media): 対象のメディア
+            layout (str | None): 保存先フォルダの分け方、 None の場合は設定値を使う
+
+        Returns:
+            Path: 実体の保存先パス
+        """
+        layout = layout or self.download_config["layout"]
+        shard_directory = Path() if layout == "flat" else self.get_shard_directory(media, "cid")
+        ext = Path(media.get_filename()).suffix
+        return self.save_base_path / self.BLOB_DIRECTORY_NAME / shard_directory / f"{media.media_id}{ext}"
 
-                response = await client.get(url)
-                response.raise_for_status()
+    def get_blob_lock(self, media_id: str) -> asyncio.Lock:
+        """同じ CID の実体を同時に DL しないためのロックを取得する
 
-                filepath.write_bytes(response.content)
+        Args:
+            media_id (str): 対象の CID
+
+        Returns:
+            asyncio.Lock: CID ごとのロック
+        """
+        if media_id not in self.blob_lock_dict:
+            self.blob_lock_dict[media_id] = asyncio.Lock()
+        return self.blob_lock_dict[media_id]
+
+    def link_file(self, blob_path: Path, filepath: Path) -> None:
+        """実体 blob_path を filepath から参照できるようにする
+
+        link_mode に従ってハードリンクまたはシンボリックリンクを作成する
+        ファイルシステムが対応していないなどでリンクを作成できない場合はコピーする
+
+        Args:
+            blob_path (Path): 実体のパス
+            filepath (Path): 参照元のパス
+        """
+        temp_path = self.get_temp_path(filepath)
+        temp_path.unlink(missing_ok=True)
+        try:
+            if self.download_config["link_mode"] == "hardlink":
+                os.link(blob_path, temp_path)
+            else:
+                # 保存先ごと移動してもリンクが切れないよう相対パスにする
+                os.symlink(os.path.relpath(blob_path, filepath.parent), temp_path)
+        except OSError as e:
+            logger.warning(f"Failed to link, copy instead : {filepath.name} ({e!r}).")
+            shutil.copyfile(blob_path, temp_path)
+        os.replace(temp_path, filepath)
+        self.add_file_index(filepath)
+
+    async def download_media(self, media: Media, client: httpx.AsyncClient, filepath: Path) -> None:
+        """メディアを種類に応じた方法で filepath に DL する
+
+        Args:
+            media (Media): DL 対象のメディア
+            client (httpx.AsyncClient): HTTP クライアント
+            filepath (Path): 保存先のパス
+        """
+        if "image" in media.mime_type:
+            await self.download_image(media, client, filepath)
         elif "video" in media.mime_type:
-            filename = media.get_filename()
-            filepath = self.save_base_path / filename
-            if filepath.exists():
+            await self.download_video(media, client, filepath)
+
+    async def worker(self, media: Media, client: httpx.AsyncClient) -> None:
+        if "image" not in media.mime_type and "video" not in media.mime_type:
+            return
+        filepath = self.get_save_path(media)
+        if self.file_index is None:
+            filepath.parent.mkdir(parents=True, exist_ok=True)
+        filepath = self.resolve_saved_path(media, filepath)
+        filename = filepath.name
+        if self.is_exist_file(filepath):
+            # 保存済のファイルは検証に成功すれば再取得しない
+            if await self.verify_file(media, filepath):
+                # 検証済とするのは実際にサイズ・CID を比較した場合のみ（存在確認だけでは検証済にしない）
+                media.verified = self.is_verifiable(media)
+                return
+            logger.warning(f"Re-download corrupt file : {filename}.")
+            self.remove_file(filepath)
+
+        if not self.download_config["content_addressed"]:
+            # DL した画像は一時ファイルの段階で verify_file を通している
+            await self.download_media(media, client, self.get_save_path(media))
+            media.verified = self.is_verifiable(media)
+            return
+
+        # 実体は CID ごとに1つだけ保存し、保存済の CID であれば DL しない
+        blob_path = self.get_blob_path(media)
+        if self.file_index is None:
+            blob_path.parent.mkdir(parents=True, exist_ok=True)
+        async with self.get_blob_lock(media.media_id):
+            blob_path = self.resolve_saved_path(media, blob_path)
+            if self.is_exist_file(blob_path) and not await self.verify_file(media, blob_path):
+                logger.warning(f"Re-download corrupt blob : {blob_path.name}.")
+                self.remove_file(blob_path)
+            if not self.is_exist_file(blob_path):
+                blob_path = self.get_blob_path(media)
+                await self.download_media(media, client, blob_path)
+                blob_path = self.resolve_saved_path(media, blob_path)
+        # MPEG-TS のまま保存した実体は、参照元の拡張子も .ts にする
+        self.link_file(blob_path, filepath.with_suffix(blob_path.suffix))
+        media.verified = self.is_verifiable(media)
+
+    def remove_empty_directory(self, directory: Path) -> None:
+        """directory から save_base_path の手前まで、空になったフォルダを削除する
+
+        Args:
+            directory (Path): 削除を開始するフォルダ
+        """
+        stop_directory_list = [self.save_base_path, self.save_base_path / self.BLOB_DIRECTORY_NAME]
+        while directory not in stop_directory_list and self.save_base_path in directory.parents:
+            try:
+                directory.rmdir()
+            except OSError:
+                # 空でない
+                return
+            directory = directory.parent
+
+    def relocate(self, media_list: list[Media]) -> int:
+        """保存済のファイルを、現在の layout に従った保存先に移動する
+
+        いずれかの layout の保存先にあるファイルを探して移動する
+        content_addressed の実体も移動し、シンボリックリンクは移動後の実体を参照するように作り直す
+        移動先に既にファイルがある場合は移動しない
+
+        Args:
+            media_list (list[Media]): 対象のメディア
+
+        Returns:
+            int: 移動したファイルの数
+        """
+        moved_num = 0
+
+        def move(candidate_list: list[Path], target_path: Path, blob_path: Path | None = None) -> None:
+            nonlocal moved_num
+            if target_path.exists() or target_path.is_symlink():
+                return
+            for source_path in candidate_list:
+                if source_path == target_path or not (source_path.exists() or source_path.is_symlink()):
+                    continue
+                target_path.parent.mkdir(parents=True, exist_ok=True)
+                if source_path.is_symlink() and blob_path is not None:
+                    # 相対パスのリンクは移動すると参照先がずれるため作り直す
+                    self.link_file(blob_path, target_path)
+                    source_path.unlink()
+                else:
+                    os.replace(source_path, target_path)
+                self.remove_empty_directory(source_path.parent)
+                moved_num += 1
                 return
-            command = [
-                "ffmpeg",
-                "-i",
-                media.url,
-                "-loglevel",
-                "fatal",
-                "-c",
-                "copy",
-                "-bsf:a",
-                "aac_adtstoasc",
-                filepath,
-            ]
-            result = await asyncio.create_subprocess_exec(*command)
-            await result.communicate()
-
-    async def excute(self, media_list: list[Media]) -> None:
-        task_list = [self.worker(media) for media in media_list]
-        await asyncio.gather(*task_list)
-
-    def download(self, media_list: list[Media]) -> None:
+
+        def move_with_ts(media: Media, candidate_list: list[Path], target_path: Path, blob_path: Path | None) -> None:
+            move(candidate_list, target_path, blob_path)
+            if "video" in media.mime_type:
+                # MPEG-TS のまま .ts で保存した動画も移動する
+                move(
+                    [self.get_ts_path(path) for path in candidate_list],
+                    self.get_ts_path(target_path),
+                    self.get_ts_path(blob_path) if blob_path is not None else None,
+                )
+
+        if self.download_config["content_addressed"]:
+            for media in media_list:
+                candidate_list = [self.get_blob_path(media, layout) for layout in LAYOUT_LIST]
+                move_with_ts(media, candidate_list, self.get_blob_path(media), None)
+        for media in media_list:
+            blob_path = self.get_blob_path(media) if self.download_config["content_addressed"] else None
+            candidate_list = [self.get_save_path(media, layout) for layout in LAYOUT_LIST]
+            move_with_ts(media, candidate_list, self.get_save_path(media), blob_path)
+        # 移動したファイルは索引に反映していないため、次回の excute で列挙し直す
+        self.clear_file_index()
+        return moved_num
+
+    async def excute(self, media_list: list[Media], client: httpx.AsyncClient | None = None) -> list[Media]:
+        """media_list のメディアを並行して DL する
+
+        画像と動画はそれぞれのキューに積み、
+        image_concurrency / video_concurrency 個のワーカーがキューの先頭から順に処理する
+        1件の DL に失敗しても他の DL は継続する
+
+        Args:
+            media_list (list[Media]): DL 対象のメディア
+            client (httpx.AsyncClient | None): 使用するクライアント、 None の場合はこの呼び出しの間だけ作成する
+                                               複数回の excute で接続プールを共有する場合に指定する
+
+        Returns:
+            list[Media]: DL に失敗したメディア
+        """
+        # セマフォ・ロックはイベントループごとに作り直す
+        self.host_semaphore_dict = {}
+        self.blob_lock_dict = {}
+        image_queue: asyncio.Queue[Media] = asyncio.Queue()
+        video_queue: asyncio.Queue[Media] = asyncio.Queue()
+        for media in media_list:
+            if "video" in media.mime_type:
+                video_queue.put_nowait(media)
+            else:
+                image_queue.put_nowait(media)
+
+        total_num = len(media_list)
+        progress_step = max(total_num // 10, 1)
+        done_num = 0
+        failed_media_set: set[Media] = set()
+
+        async def consumer(queue: asyncio.Queue[Media], client: httpx.AsyncClient) -> None:
+            nonlocal done_num
+            while not queue.empty():
+                media = queue.get_nowait()
+                try:
+                    await self.worker(media, client)
+                except Exception as e:
+                    logger.warning(f"Download failed : {media.url} ({e!r})")
+                    failed_media_set.add(media)
+                done_num += 1
+                if done_num % progress_step == 0 or done_num == total_num:
+                    logger.info(f"Download progress : {done_num}/{total_num}.")
+
+        # 既存ファイルの確認は、保存先フォルダごとに1回だけ列挙した索引で行う
+        # 索引は excute をまたいで保持し、前回までに列挙していないフォルダのみ列挙する
+        self.update_file_index(media_list)
+        client_context = self.create_client() if client is None else contextlib.nullcontext(client)
+        async with client_context as client:
+            consumer_list = [
+                consumer(image_queue, client) for _ in range(int(self.download_config["image_concurrency"]))
+            ] + [consumer(video_queue, client) for _ in range(int(self.download_config["video_concurrency"]))]
+            await asyncio.gather(*consumer_list)
+        return [media for media in media_list if media in failed_media_set]
+
+    def download(self, media_list: list[Media]) -> list[Media]:
+        """media_list のメディアを DL する
+
+        Args:
+            media_list (list[Media]): DL 対象のメディア
+
+        Returns:
+            list[Media]: DL に失敗したメディア
+        """
         logger.info("Downloader download -> start")
         logger.info(f"Save base path : {str(self.save_base_path)} -> start")
-        asyncio.run(self.excute(media_list))
+        failed_media_list = asyncio.run(self.excute(media_list))
+        if failed_media_list:
+            logger.warning(f"Num of failed media is {len(failed_media_list)}.")
         logger.info("Downloader download -> done")
+        return failed_media_list
 
 
 if __name__ == "__main__":
@@ -0,0 +1,205 @@
+import gzip
+import importlib.util
+import io
+import time
+from collections.abc import Iterable, Iterator
+from datetime import datetime
+from logging import INFO, getLogger
+from pathlib import Path
+from typing import IO
+
+import orjson
+
+logger = getLogger(__name__)
+logger.setLevel(INFO)
+
+# キャッシュ設定の既定値
+# config.json の general.cache で項目ごとに上書きできる
+# codec             : セグメントの圧縮形式、"gzip" または "zstd"（zstd は zstandard がインストールされている場合のみ）
+# compress_level    : 圧縮レベル（gzip は 1~9、zstd は 1~22）、0 の場合は codec ごとの既定値
+# max_segment_bytes : セグメントのサイズがこれを超えたら次の書き込みから新しいセグメントにする
+# retention_days    : 最終更新からこの日数を過ぎたキャッシュファイルを削除する、0 の場合は削除しない
+#                     以前のバージョンの .json キャッシュも対象になるため、既定では削除しない
+DEFAULT_CACHE_CONFIG = {
+    "codec": "gzip",
+    "compress_level": 0,
+    "max_segment_bytes": 16 * 1024 * 1024,
+    "retention_days": 0,
+}
+CACHE_CODEC_LIST = ["gzip", "zstd"]
+SEGMENT_SUFFIX_DICT = {"gzip": ".jsonl.gz", "zstd": ".jsonl.zst"}
+# 書き込み速度を優先した codec ごとの圧縮レベル（どちらも最大レベルの数倍速く、サイズの差は小さい）
+DEFAULT_COMPRESS_LEVEL_DICT = {"gzip": 3, "zstd": 3}
+# 以前のバージョンで作成した、1回の取得結果を丸ごと保存したキャッシュファイル
+LEGACY_CACHE_SUFFIX = ".json"
+
+
+class FeedCache:
+    """fetch したエントリのキャッシュ
+
+    エントリを1行1つの JSON Lines として、圧縮したセグメントファイルに追記する
+    1回の書き込みは1つの gzip メンバー / zstd フレームとなるため、
+    書き込み中に中断しても、それまでに書き込んだエントリは読み込める
+    セグメントのファイル名は作成日時から始まるため、ファイル名順に読めば古い順になる
+    """
+
+    cache_path: Path
+    cache_config: dict
+    codec: str
+
+    def __init__(self, cache_path: Path, cache_config: dict | None = None) -> None:
+        self.cache_path = cache_path
+        self.cache_config = DEFAULT_CACHE_CONFIG | (cache_config or {})
+        self.codec = self.cache_config["codec"]
+        if self.codec not in CACHE_CODEC_LIST:
+            raise ValueError(f"cache codec '{self.codec}' is invalid.")
+        if self.codec == "zstd" and importlib.util.find_spec("zstandard") is None:
+            logger.warning("zstandard is not installed, use gzip for cache instead.")
+            self.codec = "gzip"
+        self.cache_path.mkdir(parents=True, exist_ok=True)
+
+    def get_cache_file_list(self) -> list[Path]:
+        """キャッシュファイルのリストを返す
+
+        以前のバージョンで作成したキャッシュファイルも含む
+
+        Returns:
+            list[Path]: キャッシュファイルのリスト（古い順）
+        """
+        suffix_tuple = (*SEGMENT_SUFFIX_DICT.values(), LEGACY_CACHE_SUFFIX)
+        return sorted(path for path in self.cache_path.glob("*_bluesky.json*") if path.name.endswith(suffix_tuple))
+
+    def get_segment_path(self) -> Path:
+        """次に書き込むセグメントのパスを返す
+
+        最新のキャッシュファイルが現在の codec のセグメントで、
+        max_segment_bytes に達していなければそのセグメントに追記する
+        それ以外の場合は新しいセグメントを作成する
+
+        Returns:
+            Path: 書き込み先のセグメントのパス
+        """
+        suffix = SEGMENT_SUFFIX_DICT[self.codec]
+        cache_file_list = self.get_cache_file_list()
+        if cache_file_list:
+            latest_path = cache_file_list[-1]
+            if latest_path.name.endswith(suffix) and latest_path.stat().st_size < int(
+                self.cache_config["max_segment_bytes"]
+            ):
+                return latest_path
+        date_str = datetime.now().strftime("%Y%m%d%H%M%S")  # YYYYMMDDhhmmss
+        return self.cache_path / f"{date_str}_bluesky{suffix}"
+
+    def compress(self, data: bytes) -> bytes:
+        """codec に従って圧縮する
+
+        Args:
+            data (bytes): 圧縮対象
+
+        Returns:
+            bytes: 圧縮結果（gzip メンバー / zstd フレーム1つ）
+        """
+        level = int(self.cache_config["compress_level"]) or DEFAULT_COMPRESS_LEVEL_DICT[self.codec]
+        if self.codec == "zstd":
+            import zstandard
+
+            return zstandard.ZstdCompressor(level=level).compress(data)
+        return gzip.compress(data, compresslevel=level)
+
+    def open_segment(self, segment_path: Path) -> IO[bytes]:
+        """セグメントを1行ずつ読み込めるように開く
+
+        Args:
+            segment_path (Path): セグメントのパス
+
+        Returns:
+            IO[bytes]: 展開しながら読み込むストリーム
+        """
+        if segment_path.name.endswith(SEGMENT_SUFFIX_DICT["zstd"]):
+            import zstandard
+
+            reader = zstandard.ZstdDecompressor().stream_reader(segment_path.open("rb"), read_across_frames=True)
+            return io.BufferedReader(reader)
+        return gzip.open(segment_path, "rb")
+
+    def append(self, entry_list: Iterable[dict]) -> Path | None:
+        """エントリをセグメントに追記する
+
+        追記後に retention_days を過ぎたキャッシュファイルを削除する
+
+        Args:
+            entry_list (Iterable[dict]): 追記するエントリ（古い順）
+
+        Returns:
+            Path | None: 書き込んだセグメントのパス、エントリが空の場合は None
+        """
+        data = b"".join(orjson.dumps(entry, option=orjson.OPT_APPEND_NEWLINE) for entry in entry_list)
+        if not data:
+            return None
+        segment_path = self.get_segment_path()
+        compressed = self.compress(data)
+        with segment_path.open("ab") as f:
+            f.write(compressed)
+        self.prune()
+        return segment_path
+
+    def replay(self) -> Iterator[dict]:
+        """キャッシュのエントリを古い順に1つずつ返す
+
+        セグメントは展開しながら1行ずつ読み込むため、ファイル全体を読み込むことはない
+        以前のバージョンのキャッシュファイルは1ファイルずつ丸ごと読み込む
+        末尾が壊れているセグメントは、読み込めたところまでを返す
+
+        Yields:
+            dict: エントリ
+        """
+        for cache_file_path in self.get_cache_file_list():
+            if cache_file_path.name.endswith(LEGACY_CACHE_SUFFIX):
+                result = orjson.loads(cache_file_path.read_bytes()).get("result") or {}
+                # 以前のキャッシュファイルは新しい順のため、古い順にする
+                yield from reversed(result.get("feed") or [])
+                continue
+            if cache_file_path.name.endswith(SEGMENT_SUFFIX_DICT["zstd"]) and not importlib.util.find_spec(
+                "zstandard"
+            ):
+                logger.warning(f"zstandard is not installed, skip cache : {cache_file_path.name}.")
+                continue
+            try:
+                with self.open_segment(cache_file_path) as f:
+                    for line in f:
+                        if line.strip():
+                            yield orjson.loads(line)
+            except Exception as e:
+                logger.warning(f"Cache segment is broken, skip the rest : {cache_file_path.name} ({e!r}).")
+
+    def prune(self) -> list[Path]:
+        """最終更新から retention_days を過ぎたキャッシュファイルを削除する
+
+        最新のキャッシュファイル（次の書き込み先）は削除しない
+
+        Returns:
+            list[Path]: 削除したキャッシュファイルのリスト
+        """
+        retention_days = float(self.cache_config["retention_days"])
+        if retention_days <= 0:
+            return []
+        threshold = time.time() - retention_days * 24 * 60 * 60
+        removed_list = []
+        for cache_file_path in self.get_cache_file_list()[:-1]:
+            if cache_file_path.stat().st_mtime < threshold:
+                cache_file_path.unlink(missing_ok=True)
+                removed_list.append(cache_file_path)
+        if removed_list:
+            logger.info(f"Removed {len(removed_list)} expired cache files.")
+        return removed_list
+
+
+if __name__ == "__main__":
+    import logging.config
+
+    logging.config.fileConfig("./log/logging.ini", disable_existing_loggers=False)
+    feed_cache = FeedCache(Path("./cache/"))
+    entry_num = 0
+    for entry in feed_cache.replay():
+        entry_num += 1
+    print(f"{entry_num} entries in {len(feed_cache.get_cache_file_list())} cache files.")
@@ -1,82 +1,304 @@
+import contextlib
+import itertools
+import os
 import pprint
-from datetime import datetime
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
 from logging import INFO, getLogger
 from pathlib import Path
 
 import orjson
 
+from bluesky_crawler.crawler.feed_cache import FeedCache
 from bluesky_crawler.crawler.valueobject.fetched_info import FetchedInfo
-from bluesky_crawler.manager.manager import BlueskyManager
+from bluesky_crawler.manager.manager import BlueskyManager, get_account_list
 from bluesky_crawler.util import find_values
 
 logger = getLogger(__name__)
 logger.setLevel(INFO)
 
+# FetchedInfo 作成時の設定
+# executor       : "serial" なら1プロセスで処理する、"process" ならエントリを複数プロセスで解析する
+# max_workers    : ワーカープロセス数、0 の場合は CPU コア数
+# chunk_size     : 1回でワーカープロセスに渡すエントリ数
+# min_batch_size : このエントリ数未満の場合は executor によらず1プロセスで処理する
+#                  （プロセス起動のコストの方が大きいため）
+DEFAULT_PARSE_CONFIG = {
+    "executor": "serial",
+    "max_workers": 0,
+    "chunk_size": 500,
+    "min_batch_size": 2000,
+}
+PARSE_EXECUTOR_LIST = ["serial", "process"]
+# キャッシュから読み込む際に、まとめて FetchedInfo を作成するエントリ数
+REPLAY_BATCH_SIZE = 10000
+
+
+def parse_entry_list(entry_list: list[dict]) -> list[tuple[dict, dict, list[dict]] | str]:
+    """エントリのリストを FetchedInfo.parse で解析する
+
+    解析できなかったエントリは例外のメッセージを結果とする
+
+    Args:
+        entry_list (list[dict]): エントリのリスト
+
+    Returns:
+        list[tuple[dict, dict, list[dict]] | str]: 解析結果（entry_list と同じ順）
+    """
+    result = []
+    for entry in entry_list:
+        try:
+            result.append(FetchedInfo.parse(entry))
+        except Exception as e:
+            result.append(str(e))
+    return result
+
+
+def parse_chunk(chunk_bytes: bytes) -> bytes:
+    """ワーカープロセスで parse_entry_list を実行する
+
+    ワーカープロセスで実行されるためモジュールのトップレベルに定義する
+    プロセス間の受け渡しは pickle より速い orjson の bytes で行う
+
+    Args:
+        chunk_bytes (bytes): エントリのリストを orjson でエンコードしたもの
+
+    Returns:
+        bytes: parse_entry_list の結果を orjson でエンコードしたもの
+    """
+    return orjson.dumps(parse_entry_list(orjson.loads(chunk_bytes)))
+
 
 class Fetcher:
     manager: BlueskyManager
     is_debug: bool
     cache_path = Path("./cache/")
+    cache: FeedCache
+    latest_post_uri: str | None = None
+    parse_config: dict
+    process_pool: ProcessPoolExecutor | None = None
 
-    def __init__(self, config_path: Path, is_debug: bool = False) -> None:
+    def __init__(self, config_path: Path, is_debug: bool = False, handle_name: str | None = None) -> None:
         logger.info("Fetcher init -> start")
         config_dict = orjson.loads(config_path.read_bytes())
-        self.manager = BlueskyManager(config_dict)
+        self.parse_config = DEFAULT_PARSE_CONFIG | config_dict["general"].get("parse", {})
+        if self.parse_config["executor"] not in PARSE_EXECUTOR_LIST:
+            raise ValueError(f"parse executor '{self.parse_config['executor']}' is invalid.")
+        self.manager = BlueskyManager(config_dict, handle_name)
         self.is_debug = is_debug
 
-        self.cache_path.mkdir(parents=True, exist_ok=True)
+        # 複数アカウントの場合、キャッシュはアカウントごとのフォルダに保存する
+        if len(get_account_list(config_dict)) > 1:
+            self.cache_path = self.cache_path / self.manager.handle_name
+        self.cache = FeedCache(self.cache_path, config_dict["general"].get("cache", {}))
         logger.info("Fetcher init -> done")
 
-    def fetch(self) -> list[FetchedInfo]:
+    def fetch(self, last_post_uri: str | None = None) -> list[FetchedInfo]:
+        """ふぁぼ一覧を取得して FetchedInfo のリストを返す
+
+        last_post_uri が指定された場合は、そのエントリより新しいエントリのみを対象とする
+        取得したエントリのうち最新のものの post uri を latest_post_uri に保持する
+        is_debug の場合は API の代わりにキャッシュのすべてのエントリを対象とする
+
+        Args:
+            last_post_uri (str | None): 前回取得時の最新エントリの post uri
+
+        Returns:
+            list[FetchedInfo]: 取得結果（古い順）
+        """
         logger.info("Fetcher fetch -> start")
-        fetched_entry_list: list[dict] = []
-        if not self.is_debug:
-            logger.info("Fetch from bluesky API -> start")
-            fetched_entry_list = self.manager.get_actor_likes(limit=100)
-            logger.info("Fetch from bluesky API -> done")
-
-            if len(find_values(fetched_entry_list, "feed", True, [""])) > 0:
-                logger.info("Saving Cache -> start")
-                date_str = datetime.now().strftime("%Y%m%d%H%M%S")  # YYYYMMDDhhmmss
-                cache_filename = f"{date_str}_bluesky.json"
-                save_path = self.cache_path / cache_filename
-                save_path.write_bytes(orjson.dumps({"result": fetched_entry_list}, option=orjson.OPT_INDENT_2))
-                logger.info(f"Saved for {str(save_path)}.")
-                logger.info("Saving Cache -> done")
-        else:
-            logger.info("Fetch from cache file -> start")
-            load_paths: list[Path] = [p for p in self.cache_path.glob("*bluesky.json*")]
-            if len(load_paths) == 0:
-                raise ValueError("Cache file is not exist.")
-            load_path: Path = load_paths[-1]
-            fetched_entry_list: list[dict] = orjson.loads(load_path.read_bytes()).get("result")
-            logger.info(f"Loaded from {str(load_path)}.")
-            logger.info("Fetch from cache file -> done")
-
-        # def sort_by_created_at(r: dict) -> datetime:
-        #     try:
-        #         result = datetime.fromisoformat(r["post"]["record"]["created_at"])
-        #     except ValueError | TypeError | KeyError:
-        #         return -1
-        #     return result
-        # post_list.sort(key=sort_by_created_at, reverse=False)
-
-        post_list: list[dict] = find_values(fetched_entry_list, "feed", True, [""])
-        post_list.reverse()
+        if self.is_debug:
+            fetched_info_list = self.replay_cache()
+            logger.info("Fetcher fetch -> done")
+            return fetched_info_list
+
+        post_list: list[dict] = []
+        for page_post_list in self.fetch_iter(last_post_uri):
+            post_list.extend(page_post_list)
+        fetched_info_list = self.create_fetched_info_list(post_list)
+        logger.info("Fetcher fetch -> done")
+        return fetched_info_list
+
+    def fetch_iter(self, last_post_uri: str | None = None) -> Iterator[list[dict]]:
+        """ふぁぼ一覧を1ページ取得するごとにエントリのリストを返す
+
+        対象となるエントリと latest_post_uri は fetch と同じ
+        取得したエントリは、すべてのページを取得し終えた時点で古い順にキャッシュに追記する
+        is_debug の場合は API の代わりにキャッシュから REPLAY_BATCH_SIZE ごとに返す
+
+        Args:
+            last_post_uri (str | None): 前回取得時の最新エントリの post uri
+
+        Yields:
+            list[dict]: 1ページ分のエントリのリスト（新しい順）
+        """
+        if self.is_debug:
+            yield from self.iter_cache()
+            return
+
+        logger.info("Fetch from bluesky API -> start")
+        fetched_post_list: list[dict] = []
+        for page_post_list, _ in self.manager.iter_actor_likes(limit=100, last_post_uri=last_post_uri):
+            if not fetched_post_list and len(page_post_list) > 0:
+                self.latest_post_uri = page_post_list[0].get("post", {}).get("uri", self.latest_post_uri)
+            fetched_post_list.extend(page_post_list)
+            yield page_post_list
+        logger.info("Fetch from bluesky API -> done")
+
+        if len(fetched_post_list) > 0:
+            logger.info("Saving Cache -> start")
+            # キャッシュには古い順に追記する
+            save_path = self.cache.append(reversed(fetched_post_list))
+            logger.info(f"Saved for {str(save_path)}.")
+            logger.info("Saving Cache -> done")
+
+    def iter_cache(self) -> Iterator[list[dict]]:
+        """キャッシュのすべてのエントリを REPLAY_BATCH_SIZE ごとに返す
+
+        最後に返したエントリの post uri を latest_post_uri に保持する
+
+        Yields:
+            list[dict]: エントリのリスト（新しい順）
+        """
+        if len(self.cache.get_cache_file_list()) == 0:
+            raise ValueError("Cache file is not exist.")
+        for entry_batch in itertools.batched(self.cache.replay(), REPLAY_BATCH_SIZE):
+            self.latest_post_uri = entry_batch[-1].get("post", {}).get("uri", self.latest_post_uri)
+            # create_fetched_info_list は新しい順のリストを受け取る
+            yield list(reversed(entry_batch))
 
+    def replay_cache(self) -> list[FetchedInfo]:
+        """キャッシュのすべてのエントリから FetchedInfo のリストを作成する
+
+        キャッシュは1エントリずつ読み込み、REPLAY_BATCH_SIZE ごとに FetchedInfo を作成する
+        最後に読み込んだエントリの post uri を latest_post_uri に保持する
+
+        Returns:
+            list[FetchedInfo]: 作成結果（古い順）
+        """
+        logger.info("Fetch from cache file -> start")
+        fetched_info_list: list[FetchedInfo] = []
+        for post_list in self.iter_cache():
+            fetched_info_list.extend(self.create_fetched_info_list(post_list))
+        logger.info(f"Loaded from {str(self.cache.cache_path)}.")
+        logger.info("Fetch from cache file -> done")
+        return fetched_info_list
+
+    def fetch_page(self, cursor: str | None = None) -> tuple[list[FetchedInfo], str | None]:
+        """ふぁぼ一覧を1ページ分取得して FetchedInfo のリストを返す
+
+        cursor が None の場合（最新のページ）は、最新エントリの post uri を latest_post_uri に保持する
+
+        Args:
+            cursor (str | None): 取得開始位置、None の場合は最新のページ
+
+        Returns:
+            tuple[list[FetchedInfo], str | None]: (取得結果（古い順）, 次のページの cursor)
+                                                  次のページが存在しない場合 cursor は None
+        """
+        response = self.manager.get_actor_likes_page(cursor, limit=100)
+        post_list: list[dict] = find_values(response, "feed", True, [""])
+        if cursor is None and len(post_list) > 0:
+            self.latest_post_uri = post_list[0].get("post", {}).get("uri", self.latest_post_uri)
+        next_cursor = response.get("cursor") if len(post_list) > 0 else None
+        return self.create_fetched_info_list(post_list), next_cursor
+
+    def get_parse_batch_size(self) -> int:
+        """ページ単位で取得したエントリを、まとめて解析するエントリ数を返す
+
+        executor が "process" の場合は、ワーカープロセスで解析できるよう min_batch_size 件までまとめる
+
+        Returns:
+            int: まとめて解析するエントリ数、 1 の場合はページごとに解析する
+        """
+        if self.parse_config["executor"] == "process":
+            return max(int(self.parse_config["min_batch_size"]), 1)
+        return 1
+
+    def create_fetched_info_list(self, post_list: list[dict]) -> list[FetchedInfo]:
+        """エントリのリストから FetchedInfo のリストを作成する
+
+        メディアを含まないなど、解析できなかったエントリは除外する
+        parse_config の executor が "process" かつエントリ数が min_batch_size 以上の場合は、
+        辞書解析をワーカープロセスで行い、モデルのインスタンス作成のみをこのプロセスで行う
+        （モデルのインスタンスはプロセス間で受け渡すコストの方が作成するコストより大きいため）
+
+        Args:
+            post_list (list[dict]): エントリのリスト（新しい順）
+
+        Returns:
+            list[FetchedInfo]: 作成結果（古い順）
+        """
         logger.info("Create FetchedInfo -> start")
+        entry_list = list(reversed(post_list))
+        min_batch_size = int(self.parse_config["min_batch_size"])
+        if self.parse_config["executor"] == "process" and len(entry_list) >= min_batch_size:
+            parsed_iter = self.parse_in_process_pool(entry_list)
+        else:
+            parsed_iter = iter(parse_entry_list(entry_list))
+
         fetched_info_list = []
-        for entry in post_list:
+        for parsed in parsed_iter:
+            if isinstance(parsed, str):
+                logger.debug(parsed)
+                continue
             try:
-                fetched_info = FetchedInfo.create(entry)
+                fetched_info = FetchedInfo.build(parsed)
             except Exception as e:
                 logger.debug(e)
                 continue
             fetched_info_list.append(fetched_info)
         logger.info("Create FetchedInfo -> done")
-        logger.info("Fetcher fetch -> done")
         return fetched_info_list
 
+    @contextlib.contextmanager
+    def reuse_process_pool(self) -> Iterator[None]:
+        """with の間、 parse_in_process_pool で使うワーカープロセスのプールを使い回す
+
+        ページをまとめて何回も解析する場合に、解析ごとのプロセス起動のコストを避ける
+        executor が "process" でない場合、既にプールを使い回している場合は何もしない
+
+        Yields:
+            None: プールを使い回す区間
+        """
+        if self.parse_config["executor"] != "process" or self.process_pool is not None:
+            yield
+            return
+        max_workers = int(self.parse_config["max_workers"]) or os.cpu_count() or 1
+        self.process_pool = ProcessPoolExecutor(max_workers=max_workers)
+        try:
+            yield
+        finally:
+            self.process_pool.shutdown()
+            self.process_pool = None
+
+    def parse_in_process_pool(self, entry_list: list[dict]) -> Iterator[tuple[dict, dict, list[dict]] | str]:
+        """エントリのリストを chunk_size ごとに分割し、ワーカープロセスで解析する
+
+        解析が終わった chunk から順に結果を返すため、
+        呼び出し側でのインスタンス作成と後続の chunk の解析が並行して進む
+        reuse_process_pool の間はそのプールを使い、それ以外は呼び出しごとにプールを作成する
+
+        Args:
+            entry_list (list[dict]): エントリのリスト
+
+        Yields:
+            tuple[dict, dict, list[dict]] | str: 解析結果（entry_list と同じ順）
+        """
+        chunk_size = max(int(self.parse_config["chunk_size"]), 1)
+        chunk_list = [orjson.dumps(entry_list[i : i + chunk_size]) for i in range(0, len(entry_list), chunk_size)]
+        if self.process_pool is not None:
+            pool_context = contextlib.nullcontext(self.process_pool)
+            logger.info(f"Parse {len(entry_list)} entries in reused process pool.")
+        else:
+            max_workers = min(int(self.parse_config["max_workers"]) or os.cpu_count() or 1, len(chunk_list))
+            pool_context = ProcessPoolExecutor(max_workers=max_workers)
+            logger.info(f"Parse {len(entry_list)} entries in {max_workers} processes.")
+        with pool_context as executor:
+            # map は chunk_list と同じ順で結果を返す
+            for parsed_chunk in executor.map(parse_chunk, chunk_list):
+                yield from orjson.loads(parsed_chunk)
+
 
 if __name__ == "__main__":
     import logging.config
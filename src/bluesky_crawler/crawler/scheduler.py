@@ -0,0 +1,167 @@
+import asyncio
+import random
+import signal
+import time
+from logging import INFO, getLogger
+from pathlib import Path
+
+import orjson
+
+from bluesky_crawler.crawler.crawler import Crawler
+
+logger = getLogger(__name__)
+logger.setLevel(INFO)
+
+# 常駐実行時の設定
+# config.json の general.daemon で項目ごとに上書きできる
+# interval       : 新しいふぁぼがあった場合の次の実行までの待機時間 [sec]
+# max_interval   : 待機時間の上限 [sec]
+# backoff_factor : 新しいふぁぼがなかった場合・失敗した場合に待機時間に掛ける倍率
+# jitter         : 待機時間をこの割合の範囲でランダムに増減させる（0 の場合は増減させない）
+# min_remaining  : ふぁぼ一覧の取得のレート制限の残り回数がこれ以下の場合は、制限の期間が切り替わるまで待機する
+DEFAULT_DAEMON_CONFIG = {
+    "interval": 300,
+    "max_interval": 3600,
+    "backoff_factor": 2.0,
+    "jitter": 0.1,
+    "min_remaining": 10,
+}
+
+
+class Scheduler:
+    """Crawler を1つのプロセスで定期的に実行する
+
+    Crawler（ログイン済のセッションと DB エンジン）と DL 用のクライアントは実行をまたいで使い回す
+    新しいふぁぼがなかった場合は待機時間を backoff_factor 倍ずつ max_interval まで延ばし、
+    新しいふぁぼがあった場合は interval に戻す
+    ふぁぼ一覧の取得のレート制限の残りが少ない場合は、制限の期間が切り替わるまで次の実行を遅らせる
+    SIGINT / SIGTERM を受け取った場合は、実行中のクロールが終わってから停止する
+    """
+
+    crawler: Crawler
+    daemon_config: dict
+    current_interval: float
+    stop_event: asyncio.Event | None = None
+    config_path: Path = Path("./config/config.json")
+
+    def __init__(self, crawler: Crawler) -> None:
+        config_dict = orjson.loads(self.config_path.read_bytes())
+        self.crawler = crawler
+        self.daemon_config = DEFAULT_DAEMON_CONFIG | config_dict["general"].get("daemon", {})
+        interval = float(self.daemon_config["interval"])
+        if interval <= 0:
+            raise ValueError(f"daemon interval '{self.daemon_config['interval']}' is invalid.")
+        if float(self.daemon_config["max_interval"]) < interval:
+            raise ValueError(f"daemon max_interval '{self.daemon_config['max_interval']}' is invalid.")
+        if float(self.daemon_config["backoff_factor"]) < 1:
+            raise ValueError(f"daemon backoff_factor '{self.daemon_config['backoff_factor']}' is invalid.")
+        if not 0 <= float(self.daemon_config["jitter"]) < 1:
+            raise ValueError(f"daemon jitter '{self.daemon_config['jitter']}' is invalid.")
+        if int(self.daemon_config["min_remaining"]) < 0:
+            raise ValueError(f"daemon min_remaining '{self.daemon_config['min_remaining']}' is invalid.")
+        self.current_interval = interval
+
+    def next_interval(self, media_num: int | None) -> float:
+        """次の実行までの待機時間を返す
+
+        Args:
+            media_num (int | None): 今回新規にDLしたメディアの数、失敗した場合は None
+
+        Returns:
+            float: 待機時間 [sec]
+        """
+        if media_num:
+            self.current_interval = float(self.daemon_config["interval"])
+        else:
+            self.current_interval = min(
+                self.current_interval * float(self.daemon_config["backoff_factor"]),
+                float(self.daemon_config["max_interval"]),
+            )
+        jitter = float(self.daemon_config["jitter"])
+        return self.current_interval * random.uniform(1 - jitter, 1 + jitter)
+
+    def get_rate_limit_wait_time(self) -> float:
+        """レート制限の残りが min_remaining 以下のアカウントがあれば、制限の期間が切り替わるまでの時間を返す
+
+        Returns:
+            float: 待機時間 [sec]、残りが十分にある場合は 0
+        """
+        wait_time = 0.0
+        for budget in self.crawler.get_rate_limit_budget_list():
+            if budget.remaining <= int(self.daemon_config["min_remaining"]):
+                wait_time = max(wait_time, budget.reset_at - time.time())
+        return wait_time
+
+    def stop(self) -> None:
+        """常駐実行を停止する（実行中のクロールは最後まで行う）"""
+        logger.info("Stop requested.")
+        if self.stop_event is not None:
+            self.stop_event.set()
+
+    def install_signal_handler(self) -> None:
+        """SIGINT / SIGTERM で stop を呼ぶようにする
+
+        イベントループのシグナルハンドラが使えない環境（Windows）では signal.signal で登録する
+        """
+        loop = asyncio.get_running_loop()
+        for signal_num in [signal.SIGINT, signal.SIGTERM]:
+            try:
+                loop.add_signal_handler(signal_num, self.stop)
+            except (NotImplementedError, RuntimeError):
+                signal.signal(signal_num, lambda signum, frame: loop.call_soon_threadsafe(self.stop))
+
+    async def wait(self, interval: float) -> bool:
+        """interval 秒か、停止が要求されるまで待機する
+
+        Args:
+            interval (float): 待機時間 [sec]
+
+        Returns:
+            bool: 停止が要求された場合 True
+        """
+        try:
+            await asyncio.wait_for(self.stop_event.wait(), timeout=interval)
+        except TimeoutError:
+            pass
+        return self.stop_event.is_set()
+
+    async def run_forever(self) -> int:
+        """停止が要求されるまで、待機を挟みながらクロールを繰り返す
+
+        1回のクロールが失敗した場合はログに記録し、待機時間を延ばして次の実行で再試行する
+
+        Returns:
+            int: 実行したクロールの回数
+        """
+        self.stop_event = asyncio.Event()
+        self.install_signal_handler()
+        cycle_num = 0
+        async with self.crawler.downloader.create_client() as client:
+            while not self.stop_event.is_set():
+                cycle_num += 1
+                logger.info(f"Crawl cycle {cycle_num} -> start")
+                try:
+                    media_num = await self.crawler.crawl(client)
+                except Exception:
+                    logger.exception(f"Crawl cycle {cycle_num} failed.")
+                    media_num = None
+                interval = self.next_interval(media_num)
+                rate_limit_wait_time = self.get_rate_limit_wait_time()
+                if rate_limit_wait_time > interval:
+                    logger.info("Rate limit budget is low, wait until it is reset.")
+                    interval = rate_limit_wait_time
+                logger.info(f"Crawl cycle {cycle_num} -> done, next crawl after {interval:.1f} [sec].")
+                if await self.wait(interval):
+                    break
+        return cycle_num
+
+    def run(self) -> int:
+        """常駐実行する
+
+        Returns:
+            int: 実行したクロールの回数
+        """
+        logger.info("Scheduler run -> start")
+        cycle_num = asyncio.run(self.run_forever())
+        logger.info("Scheduler run -> done")
+        return cycle_num
@@ -0,0 +1,207 @@
+from dataclasses import dataclass
+from typing import Any, Self
+
+# API のレスポンス JSON をそのまま読み込んだ場合（raw モード）のキー名
+# model_dump したデータではスネークケース、生の JSON ではキャメルケースになる
+RAW_KEY_DICT = {
+    "display_name": "displayName",
+    "created_at": "createdAt",
+    "mime_type": "mimeType",
+}
+# 生の JSON のエントリのうち FeedEntry.create が参照するキーの木
+# 値が None のキーは値をそのまま残し、辞書のキーはその配下をさらに絞り込む（リストは要素ごとに絞り込む）
+# FeedEntry.create で参照する値を変えた場合はこの木も更新する
+RAW_ENTRY_KEY_TREE = {
+    "post": {
+        "uri": None,
+        "author": {"did": None, "handle": None, "displayName": None, "avatar": None},
+        "record": {
+            "createdAt": None,
+            "text": None,
+            "embed": {
+                "images": {"image": {"mimeType": None, "size": None}, "mimeType": None, "size": None},
+                "video": {"mimeType": None, "size": None},
+                "mimeType": None,
+                "size": None,
+            },
+        },
+        "embed": {"images": {"fullsize": None, "alt": None}, "playlist": None, "alt": None},
+    },
+}
+
+
+def prune_raw_entry(obj: Any, key_tree: dict | None = None) -> Any:
+    """生の JSON のエントリから FeedEntry.create が参照する値だけを残した辞書を返す
+
+    raw モードで取得したページの辞書全体を保持しないよう、1ページ取得するごとに絞り込む
+
+    Args:
+        obj (Any): 対象の辞書（エントリ）、またはその配下の値
+        key_tree (dict | None): 残すキーの木、None の場合は RAW_ENTRY_KEY_TREE
+
+    Returns:
+        Any: 絞り込んだ辞書、辞書・リスト以外の値はそのまま返す
+    """
+    key_tree = RAW_ENTRY_KEY_TREE if key_tree is None else key_tree
+    if isinstance(obj, list):
+        return [prune_raw_entry(value, key_tree) for value in obj]
+    if not isinstance(obj, dict):
+        return obj
+    return {
+        key: obj[key] if child_tree is None else prune_raw_entry(obj[key], child_tree)
+        for key, child_tree in key_tree.items()
+        if key in obj
+    }
+
+
+def get_value(obj: Any, key: str) -> Any:
+    """obj 直下の key に対応する値を取得する
+
+    key が見つからない場合は、生の JSON でのキー名（RAW_KEY_DICT）でも探す
+
+    Args:
+        obj (Any): 対象の辞書
+        key (str): キー（スネークケース）
+
+    Returns:
+        Any: key に対応する値、値が None の場合もそのまま返す
+    """
+    if isinstance(obj, dict):
+        if key in obj:
+            return obj[key]
+        if (raw_key := RAW_KEY_DICT.get(key)) in obj:
+            return obj[raw_key]
+    raise ValueError(f"value of key='{key}' is not found.")
+
+
+def get_optional_value(obj: Any, key: str) -> Any:
+    """obj 直下の省略可能な key に対応する値を取得する
+
+    生の JSON では値のない省略可能なフィールドはキーごと省略されるため、
+    キーが見つからない場合は None を返す
+
+    Args:
+        obj (Any): 対象の辞書
+        key (str): キー（スネークケース）
+
+    Returns:
+        Any: key に対応する値、見つからない場合は None
+    """
+    if not isinstance(obj, dict):
+        raise ValueError(f"value of key='{key}' is not found.")
+    if key in obj:
+        return obj[key]
+    return obj.get(RAW_KEY_DICT.get(key))
+
+
+def get_one_value(obj: Any, key: str, child_key: str) -> Any:
+    """obj 直下、または obj[child_key] 直下の key に対応する値を1つだけ取得する
+
+    record 配下の embed では mime_type と size が image / video の下にあるため、
+    両方を探して1つだけ見つかることを確認する
+    生の JSON でのキー名（RAW_KEY_DICT）でも探す
+
+    Args:
+        obj (Any): 対象の辞書
+        key (str): キー（スネークケース）
+        child_key (str): key を探す子の辞書のキー
+
+    Returns:
+        Any: key に対応する値
+    """
+    if not isinstance(obj, dict):
+        raise ValueError(f"value of key='{key}' is not found.")
+    key_list = [key, RAW_KEY_DICT[key]] if key in RAW_KEY_DICT else [key]
+    result = []
+    child_dict = obj.get(child_key)
+    for target_key in key_list:
+        if target_key in obj:
+            result.append(obj[target_key])
+        if isinstance(child_dict, dict) and target_key in child_dict:
+            result.append(child_dict[target_key])
+    if len(result) == 0:
+        raise ValueError(f"value of key='{key}' is not found.")
+    if len(result) > 1:
+        raise ValueError(f"values of key='{key}' are multiple found.")
+    return result[0]
+
+
+@dataclass(frozen=True)
+class FeedMedia:
+    url: str
+    alt_text: str
+    mime_type: str
+    size: int
+
+
+@dataclass(frozen=True)
+class FeedEntry:
+    uri: str
+    did: str
+    handle: str
+    display_name: str | None
+    avatar: str | None
+    created_at: str
+    text: str
+    media_list: list[FeedMedia]
+
+    @classmethod
+    def create(cls, fetched_dict: dict) -> Self:
+        """fetch データの1レコードから必要な値だけを取り出す
+
+        辞書の構造をたどるのは1回のみで、それぞれの値は決まった位置から直接取り出す
+        model_dump したデータ（スネークケース）と生の JSON（キャメルケース）の両方を受け付ける
+        fetch データの辞書構造が変わった・取得情報の参照元が変わった場合はこのメソッドを更新する
+
+        Args:
+            fetched_dict (dict): fetch したデータ辞書の1レコード
+
+        Returns:
+            Self: FeedEntry インスタンス
+        """
+        post_dict = get_value(fetched_dict, "post")
+        author_dict = get_value(post_dict, "author")
+        record_dict = get_value(post_dict, "record")
+
+        # post 直下の embed (直リンクとaltテキストが含まれる)と
+        # record 配下の embed (mime_type と size が含まれる)の両方からメディアを取り出す
+        embed_dict = post_dict.get("embed")
+        record_embed_dict = record_dict.get("embed")
+        media_list: list[FeedMedia] = []
+        if isinstance(embed_dict, dict) and isinstance(record_embed_dict, dict):
+            if "images" in embed_dict and "images" in record_embed_dict:
+                # 画像
+                for image_dict_1, image_dict_2 in zip(embed_dict["images"], record_embed_dict["images"]):
+                    media_list.append(
+                        FeedMedia(
+                            get_value(image_dict_1, "fullsize"),
+                            get_value(image_dict_1, "alt"),
+                            get_one_value(image_dict_2, "mime_type", "image"),
+                            get_one_value(image_dict_2, "size", "image"),
+                        )
+                    )
+            elif "playlist" in embed_dict:
+                # 動画
+                media_list.append(
+                    FeedMedia(
+                        embed_dict["playlist"],
+                        get_optional_value(embed_dict, "alt") or "",
+                        get_one_value(record_embed_dict, "mime_type", "video"),
+                        get_one_value(record_embed_dict, "size", "video"),
+                    )
+                )
+            else:
+                raise ValueError("Like entry has no media.")
+        else:
+            raise ValueError("Like entry has no media.")
+
+        return cls(
+            get_value(post_dict, "uri"),
+            get_value(author_dict, "did"),
+            get_value(author_dict, "handle"),
+            get_optional_value(author_dict, "display_name"),
+            get_optional_value(author_dict, "avatar"),
+            get_value(record_dict, "created_at"),
+            get_value(record_dict, "text"),
+            media_list,
+        )
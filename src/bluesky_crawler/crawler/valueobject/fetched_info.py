@@ -5,10 +5,9 @@ from datetime import datetime
 from pathlib import Path
 from typing import Self
 
-import orjson
-
+from bluesky_crawler.crawler.valueobject.feed_entry import FeedEntry
 from bluesky_crawler.db.model import Like, Media, User
-from bluesky_crawler.util import find_values, to_jst
+from bluesky_crawler.util import to_jst
 
 
 @dataclass(frozen=True)
@@ -55,8 +54,7 @@ class FetchedInfo:
     def create(cls, fetched_dict: dict) -> Self:
         """fetched_info インスタンスを作成する
 
-        fetch データの辞書解析を行う
-        fetch データの辞書構造が変わった・取得情報の参照元が変わった場合はこのメソッドを更新する
+        fetch データの辞書解析（parse）とモデルのインスタンス作成（build）を続けて行う
 
         Args:
             fetched_dict (dict): fetch したデータ辞書の1レコード
@@ -64,6 +62,38 @@ class FetchedInfo:
         Returns:
             Self: fetched_info インスタンス
         """
+        return cls.build(cls.parse(fetched_dict))
+
+    @classmethod
+    def build(cls, parsed: tuple[dict, dict, list[dict]]) -> Self:
+        """parse の結果から fetched_info インスタンスを作成する
+
+        Args:
+            parsed (tuple[dict, dict, list[dict]]): parse の結果
+
+        Returns:
+            Self: fetched_info インスタンス
+        """
+        like_dict, user_dict, media_dict_list = parsed
+        like = Like.create(like_dict)
+        user = User.create(user_dict)
+        media_list = [Media.create(media_dict) for media_dict in media_dict_list]
+        return cls(like, user, media_list)
+
+    @staticmethod
+    def parse(fetched_dict: dict) -> tuple[dict, dict, list[dict]]:
+        """fetch データの辞書解析を行う
+
+        モデルのインスタンスは作成せず、Like, User, Media の create に渡す辞書を返す
+        返り値は組み込み型のみのため、プロセス間で受け渡すことができる
+        fetch データの辞書構造が変わった・取得情報の参照元が変わった場合はこのメソッドを更新する
+
+        Args:
+            fetched_dict (dict): fetch したデータ辞書の1レコード
+
+        Returns:
+            tuple[dict, dict, list[dict]]: (like の辞書, user の辞書, media の辞書のリスト)
+        """
 
         def normalize_date_at(date_at_str: str) -> str:
             """日時文字列を日本時間に変換する
@@ -82,123 +112,70 @@ class FetchedInfo:
         # 採用する登録日時を取得
         registered_at = datetime.now().isoformat()
         # fetch データの辞書解析
-        post_dict = find_values(fetched_dict, "post", True, [""])
-        author_dict = find_values(post_dict, "author", True, [""])
-        record_dict = find_values(post_dict, "record", True, [""])
-
-        # メディアが含まれる部分を抽出する
-        embed_dict, record_embed_dict = {}, {}
-        media_list_1, media_list_2 = [], []
-        is_no_image, is_no_video = False, False
-        try:
-            # 画像を含むか調べる
-            # post 直下の embed (直リンクとaltテキストが含まれる)と
-            # record 配下の embed (mime_type と size が含まれる)がそれぞれ存在するか確認する
-            embed_dict = find_values(post_dict, "embed", True, [""])
-            record_embed_dict = find_values(record_dict, "embed", True, [""])
-            media_list_1 = find_values(embed_dict, "images", True, [""])
-            media_list_2 = find_values(record_embed_dict, "images", True, [""])
-        except ValueError:
-            # 画像は含まれていなかった
-            is_no_image = True
-
-        if is_no_image:
-            # 動画を含むか調べる
-            try:
-                # post 直下の embed
-                embed_dict = find_values(post_dict, "embed", True, [""])
-                record_embed_dict = find_values(record_dict, "embed", True, [""])
-                playlist = find_values(embed_dict, "playlist", True, [""])
-                alt_text = find_values(embed_dict, "alt", True, [""])
-                mime_type = find_values(record_embed_dict, "mime_type", True, ["video"])
-                size = find_values(record_embed_dict, "size", True, ["video"])
-
-                alt_text = alt_text if alt_text else ""
-                media_list_1 = [{"fullsize": playlist, "alt": alt_text}]
-                media_list_2 = [{"mime_type": mime_type, "size": size}]
-            except ValueError:
-                # 動画は含まれていなかった
-                is_no_video = True
-
-        if is_no_image and is_no_video:
-            # メディアが含まれていなかった → エラー
-            raise ValueError("Like entry has no media.")
+        # 必要な値は FeedEntry で1回の走査でまとめて取り出す
+        entry = FeedEntry.create(fetched_dict)
 
         # post 情報から post_id と created_at を抽出する
-        uri: str = find_values(post_dict, "uri", True, [""])
-        post_id = uri.split(r"/")[-1]
-        post_created_at = normalize_date_at(find_values(record_dict, "created_at", True, [""]))
+        post_id = entry.uri.split(r"/")[-1]
+        post_created_at = normalize_date_at(entry.created_at)
 
         # author 情報から username を抽出する
-        user_username = find_values(author_dict, "handle", True, [""])
-
-        # media_list 作成
-        media_list = []
-        zipped_media_list = zip(media_list_1, media_list_2)
-        for index, zipped_media in enumerate(zipped_media_list):
-            media_dict_1, media_dict_2 = zipped_media
-            media_url: str = find_values(media_dict_1, "fullsize", True, [""])
-            media_alt_text = find_values(media_dict_1, "alt", True, [""])
+        user_username = entry.handle
+
+        # media の辞書のリスト作成
+        media_dict_list = []
+        for index, feed_media in enumerate(entry.media_list):
+            media_url = feed_media.url
             media_id = (
                 re.findall(r"^.*/(.+)/playlist.m3u8$", media_url)
                 if "playlist.m3u8" in media_url
                 else re.findall(r"^.*/(.+)@.*?$", media_url)
             )
             media_id = media_id[0]
-            media_mime_type = find_values(media_dict_2, "mime_type", True)
-            media_size = find_values(media_dict_2, "size", True)
-            media_created_at = post_created_at
-            media = Media.create({
+            media_dict_list.append({
                 "post_id": post_id,
                 "media_id": media_id,
                 "media_index": index + 1,
                 "username": user_username,
-                "alt_text": media_alt_text,
-                "mime_type": media_mime_type,
-                "size": media_size,
+                "alt_text": feed_media.alt_text,
+                "mime_type": feed_media.mime_type,
+                "size": feed_media.size,
                 "url": media_url,
-                "created_at": media_created_at,
+                "created_at": post_created_at,
                 "registered_at": registered_at,
             })
-            media_list.append(media)
 
-        # like 作成
-        user_id = find_values(author_dict, "did", True, [""])
+        # like の辞書作成
+        user_id = entry.did
         post_url = f"https://bsky.app/profile/{user_username}/post/{post_id}"
-        post_text = find_values(record_dict, "text", True, [""])
-        like = Like.create({
+        like_dict = {
             "post_id": post_id,
             "user_id": user_id,
             "url": post_url,
-            "text": post_text,
+            "text": entry.text,
             "created_at": post_created_at,
             "registered_at": registered_at,
-        })
+        }
 
-        # user 作成
-        user_name = find_values(author_dict, "display_name", True, [""]) or user_username
-        user_avatar_url = find_values(author_dict, "avatar", True, [""])
-        user = User.create({
+        # user の辞書作成
+        user_name = entry.display_name or user_username
+        user_dict = {
             "user_id": user_id,
             "name": user_name,
             "username": user_username,
-            "avatar_url": user_avatar_url,
+            "avatar_url": entry.avatar,
             "registered_at": registered_at,
-        })
-
-        # FetchedInfo インスタンス作成
-        return FetchedInfo(like, user, media_list)
+        }
+        return like_dict, user_dict, media_dict_list
 
 
 if __name__ == "__main__":
-    cache_path = Path("./cache/")
-    load_paths: list[Path] = [p for p in cache_path.glob("*bluesky.json*")]
-    if len(load_paths) == 0:
+    from bluesky_crawler.crawler.feed_cache import FeedCache
+
+    feed_cache = FeedCache(Path("./cache/"))
+    if len(feed_cache.get_cache_file_list()) == 0:
         pprint.pprint("Cache file is not exist.")
         exit(-1)
-    load_path: Path = load_paths[-1]
-    fetched_entry_list: list[dict] = orjson.loads(load_path.read_bytes()).get("result")
-    fetched_entry_list = fetched_entry_list["feed"]
-    for entry in fetched_entry_list[:3]:
+    for entry, _ in zip(feed_cache.replay(), range(3)):
         fetched_info = FetchedInfo.create(entry)
         pprint.pprint(fetched_info)
@@ -0,0 +1,171 @@
+import re
+from dataclasses import dataclass
+from typing import Self
+from urllib.parse import urljoin
+
+
+def parse_attribute_list(attribute_text: str) -> dict[str, str]:
+    """HLS タグの属性リストを辞書にする
+
+    例: 'BANDWIDTH=1280000,RESOLUTION=1280x720,CODECS="avc1.64001f,mp4a.40.2"'
+
+    Args:
+        attribute_text (str): タグの ":" 以降の文字列
+
+    Returns:
+        dict[str, str]: {属性名: 値}、値を囲む引用符は取り除く
+    """
+    result: dict[str, str] = {}
+    for name, value in re.findall(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)', attribute_text):
+        result[name] = value.strip('"')
+    return result
+
+
+@dataclass(frozen=True)
+class HlsVariant:
+    url: str
+    bandwidth: int
+    resolution: int
+
+    def __post_init__(self) -> None:
+        """引数チェック
+
+        Raises:
+            ValueError: url が空文字列
+            ValueError: bandwidth が0未満
+            ValueError: resolution が0未満
+        """
+        if not (isinstance(self.url, str) and self.url != ""):
+            raise ValueError("Argument url is invalid.")
+        if not (isinstance(self.bandwidth, int) and self.bandwidth >= 0):
+            raise ValueError("Argument bandwidth is invalid.")
+        if not (isinstance(self.resolution, int) and self.resolution >= 0):
+            raise ValueError("Argument resolution is invalid.")
+
+
+@dataclass(frozen=True)
+class HlsPlaylist:
+    variant_list: list[HlsVariant]
+    init_url: str | None
+    segment_url_list: list[str]
+
+    def __post_init__(self) -> None:
+        """引数チェック
+
+        マスタープレイリスト（variant_list のみ）と
+        メディアプレイリスト（segment_url_list のみ）のどちらかであることを確認する
+
+        Raises:
+            ValueError: variant_list と segment_url_list が両方空、または両方空でない
+        """
+        if not isinstance(self.variant_list, list) or not isinstance(self.segment_url_list, list):
+            raise ValueError("Argument variant_list or segment_url_list is not list.")
+        if bool(self.variant_list) == bool(self.segment_url_list):
+            raise ValueError("Playlist must have either variants or segments.")
+
+    def is_master(self) -> bool:
+        """マスタープレイリストか
+
+        Returns:
+            bool: マスタープレイリストなら True
+        """
+        return bool(self.variant_list)
+
+    def is_fmp4(self) -> bool:
+        """セグメントが fMP4 か
+
+        EXT-X-MAP で初期化セグメントが指定されている場合は fMP4 とみなし、
+        それ以外は MPEG-TS とみなす
+
+        Returns:
+            bool: fMP4 なら True
+        """
+        return self.init_url is not None
+
+    def select_variant(self, rendition: str = "highest") -> HlsVariant:
+        """マスタープレイリストからレンディションを選択する
+
+        解像度、帯域幅の順に比較する
+
+        Args:
+            rendition (str): "highest" なら最高画質、"lowest" なら最低画質を選択する
+
+        Returns:
+            HlsVariant: 選択したレンディション
+        """
+        if not self.is_master():
+            raise ValueError("Playlist is not master playlist.")
+        if rendition not in ["highest", "lowest"]:
+            raise ValueError(f"rendition '{rendition}' is invalid.")
+        sorted_variant_list = sorted(self.variant_list, key=lambda v: (v.resolution, v.bandwidth))
+        return sorted_variant_list[-1] if rendition == "highest" else sorted_variant_list[0]
+
+    @classmethod
+    def create(cls, playlist_text: str, base_url: str) -> Self:
+        """HlsPlaylist インスタンスを作成する
+
+        プレイリスト内の相対 url は base_url を基準に解決する
+        暗号化されたセグメント、バイトレンジ指定のセグメント、
+        音声が別レンディションになっているプレイリストは対応しない
+
+        Args:
+            playlist_text (str): m3u8 プレイリストの内容
+            base_url (str): プレイリストの url
+
+        Returns:
+            Self: HlsPlaylist インスタンス
+        """
+        line_list = [line.strip() for line in playlist_text.splitlines() if line.strip() != ""]
+        if not line_list or line_list[0] != "#EXTM3U":
+            raise ValueError("Playlist is not m3u8.")
+
+        variant_list: list[HlsVariant] = []
+        init_url: str | None = None
+        segment_url_list: list[str] = []
+        stream_inf: dict[str, str] | None = None
+        for line in line_list[1:]:
+            tag, _, attribute_text = line.partition(":")
+            match tag:
+                case "#EXT-X-STREAM-INF":
+                    stream_inf = parse_attribute_list(attribute_text)
+                case "#EXT-X-MEDIA":
+                    if "URI" in parse_attribute_list(attribute_text):
+                        raise ValueError("Separate media rendition is not supported.")
+                case "#EXT-X-KEY":
+                    if parse_attribute_list(attribute_text).get("METHOD", "NONE") != "NONE":
+                        raise ValueError("Encrypted segment is not supported.")
+                case "#EXT-X-BYTERANGE":
+                    raise ValueError("Byte range segment is not supported.")
+                case "#EXT-X-MAP":
+                    attribute_dict = parse_attribute_list(attribute_text)
+                    if "BYTERANGE" in attribute_dict:
+                        raise ValueError("Byte range segment is not supported.")
+                    init_url = urljoin(base_url, attribute_dict["URI"])
+                case _ if line.startswith("#"):
+                    pass
+                case _:
+                    url = urljoin(base_url, line)
+                    if stream_inf is not None:
+                        width, _, height = stream_inf.get("RESOLUTION", "0x0").partition("x")
+                        resolution = int(width or 0) * int(height or 0)
+                        bandwidth = int(stream_inf.get("BANDWIDTH", 0))
+                        variant_list.append(HlsVariant(url, bandwidth, resolution))
+                        stream_inf = None
+                    else:
+                        segment_url_list.append(url)
+        return cls(variant_list, init_url, segment_url_list)
+
+
+if __name__ == "__main__":
+    import pprint
+
+    playlist_text = """#EXTM3U
+#EXT-X-VERSION:3
+#EXT-X-STREAM-INF:BANDWIDTH=1280000,RESOLUTION=1280x720
+720p/video.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=640000,RESOLUTION=640x360
+360p/video.m3u8
+"""
+    playlist = HlsPlaylist.create(playlist_text, "https://video.bsky.app/watch/did/cid/playlist.m3u8")
+    pprint.pprint(playlist)
+    pprint.pprint(playlist.select_variant())
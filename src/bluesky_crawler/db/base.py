@@ -1,34 +1,186 @@
+import re
 from abc import ABCMeta, abstractmethod
+from contextlib import contextmanager
+from typing import Iterator
 
-from sqlalchemy import create_engine
+from sqlalchemy import Engine, create_engine, event, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session, sessionmaker
 from sqlalchemy.pool import StaticPool
 
+from bluesky_crawler.db.migration import migrate
 from bluesky_crawler.db.model import Base as ModelBase
 
+# db_path ごとに共有するエンジンとセッションファクトリ
+# :memory: は接続ごとに別のDBとなるため共有しない
+engine_cache: dict[str, tuple[Engine, sessionmaker]] = {}
+
+# 接続ごとに設定する PRAGMA の既定値
+# config.json の general.sqlite_pragma で項目ごとに上書きできる
+DEFAULT_PRAGMA = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 268435456,
+    "cache_size": -65536,
+    "temp_store": "MEMORY",
+}
+
+
+def make_pragma_statement_list(pragma_dict: dict | None) -> list[str]:
+    """PRAGMA 設定から実行する PRAGMA 文のリストを作成する
+
+    Args:
+        pragma_dict (dict | None): PRAGMA 設定、 DEFAULT_PRAGMA に対する差分
+                                   値に None を指定した項目は設定しない
+
+    Raises:
+        ValueError: DEFAULT_PRAGMA にない項目、または不正な値が含まれる
+
+    Returns:
+        list[str]: PRAGMA 文のリスト
+    """
+    merged_pragma_dict = DEFAULT_PRAGMA | (pragma_dict or {})
+    statement_list = []
+    for name, value in merged_pragma_dict.items():
+        if name not in DEFAULT_PRAGMA:
+            raise ValueError(f"pragma '{name}' is not supported.")
+        if value is None:
+            continue
+        if isinstance(value, bool) or not re.search(r"^-?\w+$", str(value)):
+            raise ValueError(f"pragma '{name}' value is invalid.")
+        statement_list.append(f"PRAGMA {name}={value}")
+    return statement_list
+
+
+def get_engine(db_path: str, pragma_dict: dict | None = None) -> tuple[Engine, sessionmaker]:
+    """db_path に対応するエンジンとセッションファクトリを取得する
+
+    初回のみエンジンを作成してテーブルの作成・既存テーブルのマイグレーションを行い、以降は同じものを返す
+    PRAGMA は接続ごとに設定する、エンジン共有時は初回作成時の pragma_dict が使われる
+
+    Args:
+        db_path (str): DBファイルのパス
+        pragma_dict (dict | None): PRAGMA 設定、 DEFAULT_PRAGMA に対する差分
+
+    Returns:
+        tuple[Engine, sessionmaker]: (エンジン, セッションファクトリ)
+    """
+    if db_path in engine_cache:
+        return engine_cache[db_path]
+
+    pragma_statement_list = make_pragma_statement_list(pragma_dict)
+
+    engine = create_engine(
+        f"sqlite:///{db_path}",
+        echo=False,
+        poolclass=StaticPool,
+        # pool_recycle=5,
+        connect_args={
+            "timeout": 30,
+            "check_same_thread": False,
+        },
+    )
+
+    @event.listens_for(engine, "connect")
+    def set_pragma(dbapi_connection, connection_record) -> None:
+        cursor = dbapi_connection.cursor()
+        for statement in pragma_statement_list:
+            cursor.execute(statement)
+        cursor.close()
+
+    ModelBase.metadata.create_all(engine)
+    migrate(engine)
+    session_factory = sessionmaker(bind=engine, autoflush=False)
+    if db_path != ":memory:":
+        engine_cache[db_path] = (engine, session_factory)
+    return engine, session_factory
+
 
 class Base(metaclass=ABCMeta):
-    def __init__(self, db_path: str = "bksy_db.db") -> None:
+    # 1回の IN 句・INSERT で扱うレコード数（SQLite のバインド変数の上限を超えないようにする）
+    CHUNK_SIZE = 500
+
+    def __init__(self, db_path: str = "bksy_db.db", pragma_dict: dict | None = None) -> None:
         self.db_path = db_path
         self.db_url = f"sqlite:///{self.db_path}"
+        self.engine, self.session_factory = get_engine(self.db_path, pragma_dict)
+
+    @contextmanager
+    def transaction(self) -> Iterator[Session]:
+        """1つのトランザクションとしてまとめて処理するためのセッションを返す
+
+        同じ db_path の他の DB クラスの upsert に session として渡すことで、
+        複数テーブルへの書き込みを1回のコミットにまとめる
+        例外が発生した場合はロールバックする
+
+        Yields:
+            Session: セッション
+        """
+        session = self.session_factory()
+        try:
+            yield session
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def bulk_upsert(self, model: type, record_list: list, key_name: str, session: Session | None = None) -> list[int]:
+        """INSERT ... ON CONFLICT DO UPDATE によるまとめての upsert
 
-        self.engine = create_engine(
-            self.db_url,
-            echo=False,
-            poolclass=StaticPool,
-            # pool_recycle=5,
-            connect_args={
-                "timeout": 30,
-                "check_same_thread": False,
-            },
+        CHUNK_SIZE 件ずつ、登録済キーの問い合わせと INSERT を行う
+        すべてのチャンクは1つのトランザクション内で処理する
+        session が指定された場合はそのセッションで処理し、コミットは呼び出し元に任せる
+
+        Args:
+            model (type): 対象のモデルクラス
+            record_list (list): 投入レコードのリスト
+            key_name (str): UNIQUE 制約を持つキーのカラム名
+            session (Session | None): 使用するセッション、 None の場合は新規に作成してコミットまで行う
+
+        Returns:
+            list[int]: レコードに対応した投入結果のリスト
+                       追加したレコードは0、更新したレコードは1が入る
+        """
+        result: list[int] = []
+        table = model.__table__
+        key_column = table.c[key_name]
+        column_name_list = [c.name for c in table.columns if not c.primary_key]
+
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[key_column],
+            set_={name: stmt.excluded[name] for name in column_name_list if name != key_name},
         )
-        ModelBase.metadata.create_all(self.engine)
+
+        is_own_session = session is None
+        if is_own_session:
+            session = self.session_factory()
+
+        seen_key_set: set = set()
+        for i in range(0, len(record_list), self.CHUNK_SIZE):
+            chunk = record_list[i : i + self.CHUNK_SIZE]
+            key_list = [getattr(r, key_name) for r in chunk]
+            exist_key_set = set(session.scalars(select(key_column).where(key_column.in_(key_list))))
+            for key in key_list:
+                # 登録済、または同一バッチ内で先に投入したキーは UPDATE 扱い
+                result.append(1 if key in exist_key_set or key in seen_key_set else 0)
+                seen_key_set.add(key)
+            value_list = [{name: getattr(r, name) for name in column_name_list} for r in chunk]
+            session.execute(stmt, value_list)
+
+        if is_own_session:
+            session.commit()
+            session.close()
+        return result
 
     @abstractmethod
     def select(self):
         return []
 
     @abstractmethod
-    def upsert(self, record):
+    def upsert(self, record, session=None):
         return []
 
 
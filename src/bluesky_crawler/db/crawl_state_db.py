@@ -0,0 +1,69 @@
+from datetime import datetime
+
+from sqlalchemy import and_
+from sqlalchemy.orm import Session
+
+from bluesky_crawler.db.base import Base
+from bluesky_crawler.db.model import CrawlState
+
+
+class CrawlStateDB(Base):
+    def __init__(self, db_path: str = "bksy_db.db", pragma_dict: dict | None = None):
+        super().__init__(db_path, pragma_dict)
+
+    def select(self):
+        session = self.session_factory()
+        result = session.query(CrawlState).all()
+        session.close()
+        return result
+
+    def upsert(self, record: CrawlState | list[CrawlState] | list[dict], session: Session | None = None) -> list[int]:
+        """upsert
+
+        Args:
+            record (CrawlState | list[CrawlState] | list[dict]): 投入レコード、またはレコード辞書のリスト
+            session (Session | None): 使用するセッション、 None の場合は新規に作成してコミットまで行う
+
+        Returns:
+            list[int]: レコードに対応した投入結果のリスト
+                       追加したレコードは0、更新したレコードは1が入る
+        """
+        record_list: list[CrawlState] = []
+        match record:
+            case CrawlState():
+                record_list = [record]
+            case [CrawlState(), *rest] if all([isinstance(r, CrawlState) for r in rest]):
+                record_list = record
+            case [dict(), *rest] if all([isinstance(r, dict) for r in rest]):
+                record_list = [CrawlState.create(r) for r in record]
+            case _:
+                raise TypeError("record is invalid type.")
+
+        return self.bulk_upsert(CrawlState, record_list, "key", session)
+
+    def get_value(self, key: str) -> str | None:
+        """key に対応する状態値を取得する
+
+        Args:
+            key (str): 状態のキー
+
+        Returns:
+            str | None: 状態値、未登録の場合は None
+        """
+        session = self.session_factory()
+        record = session.query(CrawlState).filter(and_(CrawlState.key == key)).one_or_none()
+        session.close()
+        return record.value if record else None
+
+    def set_value(self, key: str, value: str | None) -> int:
+        """key に対応する状態値を登録する
+
+        Args:
+            key (str): 状態のキー
+            value (str | None): 状態値
+
+        Returns:
+            int: 追加した場合は0、更新した場合は1
+        """
+        updated_at = datetime.now().isoformat()
+        return self.upsert(CrawlState(key, value, updated_at))[0]
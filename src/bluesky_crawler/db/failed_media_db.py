@@ -0,0 +1,115 @@
+from datetime import datetime
+
+import orjson
+from sqlalchemy.orm import Session
+
+from bluesky_crawler.db.base import Base
+from bluesky_crawler.db.model import FailedMedia, Media
+
+
+class FailedMediaDB(Base):
+    def __init__(self, db_path: str = "bksy_db.db", pragma_dict: dict | None = None):
+        super().__init__(db_path, pragma_dict)
+
+    def select(self):
+        session = self.session_factory()
+        result = session.query(FailedMedia).all()
+        session.close()
+        return result
+
+    def upsert(
+        self, record: FailedMedia | list[FailedMedia] | list[dict], session: Session | None = None
+    ) -> list[int]:
+        """upsert
+
+        Args:
+            record (FailedMedia | list[FailedMedia] | list[dict]): 投入レコード、またはレコード辞書のリスト
+            session (Session | None): 使用するセッション、 None の場合は新規に作成してコミットまで行う
+
+        Returns:
+            list[int]: レコードに対応した投入結果のリスト
+                       追加したレコードは0、更新したレコードは1が入る
+        """
+        record_list: list[FailedMedia] = []
+        match record:
+            case FailedMedia():
+                record_list = [record]
+            case [FailedMedia(), *rest] if all([isinstance(r, FailedMedia) for r in rest]):
+                record_list = record
+            case [dict(), *rest] if all([isinstance(r, dict) for r in rest]):
+                record_list = [FailedMedia.create(r) for r in record]
+            case _:
+                raise TypeError("record is invalid type.")
+
+        return self.bulk_upsert(FailedMedia, record_list, "media_id", session)
+
+    def add_attempt(self, media_list: list[Media]) -> dict[str, int]:
+        """media_list のメディアの DL 失敗を記録し、これまでに失敗した回数を返す
+
+        Args:
+            media_list (list[Media]): DL に失敗したメディア
+
+        Returns:
+            dict[str, int]: media_id ごとの失敗した回数（今回の失敗を含む）
+        """
+        media_dict = {media.media_id: media for media in media_list}
+        if len(media_dict) == 0:
+            return {}
+
+        attempt_num_dict: dict[str, int] = {}
+        media_id_list = list(media_dict)
+        session = self.session_factory()
+        for i in range(0, len(media_id_list), self.CHUNK_SIZE):
+            chunk = media_id_list[i : i + self.CHUNK_SIZE]
+            q = session.query(FailedMedia.media_id, FailedMedia.attempt_num).filter(FailedMedia.media_id.in_(chunk))
+            attempt_num_dict.update(q.all())
+        session.close()
+
+        updated_at = datetime.now().isoformat()
+        record_list = [
+            FailedMedia(
+                media_id,
+                media.post_id,
+                orjson.dumps(media.to_dict()).decode(),
+                attempt_num_dict.get(media_id, 0) + 1,
+                updated_at,
+            )
+            for media_id, media in media_dict.items()
+        ]
+        self.upsert(record_list)
+        return {record.media_id: record.attempt_num for record in record_list}
+
+    def delete(self, media_id_list: list[str]) -> int:
+        """media_id_list のメディアの DL 失敗の記録を削除する
+
+        Args:
+            media_id_list (list[str]): 削除対象の media_id のリスト
+
+        Returns:
+            int: 削除したレコードの数
+        """
+        media_id_list = list(dict.fromkeys(media_id_list))
+        if len(media_id_list) == 0:
+            return 0
+
+        deleted_num = 0
+        with self.transaction() as session:
+            for i in range(0, len(media_id_list), self.CHUNK_SIZE):
+                chunk = media_id_list[i : i + self.CHUNK_SIZE]
+                q = session.query(FailedMedia).filter(FailedMedia.media_id.in_(chunk))
+                deleted_num += q.delete(synchronize_session=False)
+        return deleted_num
+
+    def select_retry(self, min_attempt_num: int) -> list[Media]:
+        """min_attempt_num 回以上 DL に失敗したメディアを返す
+
+        Args:
+            min_attempt_num (int): 対象とする失敗回数の下限
+
+        Returns:
+            list[Media]: 再取得の対象のメディア
+        """
+        session = self.session_factory()
+        result = session.query(FailedMedia).filter(FailedMedia.attempt_num >= min_attempt_num).all()
+        session.close()
+        return [record.to_media() for record in result]
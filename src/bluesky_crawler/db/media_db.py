@@ -1,33 +1,66 @@
-from sqlalchemy import and_
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.orm.exc import NoResultFound
+from sqlalchemy.orm import Session
 
 from bluesky_crawler.db.base import Base
 from bluesky_crawler.db.model import Media
 
 
 class MediaDB(Base):
-    def __init__(self, db_path: str = "bksy_db.db"):
-        super().__init__(db_path)
+    def __init__(self, db_path: str = "bksy_db.db", pragma_dict: dict | None = None):
+        super().__init__(db_path, pragma_dict)
 
     def select(self):
-        Session = sessionmaker(bind=self.engine, autoflush=False)
-        session = Session()
+        session = self.session_factory()
         result = session.query(Media).all()
         session.close()
         return result
 
-    def upsert(self, record: Media | list[Media] | list[dict]) -> list[int]:
+    def select_exist_media_id(self, media_id_list: list[str]) -> set[str]:
+        """media_id_list のうち、DBに登録済の media_id を返す
+
+        media_id の UNIQUE インデックスを使った IN 句で問い合わせる
+        CHUNK_SIZE 件ずつ問い合わせる
+
+        Args:
+            media_id_list (list[str]): 確認対象の media_id のリスト
+
+        Returns:
+            set[str]: DBに登録済の media_id
+        """
+        result: set[str] = set()
+        media_id_list = list(dict.fromkeys(media_id_list))
+        if len(media_id_list) == 0:
+            return result
+
+        session = self.session_factory()
+        for i in range(0, len(media_id_list), self.CHUNK_SIZE):
+            chunk = media_id_list[i : i + self.CHUNK_SIZE]
+            q = session.query(Media.media_id).filter(Media.media_id.in_(chunk))
+            result.update(media_id for (media_id,) in q.all())
+        session.close()
+        return result
+
+    def select_unverified(self) -> list[Media]:
+        """DL したファイルの検証が済んでいないメディアを返す
+
+        Returns:
+            list[Media]: 未検証のメディア
+        """
+        session = self.session_factory()
+        result = session.query(Media).filter(Media.verified.is_(False)).all()
+        session.close()
+        return result
+
+    def upsert(self, record: Media | list[Media] | list[dict], session: Session | None = None) -> list[int]:
         """upsert
 
         Args:
             record (Media | list[dict] | list[Media]): 投入レコード、またはレコード辞書のリスト
+            session (Session | None): 使用するセッション、 None の場合は新規に作成してコミットまで行う
 
         Returns:
             list[int]: レコードに対応した投入結果のリスト
                        追加したレコードは0、更新したレコードは1が入る
         """
-        result: list[int] = []
         record_list: list[Media] = []
         match record:
             case Media():
@@ -39,33 +72,4 @@ class MediaDB(Base):
             case _:
                 raise TypeError("record is invalid type.")
 
-        Session = sessionmaker(bind=self.engine, autoflush=False)
-        session = Session()
-
-        for r in record_list:
-            try:
-                q = (
-                    session.query(Media)
-                    .filter(and_(Media.post_id == r.post_id, Media.media_id == r.media_id))
-                    .with_for_update()
-                )
-                p = q.one()
-            except NoResultFound:
-                # INSERT
-                session.add(r)
-                result.append(0)
-            else:
-                # UPDATE
-                p.post_id = r.post_id
-                p.media_id = r.media_id
-                p.alt_text = r.alt_text
-                p.mime_type = r.mime_type
-                p.size = r.size
-                p.url = r.url
-                p.created_at = r.created_at
-                p.registered_at = r.registered_at
-                result.append(1)
-
-        session.commit()
-        session.close()
-        return result
+        return self.bulk_upsert(Media, record_list, "media_id", session)
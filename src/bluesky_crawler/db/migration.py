@@ -0,0 +1,77 @@
+from logging import INFO, getLogger
+from typing import Callable
+
+from sqlalchemy import Connection, Engine, inspect
+
+from bluesky_crawler.db.model import Base as ModelBase
+from bluesky_crawler.util import to_epoch
+
+logger = getLogger(__name__)
+logger.setLevel(INFO)
+
+# 既存テーブルにカラムを追加した際に、既存レコードの値を埋めるための変換
+# {(テーブル名, 追加したカラム名): (変換元カラム名, 変換関数)}
+BACKFILL_COLUMN_DICT: dict[tuple[str, str], tuple[str, Callable]] = {
+    ("Like", "created_at_epoch"): ("created_at", to_epoch),
+    ("Media", "created_at_epoch"): ("created_at", to_epoch),
+}
+
+
+def backfill_column(connection: Connection, table_name: str, column_name: str) -> None:
+    """追加したカラムについて、既存レコードの値を埋める
+
+    Args:
+        connection (Connection): 接続
+        table_name (str): テーブル名
+        column_name (str): 追加したカラム名
+    """
+    if (table_name, column_name) not in BACKFILL_COLUMN_DICT:
+        return
+    source_column_name, convert = BACKFILL_COLUMN_DICT[(table_name, column_name)]
+    rows = connection.exec_driver_sql(f'SELECT "id", "{source_column_name}" FROM "{table_name}"').all()
+    value_list = [(convert(source_value), record_id) for record_id, source_value in rows]
+    if len(value_list) == 0:
+        return
+    connection.exec_driver_sql(f'UPDATE "{table_name}" SET "{column_name}" = ? WHERE "id" = ?', value_list)
+    logger.info(f"Backfilled {table_name}.{column_name} for {len(value_list)} records.")
+
+
+def migrate(engine: Engine) -> None:
+    """既存のDBをモデル定義に合わせて更新する
+
+    create_all は既存テーブルを変更しないため、
+    モデルに追加されたカラムとインデックスをここで既存テーブルに追加する
+    追加できるカラムは NULL 許容か既定値を持つもののみ
+
+    Args:
+        engine (Engine): 対象DBのエンジン
+
+    Raises:
+        ValueError: NULL 非許容かつ既定値を持たないカラムが追加されていた
+    """
+    with engine.begin() as connection:
+        # StaticPool では接続が共有されるため、インスペクタも同じトランザクション内で使う
+        inspector = inspect(connection)
+        exist_table_name_list = inspector.get_table_names()
+        for table in ModelBase.metadata.sorted_tables:
+            if table.name not in exist_table_name_list:
+                continue
+
+            exist_column_name_list = [c["name"] for c in inspector.get_columns(table.name)]
+            for column in table.columns:
+                if column.name in exist_column_name_list:
+                    continue
+                if not column.nullable and column.server_default is None:
+                    raise ValueError(f"column '{table.name}.{column.name}' can not be added to existing table.")
+                column_type = column.type.compile(engine.dialect)
+                default = ""
+                if column.server_default is not None:
+                    default = f" DEFAULT {column.server_default.arg}"
+                connection.exec_driver_sql(
+                    f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}{default}'
+                )
+                logger.info(f"Added column {table.name}.{column.name}.")
+                backfill_column(connection, table.name, column.name)
+
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
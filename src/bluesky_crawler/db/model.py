@@ -2,9 +2,12 @@ import re
 from pathlib import Path
 from typing import Self
 
-from sqlalchemy import Column, Integer, String, create_engine
+import orjson
+from sqlalchemy import Boolean, Column, Integer, String, create_engine, text
 from sqlalchemy.orm import Session, declarative_base
 
+from bluesky_crawler.util import to_epoch
+
 Base = declarative_base()
 
 
@@ -17,6 +20,7 @@ class Like(Base):
     [text] TEXT,
     [created_at] TEXT NOT NULL,
     [registered_at] TEXT NOT NULL,
+    [created_at_epoch] INTEGER,
     PRIMARY KEY([id])
     """
 
@@ -24,11 +28,12 @@ class Like(Base):
 
     id = Column(Integer, primary_key=True)
     post_id = Column(String(256), nullable=False, unique=True)
-    user_id = Column(String(256), nullable=False)
+    user_id = Column(String(256), nullable=False, index=True)
     url = Column(String(256), nullable=False)
     text = Column(String(512))
     created_at = Column(String(256), nullable=False)
     registered_at = Column(String(256), nullable=False)
+    created_at_epoch = Column(Integer, index=True)
 
     def __init__(self, post_id: str, user_id: str, url: str, text: str, created_at: str, registered_at: str):
         # self.id = id
@@ -38,6 +43,7 @@ class Like(Base):
         self.text = text
         self.created_at = created_at
         self.registered_at = registered_at
+        self.created_at_epoch = to_epoch(created_at)
 
     @classmethod
     def create(self, args_dict: dict) -> Self:
@@ -60,6 +66,9 @@ class Like(Base):
     def __eq__(self, other):
         return isinstance(other, Like) and other.post_id == self.post_id
 
+    def __hash__(self):
+        return hash(self.post_id)
+
     def to_dict(self) -> dict:
         return {
             "post_id": self.post_id,
@@ -119,6 +128,9 @@ class User(Base):
     def __eq__(self, other):
         return isinstance(other, User) and other.user_id == self.user_id
 
+    def __hash__(self):
+        return hash(self.user_id)
+
     def to_dict(self) -> dict:
         return {
             "user_id": self.user_id,
@@ -142,22 +154,26 @@ class Media(Base):
     [url] TEXT NOT NULL,
     [created_at] TEXT NOT NULL,
     [registered_at] TEXT NOT NULL,
+    [created_at_epoch] INTEGER,
+    [verified] BOOLEAN NOT NULL DEFAULT 0,
     PRIMARY KEY([id])
     """
 
     __tablename__ = "Media"
 
     id = Column(Integer, primary_key=True)
-    post_id = Column(String(256), nullable=False)
+    post_id = Column(String(256), nullable=False, index=True)
     media_id = Column(String(256), nullable=False, unique=True)
     media_index = Column(Integer, nullable=False)
-    username = Column(String(256), nullable=False)
+    username = Column(String(256), nullable=False, index=True)
     alt_text = Column(String(512))
     mime_type = Column(String(256), nullable=False)
     size = Column(Integer, nullable=False)
     url = Column(String(512), nullable=False)
     created_at = Column(String(256), nullable=False)
     registered_at = Column(String(256), nullable=False)
+    created_at_epoch = Column(Integer, index=True)
+    verified = Column(Boolean, nullable=False, server_default=text("0"))
 
     def __init__(
         self,
@@ -183,6 +199,9 @@ class Media(Base):
         self.url = url
         self.created_at = created_at
         self.registered_at = registered_at
+        self.created_at_epoch = to_epoch(created_at)
+        # DL したファイルの検証が済んでいるか、 Downloader が設定する
+        self.verified = False
 
     @classmethod
     def create(self, args_dict: dict) -> Self:
@@ -215,6 +234,9 @@ class Media(Base):
     def __eq__(self, other):
         return isinstance(other, Media) and other.media_id == self.media_id and other.post_id == self.post_id
 
+    def __hash__(self):
+        return hash((self.post_id, self.media_id))
+
     def to_dict(self) -> dict:
         return {
             "post_id": self.post_id,
@@ -245,6 +267,122 @@ class Media(Base):
         return filename
 
 
+class CrawlState(Base):
+    """クロール状態モデル
+    [id] INTEGER NOT NULL UNIQUE,
+    [key] TEXT NOT NULL UNIQUE,
+    [value] TEXT,
+    [updated_at] TEXT NOT NULL,
+    PRIMARY KEY([id])
+    """
+
+    __tablename__ = "CrawlState"
+
+    id = Column(Integer, primary_key=True)
+    key = Column(String(256), nullable=False, unique=True)
+    value = Column(String(512))
+    updated_at = Column(String(256), nullable=False)
+
+    def __init__(self, key: str, value: str, updated_at: str):
+        # self.id = id
+        self.key = key
+        self.value = value
+        self.updated_at = updated_at
+
+    @classmethod
+    def create(self, args_dict: dict) -> Self:
+        match args_dict:
+            case {
+                "key": key,
+                "value": value,
+                "updated_at": updated_at,
+            }:
+                return CrawlState(key, value, updated_at)
+            case _:
+                raise ValueError("Unmatch args_dict.")
+
+    def __repr__(self):
+        return f"<CrawlState(key='{self.key}')>"
+
+    def __eq__(self, other):
+        return isinstance(other, CrawlState) and other.key == self.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def to_dict(self) -> dict:
+        return {
+            "key": self.key,
+            "value": self.value,
+            "updated_at": self.updated_at,
+        }
+
+
+class FailedMedia(Base):
+    """DL に失敗したメディアモデル
+    [id] INTEGER NOT NULL UNIQUE,
+    [media_id] TEXT NOT NULL UNIQUE,
+    [post_id] TEXT NOT NULL,
+    [media] TEXT NOT NULL,
+    [attempt_num] INTEGER NOT NULL,
+    [updated_at] TEXT NOT NULL,
+    PRIMARY KEY([id])
+    """
+
+    __tablename__ = "FailedMedia"
+
+    id = Column(Integer, primary_key=True)
+    media_id = Column(String(256), nullable=False, unique=True)
+    post_id = Column(String(256), nullable=False)
+    media = Column(String, nullable=False)
+    attempt_num = Column(Integer, nullable=False)
+    updated_at = Column(String(256), nullable=False)
+
+    def __init__(self, media_id: str, post_id: str, media: str, attempt_num: int, updated_at: str):
+        # self.id = id
+        self.media_id = media_id
+        self.post_id = post_id
+        # 再取得時に Media を復元するための Media.to_dict の JSON
+        self.media = media
+        self.attempt_num = attempt_num
+        self.updated_at = updated_at
+
+    @classmethod
+    def create(self, args_dict: dict) -> Self:
+        match args_dict:
+            case {
+                "media_id": media_id,
+                "post_id": post_id,
+                "media": media,
+                "attempt_num": attempt_num,
+                "updated_at": updated_at,
+            }:
+                return FailedMedia(media_id, post_id, media, attempt_num, updated_at)
+            case _:
+                raise ValueError("Unmatch args_dict.")
+
+    def __repr__(self):
+        return f"<FailedMedia(media_id='{self.media_id}', attempt_num={self.attempt_num})>"
+
+    def __eq__(self, other):
+        return isinstance(other, FailedMedia) and other.media_id == self.media_id
+
+    def __hash__(self):
+        return hash(self.media_id)
+
+    def to_dict(self) -> dict:
+        return {
+            "media_id": self.media_id,
+            "post_id": self.post_id,
+            "media": self.media,
+            "attempt_num": self.attempt_num,
+            "updated_at": self.updated_at,
+        }
+
+    def to_media(self) -> Media:
+        return Media.create(orjson.loads(self.media))
+
+
 if __name__ == "__main__":
     test_db = Path("./test_DB.db")
     test_db.unlink(missing_ok=True)
@@ -1,7 +1,9 @@
+import argparse
 import logging.config
 from logging import INFO, getLogger
 
 from bluesky_crawler.crawler.crawler import Crawler
+from bluesky_crawler.crawler.scheduler import Scheduler
 
 logging.config.fileConfig("./log/logging.ini", disable_existing_loggers=False)
 # for name in logging.root.manager.loggerDict:
@@ -12,11 +14,33 @@ logger.setLevel(INFO)
 
 
 def main() -> None:
+    parser = argparse.ArgumentParser(description="Bluesky crawler")
+    parser.add_argument("--backfill", action="store_true", help="crawl the whole like history (resumable)")
+    parser.add_argument(
+        "--verify", action="store_true", help="verify downloaded media and re-download only corrupt ones"
+    )
+    parser.add_argument(
+        "--migrate-layout", action="store_true", help="move saved media to match the configured directory layout"
+    )
+    parser.add_argument(
+        "--daemon", action="store_true", help="keep running and crawl periodically until SIGINT/SIGTERM"
+    )
+    args = parser.parse_args()
+
     horizontal_line = "-" * 80
     logger.info(horizontal_line)
     logger.info("Bluesky crawler -> start")
     crawler = Crawler()
-    crawler.run()
+    if args.backfill:
+        crawler.backfill()
+    elif args.verify:
+        crawler.verify()
+    elif args.migrate_layout:
+        crawler.migrate_layout()
+    elif args.daemon:
+        Scheduler(crawler).run()
+    else:
+        crawler.run()
     logger.info("Bluesky crawler -> done")
     logger.info(horizontal_line)
 
@@ -1,46 +1,678 @@
 import logging.config
+import os
 import pprint
+import random
+import re
+import tempfile
+import threading
+import time
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
 from logging import INFO, getLogger
 from pathlib import Path
+from typing import Any
 
+import httpx
 import orjson
-from atproto import Client
-from atproto_client.exceptions import BadRequestError
+from atproto import Client, Session, SessionEvent, models
+from atproto_client.exceptions import BadRequestError, LoginRequiredError, RequestErrorBase, RequestException
+from atproto_client.exceptions import UnauthorizedError
+from atproto_client.models.utils import get_or_create, get_response_model
+from atproto_client.request import Response
+from atproto_server.auth.jwt import get_jwt_payload
+
+from bluesky_crawler.crawler.valueobject.feed_entry import prune_raw_entry
 
 logger = getLogger(__name__)
 logger.setLevel(INFO)
 
+# validated : atproto の pydantic モデルを経由して model_dump した辞書を返す
+# raw       : API のレスポンスを bytes のまま受け取り、orjson でデコードした辞書を返す
+FETCH_MODE_LIST = ["validated", "raw"]
+GET_ACTOR_LIKES_NSID = "app.bsky.feed.getActorLikes"
+CREATE_SESSION_NSID = "com.atproto.server.createSession"
+# アクセストークンの期限のこの秒数前から更新する（atproto の Client と同じ）
+SESSION_REFRESH_MARGIN = 15 * 60
+# セッションの読み込み・作成・更新に使う atproto の Client の非公開の属性
+# 公開の login はセッションの読み込み・作成の後に必ずプロフィールの取得（getProfile）を行うため、
+# その手前の処理を直接呼ぶ
+# 非公開の属性は atproto の版によって変わりうるため、pyproject.toml で版を固定し、
+# BlueskyManager の作成時に存在を確認する
+CLIENT_PRIVATE_ATTRIBUTE_LIST = [
+    "_import_session_string",
+    "_get_and_set_session",
+    "_refresh_and_set_session",
+    "_refresh_lock",
+]
+# トークンが無効であることを示す XRPC のエラー
+TOKEN_ERROR_LIST = ["ExpiredToken", "InvalidToken"]
+# API 呼び出しのレート制限の設定
+# config.json の general.rate_limit で項目ごとに上書きできる
+# rate         : エンドポイントごとの1秒あたりのリクエスト数の上限（トークンバケットの補充速度）
+# burst        : 間隔を空けずに続けて送れるリクエスト数（トークンバケットの容量）
+# max_retry    : 429 / 5xx の場合に再試行する回数
+# backoff_base : 再試行までの待機時間の初期値 [sec]、再試行ごとに2倍にする
+# backoff_max  : 再試行までの待機時間の上限 [sec]
+# jitter       : 再試行までの待機時間をこの割合の範囲でランダムに増減させる（0 の場合は増減させない）
+DEFAULT_RATE_LIMIT_CONFIG = {
+    "rate": 5.0,
+    "burst": 10,
+    "max_retry": 5,
+    "backoff_base": 1.0,
+    "backoff_max": 300.0,
+    "jitter": 0.1,
+}
+# 再試行する HTTP ステータスコード
+RETRY_STATUS_LIST = [429, 500, 502, 503, 504]
+
+
+def is_jwt_expired(jwt: str, margin: float = 0) -> bool:
+    """JWT の期限が切れているかを返す（署名の検証は行わない）
+
+    Args:
+        jwt (str): 対象の JWT
+        margin (float): 期限のこの秒数前から切れているとみなす
+
+    Returns:
+        bool: 期限が切れている場合 True、期限が読み取れない場合も True
+    """
+    try:
+        exp = get_jwt_payload(jwt).exp
+    except Exception:
+        return True
+    return exp is None or time.time() + margin >= exp
+
+
+def is_token_error(e: RequestErrorBase) -> bool:
+    """XRPC のエラーがトークンの失効・不正によるものかを返す
+
+    Args:
+        e (RequestErrorBase): atproto の Client が送出した例外
+
+    Returns:
+        bool: トークンの失効・不正によるエラーの場合 True
+    """
+    content = e.response.content if e.response is not None else None
+    return getattr(content, "error", None) in TOKEN_ERROR_LIST
+
+
+def check_client_compatibility(client: Client) -> None:
+    """atproto の Client がセッション管理に使う非公開の属性を持っているかを確認する
+
+    Args:
+        client (Client): 確認する Client
+
+    Raises:
+        RuntimeError: 非公開の属性がない（atproto の版が想定と異なる）場合
+    """
+    missing_list = [name for name in CLIENT_PRIVATE_ATTRIBUTE_LIST if not hasattr(client, name)]
+    if missing_list:
+        raise RuntimeError(
+            f"atproto Client has no {', '.join(missing_list)}, install the atproto version pinned in pyproject.toml."
+        )
+
+
+def get_xrpc_error(response: httpx.Response) -> str | None:
+    """XRPC のエラーレスポンスからエラーの種類を返す
+
+    Args:
+        response (httpx.Response): XRPC のレスポンス
+
+    Returns:
+        str | None: エラーの種類（"ExpiredToken" など）、読み取れない場合は None
+    """
+    try:
+        error_dict = orjson.loads(response.content)
+    except orjson.JSONDecodeError:
+        return None
+    return error_dict.get("error") if isinstance(error_dict, dict) else None
+
+
+def get_header_dict(headers: dict | httpx.Headers | None) -> dict[str, str]:
+    """レスポンスヘッダをキーが小文字の辞書にして返す
+
+    Args:
+        headers (dict | httpx.Headers | None): atproto または httpx のレスポンスヘッダ
+
+    Returns:
+        dict[str, str]: キーを小文字にしたレスポンスヘッダ
+    """
+    return {key.lower(): value for key, value in (headers or {}).items()}
+
+
+@dataclass(frozen=True)
+class RateLimitBudget:
+    """サーバから通知されたレート制限の残り
+
+    Attributes:
+        limit (int | None): 期間内のリクエスト数の上限、通知されなかった場合は None
+        remaining (int): 期間内に送れる残りのリクエスト数
+        reset_at (float): 期間が切り替わる（残りが limit に戻る）時刻の UNIX 時間
+    """
+
+    limit: int | None
+    remaining: int
+    reset_at: float
+
+
+class TokenBucket:
+    """1つのエンドポイントのトークンバケット
+
+    rate [個/sec] でトークンを capacity 個まで補充し、リクエストごとに1個消費する
+    レスポンスの ratelimit-* ヘッダを反映した場合は、サーバ側の残り回数を超えて送らないようにする
+    """
+
+    max_rate: float
+    rate: float
+    capacity: float
+    tokens: float
+    updated_at: float
+    limit: int | None = None
+    remaining: int | None = None
+    reset_at: float | None = None
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        # rate はサーバの ratelimit-policy に合わせて下げることがあるため、設定値を max_rate として保持する
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def reserve(self) -> float:
+        """トークンを1個予約し、リクエストを送れるまでの待機時間を返す
+
+        トークンが足りない場合も予約する（残数を負にする）ため、続けて呼ばれた場合は順に間隔が空く
+        サーバ側の残り回数を使い切っている場合は、期間が切り替わるまで待機させる
+
+        Returns:
+            float: 待機時間 [sec]
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate) - 1
+        self.updated_at = now
+        wait_time = max(-self.tokens / self.rate, 0.0)
+        budget = self.get_budget()
+        if budget is not None:
+            if budget.remaining <= 0:
+                wait_time = max(wait_time, budget.reset_at - time.time())
+            self.remaining -= 1
+        return wait_time
+
+    def update(self, headers: dict | httpx.Headers | None) -> None:
+        """レスポンスの ratelimit-* ヘッダを反映する
+
+        ratelimit-policy（"3000;w=300" の形式）があれば、期間内の上限を超えないように補充速度も下げる
+
+        Args:
+            headers (dict | httpx.Headers | None): レスポンスヘッダ
+        """
+        header_dict = get_header_dict(headers)
+        try:
+            remaining = int(header_dict["ratelimit-remaining"])
+            reset_at = float(header_dict["ratelimit-reset"])
+        except (KeyError, ValueError):
+            return
+        limit = header_dict.get("ratelimit-limit", "")
+        self.limit = int(limit) if limit.isdigit() else None
+        self.remaining = remaining
+        self.reset_at = reset_at
+        self.tokens = min(self.tokens, remaining)
+
+        rate = self.max_rate
+        for policy in header_dict.get("ratelimit-policy", "").split(","):
+            match = re.fullmatch(r"\s*(\d+)\s*;\s*w=(\d+)\s*", policy)
+            if match and int(match[1]) > 0 and int(match[2]) > 0:
+                rate = min(rate, int(match[1]) / int(match[2]))
+        self.rate = rate
+
+    def get_budget(self) -> RateLimitBudget | None:
+        """サーバ側のレート制限の残りを返す
+
+        Returns:
+            RateLimitBudget | None: レート制限の残り、通知されていない・期間が切り替わった場合は None
+        """
+        if self.remaining is None or self.reset_at is None or self.reset_at <= time.time():
+            return None
+        return RateLimitBudget(self.limit, max(self.remaining, 0), self.reset_at)
+
+
+class RateLimiter:
+    """API 呼び出しのレート制限
+
+    エンドポイント（NSID）ごとのトークンバケットで送信間隔を空け、
+    429 / 5xx のレスポンスは待機して再試行する
+    複数のスレッドから呼び出してよい（待機はロックの外で行う）
+    """
+
+    rate_limit_config: dict
+    bucket_dict: dict[str, TokenBucket]
+    lock: threading.Lock
+
+    def __init__(self, rate_limit_config: dict | None = None) -> None:
+        self.rate_limit_config = DEFAULT_RATE_LIMIT_CONFIG | (rate_limit_config or {})
+        if float(self.rate_limit_config["rate"]) <= 0:
+            raise ValueError(f"rate_limit rate '{self.rate_limit_config['rate']}' is invalid.")
+        if float(self.rate_limit_config["burst"]) < 1:
+            raise ValueError(f"rate_limit burst '{self.rate_limit_config['burst']}' is invalid.")
+        if int(self.rate_limit_config["max_retry"]) < 0:
+            raise ValueError(f"rate_limit max_retry '{self.rate_limit_config['max_retry']}' is invalid.")
+        if float(self.rate_limit_config["backoff_base"]) < 0:
+            raise ValueError(f"rate_limit backoff_base '{self.rate_limit_config['backoff_base']}' is invalid.")
+        if float(self.rate_limit_config["backoff_max"]) < float(self.rate_limit_config["backoff_base"]):
+            raise ValueError(f"rate_limit backoff_max '{self.rate_limit_config['backoff_max']}' is invalid.")
+        if not 0 <= float(self.rate_limit_config["jitter"]) < 1:
+            raise ValueError(f"rate_limit jitter '{self.rate_limit_config['jitter']}' is invalid.")
+        self.bucket_dict = {}
+        self.lock = threading.Lock()
+
+    def get_bucket(self, endpoint: str) -> TokenBucket:
+        """エンドポイントのトークンバケットを返す（なければ作成する）、lock を取得してから呼ぶこと
+
+        Args:
+            endpoint (str): エンドポイントの NSID
+
+        Returns:
+            TokenBucket: エンドポイントのトークンバケット
+        """
+        if endpoint not in self.bucket_dict:
+            self.bucket_dict[endpoint] = TokenBucket(
+                float(self.rate_limit_config["rate"]), float(self.rate_limit_config["burst"])
+            )
+        return self.bucket_dict[endpoint]
+
+    def acquire(self, endpoint: str) -> None:
+        """エンドポイントにリクエストを送れるまで待機する
+
+        Args:
+            endpoint (str): エンドポイントの NSID
+        """
+        with self.lock:
+            wait_time = self.get_bucket(endpoint).reserve()
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+    def update(self, endpoint: str, headers: dict | httpx.Headers | None) -> None:
+        """レスポンスの ratelimit-* ヘッダをエンドポイントのトークンバケットに反映する
+
+        Args:
+            endpoint (str): エンドポイントの NSID
+            headers (dict | httpx.Headers | None): レスポンスヘッダ
+        """
+        with self.lock:
+            self.get_bucket(endpoint).update(headers)
+
+    def get_budget(self, endpoint: str) -> RateLimitBudget | None:
+        """エンドポイントのサーバ側のレート制限の残りを返す
+
+        Args:
+            endpoint (str): エンドポイントの NSID
+
+        Returns:
+            RateLimitBudget | None: レート制限の残り、通知されていない・期間が切り替わった場合は None
+        """
+        with self.lock:
+            return self.get_bucket(endpoint).get_budget()
+
+    def get_wait_time(self, status_code: int, headers: dict | httpx.Headers | None, retry_num: int) -> float:
+        """再試行するまでの待機時間を返す
+
+        429 の場合は retry-after ヘッダ（秒数）か ratelimit-reset ヘッダ（UNIX 時間）があればそれまで待つ
+        それ以外は backoff_base から再試行ごとに2倍にした時間を jitter の範囲で増減させる
+        いずれも backoff_max までとする
+
+        Args:
+            status_code (int): レスポンスの HTTP ステータスコード
+            headers (dict | httpx.Headers | None): レスポンスヘッダ
+            retry_num (int): これまでに再試行した回数
+
+        Returns:
+            float: 待機時間 [sec]
+        """
+        header_dict = get_header_dict(headers)
+        wait_time: float | None = None
+        if status_code == 429:
+            try:
+                wait_time = float(header_dict["retry-after"])
+            except (KeyError, ValueError):
+                try:
+                    wait_time = float(header_dict["ratelimit-reset"]) - time.time()
+                except (KeyError, ValueError):
+                    pass
+        if wait_time is None:
+            jitter = float(self.rate_limit_config["jitter"])
+            wait_time = float(self.rate_limit_config["backoff_base"]) * 2**retry_num
+            wait_time *= random.uniform(1 - jitter, 1 + jitter)
+        return min(max(wait_time, 0.0), float(self.rate_limit_config["backoff_max"]))
+
+    def call(self, endpoint: str, send: Callable[[], Any]) -> Any:
+        """レート制限に従ってリクエストを送り、429 / 5xx の場合は待機して再試行する
+
+        send は1回分のリクエストを送り、status_code と headers を持つレスポンスを返す関数とする
+        （httpx.Response を返す、または atproto の Client のように失敗時に RequestErrorBase を送出する）
+        send がレスポンス以外（atproto のモデルなど）を返した場合は成功として扱う
+        再試行しても成功しなかった場合は、最後のレスポンスをそのまま返す（例外の場合は送出する）
+
+        Args:
+            endpoint (str): エンドポイントの NSID
+            send (Callable[[], Any]): 1回分のリクエストを送る関数
+
+        Returns:
+            Any: send が返したレスポンス
+        """
+        max_retry = int(self.rate_limit_config["max_retry"])
+        for retry_num in range(max_retry + 1):
+            self.acquire(endpoint)
+            error: RequestErrorBase | None = None
+            try:
+                response = send()
+            except RequestErrorBase as e:
+                if e.response is None:
+                    raise
+                response, error = e.response, e
+            status_code, headers = getattr(response, "status_code", None), getattr(response, "headers", None)
+            self.update(endpoint, headers)
+            if status_code not in RETRY_STATUS_LIST or retry_num == max_retry:
+                break
+            wait_time = self.get_wait_time(status_code, headers, retry_num)
+            logger.warning(
+                f"{endpoint} responded {status_code}, retry after {wait_time:.1f} [sec] ({retry_num + 1}/{max_retry})."
+            )
+            time.sleep(wait_time)
+        if error is not None:
+            raise error
+        return response
+
+
+def get_account_list(config_dict: dict) -> list[dict]:
+    """config の bluesky からアカウント設定のリストを返す
+
+    bluesky には1アカウント分の設定（辞書）か、複数アカウント分の設定のリストを指定できる
+
+    Args:
+        config_dict (dict): config.json の内容
+
+    Returns:
+        list[dict]: アカウント設定（handle_name, password）のリスト（設定と同じ順）
+    """
+    account_config = config_dict["bluesky"]
+    account_list = account_config if isinstance(account_config, list) else [account_config]
+    if len(account_list) == 0:
+        raise ValueError("bluesky account is not configured.")
+    handle_name_list = [account["handle_name"] for account in account_list]
+    if len(set(handle_name_list)) != len(handle_name_list):
+        raise ValueError("bluesky handle_name is duplicated.")
+    return account_list
+
 
 class BlueskyManager:
     handle_name: str
     handle: str
     password: str
     client: Client
+    fetch_mode: str
+    session_file: Path
+    session: Session | None = None
+    http_client: httpx.Client | None = None
+    rate_limiter: RateLimiter
+
+    def __init__(self, config_dict: dict, handle_name: str | None = None) -> None:
+        # handle_name が None の場合は最初のアカウントを使う
+        # セッションはアカウントごとに別の Client と別のセッションファイルで管理する
+        account_list = get_account_list(config_dict)
+        if handle_name is None:
+            account = account_list[0]
+        else:
+            account = next((account for account in account_list if account["handle_name"] == handle_name), None)
+            if account is None:
+                raise ValueError(f"bluesky account '{handle_name}' is not configured.")
 
-    def __init__(self, config_dict: dict) -> None:
         self.client = Client(base_url="https://bsky.social")
-        self.handle_name = config_dict["bluesky"]["handle_name"]
-        self.password = config_dict["bluesky"]["password"]
+        check_client_compatibility(self.client)
+        self.handle_name = account["handle_name"]
+        self.password = account["password"]
         self.handle = f"{self.handle_name}.bsky.social"
 
-        session_file = Path(f"./config/{self.handle_name}_session.txt")
-        session_string = session_file.read_text(encoding="utf8") if session_file.exists() else None
+        self.fetch_mode = config_dict.get("general", {}).get("fetch_mode", "validated")
+        if self.fetch_mode not in FETCH_MODE_LIST:
+            raise ValueError(f"fetch_mode '{self.fetch_mode}' is invalid.")
+        # レート制限はアカウントごとにかかるため、RateLimiter もアカウントごとに持つ
+        self.rate_limiter = RateLimiter(config_dict.get("general", {}).get("rate_limit", {}))
+
+        # ログインは最初に API を呼び出すときまで行わない（ensure_session）
+        self.session_file = Path(f"./config/{self.handle_name}_session.txt")
+        # Client は関数のコールバックのみ登録する（バウンドメソッドは無視される）ため、関数で包んで渡す
+        self.client.on_session_change(lambda event, session: self.on_session_change(event, session))
+        self.load_session()
+
+    def load_session(self) -> bool:
+        """セッションファイルに保存したセッションを読み込む
+
+        通信は行わない、リフレッシュトークンの期限が切れている場合は読み込まない
+
+        Returns:
+            bool: 読み込んだ場合 True
+        """
+        if not self.session_file.exists():
+            return False
+        try:
+            session_string = self.session_file.read_text(encoding="utf8").strip()
+            session = Session.decode(session_string)
+            if is_jwt_expired(session.refresh_jwt):
+                logger.info("Saved session is expired.")
+                return False
+        except Exception as e:
+            logger.warning(f"Saved session is invalid : {e!r}.")
+            return False
+        # login(session_string=...) と同じ読み込み（プロフィールの取得は行わない）
+        self.client._import_session_string(session_string)
+        return True
+
+    def save_session(self, session_string: str) -> None:
+        """セッションをセッションファイルに書き込む
+
+        一時ファイルに書き込んでから置き換えるため、書き込み中に中断しても壊れたファイルは残らない
+
+        Args:
+            session_string (str): 書き込むセッション
+        """
+        if self.session_file.exists() and self.session_file.read_text(encoding="utf8") == session_string:
+            return
+        self.session_file.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            "w", encoding="utf8", dir=self.session_file.parent, prefix=f".{self.session_file.name}.", delete=False
+        ) as f:
+            f.write(session_string)
+        try:
+            os.replace(f.name, self.session_file)
+        except Exception:
+            Path(f.name).unlink(missing_ok=True)
+            raise
+
+    def on_session_change(self, event: SessionEvent, session: Session) -> None:
+        """セッションが作成・更新されたときに Client から呼ばれる
+
+        Args:
+            event (SessionEvent): 作成・更新・読み込みの種類
+            session (Session): 新しいセッション
+        """
+        self.session = session.copy()
+        if event != SessionEvent.IMPORT:
+            self.save_session(session.encode())
 
+    def login(self) -> None:
+        """ハンドルネームとパスワードでログインする（createSession）
+
+        ふぁぼ一覧の取得と同じ RateLimiter を通して送り、429 / 5xx の場合は待機して再試行する
+        """
+        # login と同じセッション作成（プロフィールの取得は行わない）
+        self.rate_limiter.call(
+            CREATE_SESSION_NSID, lambda: self.client._get_and_set_session(self.handle, self.password)
+        )
+        logger.info(f"Logged in as {self.handle}.")
+
+    def refresh_session(self) -> None:
+        """リフレッシュトークンでアクセストークンを更新する（refreshSession）
+
+        リフレッシュトークンが無効になっていた場合はログインし直す
+        """
         try:
-            response = self.client.login(self.handle, self.password, session_string)
-        except BadRequestError:
-            self.client = Client(base_url="https://bsky.social")
-            response = self.client.login(self.handle, self.password)
+            with self.client._refresh_lock:
+                self.client._refresh_and_set_session()
+            logger.info("Session refreshed.")
+        except (BadRequestError, UnauthorizedError, LoginRequiredError):
+            logger.info("Refresh token is invalid, login again.")
+            self.login()
+
+    def ensure_session(self) -> None:
+        """API を呼び出せるセッションを用意する
+
+        保存したセッションがあればそのまま使い、アクセストークンの期限が近い場合のみ更新する
+        セッションがない、またはリフレッシュトークンの期限が切れている場合はログインする
+        """
+        if self.session is None or is_jwt_expired(self.session.refresh_jwt):
+            self.login()
+        elif is_jwt_expired(self.session.access_jwt, SESSION_REFRESH_MARGIN):
+            self.refresh_session()
+
+    def get_rate_limit_budget(self) -> RateLimitBudget | None:
+        """ふぁぼ一覧の取得（getActorLikes）のレート制限の残りを返す
+
+        Returns:
+            RateLimitBudget | None: レート制限の残り、通知されていない・期間が切り替わった場合は None
+        """
+        return self.rate_limiter.get_budget(GET_ACTOR_LIKES_NSID)
+
+    def get_actor_likes(self, limit: int = 100, last_post_uri: str | None = None, max_page_num: int = 100) -> dict:
+        """ふぁぼ一覧を取得する
+
+        last_post_uri が指定された場合は cursor をたどってページングし、
+        last_post_uri のエントリに到達した時点で取得を打ち切る
+        last_post_uri 自体とそれ以降のエントリは結果に含めない
+        last_post_uri が指定されなかった場合は最新の1ページのみ取得する
+
+        Args:
+            limit (int): 1ページあたりの取得件数
+            last_post_uri (str | None): 前回取得時の最新エントリの post uri
+            max_page_num (int): 最大ページ数、last_post_uri に到達しない場合の打ち切り用
+
+        Returns:
+            dict: {"feed": 取得したエントリのリスト（新しい順）, "cursor": 最後に取得したページの cursor}
+        """
+        feed_list: list[dict] = []
+        cursor: str | None = None
+        for page_feed_list, cursor in self.iter_actor_likes(limit, last_post_uri, max_page_num):
+            feed_list.extend(page_feed_list)
+        return {"feed": feed_list, "cursor": cursor}
+
+    def iter_actor_likes(
+        self, limit: int = 100, last_post_uri: str | None = None, max_page_num: int = 100
+    ) -> Iterator[tuple[list[dict], str | None]]:
+        """ふぁぼ一覧を1ページ取得するごとに返す
+
+        ページングと打ち切りの条件は get_actor_likes と同じ
+        呼び出し側が次のページを要求するまで、次のページは取得しない
+
+        Args:
+            limit (int): 1ページあたりの取得件数
+            last_post_uri (str | None): 前回取得時の最新エントリの post uri
+            max_page_num (int): 最大ページ数、last_post_uri に到達しない場合の打ち切り用
 
-        new_session_string = self.client.export_session_string()
-        if session_string != new_session_string:
-            session_file.write_text(new_session_string, encoding="utf8")
+        Yields:
+            tuple[list[dict], str | None]: (そのページで取得したエントリのリスト（新しい順）, そのページの cursor)
+        """
+        cursor: str | None = None
+        for page_num in range(1, max_page_num + 1):
+            response = self.get_actor_likes_page(cursor, limit)
 
-    def get_actor_likes(self, limit: int = 100) -> dict:
+            page_feed_list: list[dict] = response.get("feed") or []
+            feed_list: list[dict] = []
+            is_reached = False
+            for entry in page_feed_list:
+                if last_post_uri and entry.get("post", {}).get("uri") == last_post_uri:
+                    is_reached = True
+                    break
+                feed_list.append(entry)
+
+            cursor = response.get("cursor")
+            yield feed_list, cursor
+            if is_reached or not last_post_uri or not cursor or not page_feed_list:
+                break
+            if page_num == max_page_num:
+                logger.warning(f"Reached max page num ({max_page_num}) before last post uri.")
+
+    def get_actor_likes_page(self, cursor: str | None = None, limit: int = 100) -> dict:
+        """ふぁぼ一覧を1ページ分取得する
+
+        fetch_mode が raw の場合は pydantic モデルを経由せずに取得する（get_actor_likes_page_raw）
+        raw の場合、返り値の辞書のキーは API のレスポンスのまま（キャメルケース）となる
+
+        Args:
+            cursor (str | None): 取得開始位置、None の場合は最新のページ
+            limit (int): 1ページあたりの取得件数
+
+        Returns:
+            dict: {"feed": 取得したエントリのリスト（新しい順）, "cursor": 次のページの cursor}
+                  次のページが存在しない場合 cursor は None
+        """
         params = {"actor": self.handle, "limit": limit}
-        response = self.client.app.bsky.feed.get_actor_likes(params=params)
-        response = response.model_dump()
-        return response
+        if cursor:
+            params["cursor"] = cursor
+        self.ensure_session()
+        if self.fetch_mode == "raw":
+            return self.get_actor_likes_page_raw(params)
+        params_model = get_or_create(params, models.AppBskyFeedGetActorLikes.Params)
+
+        def send() -> Response:
+            # client.app.bsky.feed.get_actor_likes と同じ呼び出し（ratelimit-* ヘッダを読むためレスポンスを受け取る）
+            return self.client.invoke_query(
+                GET_ACTOR_LIKES_NSID, params=params_model, output_encoding="application/json"
+            )
+
+        try:
+            response = self.rate_limiter.call(GET_ACTOR_LIKES_NSID, send)
+        except (BadRequestError, UnauthorizedError) as e:
+            # 期限前に無効になったトークン（サーバ側での失効など）は1回だけ更新して再試行する
+            if not is_token_error(e):
+                raise
+            logger.info("Access token is rejected, refresh session.")
+            self.refresh_session()
+            response = self.rate_limiter.call(GET_ACTOR_LIKES_NSID, send)
+        return get_response_model(response, models.AppBskyFeedGetActorLikes.Response).model_dump()
+
+    def get_actor_likes_page_raw(self, params: dict) -> dict:
+        """ふぁぼ一覧を1ページ分、レスポンスの bytes から直接取得する
+
+        ログイン済のセッションの PDS とアクセストークンを用いて XRPC を直接呼び出し、
+        レスポンスを orjson でデコードする（pydantic モデルのインスタンスは作成しない）
+        ページ全体の辞書は保持せず、各エントリは FeedEntry の作成に必要な値だけに絞り込む（prune_raw_entry）
+        アクセストークンが拒否された場合は、1回だけセッションを更新して再試行する
+        レート制限と 429 / 5xx の再試行は RateLimiter で行う
+
+        Args:
+            params (dict): getActorLikes のクエリパラメータ
+
+        Returns:
+            dict: {"feed": 取得したエントリのリスト（新しい順、必要な値のみ）, "cursor": 次のページの cursor}
+        """
+        if self.http_client is None:
+            self.http_client = httpx.Client(timeout=httpx.Timeout(5, read=60), follow_redirects=True)
+        for retry_num in range(2):
+            session = self.session
+            url = f"{session.pds_endpoint.rstrip('/')}/xrpc/{GET_ACTOR_LIKES_NSID}"
+            headers = {"Authorization": f"Bearer {session.access_jwt}"}
+            response = self.rate_limiter.call(
+                GET_ACTOR_LIKES_NSID, lambda: self.http_client.get(url, params=params, headers=headers)
+            )
+            if retry_num == 0 and response.status_code in [400, 401] and get_xrpc_error(response) in TOKEN_ERROR_LIST:
+                logger.info("Access token is rejected, refresh session.")
+                self.refresh_session()
+                continue
+            break
+        response.raise_for_status()
+        response_dict = orjson.loads(response.content)
+        feed_list = [prune_raw_entry(entry) for entry in response_dict.get("feed") or []]
+        return {"feed": feed_list, "cursor": response_dict.get("cursor")}
 
 
 if __name__ == "__main__":
@@ -1,4 +1,5 @@
-from datetime import datetime, timedelta
+import base64
+from datetime import datetime, timedelta, timezone
 from typing import Any
 
 
@@ -45,3 +46,39 @@ def to_jst(gmt: datetime) -> datetime:
         raise ValueError("args is not datetime.")
     jst = gmt + timedelta(hours=9)
     return jst
+
+
+def to_epoch(jst_isoformat: str) -> int | None:
+    """日本時間のISOフォーマット日時文字列を UNIX 時間（秒）に変換する
+
+    Args:
+        jst_isoformat (str): ISOフォーマットの日時文字列(JST)、タイムゾーン指定がない場合は JST とみなす
+
+    Returns:
+        int | None: UNIX 時間（秒）、変換できなかった場合は None
+    """
+    try:
+        dt = datetime.fromisoformat(jst_isoformat)
+    except (TypeError, ValueError):
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone(timedelta(hours=9)))
+    return int(dt.timestamp())
+
+
+def to_raw_cid(sha256_digest: bytes) -> str:
+    """sha2-256 のダイジェストから CIDv1 (raw, base32) 文字列を作成する
+
+    Bluesky の画像 blob の CID ("bafkrei..." で始まるもの) はこの形式で表される
+
+    Args:
+        sha256_digest (bytes): 対象バイト列の sha2-256 ダイジェスト
+
+    Returns:
+        str: CIDv1 文字列
+    """
+    if not isinstance(sha256_digest, bytes) or len(sha256_digest) != 32:
+        raise ValueError("args is not sha2-256 digest.")
+    # version(1), codec(raw), multihash(sha2-256, 32byte)
+    cid_bytes = bytes([0x01, 0x55, 0x12, 0x20]) + sha256_digest
+    return "b" + base64.b32encode(cid_bytes).decode().lower().rstrip("=")
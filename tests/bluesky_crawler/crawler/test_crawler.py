@@ -1,3 +1,4 @@
+import asyncio
 import shutil
 import sys
 import unittest
@@ -7,21 +8,37 @@ from pathlib import Path
 
 import freezegun
 import orjson
-from mock import MagicMock, call, patch
+from mock import AsyncMock, MagicMock, call, patch
 
-from bluesky_crawler.crawler.crawler import Crawler
+from bluesky_crawler.crawler.crawler import DEFAULT_PIPELINE_CONFIG, Crawler
 from bluesky_crawler.crawler.downloader import Downloader
 from bluesky_crawler.crawler.fetcher import Fetcher
 from bluesky_crawler.crawler.valueobject.fetched_info import FetchedInfo
+from bluesky_crawler.db.crawl_state_db import CrawlStateDB
+from bluesky_crawler.db.failed_media_db import FailedMediaDB
 from bluesky_crawler.db.like_db import LikeDB
 from bluesky_crawler.db.media_db import MediaDB
 from bluesky_crawler.db.model import Media
 from bluesky_crawler.db.user_db import UserDB
-from bluesky_crawler.manager.manager import BlueskyManager
+from bluesky_crawler.manager.manager import BlueskyManager, RateLimitBudget
 from bluesky_crawler.util import find_values
 
 
 class TestCrawler(unittest.TestCase):
+    def setUp(self) -> None:
+        # config.json の読み込み
+        self.config_dict = {
+            "bluesky": {"handle_name": "dummy_handle_name", "password": "dummy_password"},
+            "general": {
+                "save_base_path": "./tests/bluesky_crawler/config/test_base_path/",
+                "save_num": 300,
+                "sqlite_pragma": {"journal_mode": "WAL"},
+            },
+        }
+        mock_read_bytes = self.enterContext(patch("bluesky_crawler.crawler.crawler.Path.read_bytes"))
+        mock_read_bytes.side_effect = lambda: orjson.dumps(self.config_dict)
+        return super().setUp()
+
     def make_fetched_dict(self, index: int = 0, media_num: int = 4) -> dict:
         post_id = f"post_id_{index}"
         user_id = f"user_id_{index}"
@@ -85,15 +102,42 @@ class TestCrawler(unittest.TestCase):
         mock_like_db = self.enterContext(patch("bluesky_crawler.crawler.crawler.LikeDB", spec=LikeDB))
         mock_user_db = self.enterContext(patch("bluesky_crawler.crawler.crawler.UserDB", spec=UserDB))
         mock_media_db = self.enterContext(patch("bluesky_crawler.crawler.crawler.MediaDB", spec=MediaDB))
+        mock_crawl_state_db = self.enterContext(
+            patch("bluesky_crawler.crawler.crawler.CrawlStateDB", spec=CrawlStateDB)
+        )
+        mock_failed_media_db = self.enterContext(
+            patch("bluesky_crawler.crawler.crawler.FailedMediaDB", spec=FailedMediaDB)
+        )
         instance = Crawler()
-        self.assertIsInstance(instance.fetcher, Fetcher)
+        self.assertEqual(["dummy_handle_name"], list(instance.fetcher_dict))
+        self.assertIsInstance(instance.fetcher_dict["dummy_handle_name"], Fetcher)
+        mock_fetcher.assert_called_once_with(Path("./config/config.json"), handle_name="dummy_handle_name")
         self.assertIsInstance(instance.downloader, Downloader)
         self.assertIsInstance(instance.like_db, LikeDB)
         self.assertIsInstance(instance.user_db, UserDB)
         self.assertIsInstance(instance.media_db, MediaDB)
+        self.assertIsInstance(instance.crawl_state_db, CrawlStateDB)
+        self.assertIsInstance(instance.failed_media_db, FailedMediaDB)
+
+        pragma_dict = self.config_dict["general"]["sqlite_pragma"]
+        mock_like_db.assert_called_once_with(pragma_dict=pragma_dict)
+        mock_user_db.assert_called_once_with(pragma_dict=pragma_dict)
+        mock_media_db.assert_called_once_with(pragma_dict=pragma_dict)
+        mock_crawl_state_db.assert_called_once_with(pragma_dict=pragma_dict)
+        mock_failed_media_db.assert_called_once_with(pragma_dict=pragma_dict)
         self.assertEqual(Path("./config/config.json"), instance.config_path)
+        self.assertEqual(DEFAULT_PIPELINE_CONFIG, instance.pipeline_config)
 
-    def test_run(self):
+        self.config_dict["general"]["pipeline"] = {"queue_size": 8}
+        instance = Crawler()
+        self.assertEqual(DEFAULT_PIPELINE_CONFIG | {"queue_size": 8}, instance.pipeline_config)
+
+        for invalid_config in [{"queue_size": 0}, {"max_failed_attempts": 0}]:
+            self.config_dict["general"]["pipeline"] = invalid_config
+            with self.assertRaises(ValueError):
+                instance = Crawler()
+
+    def test_store(self):
         self.enterContext(freezegun.freeze_time("2099-03-24T12:34:56"))
         mock_logger = self.enterContext(patch("bluesky_crawler.crawler.crawler.logger"))
         mock_fetcher = self.enterContext(patch("bluesky_crawler.crawler.crawler.Fetcher", spec=Fetcher))
@@ -101,18 +145,29 @@ class TestCrawler(unittest.TestCase):
         mock_like_db = self.enterContext(patch("bluesky_crawler.crawler.crawler.LikeDB", spec=LikeDB))
         mock_user_db = self.enterContext(patch("bluesky_crawler.crawler.crawler.UserDB", spec=UserDB))
         mock_media_db = self.enterContext(patch("bluesky_crawler.crawler.crawler.MediaDB", spec=MediaDB))
+        mock_crawl_state_db = self.enterContext(
+            patch("bluesky_crawler.crawler.crawler.CrawlStateDB", spec=CrawlStateDB)
+        )
+        mock_failed_media_db = self.enterContext(
+            patch("bluesky_crawler.crawler.crawler.FailedMediaDB", spec=FailedMediaDB)
+        )
         config_path: Path = Path("./config/config.json")
-        DB_LIMIT_MEDIA_NUM = 1000
-        max_fetched_list_num = (DB_LIMIT_MEDIA_NUM * 2) // 4 + 2
+        pragma_dict = self.config_dict["general"]["sqlite_pragma"]
+        max_fetched_list_num = MediaDB.CHUNK_SIZE // 2 + 2
 
-        def pre_run(in_db_media_flag, fetched_info_num):
-            fetched_list = self.make_fetched_list(fetched_info_num)
+        def pre_run(in_db_media_flag, fetched_info_num, download_failed_flag):
             mock_fetcher.reset_mock()
-            mock_fetcher.return_value.fetch.side_effect = lambda: fetched_list
-
+            mock_crawl_state_db.reset_mock()
             mock_downloader.reset_mock()
+            mock_downloader.return_value.download.side_effect = lambda media_list: (
+                media_list[:2] if download_failed_flag else []
+            )
             mock_like_db.reset_mock()
             mock_user_db.reset_mock()
+            mock_failed_media_db.reset_mock()
+            mock_failed_media_db.return_value.add_attempt.side_effect = lambda media_list: {
+                media.media_id: 1 for media in media_list
+            }
 
             mock_media_db.reset_mock()
             if in_db_media_flag:
@@ -123,11 +178,14 @@ class TestCrawler(unittest.TestCase):
                     for record in records:
                         _, _, media = record
                         in_db_media.append(media)
-                mock_media_db.return_value.select.side_effect = lambda: in_db_media
+                in_db_media_id = {m.media_id for m in in_db_media}
+                mock_media_db.return_value.select_exist_media_id.side_effect = lambda media_id_list: {
+                    media_id for media_id in media_id_list if media_id in in_db_media_id
+                }
             else:
-                mock_media_db.return_value.select.side_effect = lambda: []
+                mock_media_db.return_value.select_exist_media_id.side_effect = lambda media_id_list: set()
 
-        def post_run(in_db_media_flag, fetched_info_num):
+        def post_run(in_db_media_flag, fetched_info_num, download_failed_flag, actual):
             fetched_list = self.make_fetched_list(fetched_info_num)
             in_db_media: list[Media] = []
             if in_db_media_flag:
@@ -140,9 +198,8 @@ class TestCrawler(unittest.TestCase):
                         in_db_media.append(media)
             else:
                 in_db_media = []
-            if (n := len(in_db_media)) > DB_LIMIT_MEDIA_NUM:
-                in_db_media = in_db_media[n - DB_LIMIT_MEDIA_NUM :]
             in_db_media_id = [m.media_id for m in in_db_media]
+            candidate_media_id_list = [media.media_id for fetched in fetched_list for media in fetched.media_list]
 
             like_list, user_list, media_list = [], [], []
             for fetched_record in fetched_list:
@@ -158,33 +215,585 @@ class TestCrawler(unittest.TestCase):
                     if media not in media_list:
                         media_list.append(media)
 
-            self.assertEqual([call(config_path), call().fetch()], mock_fetcher.mock_calls)
+            self.assertEqual([call(config_path, handle_name="dummy_handle_name")], mock_fetcher.mock_calls)
+            self.assertEqual([call(pragma_dict=pragma_dict)], mock_crawl_state_db.mock_calls)
 
             if len(media_list) == 0:
                 self.assertEqual([call(config_path)], mock_downloader.mock_calls)
-                self.assertEqual([call()], mock_like_db.mock_calls)
-                self.assertEqual([call()], mock_user_db.mock_calls)
-                self.assertEqual([call(), call().select()], mock_media_db.mock_calls)
+                self.assertEqual([call(pragma_dict=pragma_dict)], mock_like_db.mock_calls)
+                self.assertEqual([call(pragma_dict=pragma_dict)], mock_user_db.mock_calls)
+                self.assertEqual(
+                    [call(pragma_dict=pragma_dict), call().select_exist_media_id(candidate_media_id_list)],
+                    mock_media_db.mock_calls,
+                )
+                self.assertEqual((0, 0), actual)
             else:
+                session = mock_media_db.return_value.transaction.return_value.__enter__.return_value
                 self.assertEqual([call(config_path), call().download(media_list)], mock_downloader.mock_calls)
-                self.assertEqual([call(), call().upsert(like_list)], mock_like_db.mock_calls)
-                self.assertEqual([call(), call().upsert(user_list)], mock_user_db.mock_calls)
-                self.assertEqual([call(), call().select(), call().upsert(media_list)], mock_media_db.mock_calls)
+                failed_media_list = []
+                if download_failed_flag:
+                    # DL に失敗したメディアと、そのメディアを含むエントリの Like/User は DB に登録しない
+                    failed_media_list = media_list[:2]
+                    failed_post_id_set = {media.post_id for media in failed_media_list}
+                    like_list = [like for like in like_list if like.post_id not in failed_post_id_set]
+                    user_list = [user for user in user_list if user.user_id in {like.user_id for like in like_list}]
+                    media_list = media_list[2:]
+                self.assertEqual(
+                    [call(pragma_dict=pragma_dict), call().upsert(like_list, session)], mock_like_db.mock_calls
+                )
+                self.assertEqual(
+                    [call(pragma_dict=pragma_dict), call().upsert(user_list, session)], mock_user_db.mock_calls
+                )
+                self.assertEqual(
+                    [
+                        call(pragma_dict=pragma_dict),
+                        call().select_exist_media_id(candidate_media_id_list),
+                        call().transaction(),
+                        call().transaction().__enter__(),
+                        call().upsert(media_list, session),
+                        call().transaction().__exit__(None, None, None),
+                    ],
+                    mock_media_db.mock_calls,
+                )
+                self.assertEqual((len(media_list), len(failed_media_list)), actual)
 
-        Params = namedtuple("Params", ["in_db_media_flag", "fetched_info_num"])
+        Params = namedtuple("Params", ["in_db_media_flag", "fetched_info_num", "download_failed_flag"])
         params_list = [
-            Params(False, 5),
-            Params(False, 0),
-            Params(True, 5),
-            Params(True, max_fetched_list_num),
+            Params(False, 5, False),
+            Params(False, 0, False),
+            Params(True, 5, False),
+            Params(True, max_fetched_list_num, False),
+            Params(False, 5, True),
         ]
 
         for params in params_list:
-            pre_run(params.in_db_media_flag, params.fetched_info_num)
+            pre_run(params.in_db_media_flag, params.fetched_info_num, params.download_failed_flag)
             instance = Crawler()
+            actual = instance.store(self.make_fetched_list(params.fetched_info_num))
+            post_run(params.in_db_media_flag, params.fetched_info_num, params.download_failed_flag, actual)
+
+        # DL の結果に従って失敗した回数の記録を更新する
+        pre_run(False, 5, True)
+        instance = Crawler()
+        actual = instance.store(self.make_fetched_list(5))
+        media_list = [media for fetched in self.make_fetched_list(5) for media in fetched.media_list]
+        self.assertEqual(
+            [call.delete([media.media_id for media in media_list[2:]]), call.add_attempt(media_list[:2])],
+            mock_failed_media_db.return_value.mock_calls,
+        )
+
+        # max_failed_attempts 回失敗したメディアはエントリの登録を見送らず、メディアのみ登録しない
+        pre_run(False, 5, True)
+        max_failed_attempts = DEFAULT_PIPELINE_CONFIG["max_failed_attempts"]
+        mock_failed_media_db.return_value.add_attempt.side_effect = lambda media_list: {
+            media.media_id: max_failed_attempts for media in media_list
+        }
+        instance = Crawler()
+        actual = instance.store(self.make_fetched_list(5))
+        self.assertEqual((len(media_list) - 2, 0), actual)
+        session = mock_media_db.return_value.transaction.return_value.__enter__.return_value
+        mock_media_db.return_value.upsert.assert_called_once_with(media_list[2:], session)
+        liked_post_id_list = [like.post_id for like in mock_like_db.return_value.upsert.call_args.args[0]]
+        self.assertEqual(list(dict.fromkeys(media.post_id for media in media_list)), liked_post_id_list)
+
+    def test_run(self):
+        self.enterContext(freezegun.freeze_time("2099-03-24T12:34:56"))
+        mock_logger = self.enterContext(patch("bluesky_crawler.crawler.crawler.logger"))
+        mock_fetcher = self.enterContext(patch("bluesky_crawler.crawler.crawler.Fetcher", spec=Fetcher))
+        mock_downloader = self.enterContext(patch("bluesky_crawler.crawler.crawler.Downloader", spec=Downloader))
+        mock_like_db = self.enterContext(patch("bluesky_crawler.crawler.crawler.LikeDB", spec=LikeDB))
+        mock_user_db = self.enterContext(patch("bluesky_crawler.crawler.crawler.UserDB", spec=UserDB))
+        mock_media_db = self.enterContext(patch("bluesky_crawler.crawler.crawler.MediaDB", spec=MediaDB))
+        mock_crawl_state_db = self.enterContext(
+            patch("bluesky_crawler.crawler.crawler.CrawlStateDB", spec=CrawlStateDB)
+        )
+        mock_failed_media_db = self.enterContext(
+            patch("bluesky_crawler.crawler.crawler.FailedMediaDB", spec=FailedMediaDB)
+        )
+        last_post_uri = "last_post_uri"
+        latest_post_uri = "latest_post_uri"
+        page_size = 3
+
+        def make_page_list(page_num: int, duplicate_flag: bool) -> list[list[dict]]:
+            # ページは新しい順、ページ内のエントリも新しい順
+            post_list = self.make_fetched_dict_list(page_num * page_size)["feed"]
+            page_list = [post_list[i : i + page_size] for i in range(0, len(post_list), page_size)]
+            if duplicate_flag and page_list:
+                # 前のページと同じメディアを含むエントリ
+                page_list[-1].append(page_list[0][0])
+            return page_list
+
+        def pre_run(page_num, in_db_media_flag, download_failed_flag, duplicate_flag):
+            page_list = make_page_list(page_num, duplicate_flag)
+            mock_fetcher.reset_mock()
+            mock_fetcher.return_value.fetch_iter.side_effect = lambda last_post_uri: iter(page_list)
+            mock_fetcher.return_value.create_fetched_info_list.side_effect = lambda post_list: [
+                FetchedInfo.create(entry) for entry in reversed(post_list)
+            ]
+            mock_fetcher.return_value.get_parse_batch_size.return_value = 1
+            mock_fetcher.return_value.latest_post_uri = latest_post_uri
+            mock_crawl_state_db.reset_mock()
+            mock_crawl_state_db.return_value.get_value.side_effect = lambda key: last_post_uri
+
+            mock_downloader.reset_mock()
+            mock_downloader.return_value.excute = AsyncMock(
+                side_effect=lambda media_list, client: media_list[:1] if download_failed_flag else []
+            )
+            mock_like_db.reset_mock()
+            mock_user_db.reset_mock()
+            mock_failed_media_db.reset_mock()
+            mock_failed_media_db.return_value.select_retry.return_value = []
+            mock_failed_media_db.return_value.add_attempt.side_effect = lambda media_list: {
+                media.media_id: 1 for media in media_list
+            }
+            mock_media_db.reset_mock()
+            # 最も古いページのメディアは DB に登録済
+            in_db_media_id = set()
+            if in_db_media_flag and page_list:
+                for fetched in self.make_fetched_list(page_size):
+                    in_db_media_id.update(media.media_id for media in fetched.media_list)
+            mock_media_db.return_value.select_exist_media_id.side_effect = lambda media_id_list: {
+                media_id for media_id in media_id_list if media_id in in_db_media_id
+            }
+            return in_db_media_id
+
+        def post_run(page_num, in_db_media_flag, download_failed_flag, duplicate_flag, in_db_media_id):
+            seen_media_id = set(in_db_media_id)
+            expect_excute_calls, expect_like_calls, expect_user_calls, expect_media_calls = [], [], [], []
+            client = mock_downloader.return_value.create_client.return_value.__aenter__.return_value
+            session = mock_media_db.return_value.transaction.return_value.__enter__.return_value
+            for post_list in make_page_list(page_num, duplicate_flag):
+                like_list, user_list, media_list = [], [], []
+                for fetched in [FetchedInfo.create(entry) for entry in reversed(post_list)]:
+                    for like, user, media in fetched.get_records():
+                        if media.media_id in seen_media_id:
+                            continue
+                        if like not in like_list:
+                            like_list.append(like)
+                        if user not in user_list:
+                            user_list.append(user)
+                        if media not in media_list:
+                            media_list.append(media)
+                if len(media_list) == 0:
+                    continue
+                seen_media_id.update(media.media_id for media in media_list)
+                expect_excute_calls.append(call(media_list, client))
+                if download_failed_flag:
+                    # DL に失敗したメディアと、そのメディアを含むエントリの Like/User は DB に登録しない
+                    like_list = [like for like in like_list if like.post_id != media_list[0].post_id]
+                    user_list = [user for user in user_list if user.user_id in {like.user_id for like in like_list}]
+                    media_list = media_list[1:]
+                expect_like_calls.append(call.upsert(like_list, session))
+                expect_user_calls.append(call.upsert(user_list, session))
+                expect_media_calls.append(call.upsert(media_list, session))
+
+            mock_fetcher.return_value.fetch_iter.assert_called_once_with(last_post_uri)
+            # 保存済ファイルの索引は crawl ごとに作り直す
+            mock_downloader.return_value.clear_file_index.assert_called_once_with()
+            # 解析のワーカープロセスのプールはパイプラインの間使い回す
+            mock_fetcher.return_value.reuse_process_pool.assert_called_once_with()
+            self.assertEqual(expect_excute_calls, mock_downloader.return_value.excute.mock_calls)
+            self.assertEqual(expect_like_calls, mock_like_db.return_value.mock_calls)
+            self.assertEqual(expect_user_calls, mock_user_db.return_value.mock_calls)
+            actual_media_calls = [c for c in mock_media_db.return_value.mock_calls if c[0] == "upsert"]
+            self.assertEqual(expect_media_calls, actual_media_calls)
+            # 最新エントリはすべてのページを登録し終えてから更新する
+            # DL に失敗したメディアがあった場合は更新せず、次回に前回の位置から再取得する
+            expect_state_calls = [call.get_value(f"{Crawler.LATEST_POST_URI_KEY}:dummy_handle_name")]
+            if not download_failed_flag or not expect_excute_calls:
+                expect_state_calls.append(
+                    call.set_value(f"{Crawler.LATEST_POST_URI_KEY}:dummy_handle_name", latest_post_uri)
+                )
+            self.assertEqual(expect_state_calls, mock_crawl_state_db.return_value.mock_calls)
+
+        Params = namedtuple("Params", ["page_num", "in_db_media_flag", "download_failed_flag", "duplicate_flag"])
+        params_list = [
+            Params(3, False, False, False),
+            Params(0, False, False, False),
+            Params(3, True, False, False),
+            Params(1, True, False, False),
+            Params(3, False, True, False),
+            Params(3, False, False, True),
+        ]
+        for params in params_list:
+            in_db_media_id = pre_run(*params)
+            instance = Crawler()
+            instance.pipeline_config["queue_size"] = 1
             actual = instance.run()
+            post_run(*params, in_db_media_id)
+            expect_media_num = sum(len(c.args[0]) for c in mock_media_db.return_value.upsert.mock_calls)
+            self.assertEqual(expect_media_num, actual)
+
+        # DL に失敗したメディアは次回の実行時に再取得し、そのエントリの Like/User とともに登録する
+        in_db_media_id = pre_run(3, False, True, False)
+        Crawler().run()
+        committed_media_list = [media for c in mock_media_db.return_value.upsert.mock_calls for media in c.args[0]]
+        failed_media_list = [c.args[0][0] for c in mock_downloader.return_value.excute.mock_calls]
+        in_db_media_id.update(media.media_id for media in committed_media_list)
+        mock_downloader.return_value.excute = AsyncMock(side_effect=lambda media_list, client: [])
+        mock_like_db.reset_mock()
+        mock_user_db.reset_mock()
+        mock_media_db.return_value.upsert.reset_mock()
+        mock_crawl_state_db.reset_mock()
+        actual = Crawler().run()
+        mock_fetcher.return_value.fetch_iter.assert_called_with(last_post_uri)
+        retried_media_list = [media for c in mock_downloader.return_value.excute.mock_calls for media in c.args[0]]
+        self.assertEqual(failed_media_list, retried_media_list)
+        self.assertEqual(len(failed_media_list), actual)
+        retried_post_id_list = [media.post_id for media in failed_media_list]
+        liked_post_id_list = [like.post_id for c in mock_like_db.return_value.upsert.mock_calls for like in c.args[0]]
+        self.assertEqual(retried_post_id_list, liked_post_id_list)
+        mock_crawl_state_db.return_value.set_value.assert_called_once_with(
+            f"{Crawler.LATEST_POST_URI_KEY}:dummy_handle_name", latest_post_uri
+        )
+
+        # max_failed_attempts 回失敗したメディアは最新エントリの更新を妨げず、エントリを登録する
+        pre_run(3, False, True, False)
+        max_failed_attempts = DEFAULT_PIPELINE_CONFIG["max_failed_attempts"]
+        mock_failed_media_db.return_value.add_attempt.side_effect = lambda media_list: {
+            media.media_id: max_failed_attempts for media in media_list
+        }
+        actual = Crawler().run()
+        failed_media_list = [c.args[0][0] for c in mock_downloader.return_value.excute.mock_calls]
+        self.assertEqual(
+            [call(failed_media_list[i : i + 1]) for i in range(3)],
+            mock_failed_media_db.return_value.add_attempt.mock_calls,
+        )
+        liked_post_id_set = {like.post_id for c in mock_like_db.return_value.upsert.mock_calls for like in c.args[0]}
+        self.assertTrue({media.post_id for media in failed_media_list} <= liked_post_id_set)
+        committed_media_list = [media for c in mock_media_db.return_value.upsert.mock_calls for media in c.args[0]]
+        self.assertEqual([], [media for media in committed_media_list if media in failed_media_list])
+        self.assertEqual(len(committed_media_list), actual)
+        mock_crawl_state_db.return_value.set_value.assert_called_once_with(
+            f"{Crawler.LATEST_POST_URI_KEY}:dummy_handle_name", latest_post_uri
+        )
+
+        # 再取得リストのメディアは crawl ごとに再取得し、成功したメディアのみ登録する
+        pre_run(0, False, False, False)
+        retry_media_list = failed_media_list
+        mock_failed_media_db.return_value.select_retry.return_value = retry_media_list
+        mock_downloader.return_value.excute = AsyncMock(side_effect=lambda media_list, client: media_list[:1])
+        actual = Crawler().run()
+        self.assertEqual(len(retry_media_list) - 1, actual)
+        mock_failed_media_db.return_value.select_retry.assert_called_once_with(max_failed_attempts)
+        mock_downloader.return_value.excute.assert_called_once_with(retry_media_list, None)
+        mock_media_db.return_value.upsert.assert_called_once_with(retry_media_list[1:])
+        mock_failed_media_db.return_value.delete.assert_called_once_with([
+            media.media_id for media in retry_media_list[1:]
+        ])
+        mock_failed_media_db.return_value.add_attempt.assert_called_once_with(retry_media_list[:1])
+
+        # 解析をワーカープロセスで行う設定の場合は、まとめて解析するエントリ数までページをまとめる
+        pre_run(3, False, False, False)
+        mock_fetcher.return_value.get_parse_batch_size.return_value = page_size * 2
+        actual = Crawler().run()
+        page_list = make_page_list(3, False)
+        self.assertEqual(
+            [call(page_list[0] + page_list[1]), call(page_list[2])],
+            mock_fetcher.return_value.create_fetched_info_list.mock_calls,
+        )
+        self.assertEqual(page_size * 3 * 4, actual)
+
+        # DL に使用するクライアントが指定された場合はそれを使う
+        pre_run(1, False, False, False)
+        instance = Crawler()
+        client = MagicMock()
+        actual = asyncio.run(instance.crawl(client))
+        self.assertEqual(page_size * 4, actual)
+        mock_downloader.return_value.create_client.assert_not_called()
+        self.assertIs(client, mock_downloader.return_value.excute.call_args.args[1])
+
+        # 途中のステージで例外が発生した場合は、そのまま送出し最新エントリを更新しない
+        pre_run(3, False, False, False)
+        mock_downloader.return_value.excute.side_effect = OSError("download error")
+        instance = Crawler()
+        with self.assertRaises(OSError):
+            instance.run()
+        mock_crawl_state_db.return_value.set_value.assert_not_called()
+
+    def test_get_account_state(self):
+        mock_logger = self.enterContext(patch("bluesky_crawler.crawler.crawler.logger"))
+        mock_fetcher = self.enterContext(patch("bluesky_crawler.crawler.crawler.Fetcher", spec=Fetcher))
+        mock_downloader = self.enterContext(patch("bluesky_crawler.crawler.crawler.Downloader", spec=Downloader))
+        mock_like_db = self.enterContext(patch("bluesky_crawler.crawler.crawler.LikeDB", spec=LikeDB))
+        mock_user_db = self.enterContext(patch("bluesky_crawler.crawler.crawler.UserDB", spec=UserDB))
+        mock_media_db = self.enterContext(patch("bluesky_crawler.crawler.crawler.MediaDB", spec=MediaDB))
+        mock_crawl_state_db = self.enterContext(
+            patch("bluesky_crawler.crawler.crawler.CrawlStateDB", spec=CrawlStateDB)
+        )
+        mock_failed_media_db = self.enterContext(
+            patch("bluesky_crawler.crawler.crawler.FailedMediaDB", spec=FailedMediaDB)
+        )
+        self.config_dict["bluesky"] = [
+            {"handle_name": "handle_name_0", "password": "password_0"},
+            {"handle_name": "handle_name_1", "password": "password_1"},
+        ]
+        key = Crawler.LATEST_POST_URI_KEY
+        state_dict = {}
+        mock_crawl_state_db.return_value.get_value.side_effect = lambda key: state_dict.get(key)
+        mock_crawl_state_db.return_value.set_value.side_effect = lambda key, value: state_dict.update({key: value})
+        instance = Crawler()
+        self.assertEqual(f"{key}:handle_name_0", instance.get_state_key(key, "handle_name_0"))
+
+        instance.set_account_state(key, "handle_name_1", "uri_1")
+        self.assertEqual({f"{key}:handle_name_1": "uri_1"}, state_dict)
+        self.assertEqual("uri_1", instance.get_account_state(key, "handle_name_1"))
+        self.assertIsNone(instance.get_account_state(key, "handle_name_0"))
+
+        # 複数アカウント対応前の値は最初のアカウントの値として移す
+        state_dict[key] = "legacy_uri"
+        self.assertEqual("legacy_uri", instance.get_account_state(key, "handle_name_0"))
+        self.assertEqual(
+            {f"{key}:handle_name_1": "uri_1", f"{key}:handle_name_0": "legacy_uri", key: None}, state_dict
+        )
+        self.assertEqual("legacy_uri", instance.get_account_state(key, "handle_name_0"))
+
+        # 最初のアカウント以外は複数アカウント対応前の値を使わない
+        state_dict.clear()
+        state_dict[key] = "legacy_uri"
+        self.assertIsNone(instance.get_account_state(key, "handle_name_1"))
+        self.assertEqual({key: "legacy_uri"}, state_dict)
+
+    def test_get_rate_limit_budget_list(self):
+        mock_logger = self.enterContext(patch("bluesky_crawler.crawler.crawler.logger"))
+        mock_fetcher = self.enterContext(patch("bluesky_crawler.crawler.crawler.Fetcher", spec=Fetcher))
+        mock_downloader = self.enterContext(patch("bluesky_crawler.crawler.crawler.Downloader", spec=Downloader))
+        mock_like_db = self.enterContext(patch("bluesky_crawler.crawler.crawler.LikeDB", spec=LikeDB))
+        mock_user_db = self.enterContext(patch("bluesky_crawler.crawler.crawler.UserDB", spec=UserDB))
+        mock_media_db = self.enterContext(patch("bluesky_crawler.crawler.crawler.MediaDB", spec=MediaDB))
+        mock_crawl_state_db = self.enterContext(
+            patch("bluesky_crawler.crawler.crawler.CrawlStateDB", spec=CrawlStateDB)
+        )
+        mock_failed_media_db = self.enterContext(
+            patch("bluesky_crawler.crawler.crawler.FailedMediaDB", spec=FailedMediaDB)
+        )
+        instance = Crawler()
+        budget = RateLimitBudget(3000, 2990, 4070000000.0)
+        budget_dict = {"handle_name_0": budget, "handle_name_1": None}
+        instance.fetcher_dict = {}
+        for handle_name, handle_budget in budget_dict.items():
+            fetcher = MagicMock()
+            fetcher.manager.get_rate_limit_budget.return_value = handle_budget
+            instance.fetcher_dict[handle_name] = fetcher
+
+        # サーバから通知されていないアカウントは含まない
+        self.assertEqual([budget], instance.get_rate_limit_budget_list())
+
+    def test_run_multi_account(self):
+        mock_logger = self.enterContext(patch("bluesky_crawler.crawler.crawler.logger"))
+        mock_fetcher = self.enterContext(patch("bluesky_crawler.crawler.crawler.Fetcher", spec=Fetcher))
+        mock_downloader = self.enterContext(patch("bluesky_crawler.crawler.crawler.Downloader", spec=Downloader))
+        mock_like_db = self.enterContext(patch("bluesky_crawler.crawler.crawler.LikeDB", spec=LikeDB))
+        mock_user_db = self.enterContext(patch("bluesky_crawler.crawler.crawler.UserDB", spec=UserDB))
+        mock_media_db = self.enterContext(patch("bluesky_crawler.crawler.crawler.MediaDB", spec=MediaDB))
+        mock_crawl_state_db = self.enterContext(
+            patch("bluesky_crawler.crawler.crawler.CrawlStateDB", spec=CrawlStateDB)
+        )
+        mock_failed_media_db = self.enterContext(
+            patch("bluesky_crawler.crawler.crawler.FailedMediaDB", spec=FailedMediaDB)
+        )
+        handle_name_list = ["handle_name_0", "handle_name_1"]
+        self.config_dict["bluesky"] = [
+            {"handle_name": handle_name, "password": f"password_{i}"} for i, handle_name in enumerate(handle_name_list)
+        ]
+        # 2つのアカウントで post_id_2 ~ post_id_3 に共通してふぁぼをつけている
+        post_list = self.make_fetched_dict_list(6)["feed"]
+        page_list_dict = {"handle_name_0": [post_list[2:4], post_list[4:]], "handle_name_1": [post_list[:4]]}
+
+        def make_fetcher(config_path, handle_name):
+            fetcher = MagicMock(spec=Fetcher)
+            fetcher.fetch_iter.side_effect = lambda last_post_uri: iter(page_list_dict[handle_name])
+            fetcher.create_fetched_info_list.side_effect = lambda post_list: [
+                FetchedInfo.create(entry) for entry in reversed(post_list)
+            ]
+            fetcher.get_parse_batch_size.return_value = 1
+            fetcher.latest_post_uri = f"latest_post_uri_{handle_name}"
+            return fetcher
+
+        mock_fetcher.side_effect = make_fetcher
+        mock_crawl_state_db.return_value.get_value.side_effect = lambda key: (
+            f"last_post_uri_{key.split(':')[-1]}" if ":" in key else None
+        )
+        mock_downloader.return_value.excute = AsyncMock(side_effect=lambda media_list, client: [])
+        mock_media_db.return_value.select_exist_media_id.side_effect = lambda media_id_list: set()
+
+        instance = Crawler()
+        actual = instance.run()
+
+        # 各アカウントの前回の最新エントリから取得する
+        for handle_name in handle_name_list:
+            fetcher = instance.fetcher_dict[handle_name]
+            fetcher.fetch_iter.assert_called_once_with(f"last_post_uri_{handle_name}")
+
+        # 共通のメディアは1回だけ DL する
+        downloaded_media_list = [media for c in mock_downloader.return_value.excute.mock_calls for media in c.args[0]]
+        expect_media_list = [media for fetched in self.make_fetched_list(6) for media in fetched.media_list]
+        self.assertEqual(len(expect_media_list), len(downloaded_media_list))
+        self.assertEqual(set(expect_media_list), set(downloaded_media_list))
+        self.assertEqual(len(expect_media_list), actual)
+
+        # 最新エントリはアカウントごとに保存する
+        set_value_calls = [c for c in mock_crawl_state_db.return_value.mock_calls if c[0] == "set_value"]
+        expect_set_value_calls = [
+            call.set_value(f"{Crawler.LATEST_POST_URI_KEY}:{handle_name}", f"latest_post_uri_{handle_name}")
+            for handle_name in handle_name_list
+        ]
+        self.assertEqual(expect_set_value_calls, set_value_calls)
+
+    def test_backfill(self):
+        self.enterContext(freezegun.freeze_time("2099-03-24T12:34:56"))
+        mock_logger = self.enterContext(patch("bluesky_crawler.crawler.crawler.logger"))
+        mock_fetcher = self.enterContext(patch("bluesky_crawler.crawler.crawler.Fetcher", spec=Fetcher))
+        mock_downloader = self.enterContext(patch("bluesky_crawler.crawler.crawler.Downloader", spec=Downloader))
+        mock_like_db = self.enterContext(patch("bluesky_crawler.crawler.crawler.LikeDB", spec=LikeDB))
+        mock_user_db = self.enterContext(patch("bluesky_crawler.crawler.crawler.UserDB", spec=UserDB))
+        mock_media_db = self.enterContext(patch("bluesky_crawler.crawler.crawler.MediaDB", spec=MediaDB))
+        mock_crawl_state_db = self.enterContext(
+            patch("bluesky_crawler.crawler.crawler.CrawlStateDB", spec=CrawlStateDB)
+        )
+        mock_failed_media_db = self.enterContext(
+            patch("bluesky_crawler.crawler.crawler.FailedMediaDB", spec=FailedMediaDB)
+        )
+        mock_store = self.enterContext(patch("bluesky_crawler.crawler.crawler.Crawler.store"))
+        latest_post_uri = "latest_post_uri"
+        page_num = 3
+
+        def pre_run(stored_cursor, failed_page):
+            mock_fetcher.reset_mock()
+            page_list = [
+                (self.make_fetched_list(i + 1), f"cursor_{i}" if i < page_num - 1 else None) for i in range(page_num)
+            ]
+            mock_fetcher.return_value.fetch_page.side_effect = page_list
+            mock_fetcher.return_value.latest_post_uri = latest_post_uri
+            mock_crawl_state_db.reset_mock()
+            mock_crawl_state_db.return_value.get_value.side_effect = lambda key: stored_cursor
+            mock_store.reset_mock()
+            # failed_page 番目（0始まり）のページの DL に失敗する、 None の場合は失敗しない
+            mock_store.side_effect = lambda fetched_list: (
+                len(fetched_list),
+                1 if failed_page is not None and len(fetched_list) == failed_page + 1 else 0,
+            )
+
+        def post_run(stored_cursor, failed_page):
+            fetch_cursor_list = [stored_cursor] + [f"cursor_{i}" for i in range(page_num - 1)]
+            self.assertEqual(
+                [call.fetch_page(cursor) for cursor in fetch_cursor_list],
+                mock_fetcher.return_value.mock_calls,
+            )
+            self.assertEqual(
+                [call(self.make_fetched_list(i + 1)) for i in range(page_num)],
+                mock_store.mock_calls,
+            )
+
+            key = f"{Crawler.BACKFILL_CURSOR_KEY}:dummy_handle_name"
+            expect_state_calls = [call.get_value(key)]
+            if stored_cursor is None:
+                # アカウントごとの値がない場合は複数アカウント対応前の値を確認する
+                expect_state_calls.append(call.get_value(Crawler.BACKFILL_CURSOR_KEY))
+            # DL に失敗したページ以降は cursor を進めず、次回はそのページから再開する
+            is_failed = False
+            for i in range(page_num):
+                is_failed = is_failed or i == failed_page
+                if i == 0 and stored_cursor is None and not is_failed:
+                    latest_post_uri_key = f"{Crawler.LATEST_POST_URI_KEY}:dummy_handle_name"
+                    expect_state_calls.append(call.set_value(latest_post_uri_key, latest_post_uri))
+                if i < page_num - 1 and not is_failed:
+                    expect_state_calls.append(call.set_value(key, f"cursor_{i}"))
+            if not is_failed:
+                expect_state_calls.append(call.set_value(key, None))
+            self.assertEqual(expect_state_calls, mock_crawl_state_db.return_value.mock_calls)
+
+        Params = namedtuple("Params", ["stored_cursor", "failed_page"])
+        params_list = [
+            Params(None, None),
+            Params("stored_cursor", None),
+            Params(None, 0),
+            Params("stored_cursor", 1),
+            Params("stored_cursor", page_num - 1),
+        ]
+        for params in params_list:
+            pre_run(*params)
+            instance = Crawler()
+            actual = instance.backfill()
             self.assertIsNone(actual)
-            post_run(params.in_db_media_flag, params.fetched_info_num)
+            post_run(*params)
+
+    def test_verify(self):
+        mock_logger = self.enterContext(patch("bluesky_crawler.crawler.crawler.logger"))
+        mock_fetcher = self.enterContext(patch("bluesky_crawler.crawler.crawler.Fetcher", spec=Fetcher))
+        mock_downloader = self.enterContext(patch("bluesky_crawler.crawler.crawler.Downloader", spec=Downloader))
+        mock_like_db = self.enterContext(patch("bluesky_crawler.crawler.crawler.LikeDB", spec=LikeDB))
+        mock_user_db = self.enterContext(patch("bluesky_crawler.crawler.crawler.UserDB", spec=UserDB))
+        mock_media_db = self.enterContext(patch("bluesky_crawler.crawler.crawler.MediaDB", spec=MediaDB))
+        mock_crawl_state_db = self.enterContext(
+            patch("bluesky_crawler.crawler.crawler.CrawlStateDB", spec=CrawlStateDB)
+        )
+        mock_failed_media_db = self.enterContext(
+            patch("bluesky_crawler.crawler.crawler.FailedMediaDB", spec=FailedMediaDB)
+        )
+
+        Params = namedtuple("Params", ["unverified_num", "failed_index_list"])
+        params_list = [
+            Params(4, []),
+            Params(4, [1, 2]),
+            Params(2, [0, 1]),
+            Params(0, []),
+        ]
+        for params in params_list:
+            media_list = [
+                media for fetched in self.make_fetched_list(params.unverified_num) for media in fetched.media_list
+            ][: params.unverified_num]
+            failed_media_list = [media_list[i] for i in params.failed_index_list]
+            mock_media_db.reset_mock()
+            mock_media_db.return_value.select_unverified.return_value = media_list
+            mock_downloader.reset_mock()
+
+            def download(media_list):
+                # 成功したメディアは Downloader によって検証済になる
+                for media in media_list:
+                    media.verified = media not in failed_media_list
+                return failed_media_list
+
+            mock_downloader.return_value.download.side_effect = download
+
+            mock_downloader.return_value.download_config = {"verify_size": True, "verify_cid": False}
+            instance = Crawler()
+            actual = instance.verify()
+            self.assertIsNone(actual)
+
+            verified_media_list = [media for media in media_list if media not in failed_media_list]
+            if params.unverified_num == 0:
+                mock_downloader.return_value.download.assert_not_called()
+            else:
+                mock_downloader.return_value.download.assert_called_once_with(media_list)
+            expect_media_db_calls = [call.select_unverified()]
+            if verified_media_list:
+                expect_media_db_calls.append(call.upsert(verified_media_list))
+            self.assertEqual(expect_media_db_calls, mock_media_db.return_value.mock_calls)
+
+    def test_migrate_layout(self):
+        mock_logger = self.enterContext(patch("bluesky_crawler.crawler.crawler.logger"))
+        mock_fetcher = self.enterContext(patch("bluesky_crawler.crawler.crawler.Fetcher", spec=Fetcher))
+        mock_downloader = self.enterContext(patch("bluesky_crawler.crawler.crawler.Downloader", spec=Downloader))
+        mock_like_db = self.enterContext(patch("bluesky_crawler.crawler.crawler.LikeDB", spec=LikeDB))
+        mock_user_db = self.enterContext(patch("bluesky_crawler.crawler.crawler.UserDB", spec=UserDB))
+        mock_media_db = self.enterContext(patch("bluesky_crawler.crawler.crawler.MediaDB", spec=MediaDB))
+        mock_crawl_state_db = self.enterContext(
+            patch("bluesky_crawler.crawler.crawler.CrawlStateDB", spec=CrawlStateDB)
+        )
+        mock_failed_media_db = self.enterContext(
+            patch("bluesky_crawler.crawler.crawler.FailedMediaDB", spec=FailedMediaDB)
+        )
+        media_list = [media for fetched in self.make_fetched_list(2) for media in fetched.media_list]
+        mock_media_db.return_value.select.return_value = media_list
+        mock_downloader.return_value.download_config = {"layout": "date"}
+        mock_downloader.return_value.relocate.return_value = len(media_list)
+
+        instance = Crawler()
+        actual = instance.migrate_layout()
+        self.assertIsNone(actual)
+        self.assertEqual([call.select()], mock_media_db.return_value.mock_calls)
+        mock_downloader.return_value.relocate.assert_called_once_with(media_list)
 
 
 if __name__ == "__main__":
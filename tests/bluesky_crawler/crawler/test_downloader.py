@@ -1,13 +1,21 @@
+import asyncio
+import hashlib
+import os
+import re
 import shutil
 import sys
 import unittest
+from collections import namedtuple
 from logging import getLogger
 from pathlib import Path
 
+import httpx
+import orjson
 from mock import MagicMock, call, patch
 
-from bluesky_crawler.crawler.downloader import Downloader
+from bluesky_crawler.crawler.downloader import DEFAULT_DOWNLOAD_CONFIG, Downloader
 from bluesky_crawler.db.model import Media
+from bluesky_crawler.util import to_raw_cid
 
 
 class TestDownloader(unittest.IsolatedAsyncioTestCase):
@@ -39,10 +47,186 @@ class TestDownloader(unittest.IsolatedAsyncioTestCase):
         instance = self.get_instance()
         self.assertEqual(self.save_base_path, instance.save_base_path)
         self.assertEqual(300, instance.save_num)
+        self.assertEqual(DEFAULT_DOWNLOAD_CONFIG, instance.download_config)
+        self.assertEqual({}, instance.host_semaphore_dict)
         self.assertTrue(instance.save_base_path.exists())
 
-    async def test_worker(self):
+        self.assertEqual({}, instance.blob_lock_dict)
+        self.assertFalse((instance.save_base_path / Downloader.BLOB_DIRECTORY_NAME).exists())
+
+        def make_config_path(download_config: dict) -> Path:
+            config_path = self.save_base_path / "dummy_config.json"
+            config_path.write_bytes(
+                orjson.dumps({
+                    "general": {
+                        "save_base_path": str(self.save_base_path),
+                        "save_num": 300,
+                        "download": download_config,
+                    }
+                })
+            )
+            return config_path
+
+        # content_addressed が有効な場合は実体の保存先を作成する
+        instance = Downloader(make_config_path({"content_addressed": True}))
+        self.assertTrue((instance.save_base_path / Downloader.BLOB_DIRECTORY_NAME).exists())
+
+        # 不正な設定値
+        invalid_config_list = [{"fsync": "x"}, {"video_downloader": "x"}, {"link_mode": "x"}, {"layout": "x"}]
+        for invalid_config in invalid_config_list:
+            with self.assertRaises(ValueError):
+                instance = Downloader(make_config_path(invalid_config))
+
+    def test_create_client(self):
+        mock_transport = self.enterContext(patch("bluesky_crawler.crawler.downloader.httpx.AsyncHTTPTransport"))
         mock_client = self.enterContext(patch("bluesky_crawler.crawler.downloader.httpx.AsyncClient"))
+        mock_find_spec = self.enterContext(patch("bluesky_crawler.crawler.downloader.importlib.util.find_spec"))
+        instance = self.get_instance()
+        instance.download_config = DEFAULT_DOWNLOAD_CONFIG | {"max_connections": 10, "max_keepalive_connections": 5}
+        limits = httpx.Limits(max_connections=10, max_keepalive_connections=5, keepalive_expiry=30)
+
+        Params = namedtuple("Params", ["http2_config", "is_h2_installed", "expect_http2"])
+        params_list = [
+            Params(True, True, True),
+            Params(True, False, False),
+            Params(False, True, False),
+        ]
+        for params in params_list:
+            mock_transport.reset_mock()
+            mock_client.reset_mock()
+            instance.download_config["http2"] = params.http2_config
+            mock_find_spec.side_effect = lambda name: MagicMock() if params.is_h2_installed else None
+            actual = instance.create_client()
+            self.assertEqual(mock_client.return_value, actual)
+            mock_transport.assert_called_once_with(retries=3, http2=params.expect_http2, limits=limits)
+            mock_client.assert_called_once_with(
+                timeout=httpx.Timeout(5, read=60), transport=mock_transport.return_value
+            )
+
+    async def test_get_host_semaphore(self):
+        instance = self.get_instance()
+        instance.download_config["max_connections_per_host"] = 2
+        semaphore_1 = instance.get_host_semaphore("https://cdn.bsky.app/img/1@jpeg")
+        semaphore_2 = instance.get_host_semaphore("https://cdn.bsky.app/img/2@jpeg")
+        semaphore_3 = instance.get_host_semaphore("https://video.bsky.app/watch/playlist.m3u8")
+        self.assertIs(semaphore_1, semaphore_2)
+        self.assertIsNot(semaphore_1, semaphore_3)
+        self.assertEqual(["cdn.bsky.app", "video.bsky.app"], list(instance.host_semaphore_dict.keys()))
+
+        # ホストごとの同時接続数を超えると待機する
+        await semaphore_1.acquire()
+        await semaphore_1.acquire()
+        self.assertTrue(semaphore_1.locked())
+        self.assertFalse(semaphore_3.locked())
+
+    def test_get_temp_path(self):
+        instance = self.get_instance()
+        filepath = self.save_base_path / "dummy_post_id_dummy_username_01.mp4"
+        actual = instance.get_temp_path(filepath)
+        self.assertEqual(self.save_base_path / "dummy_post_id_dummy_username_01.part.mp4", actual)
+
+    def test_update_file_index(self):
+        instance = self.get_instance()
+        media_list = [self.make_image_media(b"", f"bafkrei_dummy_{i:02}") for i in range(4)]
+        for i, media in enumerate(media_list):
+            media.post_id = f"post_id_{i}"
+            media.username = f"username_{i % 2}"
+        invalid_media = self.make_image_media(b"", "bafkrei_invalid")
+        invalid_media.url = "invalid_url"
+        invalid_media.mime_type = "image"
+
+        Params = namedtuple("Params", ["layout", "content_addressed"])
+        params_list = [
+            Params("flat", False),
+            Params("username", False),
+            Params("username", True),
+        ]
+        for params in params_list:
+            shutil.rmtree(self.save_base_path, ignore_errors=True)
+            self.save_base_path.mkdir(parents=True)
+            instance.clear_file_index()
+            instance.download_config["layout"] = params.layout
+            instance.download_config["content_addressed"] = params.content_addressed
+            expect = set()
+            for media in media_list[:2]:
+                filepath = instance.get_save_path(media)
+                filepath.parent.mkdir(parents=True, exist_ok=True)
+                filepath.write_bytes(b"")
+                expect.add(filepath)
+            if params.content_addressed:
+                blob_path = instance.get_blob_path(media_list[0])
+                blob_path.parent.mkdir(parents=True, exist_ok=True)
+                blob_path.write_bytes(b"")
+                expect.add(blob_path)
+            # リンク切れのシンボリックリンクは含まない
+            broken_link_path = instance.get_save_path(media_list[2])
+            broken_link_path.parent.mkdir(parents=True, exist_ok=True)
+            broken_link_path.symlink_to("not_exist_file")
+
+            instance.update_file_index(media_list[:1] + [invalid_media])
+            instance.update_file_index(media_list)
+            self.assertEqual(expect, instance.file_index)
+            # 保存先フォルダは作成される
+            for media in media_list:
+                self.assertTrue(instance.get_save_path(media).parent.exists())
+                if params.content_addressed:
+                    self.assertTrue(instance.get_blob_path(media).parent.exists())
+
+            # 列挙済のフォルダは再度列挙しない
+            with patch("bluesky_crawler.crawler.downloader.os.scandir") as mock_scandir:
+                instance.update_file_index(media_list)
+                mock_scandir.assert_not_called()
+            self.assertEqual(expect, instance.file_index)
+
+    def test_file_index(self):
+        instance = self.get_instance()
+        filepath = self.save_base_path / "dummy.jpeg"
+        filepath.write_bytes(b"")
+
+        # 索引がない場合はファイルシステムに問い合わせる
+        self.assertIsNone(instance.file_index)
+        self.assertTrue(instance.is_exist_file(filepath))
+        instance.add_file_index(filepath)
+        self.assertIsNone(instance.file_index)
+
+        instance.file_index = set()
+        self.assertFalse(instance.is_exist_file(filepath))
+        instance.add_file_index(filepath)
+        self.assertTrue(instance.is_exist_file(filepath))
+        instance.remove_file(filepath)
+        self.assertFalse(instance.is_exist_file(filepath))
+        self.assertFalse(filepath.exists())
+
+        # 索引を破棄した場合はファイルシステムに問い合わせる
+        instance.indexed_directory_set = {self.save_base_path}
+        instance.clear_file_index()
+        self.assertIsNone(instance.file_index)
+        self.assertEqual(set(), instance.indexed_directory_set)
+
+    async def test_commit_file(self):
+        mock_fsync = self.enterContext(patch("bluesky_crawler.crawler.downloader.os.fsync"))
+        instance = self.get_instance()
+        filepath = self.save_base_path / "dummy.jpeg"
+        temp_path = instance.get_temp_path(filepath)
+
+        Params = namedtuple("Params", ["fsync_policy", "expect_fsync_num"])
+        params_list = [
+            Params("none", 0),
+            Params("file", 1),
+            Params("directory", 1 if sys.platform == "win32" else 2),
+        ]
+        for params in params_list:
+            mock_fsync.reset_mock()
+            filepath.unlink(missing_ok=True)
+            temp_path.write_bytes(b"dummy")
+            instance.download_config["fsync"] = params.fsync_policy
+            actual = await instance.commit_file(temp_path, filepath)
+            self.assertIsNone(actual)
+            self.assertFalse(temp_path.exists())
+            self.assertEqual(b"dummy", filepath.read_bytes())
+            self.assertEqual(params.expect_fsync_num, mock_fsync.call_count)
+
+    async def test_worker(self):
         media = Media.create({
             "post_id": "dummy_post_id",
             "media_id": "dummy_media_id",
@@ -51,64 +235,1016 @@ class TestDownloader(unittest.IsolatedAsyncioTestCase):
             "alt_text": "dummy_alt_text",
             "mime_type": "image/jpeg",
             "size": 0,
-            "url": "dummy_url",
+            "url": "https://cdn.bsky.app/img/feed_fullsize/plain/did:plc:dummy/dummy_url",
             "created_at": "dummy_created_at",
             "registered_at": "dummy_registered_at",
         })
-        filename = media.get_filename()
+        filepath = self.save_base_path / media.get_filename()
+        body = b"\x00" * 200000
+        request_list = []
 
-        async def client_get(url):
-            r = MagicMock()
-            r.content = str(url).encode()
-            return r
+        async def stream_body():
+            for i in range(0, len(body), 50000):
+                yield body[i : i + 50000]
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            request_list.append(request)
+            return httpx.Response(200, content=stream_body())
 
-        mock_client.return_value.__aenter__.return_value.get.side_effect = client_get
         instance = self.get_instance()
-        actual = await instance.worker(media)
+        instance.download_config["chunk_size"] = 1024
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            actual = await instance.worker(media, client)
+            self.assertIsNone(actual)
+            self.assertEqual(body, filepath.read_bytes())
+            self.assertFalse(instance.get_temp_path(filepath).exists())
+            self.assertEqual(
+                ["https://cdn.bsky.app/img/feed_fullsize/plain/did:plc:dummy/dummy_url"],
+                [str(r.url) for r in request_list],
+            )
+
+            # verify_size / verify_cid が無効な場合は検証済にしない
+            self.assertFalse(media.verified)
+
+            # DL済のファイルは再取得しない
+            request_list.clear()
+            actual = await instance.worker(media, client)
+            self.assertIsNone(actual)
+            self.assertEqual([], request_list)
+            self.assertFalse(media.verified)
+
+            # 検証が有効な場合は、DL済のファイルの検証に成功すれば再取得せずに検証済にする
+            instance.download_config["verify_size"] = True
+            media.size = len(body)
+            actual = await instance.worker(media, client)
+            self.assertIsNone(actual)
+            self.assertEqual([], request_list)
+            self.assertTrue(media.verified)
+
+            # DL済のファイルが検証に失敗した場合は、元の blob を再取得する
+            instance.download_config["verify_size"] = True
+            instance.pds_endpoint_dict["did:plc:dummy"] = "https://pds.example.com"
+            media.size = len(body)
+            filepath.write_bytes(body[:100])
+            media.verified = False
+            actual = await instance.worker(media, client)
+            self.assertIsNone(actual)
+            self.assertEqual(body, filepath.read_bytes())
+            self.assertEqual(
+                ["https://pds.example.com/xrpc/com.atproto.sync.getBlob?did=did%3Aplc%3Adummy&cid=dummy_media_id"],
+                [str(r.url) for r in request_list],
+            )
+            self.assertTrue(media.verified)
+
+    def make_image_media(self, body: bytes = b"", media_id: str = "dummy_media_id") -> Media:
+        return Media.create({
+            "post_id": "dummy_post_id",
+            "media_id": media_id,
+            "media_index": 1,
+            "username": "dummy_username",
+            "alt_text": "dummy_alt_text",
+            "mime_type": "image/jpeg",
+            "size": len(body),
+            "url": "https://cdn.bsky.app/img/feed_fullsize/plain/did:plc:dummy/dummy_url@jpeg",
+            "created_at": "dummy_created_at",
+            "registered_at": "dummy_registered_at",
+        })
+
+    def test_get_file_cid(self):
+        instance = self.get_instance()
+        instance.download_config["chunk_size"] = 7
+        filepath = self.save_base_path / "dummy.jpeg"
+        body = b"dummy_body" * 10
+        filepath.write_bytes(body)
+        actual = instance.get_file_cid(filepath)
+        self.assertEqual(to_raw_cid(hashlib.sha256(body).digest()), actual)
+
+    def test_is_verifiable(self):
+        instance = self.get_instance()
+        image_media = self.make_image_media(b"", "bafkrei_dummy")
+        dag_cbor_media = self.make_image_media(b"", "bafyrei_dummy")
+        video_media = self.make_image_media(b"", "bafkrei_dummy")
+        video_media.mime_type = "video/mp4"
+
+        Params = namedtuple("Params", ["verify_size", "verify_cid", "media", "expect"])
+        params_list = [
+            Params(False, False, image_media, False),
+            Params(True, False, image_media, True),
+            Params(False, True, image_media, True),
+            # raw コーデック以外の CID は計算できない
+            Params(False, True, dag_cbor_media, False),
+            Params(True, True, dag_cbor_media, True),
+            # 動画はどちらの検証も対象外
+            Params(True, True, video_media, False),
+        ]
+        for params in params_list:
+            instance.download_config["verify_size"] = params.verify_size
+            instance.download_config["verify_cid"] = params.verify_cid
+            self.assertEqual(params.expect, instance.is_verifiable(params.media))
+
+    async def test_verify_file(self):
+        instance = self.get_instance()
+        body = b"dummy_body"
+        cid = to_raw_cid(hashlib.sha256(body).digest())
+        filepath = self.save_base_path / "dummy.jpeg"
+        filepath.write_bytes(body)
+
+        Params = namedtuple("Params", ["verify_size", "verify_cid", "size", "media_id", "mime_type", "expect"])
+        params_list = [
+            Params(False, False, 0, "bafkrei_invalid", "image/jpeg", True),
+            Params(True, False, len(body), "bafkrei_invalid", "image/jpeg", True),
+            Params(True, False, len(body) + 1, cid, "image/jpeg", False),
+            Params(False, True, 0, cid, "image/jpeg", True),
+            Params(False, True, 0, "bafkrei_invalid", "image/jpeg", False),
+            Params(True, True, len(body), cid, "image/jpeg", True),
+            # raw コーデック以外の CID は検証できない
+            Params(False, True, 0, "bafyrei_not_raw", "image/jpeg", True),
+            # 動画は検証対象外
+            Params(True, True, 0, "bafkrei_invalid", "video/mp4", True),
+        ]
+        for params in params_list:
+            instance.download_config["verify_size"] = params.verify_size
+            instance.download_config["verify_cid"] = params.verify_cid
+            media = self.make_image_media(body, params.media_id)
+            media.size = params.size
+            media.mime_type = params.mime_type
+            actual = await instance.verify_file(media, filepath)
+            self.assertEqual(params.expect, actual)
+
+    def test_get_did(self):
+        instance = self.get_instance()
+        media = self.make_image_media()
+        self.assertEqual("did:plc:dummy", instance.get_did(media))
+
+        media.url = "https://cdn.bsky.app/img/feed_fullsize/plain/did:web:example.com/bafkrei_dummy@jpeg"
+        self.assertEqual("did:web:example.com", instance.get_did(media))
+
+        media.url = "https://cdn.bsky.app/dummy_url@jpeg"
+        with self.assertRaises(ValueError):
+            actual = instance.get_did(media)
+
+    async def test_resolve_pds_endpoint(self):
+        request_list = []
+
+        def make_did_document(did: str, service_list: list[dict]) -> bytes:
+            return orjson.dumps({"@context": [], "id": did, "alsoKnownAs": [], "service": service_list})
+
+        pds_service = {
+            "id": "#atproto_pds",
+            "type": "AtprotoPersonalDataServer",
+            "serviceEndpoint": "https://pds.example.com/",
+        }
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            request_list.append(request)
+            match str(request.url):
+                case "https://plc.directory/did:plc:dummy":
+                    return httpx.Response(200, content=make_did_document("did:plc:dummy", [pds_service]))
+                case "https://example.com:8080/.well-known/did.json":
+                    return httpx.Response(200, content=make_did_document("did:web:example.com%3A8080", [pds_service]))
+                case "https://plc.directory/did:plc:no_pds":
+                    return httpx.Response(200, content=make_did_document("did:plc:no_pds", []))
+            return httpx.Response(404)
+
+        instance = self.get_instance()
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            Params = namedtuple("Params", ["did", "expect"])
+            params_list = [
+                Params("did:plc:dummy", "https://pds.example.com"),
+                Params("did:web:example.com%3A8080", "https://pds.example.com"),
+            ]
+            for params in params_list:
+                request_list.clear()
+                actual = await instance.resolve_pds_endpoint(params.did, client)
+                self.assertEqual(params.expect, actual)
+                self.assertEqual(1, len(request_list))
+
+                # 取得済の DID は再取得しない
+                request_list.clear()
+                actual = await instance.resolve_pds_endpoint(params.did, client)
+                self.assertEqual(params.expect, actual)
+                self.assertEqual([], request_list)
+
+            # PDS が見つからない・ DID ドキュメントを取得できない・未対応の DID
+            with self.assertRaises(ValueError):
+                actual = await instance.resolve_pds_endpoint("did:plc:no_pds", client)
+            with self.assertRaises(httpx.HTTPStatusError):
+                actual = await instance.resolve_pds_endpoint("did:plc:not_found", client)
+            with self.assertRaises(ValueError):
+                actual = await instance.resolve_pds_endpoint("did:key:dummy", client)
+            self.assertEqual(["did:plc:dummy", "did:web:example.com%3A8080"], list(instance.pds_endpoint_dict))
+
+    async def test_worker_cdn_reencoded(self):
+        # CDN は元の blob を再エンコードして配信するため、サイズ・ CID が記録された値と一致しない
+        original_body = b"\xff\xd8\xff\xe0original_jpeg" + b"\x00" * 1000
+        cdn_body = b"\xff\xd8\xff\xe0reencoded_jpeg" + b"\x01" * 800
+        cid = to_raw_cid(hashlib.sha256(original_body).digest())
+        media = self.make_image_media(original_body, cid)
+        filepath = self.save_base_path / media.get_filename()
+        blob_url = f"https://pds.example.com/xrpc/com.atproto.sync.getBlob?did=did%3Aplc%3Adummy&cid={cid}"
+        did_document = {
+            "id": "did:plc:dummy",
+            "service": [
+                {
+                    "id": "#atproto_pds",
+                    "type": "AtprotoPersonalDataServer",
+                    "serviceEndpoint": "https://pds.example.com",
+                }
+            ],
+        }
+        request_list = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            request_list.append(str(request.url))
+            match str(request.url):
+                case "https://plc.directory/did:plc:dummy":
+                    return httpx.Response(200, content=orjson.dumps(did_document))
+                case url if url == blob_url:
+                    return httpx.Response(200, content=original_body)
+                case url if url == media.url:
+                    return httpx.Response(200, content=cdn_body)
+            return httpx.Response(404)
+
+        Params = namedtuple(
+            "Params", ["verify_size", "verify_cid", "expect_url_list", "expect_body", "expect_verified"]
+        )
+        params_list = [
+            # 検証しない場合は CDN から DL する
+            Params(False, False, [media.url], cdn_body, False),
+            # 検証する場合は元の blob を DL し、記録された値と一致する
+            Params(True, False, ["https://plc.directory/did:plc:dummy", blob_url], original_body, True),
+            Params(False, True, ["https://plc.directory/did:plc:dummy", blob_url], original_body, True),
+            Params(True, True, ["https://plc.directory/did:plc:dummy", blob_url], original_body, True),
+        ]
+        for params in params_list:
+            instance = self.get_instance()
+            instance.download_config["verify_size"] = params.verify_size
+            instance.download_config["verify_cid"] = params.verify_cid
+            filepath.unlink(missing_ok=True)
+            request_list.clear()
+            media.verified = False
+            async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+                actual = await instance.worker(media, client)
+            self.assertIsNone(actual)
+            self.assertEqual(params.expect_url_list, request_list)
+            self.assertEqual(params.expect_body, filepath.read_bytes())
+            self.assertEqual(params.expect_verified, media.verified)
+
+        # 以前 CDN から保存した画像は、検証を有効にすると元の blob で取得し直す
+        filepath.write_bytes(cdn_body)
+        instance = self.get_instance()
+        instance.download_config["verify_cid"] = True
+        request_list.clear()
+        media.verified = False
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            actual = await instance.worker(media, client)
         self.assertIsNone(actual)
-        self.assertTrue((self.save_base_path / filename).exists())
+        self.assertEqual(["https://plc.directory/did:plc:dummy", blob_url], request_list)
+        self.assertEqual(original_body, filepath.read_bytes())
+        self.assertTrue(media.verified)
+
+    async def test_download_image_resume(self):
+        body = bytes(range(256)) * 100
+        media = self.make_image_media(body)
+        instance = self.get_instance()
+        instance.download_config["resume_retries"] = 1
+        instance.download_config["chunk_size"] = 1000
+        filepath = self.save_base_path / media.get_filename()
+        temp_path = instance.get_temp_path(filepath)
+
+        async def broken_body(data: bytes):
+            yield data
+            raise httpx.ReadError("connection reset")
+
+        def make_handler(is_range_supported: bool, break_at: int | None, content_range_offset: int = 0):
+            def handler(request: httpx.Request) -> httpx.Response:
+                request_list.append(request)
+                offset = 0
+                if is_range_supported and (range_header := request.headers.get("Range")):
+                    offset = int(range_header.removeprefix("bytes=").removesuffix("-"))
+                if break_at is not None and len(request_list) == 1:
+                    return httpx.Response(200, content=broken_body(body[:break_at]))
+                if offset > 0:
+                    start = offset + content_range_offset
+                    headers = {"Content-Range": f"bytes {start}-{len(body) - 1}/{len(body)}"}
+                    return httpx.Response(206, content=body[start:], headers=headers)
+                return httpx.Response(200, content=body)
+
+            return handler
+
+        Params = namedtuple("Params", ["is_range_supported", "break_at", "exist_temp_size", "expect_range_list"])
+        params_list = [
+            # 同じ DL 内で通信が切れた場合は続きから再開する
+            Params(True, 10000, 0, [None, "bytes=10000-"]),
+            # 前回の DL で残った一時ファイルの続きから再開する
+            Params(True, None, 5000, ["bytes=5000-"]),
+            # Range 非対応のサーバの場合は最初から書き直す
+            Params(False, 10000, 0, [None, "bytes=10000-"]),
+            Params(False, None, 5000, ["bytes=5000-"]),
+        ]
+        for params in params_list:
+            request_list = []
+            filepath.unlink(missing_ok=True)
+            temp_path.unlink(missing_ok=True)
+            if params.exist_temp_size:
+                temp_path.write_bytes(body[: params.exist_temp_size])
+            handler = make_handler(params.is_range_supported, params.break_at)
+            async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+                actual = await instance.download_image(media, client, filepath)
+            self.assertIsNone(actual)
+            self.assertEqual(body, filepath.read_bytes())
+            self.assertFalse(temp_path.exists())
+            self.assertEqual(params.expect_range_list, [r.headers.get("Range") for r in request_list])
+
+        # 再開しきれなかった場合は一時ファイルを残して次回に再開する
+        request_list = []
+        filepath.unlink(missing_ok=True)
+
+        def always_broken_handler(request: httpx.Request) -> httpx.Response:
+            request_list.append(request)
+            return httpx.Response(200, content=broken_body(body[:1000]))
 
-        actual = await instance.worker(media)
+        async with httpx.AsyncClient(transport=httpx.MockTransport(always_broken_handler)) as client:
+            with self.assertRaises(httpx.ReadError):
+                actual = await instance.download_image(media, client, filepath)
+        self.assertEqual(2, len(request_list))
+        self.assertFalse(filepath.exists())
+        self.assertEqual(body[:1000], temp_path.read_bytes())
+
+        # Content-Range が要求と合わない場合は一時ファイルを消して失敗とする
+        request_list = []
+        handler = make_handler(True, None, content_range_offset=1)
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            with self.assertRaises(ValueError):
+                actual = await instance.download_image(media, client, filepath)
+        self.assertFalse(filepath.exists())
+        self.assertFalse(temp_path.exists())
+
+    async def test_worker_failed(self):
+        body = b"\x00" * 1000
+        media = self.make_image_media(body)
+        filepath = self.save_base_path / media.get_filename()
+        instance = self.get_instance()
+        temp_path = instance.get_temp_path(filepath)
+
+        Params = namedtuple("Params", ["handler", "verify_size", "expect_error"])
+        params_list = [
+            Params(lambda request: httpx.Response(404), False, httpx.HTTPStatusError),
+            Params(lambda request: httpx.Response(416), False, httpx.HTTPStatusError),
+            # DL したファイルが検証に失敗した
+            Params(lambda request: httpx.Response(200, content=body[:-1]), True, ValueError),
+        ]
+        instance.pds_endpoint_dict["did:plc:dummy"] = "https://pds.example.com"
+        for params in params_list:
+            temp_path.write_bytes(b"\x00" * 10)
+            instance.download_config["verify_size"] = params.verify_size
+            async with httpx.AsyncClient(transport=httpx.MockTransport(params.handler)) as client:
+                with self.assertRaises(params.expect_error):
+                    actual = await instance.worker(media, client)
+            # 途中までのファイルは残らず、 DL 済とも扱われない
+            self.assertFalse(filepath.exists())
+            self.assertFalse(temp_path.exists())
+            self.assertFalse(media.verified)
+
+    def test_get_shard_directory(self):
+        instance = self.get_instance()
+        media = self.make_image_media(media_id="bafkrei_dummy_xy")
+        media.created_at = "2024-03-23T21:34:56.897000"
+
+        Params = namedtuple("Params", ["layout", "expect"])
+        params_list = [
+            Params("flat", Path()),
+            Params("username", Path("dummy_username")),
+            Params("date", Path("2024/03")),
+            Params("cid", Path("xy")),
+        ]
+        for params in params_list:
+            actual = instance.get_shard_directory(media, params.layout)
+            self.assertEqual(params.expect, actual)
+
+        media.created_at = "invalid_created_at"
+        actual = instance.get_shard_directory(media, "date")
+        self.assertEqual(Path("unknown"), actual)
+
+        with self.assertRaises(ValueError):
+            actual = instance.get_shard_directory(media, "invalid")
+
+    def test_get_save_path(self):
+        instance = self.get_instance()
+        media = self.make_image_media(media_id="bafkrei_dummy_xy")
+        filename = media.get_filename()
+        self.assertEqual(self.save_base_path / filename, instance.get_save_path(media))
+        self.assertEqual(self.save_base_path / "xy" / filename, instance.get_save_path(media, "cid"))
+        instance.download_config["layout"] = "username"
+        self.assertEqual(self.save_base_path / "dummy_username" / filename, instance.get_save_path(media))
+
+    def test_get_blob_path(self):
+        instance = self.get_instance()
+        media = self.make_image_media(media_id="bafkrei_dummy_xy")
+        blob_base_path = self.save_base_path / Downloader.BLOB_DIRECTORY_NAME
+        actual = instance.get_blob_path(media)
+        self.assertEqual(blob_base_path / "bafkrei_dummy_xy.jpeg", actual)
+
+        # flat 以外は CID の末尾2文字ごとに分ける
+        for layout in ["username", "date", "cid"]:
+            actual = instance.get_blob_path(media, layout)
+            self.assertEqual(blob_base_path / "xy" / "bafkrei_dummy_xy.jpeg", actual)
+        instance.download_config["layout"] = "date"
+        actual = instance.get_blob_path(media)
+        self.assertEqual(blob_base_path / "xy" / "bafkrei_dummy_xy.jpeg", actual)
+
+    async def test_get_blob_lock(self):
+        instance = self.get_instance()
+        lock_1 = instance.get_blob_lock("media_id_1")
+        lock_2 = instance.get_blob_lock("media_id_1")
+        lock_3 = instance.get_blob_lock("media_id_2")
+        self.assertIs(lock_1, lock_2)
+        self.assertIsNot(lock_1, lock_3)
+
+    def test_link_file(self):
+        mock_logger = self.enterContext(patch("bluesky_crawler.crawler.downloader.logger"))
+        instance = self.get_instance()
+        blob_path = self.save_base_path / Downloader.BLOB_DIRECTORY_NAME / "dummy_cid.jpeg"
+        blob_path.parent.mkdir(parents=True, exist_ok=True)
+        blob_path.write_bytes(b"dummy_blob")
+        filepath = self.save_base_path / "dummy_post_id_dummy_username_01.jpeg"
+
+        Params = namedtuple("Params", ["link_mode", "is_link_error", "expect_samefile", "expect_symlink"])
+        params_list = [
+            Params("hardlink", False, True, False),
+            Params("symlink", False, True, True),
+            # リンクを作成できない場合はコピーする
+            Params("hardlink", True, False, False),
+            Params("symlink", True, False, False),
+        ]
+        original_link, original_symlink = os.link, os.symlink
+        for params in params_list:
+            filepath.unlink(missing_ok=True)
+            instance.download_config["link_mode"] = params.link_mode
+            with patch("bluesky_crawler.crawler.downloader.os.link") as mock_link:
+                with patch("bluesky_crawler.crawler.downloader.os.symlink") as mock_symlink:
+                    if params.is_link_error:
+                        mock_link.side_effect = OSError("not supported")
+                        mock_symlink.side_effect = OSError("not supported")
+                    else:
+                        mock_link.side_effect = original_link
+                        mock_symlink.side_effect = original_symlink
+                    actual = instance.link_file(blob_path, filepath)
+            self.assertIsNone(actual)
+            self.assertEqual(b"dummy_blob", filepath.read_bytes())
+            self.assertEqual(params.expect_samefile, filepath.samefile(blob_path))
+            self.assertEqual(params.expect_symlink, filepath.is_symlink())
+            if params.expect_symlink:
+                # 相対パスで参照する
+                self.assertEqual(Path("blobs/dummy_cid.jpeg"), filepath.readlink())
+            self.assertFalse(instance.get_temp_path(filepath).exists())
+
+    async def test_worker_content_addressed(self):
+        body = b"dummy_blob"
+        instance = self.get_instance()
+        instance.download_config["content_addressed"] = True
+        (self.save_base_path / Downloader.BLOB_DIRECTORY_NAME).mkdir(parents=True, exist_ok=True)
+
+        # 同じ CID を含む別のポスト
+        media_list = [self.make_image_media(body, "bafkrei_dummy") for _ in range(3)]
+        for i, media in enumerate(media_list):
+            media.post_id = f"post_id_{i}"
+        blob_path = instance.get_blob_path(media_list[0])
+        request_list = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            request_list.append(request)
+            return httpx.Response(200, content=body)
+
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            # 同時に処理しても実体の DL は1回のみ
+            actual = await asyncio.gather(*[instance.worker(media, client) for media in media_list[:2]])
+            self.assertEqual([None, None], actual)
+            self.assertEqual(1, len(request_list))
+            self.assertEqual(body, blob_path.read_bytes())
+            for media in media_list[:2]:
+                filepath = self.save_base_path / media.get_filename()
+                self.assertTrue(filepath.samefile(blob_path))
+                # verify_size / verify_cid が無効な場合は検証済にしない
+                self.assertFalse(media.verified)
+
+            # 保存済の CID は DL しない
+            request_list.clear()
+            actual = await instance.worker(media_list[2], client)
+            self.assertIsNone(actual)
+            self.assertEqual([], request_list)
+            self.assertTrue((self.save_base_path / media_list[2].get_filename()).samefile(blob_path))
+
+            # 実体が検証に失敗した場合は DL し直す
+            instance.download_config["verify_size"] = True
+            instance.pds_endpoint_dict["did:plc:dummy"] = "https://pds.example.com"
+            filepath = self.save_base_path / media_list[2].get_filename()
+            filepath.unlink()
+            blob_path.write_bytes(b"corrupt")
+            actual = await instance.worker(media_list[2], client)
+            self.assertIsNone(actual)
+            self.assertEqual(1, len(request_list))
+            self.assertEqual(body, filepath.read_bytes())
+            self.assertTrue(media_list[2].verified)
+
+    async def test_worker_layout(self):
+        body = b"dummy_blob"
+        media = self.make_image_media(body, "bafkrei_dummy_xy")
+        instance = self.get_instance()
+        instance.download_config["layout"] = "username"
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(200, content=body)
+
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            actual = await instance.worker(media, client)
+            self.assertIsNone(actual)
+            self.assertEqual(body, (self.save_base_path / "dummy_username" / media.get_filename()).read_bytes())
+
+            instance.download_config["content_addressed"] = True
+            media.post_id = "another_post_id"
+            actual = await instance.worker(media, client)
+            self.assertIsNone(actual)
+            filepath = self.save_base_path / "dummy_username" / media.get_filename()
+            blob_path = self.save_base_path / Downloader.BLOB_DIRECTORY_NAME / "xy" / "bafkrei_dummy_xy.jpeg"
+            self.assertTrue(filepath.samefile(blob_path))
+
+    def make_video_media(self, post_id: str = "dummy_post_id") -> Media:
+        return Media.create({
+            "post_id": post_id,
+            "media_id": "bafkrei_dummy_video",
+            "media_index": 1,
+            "username": "dummy_username",
+            "alt_text": "dummy_alt_text",
+            "mime_type": "video/mp4",
+            "size": 0,
+            "url": "https://video.bsky.app/watch/dummy/playlist.m3u8",
+            "created_at": "dummy_created_at",
+            "registered_at": "dummy_registered_at",
+        })
+
+    def test_resolve_saved_path(self):
+        instance = self.get_instance()
+        image_media = self.make_image_media(b"")
+        video_media = self.make_video_media()
+        image_path = instance.get_save_path(image_media)
+        video_path = instance.get_save_path(video_media)
+        ts_path = self.save_base_path / "dummy_post_id_dummy_username_01.ts"
+        self.assertEqual(ts_path, instance.get_ts_path(video_path))
+
+        # どちらもない場合は保存先のパス
+        self.assertEqual(video_path, instance.resolve_saved_path(video_media, video_path))
+        # MPEG-TS のまま保存した動画は .ts のパス
+        ts_path.write_bytes(b"")
+        self.assertEqual(ts_path, instance.resolve_saved_path(video_media, video_path))
+        # mp4 がある場合は mp4 を優先する
+        video_path.write_bytes(b"")
+        self.assertEqual(video_path, instance.resolve_saved_path(video_media, video_path))
+        # 画像は対象外
+        instance.get_ts_path(image_path).write_bytes(b"")
+        self.assertEqual(image_path, instance.resolve_saved_path(image_media, image_path))
+
+    async def test_worker_video_ts(self):
+        mock_download_video = self.enterContext(patch.object(Downloader, "download_video"))
+
+        async def download_video(media, client, filepath):
+            # ffmpeg がない場合に MPEG-TS のまま保存した状態を再現する
+            filepath.with_suffix(".ts").write_bytes(b"dummy_ts")
+
+        mock_download_video.side_effect = download_video
+        instance = self.get_instance()
+        media_list = [self.make_video_media(f"post_id_{i}") for i in range(2)]
+        client = MagicMock()
+
+        Params = namedtuple("Params", ["content_addressed"])
+        params_list = [
+            Params(False),
+            Params(True),
+        ]
+        for params in params_list:
+            shutil.rmtree(self.save_base_path, ignore_errors=True)
+            self.save_base_path.mkdir(parents=True)
+            instance.download_config["content_addressed"] = params.content_addressed
+            mock_download_video.reset_mock()
+            for media in media_list:
+                actual = await instance.worker(media, client)
+                self.assertIsNone(actual)
+                ts_path = instance.get_ts_path(instance.get_save_path(media))
+                self.assertEqual(b"dummy_ts", ts_path.read_bytes())
+                self.assertFalse(instance.get_save_path(media).exists())
+                if params.content_addressed:
+                    self.assertTrue(ts_path.samefile(instance.get_ts_path(instance.get_blob_path(media))))
+            # 実体は1回だけ DL する
+            self.assertEqual(1 if params.content_addressed else 2, mock_download_video.call_count)
+
+            # .ts で保存済の動画は再取得しない
+            mock_download_video.reset_mock()
+            for media in media_list:
+                actual = await instance.worker(media, client)
+                self.assertIsNone(actual)
+            mock_download_video.assert_not_called()
+
+    def test_relocate(self):
+        instance = self.get_instance()
+        media_list = [self.make_image_media(b"", f"bafkrei_dummy_{i:02}") for i in range(4)]
+        for i, media in enumerate(media_list):
+            media.post_id = f"post_id_{i}"
+            media.username = f"username_{i % 2}"
+            media.created_at = f"2024-0{i + 1}-23T21:34:56.897000"
+
+        # flat から date に移動する
+        for media in media_list[:3]:
+            instance.get_save_path(media).write_bytes(media.media_id.encode())
+        instance.download_config["layout"] = "date"
+        instance.file_index = set()
+        actual = instance.relocate(media_list)
+        self.assertEqual(3, actual)
+        # 移動したファイルは索引に反映しないため、索引を破棄する
+        self.assertIsNone(instance.file_index)
+        for media in media_list[:3]:
+            filepath = self.save_base_path / media.created_at[:4] / media.created_at[5:7] / media.get_filename()
+            self.assertEqual(media.media_id.encode(), filepath.read_bytes())
+            self.assertFalse((self.save_base_path / media.get_filename()).exists())
+
+        # 再度実行しても移動しない
+        actual = instance.relocate(media_list)
+        self.assertEqual(0, actual)
+
+        # MPEG-TS のまま保存した動画も移動する
+        video_media = self.make_video_media()
+        video_media.created_at = "2024-01-23T21:34:56.897000"
+        ts_path = instance.get_ts_path(instance.get_save_path(video_media, "flat"))
+        ts_path.write_bytes(b"dummy_ts")
+        actual = instance.relocate([video_media])
+        self.assertEqual(1, actual)
+        self.assertEqual(b"dummy_ts", instance.get_ts_path(instance.get_save_path(video_media)).read_bytes())
+        self.assertFalse(ts_path.exists())
+        media_list.append(video_media)
+
+        # date から username に移動し、空になったフォルダは削除する
+        instance.download_config["layout"] = "username"
+        actual = instance.relocate(media_list)
+        self.assertEqual(4, actual)
+        for media in media_list[:3]:
+            self.assertTrue((self.save_base_path / media.username / media.get_filename()).exists())
+        self.assertTrue(
+            instance.get_ts_path(self.save_base_path / "dummy_username" / video_media.get_filename()).exists()
+        )
+        self.assertFalse((self.save_base_path / "2024").exists())
+
+    def test_relocate_content_addressed(self):
+        instance = self.get_instance()
+        instance.download_config["content_addressed"] = True
+        instance.download_config["link_mode"] = "symlink"
+        media_list = [self.make_image_media(b"dummy_blob", "bafkrei_dummy_xy") for _ in range(2)]
+        for i, media in enumerate(media_list):
+            media.post_id = f"post_id_{i}"
+            filepath = instance.get_save_path(media)
+            blob_path = instance.get_blob_path(media)
+            blob_path.parent.mkdir(parents=True, exist_ok=True)
+            blob_path.write_bytes(b"dummy_blob")
+            instance.link_file(blob_path, filepath)
+
+        instance.download_config["layout"] = "cid"
+        actual = instance.relocate(media_list)
+        # 実体1つとリンク2つ
+        self.assertEqual(3, actual)
+        blob_path = self.save_base_path / Downloader.BLOB_DIRECTORY_NAME / "xy" / "bafkrei_dummy_xy.jpeg"
+        self.assertEqual(b"dummy_blob", blob_path.read_bytes())
+        for media in media_list:
+            filepath = self.save_base_path / "xy" / media.get_filename()
+            self.assertTrue(filepath.is_symlink())
+            self.assertTrue(filepath.samefile(blob_path))
+            self.assertFalse((self.save_base_path / media.get_filename()).is_symlink())
+        self.assertFalse((self.save_base_path / Downloader.BLOB_DIRECTORY_NAME / "bafkrei_dummy_xy.jpeg").exists())
+
+    async def test_worker_video(self):
+        mock_subprocess = self.enterContext(patch("bluesky_crawler.crawler.downloader.asyncio.create_subprocess_exec"))
+        media = Media.create({
+            "post_id": "dummy_post_id",
+            "media_id": "dummy_media_id",
+            "media_index": 1,
+            "username": "dummy_username",
+            "alt_text": "dummy_alt_text",
+            "mime_type": "video/mp4",
+            "size": 0,
+            "url": "https://video.bsky.app/watch/dummy/playlist.m3u8",
+            "created_at": "dummy_created_at",
+            "registered_at": "dummy_registered_at",
+        })
+        filepath = self.save_base_path / media.get_filename()
+        temp_path = self.save_base_path / "dummy_post_id_dummy_username_01.part.mp4"
+
+        def make_process(returncode: int):
+            async def communicate():
+                # ffmpeg が一時ファイルに途中まで書き込んだ状態を再現する
+                temp_path.write_bytes(b"partial")
+                return (None, None)
+
+            process = MagicMock()
+            process.communicate.side_effect = communicate
+            process.returncode = returncode
+            return process
+
+        instance = self.get_instance()
+        instance.download_config["video_downloader"] = "ffmpeg"
+
+        # ffmpeg が失敗した場合は途中までのファイルを削除して例外
+        mock_subprocess.side_effect = lambda *args: make_process(1)
+        with self.assertRaises(ValueError):
+            actual = await instance.worker(media, MagicMock())
+        self.assertFalse(filepath.exists())
+        self.assertFalse(temp_path.exists())
+
+        # ffmpeg は一時ファイルに出力し、完了後に保存先へリネームする
+        mock_subprocess.side_effect = lambda *args: make_process(0)
+        actual = await instance.worker(media, MagicMock())
         self.assertIsNone(actual)
-        self.assertTrue((self.save_base_path / filename).exists())
+        self.assertEqual(temp_path, mock_subprocess.call_args.args[-1])
+        self.assertTrue(filepath.exists())
+        self.assertFalse(temp_path.exists())
+
+    def make_hls_handler(self, segment_num: int = 5, is_fmp4: bool = False, is_broken: bool = False):
+        base_url = "https://video.bsky.app/watch/dummy"
+        ext = "m4s" if is_fmp4 else "ts"
+        master_playlist = (
+            "#EXTM3U\n"
+            "#EXT-X-STREAM-INF:BANDWIDTH=640000,RESOLUTION=640x360\n360p/video.m3u8\n"
+            "#EXT-X-STREAM-INF:BANDWIDTH=2560000,RESOLUTION=1280x720\n720p/video.m3u8\n"
+        )
+        media_playlist = "#EXTM3U\n"
+        if is_fmp4:
+            media_playlist += '#EXT-X-MAP:URI="init.mp4"\n'
+        for i in range(segment_num):
+            media_playlist += f"#EXTINF:6.000,\nvideo{i}.{ext}\n"
+        media_playlist += "#EXT-X-ENDLIST\n"
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            url = str(request.url)
+            if url == f"{base_url}/playlist.m3u8":
+                return httpx.Response(200, text=master_playlist)
+            if url.endswith("/video.m3u8"):
+                return httpx.Response(200, text=media_playlist)
+            if url.endswith("/init.mp4"):
+                return httpx.Response(200, content=b"init_")
+            if is_broken and url.endswith(f"video{segment_num - 1}.{ext}"):
+                return httpx.Response(500)
+            return httpx.Response(200, content=url.split("/")[-1].encode())
+
+        expect_body = (b"init_" if is_fmp4 else b"") + b"".join(f"video{i}.{ext}".encode() for i in range(segment_num))
+        return f"{base_url}/playlist.m3u8", handler, expect_body
+
+    async def test_fetch_playlist(self):
+        url, handler, _ = self.make_hls_handler()
+        instance = self.get_instance()
+
+        Params = namedtuple("Params", ["rendition", "expect_variant"])
+        params_list = [Params("highest", "720p"), Params("lowest", "360p")]
+        for params in params_list:
+            instance.download_config["video_rendition"] = params.rendition
+            async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+                actual = await instance.fetch_playlist(url, client)
+            expect = [f"https://video.bsky.app/watch/dummy/{params.expect_variant}/video{i}.ts" for i in range(5)]
+            self.assertEqual(expect, actual.segment_url_list)
+
+        # メディアプレイリストを直接指定した場合
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            actual = await instance.fetch_playlist("https://video.bsky.app/watch/dummy/720p/video.m3u8", client)
+        self.assertEqual(5, len(actual.segment_url_list))
+
+        # 入れ子のマスタープレイリスト
+        def nested_handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(200, text="#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=1\nplaylist.m3u8\n")
+
+        async with httpx.AsyncClient(transport=httpx.MockTransport(nested_handler)) as client:
+            with self.assertRaises(ValueError):
+                actual = await instance.fetch_playlist(url, client)
+
+    async def test_download_hls(self):
+        instance = self.get_instance()
+        instance.download_config["segment_concurrency"] = 3
+        output_path = self.save_base_path / "output.part.ts"
+
+        running_num = 0
+        max_running_num = 0
+        original_fetch_segment = instance.fetch_segment
+
+        async def fetch_segment(url, client):
+            nonlocal running_num, max_running_num
+            running_num += 1
+            max_running_num = max(max_running_num, running_num)
+            # 後のセグメントほど早く取得できても、プレイリストの順に連結される
+            segment_index = int(m.group(1)) if (m := re.search(r"video(\d+)\.", url)) else 0
+            await asyncio.sleep(0.01 * (10 - segment_index))
+            running_num -= 1
+            return await original_fetch_segment(url, client)
+
+        self.enterContext(patch.object(instance, "fetch_segment", side_effect=fetch_segment))
+        for is_fmp4 in [False, True]:
+            max_running_num = 0
+            url, handler, expect_body = self.make_hls_handler(segment_num=8, is_fmp4=is_fmp4)
+            async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+                actual = await instance.download_hls(url, client, output_path)
+            self.assertEqual(is_fmp4, actual)
+            self.assertEqual(expect_body, output_path.read_bytes())
+            # 先読みは segment_concurrency 個まで
+            self.assertEqual(3, max_running_num)
+
+        url, handler, _ = self.make_hls_handler(segment_num=8, is_broken=True)
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            with self.assertRaises(httpx.HTTPStatusError):
+                actual = await instance.download_hls(url, client, output_path)
+
+    async def test_download_video(self):
+        mock_logger = self.enterContext(patch("bluesky_crawler.crawler.downloader.logger"))
+        mock_which = self.enterContext(patch("bluesky_crawler.crawler.downloader.shutil.which"))
+        mock_run_ffmpeg = self.enterContext(patch.object(Downloader, "run_ffmpeg"))
+        media = Media.create({
+            "post_id": "dummy_post_id",
+            "media_id": "dummy_media_id",
+            "media_index": 1,
+            "username": "dummy_username",
+            "alt_text": "dummy_alt_text",
+            "mime_type": "video/mp4",
+            "size": 0,
+            "url": "https://video.bsky.app/watch/dummy/playlist.m3u8",
+            "created_at": "dummy_created_at",
+            "registered_at": "dummy_registered_at",
+        })
+        filepath = self.save_base_path / media.get_filename()
+        ts_path = self.save_base_path / "dummy_post_id_dummy_username_01.ts"
+        segment_path = self.save_base_path / "dummy_post_id_dummy_username_01.part.ts"
+        temp_path = self.save_base_path / "dummy_post_id_dummy_username_01.part.mp4"
+
+        async def run_ffmpeg(source, output_path):
+            content = Path(source).read_bytes() if isinstance(source, Path) else b"ffmpeg_" + source.encode()
+            output_path.write_bytes(b"mp4_" + content)
+
+        mock_run_ffmpeg.side_effect = run_ffmpeg
+
+        Params = namedtuple(
+            "Params",
+            ["video_downloader", "is_ffmpeg_available", "is_fmp4", "is_broken", "expect_source", "expect_path"],
+        )
+        params_list = [
+            # fMP4 はそのまま保存する
+            Params("native", True, True, False, None, filepath),
+            Params("native", False, True, False, None, filepath),
+            # MPEG-TS は ffmpeg があればローカルで mp4 に変換する
+            Params("native", True, False, False, segment_path, filepath),
+            # ffmpeg がなければ MPEG-TS のまま拡張子を .ts にして保存する
+            Params("native", False, False, False, None, ts_path),
+            # native で失敗した場合は ffmpeg で取得し直す
+            Params("native", True, False, True, media.url, filepath),
+            Params("ffmpeg", True, False, False, media.url, filepath),
+        ]
+        instance = self.get_instance()
+        for params in params_list:
+            mock_run_ffmpeg.reset_mock()
+            filepath.unlink(missing_ok=True)
+            ts_path.unlink(missing_ok=True)
+            mock_which.side_effect = lambda name: "/usr/bin/ffmpeg" if params.is_ffmpeg_available else None
+            instance.download_config["video_downloader"] = params.video_downloader
+            url, handler, expect_body = self.make_hls_handler(is_fmp4=params.is_fmp4, is_broken=params.is_broken)
+            async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+                actual = await instance.download_video(media, client, filepath)
+            self.assertIsNone(actual)
+
+            # 保存先以外のパスには保存しない
+            self.assertEqual([params.expect_path], [path for path in [filepath, ts_path] if path.exists()])
+            if params.expect_source is None:
+                mock_run_ffmpeg.assert_not_called()
+                self.assertEqual(expect_body, params.expect_path.read_bytes())
+            else:
+                mock_run_ffmpeg.assert_called_once_with(params.expect_source, temp_path)
+                if params.expect_source == segment_path:
+                    self.assertEqual(b"mp4_" + expect_body, filepath.read_bytes())
+                else:
+                    self.assertEqual(b"mp4_ffmpeg_" + url.encode(), filepath.read_bytes())
+            self.assertFalse(segment_path.exists())
+            self.assertFalse(temp_path.exists())
+
+        # native で失敗し ffmpeg もない場合は例外
+        filepath.unlink(missing_ok=True)
+        mock_run_ffmpeg.reset_mock()
+        mock_which.side_effect = lambda name: None
+        instance.download_config["video_downloader"] = "native"
+        url, handler, _ = self.make_hls_handler(is_broken=True)
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            with self.assertRaises(httpx.HTTPStatusError):
+                actual = await instance.download_video(media, client, filepath)
+        mock_run_ffmpeg.assert_not_called()
+        self.assertFalse(filepath.exists())
+        self.assertFalse(segment_path.exists())
 
     async def test_excute(self):
         mock_client = self.enterContext(patch("bluesky_crawler.crawler.downloader.httpx.AsyncClient"))
-        media_list = [
-            Media.create({
+        mock_logger = self.enterContext(patch("bluesky_crawler.crawler.downloader.logger"))
+
+        def make_media(i: int, mime_type: str) -> Media:
+            return Media.create({
                 "post_id": f"dummy_post_id_{i}",
                 "media_id": f"dummy_media_id_{i}",
-                "media_index": i + 1,
+                "media_index": i % 4 + 1,
                 "username": f"dummy_username_{i}",
                 "alt_text": f"dummy_alt_text_{i}",
-                "mime_type": "image/jpeg",
+                "mime_type": mime_type,
                 "size": 0,
-                "url": "dummy_url",
+                "url": f"https://cdn.bsky.app/dummy_url_{i}",
                 "created_at": "dummy_created_at",
                 "registered_at": "dummy_registered_at",
             })
-            for i in range(5)
-        ]
 
-        async def client_get(url):
-            r = MagicMock()
-            r.content = str(url).encode()
-            return r
+        image_list = [make_media(i, "image/jpeg") for i in range(20)]
+        video_list = [make_media(i, "video/mp4") for i in range(20, 25)]
+        media_list = image_list + video_list
+        failed_url_list = [image_list[3].url, video_list[1].url]
+
+        running_num = {"image": 0, "video": 0}
+        max_running_num = {"image": 0, "video": 0}
+
+        async def worker(media, client):
+            kind = "video" if "video" in media.mime_type else "image"
+            running_num[kind] += 1
+            max_running_num[kind] = max(max_running_num[kind], running_num[kind])
+            await asyncio.sleep(0.01)
+            running_num[kind] -= 1
+            if media.url in failed_url_list:
+                raise ValueError("download failed")
+            (self.save_base_path / media.get_filename()).write_bytes(b"")
 
-        mock_client.return_value.__aenter__.return_value.get.side_effect = client_get
         instance = self.get_instance()
+        instance.download_config["image_concurrency"] = 3
+        instance.download_config["video_concurrency"] = 2
+        self.enterContext(patch.object(instance, "worker", side_effect=worker))
         actual = await instance.excute(media_list)
-        self.assertIsNone(actual)
+
+        # 失敗したメディアは入力順で返り、他のメディアの DL は継続する
+        self.assertEqual([image_list[3], video_list[1]], actual)
         for media in media_list:
-            filename = media.get_filename()
-            self.assertTrue((self.save_base_path / filename).exists())
+            filepath = self.save_base_path / media.get_filename()
+            self.assertEqual(media.url not in failed_url_list, filepath.exists())
+
+        # 画像・動画それぞれの同時実行数が上限を超えない
+        self.assertEqual({"image": 3, "video": 2}, max_running_num)
+
+        # 1回の excute ではクライアントを共有する
+        mock_client.assert_called_once()
+        client = mock_client.return_value.__aenter__.return_value
+        self.assertTrue(all(c.args[1] is client for c in instance.worker.call_args_list))
+
+    async def test_excute_file_index(self):
+        mock_logger = self.enterContext(patch("bluesky_crawler.crawler.downloader.logger"))
+        media_list = [self.make_image_media(b"dummy_body", f"bafkrei_dummy_{i:02}") for i in range(6)]
+        for i, media in enumerate(media_list):
+            media.post_id = f"post_id_{i}"
+        instance = self.get_instance()
+        instance.download_config["layout"] = "cid"
+        for media in media_list[:3]:
+            filepath = instance.get_save_path(media)
+            filepath.parent.mkdir(parents=True, exist_ok=True)
+            filepath.write_bytes(b"dummy_body")
+        request_list = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            request_list.append(request)
+            return httpx.Response(200, content=b"dummy_body")
+
+        def create_client():
+            return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+        self.enterContext(patch.object(instance, "create_client", side_effect=create_client))
+        mock_exists = self.enterContext(patch.object(Path, "exists", autospec=True, side_effect=Path.exists))
+        actual = await instance.excute(media_list)
+        self.assertEqual([], actual)
+        # 保存済のファイルは索引で判定し、保存先に対する exists() は呼ばない
+        # （DL する場合の再開用の一時ファイルの確認のみ）
+        save_path_set = {instance.get_save_path(media) for media in media_list}
+        exists_path_list = [c.args[0] for c in mock_exists.call_args_list]
+        self.assertEqual(set(), save_path_set & set(exists_path_list))
+        self.assertEqual(3, len(exists_path_list))
+        self.assertEqual(3, len(request_list))
+        for media in media_list:
+            self.assertTrue(instance.get_save_path(media).exists())
+        # DL したファイルは索引に追加され、索引は excute をまたいで保持する
+        self.assertEqual(save_path_set, save_path_set & instance.file_index)
+
+        request_list.clear()
+        mock_scandir = self.enterContext(
+            patch("bluesky_crawler.crawler.downloader.os.scandir", side_effect=os.scandir)
+        )
+        actual = await instance.excute(media_list)
+        self.assertEqual([], actual)
+        mock_scandir.assert_not_called()
+        self.assertEqual([], request_list)
 
     def test_download(self):
         mock_logger = self.enterContext(patch("bluesky_crawler.crawler.downloader.logger"))
         mock_excute = self.enterContext(patch("bluesky_crawler.crawler.downloader.Downloader.excute"))
         instance = self.get_instance()
+        mock_excute.return_value = ["failed_media"]
         actual = instance.download("dummy_media_list")
-        self.assertIsNone(actual)
+        self.assertEqual(["failed_media"], actual)
         self.assertEqual([call("dummy_media_list")], mock_excute.mock_calls)
 
 
@@ -0,0 +1,164 @@
+import gzip
+import importlib.util
+import os
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+import freezegun
+import orjson
+from mock import patch
+
+from bluesky_crawler.crawler.feed_cache import DEFAULT_CACHE_CONFIG, FeedCache
+
+IS_ZSTD_INSTALLED = importlib.util.find_spec("zstandard") is not None
+
+
+class TestFeedCache(unittest.TestCase):
+    def setUp(self):
+        self.enterContext(patch("bluesky_crawler.crawler.feed_cache.logger"))
+        self.tmp_dir = Path(self.enterContext(tempfile.TemporaryDirectory()))
+
+    def make_entry_list(self, start: int, num: int) -> list[dict]:
+        return [{"post": {"uri": f"uri_{i}", "record": {"text": f"テキスト_{i}"}}} for i in range(start, start + num)]
+
+    def test_init(self):
+        cache_path = self.tmp_dir / "cache"
+        instance = FeedCache(cache_path)
+        self.assertEqual(cache_path, instance.cache_path)
+        self.assertEqual(DEFAULT_CACHE_CONFIG, instance.cache_config)
+        self.assertEqual("gzip", instance.codec)
+        # 以前のバージョンのキャッシュを消さないよう、既定では削除しない
+        self.assertEqual(0, instance.cache_config["retention_days"])
+        self.assertTrue(cache_path.is_dir())
+
+        instance = FeedCache(cache_path, {"max_segment_bytes": 100})
+        self.assertEqual(DEFAULT_CACHE_CONFIG | {"max_segment_bytes": 100}, instance.cache_config)
+
+        # zstandard がない場合は gzip にする
+        with patch("bluesky_crawler.crawler.feed_cache.importlib.util.find_spec", return_value=None):
+            instance = FeedCache(cache_path, {"codec": "zstd"})
+            self.assertEqual("gzip", instance.codec)
+
+        with self.assertRaises(ValueError):
+            instance = FeedCache(cache_path, {"codec": "invalid"})
+
+    def test_get_cache_file_list(self):
+        instance = FeedCache(self.tmp_dir)
+        filename_list = [
+            "20240102000000_bluesky.jsonl.gz",
+            "20240101000000_bluesky.json",
+            "20240103000000_bluesky.jsonl.zst",
+            "bluesky.txt",
+            "20240104000000_bluesky.jsonl",
+        ]
+        for filename in filename_list:
+            (self.tmp_dir / filename).touch()
+        actual = instance.get_cache_file_list()
+        expect = [self.tmp_dir / filename for filename in sorted(filename_list[:3])]
+        self.assertEqual(expect, actual)
+
+    def test_get_segment_path(self):
+        instance = FeedCache(self.tmp_dir, {"max_segment_bytes": 10})
+        with freezegun.freeze_time("2024-03-23T12:34:56"):
+            # キャッシュファイルがない → 新規
+            self.assertEqual(self.tmp_dir / "20240323123456_bluesky.jsonl.gz", instance.get_segment_path())
+
+            # 最新のセグメントが max_segment_bytes 未満 → 追記
+            segment_path = self.tmp_dir / "20240101000000_bluesky.jsonl.gz"
+            segment_path.write_bytes(b"\0" * 9)
+            self.assertEqual(segment_path, instance.get_segment_path())
+
+            # 最新のセグメントが max_segment_bytes 以上 → 新規
+            segment_path.write_bytes(b"\0" * 10)
+            self.assertEqual(self.tmp_dir / "20240323123456_bluesky.jsonl.gz", instance.get_segment_path())
+
+            # 最新のキャッシュファイルが別の形式 → 新規
+            segment_path.write_bytes(b"")
+            (self.tmp_dir / "20240102000000_bluesky.json").touch()
+            self.assertEqual(self.tmp_dir / "20240323123456_bluesky.jsonl.gz", instance.get_segment_path())
+
+    def test_append(self):
+        instance = FeedCache(self.tmp_dir, {"retention_days": 0})
+        self.assertIsNone(instance.append([]))
+
+        entry_list = self.make_entry_list(0, 3)
+        segment_path = instance.append(entry_list)
+        self.assertTrue(segment_path.name.endswith("_bluesky.jsonl.gz"))
+        with gzip.open(segment_path, "rb") as f:
+            self.assertEqual([orjson.loads(line) for line in f], entry_list)
+
+        # 同じセグメントに追記する（gzip メンバーが追加される）
+        self.assertEqual(segment_path, instance.append(self.make_entry_list(3, 2)))
+        with gzip.open(segment_path, "rb") as f:
+            self.assertEqual([orjson.loads(line) for line in f], self.make_entry_list(0, 5))
+
+        # 追記後に prune する
+        with patch.object(instance, "prune") as mock_prune:
+            instance.append(entry_list)
+            mock_prune.assert_called_once_with()
+
+    def test_replay(self):
+        instance = FeedCache(self.tmp_dir, {"retention_days": 0})
+        self.assertEqual([], list(instance.replay()))
+
+        # 以前のバージョンのキャッシュファイルは新しい順に保存されている
+        legacy_path = self.tmp_dir / "20240101000000_bluesky.json"
+        legacy_feed = list(reversed(self.make_entry_list(0, 3)))
+        legacy_path.write_bytes(orjson.dumps({"result": {"feed": legacy_feed, "cursor": None}}))
+        instance.cache_config["max_segment_bytes"] = 1
+        with freezegun.freeze_time("2024-03-23T12:34:56"):
+            instance.append(self.make_entry_list(3, 2))
+        with freezegun.freeze_time("2024-03-24T12:34:56"):
+            instance.append(self.make_entry_list(5, 2))
+        self.assertEqual(3, len(instance.get_cache_file_list()))
+        self.assertEqual(self.make_entry_list(0, 7), list(instance.replay()))
+
+        # 末尾が壊れているセグメントは読み込めたところまで
+        segment_path = instance.get_cache_file_list()[1]
+        data = segment_path.read_bytes() + gzip.compress(b'{"post": {"uri": "uri_x"}}\n')[:-10]
+        segment_path.write_bytes(data)
+        self.assertEqual(self.make_entry_list(0, 7), list(instance.replay()))
+
+        # zstandard がない場合、zstd のセグメントは読み込まない
+        (self.tmp_dir / "20240325000000_bluesky.jsonl.zst").write_bytes(b"dummy")
+        with patch("bluesky_crawler.crawler.feed_cache.importlib.util.find_spec", return_value=None):
+            self.assertEqual(self.make_entry_list(0, 7), list(instance.replay()))
+
+    @unittest.skipUnless(IS_ZSTD_INSTALLED, "zstandard is not installed.")
+    def test_replay_zstd(self):
+        instance = FeedCache(self.tmp_dir, {"codec": "zstd", "retention_days": 0})
+        self.assertEqual("zstd", instance.codec)
+        segment_path = instance.append(self.make_entry_list(0, 3))
+        self.assertEqual(segment_path, instance.append(self.make_entry_list(3, 2)))
+        self.assertTrue(segment_path.name.endswith("_bluesky.jsonl.zst"))
+        self.assertEqual(self.make_entry_list(0, 5), list(instance.replay()))
+
+    def test_prune(self):
+        instance = FeedCache(self.tmp_dir, {"retention_days": 30})
+        now = time.time()
+        path_list = []
+        for i, days in enumerate([60, 40, 20, 50]):
+            path = self.tmp_dir / f"2024010{i}000000_bluesky.jsonl.gz"
+            path.touch()
+            mtime = now - days * 24 * 60 * 60
+            os.utime(path, (mtime, mtime))
+            path_list.append(path)
+
+        # 最新のキャッシュファイルは retention_days を過ぎていても削除しない
+        actual = instance.prune()
+        self.assertEqual(path_list[:2], actual)
+        self.assertEqual(path_list[2:], instance.get_cache_file_list())
+
+        instance.cache_config["retention_days"] = 0
+        os.utime(path_list[2], (0, 0))
+        self.assertEqual([], instance.prune())
+        self.assertEqual(path_list[2:], instance.get_cache_file_list())
+
+
+if __name__ == "__main__":
+    if sys.argv:
+        del sys.argv[1:]
+    unittest.main(warnings="ignore")
@@ -1,6 +1,8 @@
 import sys
+import tempfile
 import unittest
 from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from pathlib import Path
 
@@ -8,7 +10,8 @@ import freezegun
 import orjson
 from mock import patch
 
-from bluesky_crawler.crawler.fetcher import Fetcher
+from bluesky_crawler.crawler.feed_cache import FeedCache
+from bluesky_crawler.crawler.fetcher import DEFAULT_PARSE_CONFIG, Fetcher, parse_chunk, parse_entry_list
 from bluesky_crawler.crawler.valueobject.fetched_info import FetchedInfo
 
 
@@ -70,44 +73,72 @@ class TestFetcher(unittest.TestCase):
 
         instance = Fetcher(config_path)
         config_dict = orjson.loads(config_path.read_bytes())
-        mock_manager.assert_called_once_with(config_dict)
+        mock_manager.assert_called_once_with(config_dict, None)
         self.assertEqual(mock_manager.return_value, instance.manager)
         self.assertEqual(False, instance.is_debug)
         self.assertEqual(Path("./cache/"), instance.cache_path)
+        self.assertEqual(Path("./cache/"), instance.cache.cache_path)
+        self.assertIsNone(instance.latest_post_uri)
+        self.assertEqual(DEFAULT_PARSE_CONFIG, instance.parse_config)
+
+        mock_read_bytes = self.enterContext(patch("bluesky_crawler.crawler.fetcher.Path.read_bytes"))
+        config_dict["general"]["parse"] = {"executor": "process", "chunk_size": 100}
+        mock_read_bytes.return_value = orjson.dumps(config_dict)
+        instance = Fetcher(config_path)
+        self.assertEqual(DEFAULT_PARSE_CONFIG | {"executor": "process", "chunk_size": 100}, instance.parse_config)
+
+        config_dict["general"]["parse"] = {"executor": "invalid"}
+        mock_read_bytes.return_value = orjson.dumps(config_dict)
+        with self.assertRaises(ValueError):
+            instance = Fetcher(config_path)
+
+        # 複数アカウントの場合、キャッシュはアカウントごとのフォルダに保存する
+        tmp_dir = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        self.enterContext(patch.object(Fetcher, "cache_path", tmp_dir))
+        del config_dict["general"]["parse"]
+        config_dict["bluesky"] = [
+            {"handle_name": "handle_name_0", "password": "password_0"},
+            {"handle_name": "handle_name_1", "password": "password_1"},
+        ]
+        mock_read_bytes.return_value = orjson.dumps(config_dict)
+        mock_manager.reset_mock()
+        mock_manager.return_value.handle_name = "handle_name_1"
+        instance = Fetcher(config_path, handle_name="handle_name_1")
+        mock_manager.assert_called_once_with(config_dict, "handle_name_1")
+        self.assertEqual(tmp_dir / "handle_name_1", instance.cache_path)
+        self.assertTrue(instance.cache.cache_path.is_dir())
 
     def test_fetch(self):
         self.enterContext(freezegun.freeze_time("2099-03-23T12:34:56"))
         mock_logger = self.enterContext(patch("bluesky_crawler.crawler.fetcher.logger"))
         mock_manager = self.enterContext(patch("bluesky_crawler.crawler.fetcher.BlueskyManager"))
         config_path = Path("./tests/bluesky_crawler/config/config.json")
-        cache_path = Path("./cache/")
 
-        def pre_run(instance, is_debug, fetched_dict_num, error_occur):
+        def pre_run(instance: Fetcher, is_debug: bool, fetched_dict_num: int, error_occur: bool) -> None:
+            tmp_dir = self.enterContext(tempfile.TemporaryDirectory())
+            instance.cache = FeedCache(Path(tmp_dir), {"retention_days": 0})
             fetched_dict_list = self.make_fetched_dict_list(fetched_dict_num)
             if error_occur:
                 del fetched_dict_list["feed"][0]["post"]["embed"]
-            mock_manager.return_value.get_actor_likes.side_effect = lambda limit: fetched_dict_list
+            mock_manager.return_value.iter_actor_likes.side_effect = lambda limit, last_post_uri: iter([
+                (fetched_dict_list["feed"][:2], "cursor_0"),
+                (fetched_dict_list["feed"][2:], None),
+            ])
 
             if is_debug and not error_occur:
-                date_str = datetime.now().strftime("%Y%m%d%H%M%S")
-                cache_filename = f"{date_str}_bluesky.json"
-                save_path = cache_path / cache_filename
-                save_path.write_bytes(orjson.dumps({"result": fetched_dict_list}, option=orjson.OPT_INDENT_2))
-
-            if is_debug and error_occur:
-                date_str = datetime.now().strftime("%Y%m%d%H%M%S")
-                cache_filename = f"{date_str}_bluesky.json"
-                save_path = cache_path / cache_filename
-                save_path.unlink(missing_ok=True)
-                instance.cache_path = Path("./tests/bluesky_crawler/cache/")
-
-        def post_run(is_debug, fetched_dict_num, error_occur):
-            if not is_debug and fetched_dict_num > 0:
-                date_str = datetime.now().strftime("%Y%m%d%H%M%S")
-                cache_filename = f"{date_str}_bluesky.json"
-                save_path = cache_path / cache_filename
-                self.assertTrue(save_path.exists())
-                save_path.unlink(missing_ok=True)
+                # 古い順に2回に分けて追記したキャッシュ
+                entry_list = list(reversed(fetched_dict_list["feed"]))
+                instance.cache.append(entry_list[:2])
+                instance.cache.append(entry_list[2:])
+
+        def post_run(instance: Fetcher, is_debug: bool, fetched_dict_num: int, error_occur: bool) -> None:
+            if not is_debug:
+                # 取得したエントリが古い順にキャッシュに追記されている
+                expect = list(reversed(self.make_fetched_dict_list(fetched_dict_num)["feed"]))
+                if error_occur:
+                    del expect[-1]["post"]["embed"]
+                self.assertEqual(expect, list(instance.cache.replay()))
+                self.assertEqual(1 if fetched_dict_num > 0 else 0, len(instance.cache.get_cache_file_list()))
 
         def make_expect(is_debug, fetched_dict_num, error_occur):
             post_list: list[dict] = self.make_fetched_dict_list(fetched_dict_num)["feed"]
@@ -130,6 +161,7 @@ class TestFetcher(unittest.TestCase):
             pre_run(instance, params.is_debug, params.fetched_dict_num, params.error_occur)
             actual = None
             if params.is_debug and params.error_occur:
+                # キャッシュファイルがない
                 with self.assertRaises(ValueError):
                     actual = instance.fetch()
                 continue
@@ -137,7 +169,213 @@ class TestFetcher(unittest.TestCase):
                 actual = instance.fetch()
             expect = make_expect(params.is_debug, params.fetched_dict_num, params.error_occur)
             self.assertEqual(expect, actual)
-            post_run(params.is_debug, params.fetched_dict_num, params.error_occur)
+            if params.fetched_dict_num > 0:
+                latest_post_uri = self.make_fetched_dict_list(params.fetched_dict_num)["feed"][0]["post"]["uri"]
+                self.assertEqual(latest_post_uri, instance.latest_post_uri)
+            else:
+                self.assertIsNone(instance.latest_post_uri)
+            post_run(instance, params.is_debug, params.fetched_dict_num, params.error_occur)
+
+    def test_fetch_iter(self):
+        self.enterContext(freezegun.freeze_time("2099-03-23T12:34:56"))
+        mock_logger = self.enterContext(patch("bluesky_crawler.crawler.fetcher.logger"))
+        mock_manager = self.enterContext(patch("bluesky_crawler.crawler.fetcher.BlueskyManager"))
+        config_path = Path("./tests/bluesky_crawler/config/config.json")
+        tmp_dir = self.enterContext(tempfile.TemporaryDirectory())
+
+        instance = Fetcher(config_path)
+        instance.cache = FeedCache(Path(tmp_dir), {"retention_days": 0})
+        post_list = self.make_fetched_dict_list(5)["feed"]
+        page_list = [([], "cursor_0"), (post_list[:3], "cursor_1"), (post_list[3:], None)]
+        mock_manager.return_value.iter_actor_likes.return_value = iter(page_list)
+
+        # 1ページ取得するごとに返す
+        page_iter = instance.fetch_iter("last_post_uri")
+        self.assertEqual([], next(page_iter))
+        self.assertIsNone(instance.latest_post_uri)
+        self.assertEqual(post_list[:3], next(page_iter))
+        self.assertEqual(post_list[0]["post"]["uri"], instance.latest_post_uri)
+        # キャッシュにはすべてのページを取得し終えてから追記する
+        self.assertEqual([], instance.cache.get_cache_file_list())
+        self.assertEqual(post_list[3:], next(page_iter))
+        with self.assertRaises(StopIteration):
+            next(page_iter)
+        mock_manager.return_value.iter_actor_likes.assert_called_once_with(limit=100, last_post_uri="last_post_uri")
+        self.assertEqual(post_list[0]["post"]["uri"], instance.latest_post_uri)
+        self.assertEqual(list(reversed(post_list)), list(instance.cache.replay()))
+
+        # is_debug の場合はキャッシュから返す
+        self.enterContext(patch("bluesky_crawler.crawler.fetcher.REPLAY_BATCH_SIZE", 2))
+        instance.is_debug = True
+        mock_manager.return_value.iter_actor_likes.reset_mock()
+        actual = list(instance.fetch_iter())
+        self.assertEqual([post_list[3:], post_list[1:3], post_list[:1]], actual)
+        mock_manager.return_value.iter_actor_likes.assert_not_called()
+
+    def test_replay_cache(self):
+        self.enterContext(freezegun.freeze_time("2099-03-23T12:34:56"))
+        mock_logger = self.enterContext(patch("bluesky_crawler.crawler.fetcher.logger"))
+        mock_manager = self.enterContext(patch("bluesky_crawler.crawler.fetcher.BlueskyManager"))
+        self.enterContext(patch("bluesky_crawler.crawler.fetcher.REPLAY_BATCH_SIZE", 2))
+        config_path = Path("./tests/bluesky_crawler/config/config.json")
+        tmp_dir = self.enterContext(tempfile.TemporaryDirectory())
+
+        instance = Fetcher(config_path, is_debug=True)
+        instance.cache = FeedCache(Path(tmp_dir), {"retention_days": 0})
+        post_list = self.make_fetched_dict_list(5)["feed"]
+        # 以前のバージョンのキャッシュファイル（新しい順）と、セグメント（古い順）が混在する
+        legacy_path = Path(tmp_dir) / "20990101000000_bluesky.json"
+        legacy_path.write_bytes(orjson.dumps({"result": {"feed": post_list[3:], "cursor": None}}))
+        instance.cache.append(reversed(post_list[:3]))
+
+        actual = instance.replay_cache()
+        expect = [FetchedInfo.create(entry) for entry in reversed(post_list)]
+        self.assertEqual(expect, actual)
+        self.assertEqual(post_list[0]["post"]["uri"], instance.latest_post_uri)
+
+    def test_fetch_page(self):
+        self.enterContext(freezegun.freeze_time("2099-03-23T12:34:56"))
+        mock_logger = self.enterContext(patch("bluesky_crawler.crawler.fetcher.logger"))
+        mock_manager = self.enterContext(patch("bluesky_crawler.crawler.fetcher.BlueskyManager"))
+        config_path = Path("./tests/bluesky_crawler/config/config.json")
+
+        Params = namedtuple("Params", ["cursor", "fetched_dict_num", "next_cursor"])
+        params_list = [
+            Params(None, 5, "next_cursor"),
+            Params("cursor", 5, "next_cursor"),
+            Params("cursor", 5, None),
+            Params("cursor", 0, "next_cursor"),
+        ]
+        for params in params_list:
+            instance = Fetcher(config_path)
+            fetched_dict_list = self.make_fetched_dict_list(params.fetched_dict_num)
+            response = fetched_dict_list | {"cursor": params.next_cursor}
+            mock_manager.return_value.get_actor_likes_page.reset_mock()
+            mock_manager.return_value.get_actor_likes_page.side_effect = lambda cursor, limit: response
+
+            actual = instance.fetch_page(params.cursor)
+            post_list = self.make_fetched_dict_list(params.fetched_dict_num)["feed"]
+            post_list.reverse()
+            expect_next_cursor = params.next_cursor if params.fetched_dict_num > 0 else None
+            expect = ([FetchedInfo.create(entry) for entry in post_list], expect_next_cursor)
+            self.assertEqual(expect, actual)
+            mock_manager.return_value.get_actor_likes_page.assert_called_once_with(params.cursor, limit=100)
+            if params.cursor is None:
+                self.assertEqual(fetched_dict_list["feed"][0]["post"]["uri"], instance.latest_post_uri)
+            else:
+                self.assertIsNone(instance.latest_post_uri)
+
+    def test_parse_entry_list(self):
+        self.enterContext(freezegun.freeze_time("2099-03-23T12:34:56"))
+        entry_list = self.make_fetched_dict_list(3)["feed"]
+        del entry_list[1]["post"]["embed"]
+
+        actual = parse_entry_list(entry_list)
+        self.assertEqual(3, len(actual))
+        self.assertEqual(FetchedInfo.parse(entry_list[0]), actual[0])
+        self.assertIsInstance(actual[1], str)
+        self.assertEqual(FetchedInfo.parse(entry_list[2]), actual[2])
+
+        # ワーカープロセスとの受け渡しは orjson の bytes で行う
+        actual = orjson.loads(parse_chunk(orjson.dumps(entry_list)))
+        self.assertEqual(orjson.loads(orjson.dumps(parse_entry_list(entry_list))), actual)
+
+    def test_get_parse_batch_size(self):
+        mock_logger = self.enterContext(patch("bluesky_crawler.crawler.fetcher.logger"))
+        mock_manager = self.enterContext(patch("bluesky_crawler.crawler.fetcher.BlueskyManager"))
+        config_path = Path("./tests/bluesky_crawler/config/config.json")
+
+        Params = namedtuple("Params", ["executor", "min_batch_size", "expect"])
+        params_list = [
+            Params("serial", 2000, 1),
+            Params("process", 2000, 2000),
+            Params("process", 0, 1),
+        ]
+        for params in params_list:
+            instance = Fetcher(config_path)
+            instance.parse_config = DEFAULT_PARSE_CONFIG | {
+                "executor": params.executor,
+                "min_batch_size": params.min_batch_size,
+            }
+            self.assertEqual(params.expect, instance.get_parse_batch_size())
+
+    def test_create_fetched_info_list(self):
+        self.enterContext(freezegun.freeze_time("2099-03-23T12:34:56"))
+        mock_logger = self.enterContext(patch("bluesky_crawler.crawler.fetcher.logger"))
+        mock_manager = self.enterContext(patch("bluesky_crawler.crawler.fetcher.BlueskyManager"))
+        config_path = Path("./tests/bluesky_crawler/config/config.json")
+
+        post_list = self.make_fetched_dict_list(10)["feed"]
+        del post_list[3]["post"]["embed"]
+        expect = [FetchedInfo.create(entry) for entry in reversed(post_list) if "embed" in entry["post"]]
+
+        def to_comparable(fetched_info_list: list[FetchedInfo]) -> list:
+            return [
+                (f.like.to_dict(), f.user.to_dict(), [media.to_dict() for media in f.media_list])
+                for f in fetched_info_list
+            ]
+
+        Params = namedtuple("Params", ["executor", "min_batch_size", "is_parallel"])
+        params_list = [
+            Params("serial", 2000, False),
+            Params("serial", 1, False),
+            Params("process", 2000, False),  # エントリ数が少ない場合は1プロセスで処理する
+            Params("process", 1, True),
+        ]
+        for params in params_list:
+            instance = Fetcher(config_path)
+            instance.parse_config = DEFAULT_PARSE_CONFIG | {
+                "executor": params.executor,
+                "max_workers": 2,
+                "chunk_size": 3,
+                "min_batch_size": params.min_batch_size,
+            }
+            with patch.object(instance, "parse_in_process_pool", wraps=instance.parse_in_process_pool) as mock_pool:
+                actual = instance.create_fetched_info_list(post_list)
+                self.assertEqual(params.is_parallel, mock_pool.called)
+            # 元の順（古い順）のまま、解析できなかったエントリは除外される
+            self.assertEqual(expect, actual)
+            self.assertEqual(to_comparable(expect), to_comparable(actual))
+
+    def test_reuse_process_pool(self):
+        self.enterContext(freezegun.freeze_time("2099-03-23T12:34:56"))
+        mock_logger = self.enterContext(patch("bluesky_crawler.crawler.fetcher.logger"))
+        mock_manager = self.enterContext(patch("bluesky_crawler.crawler.fetcher.BlueskyManager"))
+        mock_pool = self.enterContext(
+            patch("bluesky_crawler.crawler.fetcher.ProcessPoolExecutor", wraps=ProcessPoolExecutor)
+        )
+        config_path = Path("./tests/bluesky_crawler/config/config.json")
+        post_list = self.make_fetched_dict_list(6)["feed"]
+        expect = [FetchedInfo.create(entry) for entry in reversed(post_list)]
+
+        # executor が "serial" の場合はプールを作成しない
+        instance = Fetcher(config_path)
+        with instance.reuse_process_pool():
+            self.assertIsNone(instance.process_pool)
+        mock_pool.assert_not_called()
+
+        instance.parse_config = DEFAULT_PARSE_CONFIG | {
+            "executor": "process",
+            "max_workers": 2,
+            "chunk_size": 3,
+            "min_batch_size": 1,
+        }
+        # with の間は1つのプールを使い回す
+        with instance.reuse_process_pool():
+            process_pool = instance.process_pool
+            self.assertIsNotNone(process_pool)
+            with instance.reuse_process_pool():
+                self.assertIs(process_pool, instance.process_pool)
+            for _ in range(2):
+                self.assertEqual(expect, instance.create_fetched_info_list(post_list))
+        mock_pool.assert_called_once_with(max_workers=2)
+        self.assertIsNone(instance.process_pool)
+
+        # with の外では呼び出しごとにプールを作成する
+        mock_pool.reset_mock()
+        for _ in range(2):
+            self.assertEqual(expect, instance.create_fetched_info_list(post_list))
+        self.assertEqual(2, mock_pool.call_count)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,142 @@
+import asyncio
+import os
+import signal
+import sys
+import time
+import unittest
+from collections import namedtuple
+
+import freezegun
+import orjson
+from mock import AsyncMock, MagicMock, call, patch
+
+from bluesky_crawler.crawler.crawler import Crawler
+from bluesky_crawler.crawler.scheduler import DEFAULT_DAEMON_CONFIG, Scheduler
+from bluesky_crawler.manager.manager import RateLimitBudget
+
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self) -> None:
+        self.enterContext(patch("bluesky_crawler.crawler.scheduler.logger"))
+        self.config_dict = {
+            "bluesky": {"handle_name": "dummy_handle_name", "password": "dummy_password"},
+            "general": {"save_base_path": "./tests/bluesky_crawler/config/test_base_path/"},
+        }
+        mock_read_bytes = self.enterContext(patch("bluesky_crawler.crawler.scheduler.Path.read_bytes"))
+        mock_read_bytes.side_effect = lambda: orjson.dumps(self.config_dict)
+        self.mock_crawler = MagicMock(spec=Crawler)
+        self.mock_crawler.downloader = MagicMock()
+        self.mock_crawler.get_rate_limit_budget_list.return_value = []
+        return super().setUp()
+
+    def test_init(self):
+        instance = Scheduler(self.mock_crawler)
+        self.assertIs(self.mock_crawler, instance.crawler)
+        self.assertEqual(DEFAULT_DAEMON_CONFIG, instance.daemon_config)
+        self.assertEqual(DEFAULT_DAEMON_CONFIG["interval"], instance.current_interval)
+
+        self.config_dict["general"]["daemon"] = {"interval": 60}
+        instance = Scheduler(self.mock_crawler)
+        self.assertEqual(DEFAULT_DAEMON_CONFIG | {"interval": 60}, instance.daemon_config)
+        self.assertEqual(60, instance.current_interval)
+
+        error_config_list = [
+            {"interval": 0},
+            {"interval": 600, "max_interval": 300},
+            {"backoff_factor": 0.5},
+            {"jitter": -0.1},
+            {"jitter": 1},
+            {"min_remaining": -1},
+        ]
+        for error_config in error_config_list:
+            self.config_dict["general"]["daemon"] = error_config
+            with self.assertRaises(ValueError):
+                instance = Scheduler(self.mock_crawler)
+
+    def test_next_interval(self):
+        self.config_dict["general"]["daemon"] = {"interval": 10, "max_interval": 50, "backoff_factor": 2, "jitter": 0}
+        instance = Scheduler(self.mock_crawler)
+
+        Params = namedtuple("Params", ["media_num", "expect"])
+        params_list = [
+            Params(0, 20),
+            Params(0, 40),
+            Params(None, 50),
+            Params(0, 50),
+            Params(3, 10),
+            Params(None, 20),
+        ]
+        for params in params_list:
+            self.assertEqual(params.expect, instance.next_interval(params.media_num))
+
+        # jitter の範囲で増減させる
+        instance.daemon_config["jitter"] = 0.1
+        with patch("bluesky_crawler.crawler.scheduler.random.uniform", return_value=1.05) as mock_uniform:
+            self.assertAlmostEqual(10.5, instance.next_interval(1))
+            mock_uniform.assert_called_once_with(0.9, 1.1)
+
+    def test_run(self):
+        self.config_dict["general"]["daemon"] = {"interval": 10, "max_interval": 50, "backoff_factor": 2, "jitter": 0}
+        instance = Scheduler(self.mock_crawler)
+        client = self.mock_crawler.downloader.create_client.return_value.__aenter__.return_value
+        # 失敗したクロールがあっても継続する
+        self.mock_crawler.crawl = AsyncMock(side_effect=[3, 0, ValueError("crawl error"), 1])
+        mock_wait = self.enterContext(patch.object(Scheduler, "wait", side_effect=[False, False, False, True]))
+
+        actual = instance.run()
+        self.assertEqual(4, actual)
+        self.assertEqual([call(client)] * 4, self.mock_crawler.crawl.mock_calls)
+        self.assertEqual([call(10), call(20), call(40), call(10)], mock_wait.mock_calls)
+        self.mock_crawler.downloader.create_client.assert_called_once_with()
+
+    def test_get_rate_limit_wait_time(self):
+        self.enterContext(freezegun.freeze_time("2099-03-23T12:34:56"))
+        self.config_dict["general"]["daemon"] = {"min_remaining": 10}
+        instance = Scheduler(self.mock_crawler)
+        now = time.time()
+
+        Params = namedtuple("Params", ["budget_list", "expect"])
+        params_list = [
+            Params([], 0),
+            Params([RateLimitBudget(3000, 11, now + 100)], 0),
+            Params([RateLimitBudget(3000, 10, now + 100)], 100),
+            Params([RateLimitBudget(None, 0, now + 100), RateLimitBudget(3000, 3, now + 200)], 200),
+            Params([RateLimitBudget(3000, 0, now + 100), RateLimitBudget(3000, 2990, now + 200)], 100),
+        ]
+        for params in params_list:
+            self.mock_crawler.get_rate_limit_budget_list.return_value = params.budget_list
+            self.assertEqual(params.expect, instance.get_rate_limit_wait_time())
+
+    def test_run_rate_limited(self):
+        self.config_dict["general"]["daemon"] = {"interval": 10, "jitter": 0}
+        instance = Scheduler(self.mock_crawler)
+        self.mock_crawler.crawl = AsyncMock(side_effect=[1, 1])
+        mock_wait = self.enterContext(patch.object(Scheduler, "wait", side_effect=[False, True]))
+        # レート制限の残りが少ない場合は、期間が切り替わるまで次の実行を遅らせる
+        self.enterContext(patch.object(Scheduler, "get_rate_limit_wait_time", side_effect=[120, 3]))
+
+        actual = instance.run()
+        self.assertEqual(2, actual)
+        self.assertEqual([call(120), call(10)], mock_wait.mock_calls)
+
+    @unittest.skipUnless(hasattr(signal, "SIGTERM") and sys.platform != "win32", "requires POSIX signals.")
+    def test_run_sigterm(self):
+        self.config_dict["general"]["daemon"] = {"interval": 5, "jitter": 0}
+        instance = Scheduler(self.mock_crawler)
+
+        async def crawl(client):
+            # クロール中に SIGTERM を受け取った場合は、クロールを終えてから停止する
+            os.kill(os.getpid(), signal.SIGTERM)
+            await asyncio.sleep(0)
+            return 1
+
+        self.mock_crawler.crawl = AsyncMock(side_effect=crawl)
+        actual = instance.run()
+        self.assertEqual(1, actual)
+        self.assertTrue(instance.stop_event.is_set())
+
+
+if __name__ == "__main__":
+    if sys.argv:
+        del sys.argv[1:]
+    unittest.main(warnings="ignore")
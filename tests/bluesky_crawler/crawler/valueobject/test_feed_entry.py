@@ -0,0 +1,252 @@
+import sys
+import unittest
+from copy import deepcopy
+
+from bluesky_crawler.crawler.valueobject.feed_entry import FeedEntry, FeedMedia, get_one_value, get_optional_value
+from bluesky_crawler.crawler.valueobject.feed_entry import get_value, prune_raw_entry
+
+
+class TestFeedEntry(unittest.TestCase):
+    def make_image_dict(self, media_num: int = 4) -> dict:
+        return {
+            "post": {
+                "author": {
+                    "did": "did:plc:user_id_0",
+                    "handle": "username_0.bsky.social",
+                    "avatar": "https://dummy_avatar_url@jpeg",
+                    "display_name": "display_name_0",
+                },
+                "cid": "dummy_cid",
+                "record": {
+                    "created_at": "2024-03-23T12:34:56.897Z",
+                    "text": "text_0",
+                    "embed": {
+                        "images": [
+                            {
+                                "alt": f"alt_{i}",
+                                "aspect_ratio": {"height": 100, "width": 100},
+                                "image": {"mime_type": "image/jpeg", "size": 100000 * (i + 1), "ref": {}},
+                            }
+                            for i in range(media_num)
+                        ]
+                    },
+                },
+                "uri": "at://did:plc:user_id_0/app.bsky.feed.post/post_id_0",
+                "embed": {
+                    "images": [
+                        {"alt": f"alt_{i}", "fullsize": f"https://cdn.bsky.app/media_id_{i}@jpeg"}
+                        for i in range(media_num)
+                    ]
+                },
+            },
+        }
+
+    def make_video_dict(self) -> dict:
+        fetched_dict = self.make_image_dict()
+        fetched_dict["post"]["record"]["embed"] = {
+            "aspect_ratio": {"height": 100, "width": 100},
+            "video": {"mime_type": "video/mp4", "size": 5000000, "ref": {}},
+        }
+        fetched_dict["post"]["embed"] = {
+            "alt": None,
+            "cid": "video_cid",
+            "playlist": "https://video.bsky.app/watch/did/video_cid/playlist.m3u8",
+        }
+        return fetched_dict
+
+    def make_raw_image_dict(self, media_num: int = 4) -> dict:
+        return {
+            "post": {
+                "author": {
+                    "did": "did:plc:user_id_0",
+                    "handle": "username_0.bsky.social",
+                    "avatar": "https://dummy_avatar_url@jpeg",
+                    "displayName": "display_name_0",
+                },
+                "cid": "dummy_cid",
+                "record": {
+                    "$type": "app.bsky.feed.post",
+                    "createdAt": "2024-03-23T12:34:56.897Z",
+                    "text": "text_0",
+                    "embed": {
+                        "$type": "app.bsky.embed.images",
+                        "images": [
+                            {
+                                "alt": f"alt_{i}",
+                                "aspectRatio": {"height": 100, "width": 100},
+                                "image": {
+                                    "$type": "blob",
+                                    "ref": {"$link": f"media_id_{i}"},
+                                    "mimeType": "image/jpeg",
+                                    "size": 100000 * (i + 1),
+                                },
+                            }
+                            for i in range(media_num)
+                        ],
+                    },
+                },
+                "uri": "at://did:plc:user_id_0/app.bsky.feed.post/post_id_0",
+                "embed": {
+                    "$type": "app.bsky.embed.images#view",
+                    "images": [
+                        {"alt": f"alt_{i}", "fullsize": f"https://cdn.bsky.app/media_id_{i}@jpeg"}
+                        for i in range(media_num)
+                    ],
+                },
+            },
+        }
+
+    def test_get_value(self):
+        self.assertEqual("value", get_value({"key": "value"}, "key"))
+        # 生の JSON でのキー名でも探す
+        self.assertEqual("value", get_value({"createdAt": "value"}, "created_at"))
+        self.assertEqual("value", get_value({"created_at": "value", "createdAt": "raw_value"}, "created_at"))
+        self.assertIsNone(get_value({"key": None}, "key"))
+        with self.assertRaises(ValueError):
+            get_value({"another_key": "value"}, "key")
+        with self.assertRaises(ValueError):
+            get_value(None, "key")
+
+    def test_get_optional_value(self):
+        self.assertEqual("value", get_optional_value({"key": "value"}, "key"))
+        self.assertEqual("value", get_optional_value({"displayName": "value"}, "display_name"))
+        self.assertIsNone(get_optional_value({"another_key": "value"}, "key"))
+        self.assertIsNone(get_optional_value({}, "display_name"))
+        with self.assertRaises(ValueError):
+            get_optional_value(None, "key")
+
+    def test_get_one_value(self):
+        self.assertEqual("value", get_one_value({"key": "value"}, "key", "child"))
+        self.assertEqual("value", get_one_value({"child": {"key": "value"}}, "key", "child"))
+        with self.assertRaises(ValueError):
+            get_one_value({"key": "value", "child": {"key": "value"}}, "key", "child")
+        with self.assertRaises(ValueError):
+            get_one_value({"another": {"key": "value"}}, "key", "child")
+        with self.assertRaises(ValueError):
+            get_one_value("invalid", "key", "child")
+        self.assertEqual("image/jpeg", get_one_value({"image": {"mimeType": "image/jpeg"}}, "mime_type", "image"))
+        with self.assertRaises(ValueError):
+            get_one_value({"mime_type": "image/jpeg", "image": {"mimeType": "image/jpeg"}}, "mime_type", "image")
+
+    def test_create(self):
+        actual = FeedEntry.create(self.make_image_dict())
+        expect = FeedEntry(
+            "at://did:plc:user_id_0/app.bsky.feed.post/post_id_0",
+            "did:plc:user_id_0",
+            "username_0.bsky.social",
+            "display_name_0",
+            "https://dummy_avatar_url@jpeg",
+            "2024-03-23T12:34:56.897Z",
+            "text_0",
+            [
+                FeedMedia(f"https://cdn.bsky.app/media_id_{i}@jpeg", f"alt_{i}", "image/jpeg", 100000 * (i + 1))
+                for i in range(4)
+            ],
+        )
+        self.assertEqual(expect, actual)
+
+        # 生の JSON（キャメルケース）でも同じ結果になる
+        actual = FeedEntry.create(self.make_raw_image_dict())
+        self.assertEqual(expect, actual)
+
+        # 動画、 alt が None の場合は空文字列にする
+        actual = FeedEntry.create(self.make_video_dict())
+        expect_media = FeedMedia("https://video.bsky.app/watch/did/video_cid/playlist.m3u8", "", "video/mp4", 5000000)
+        self.assertEqual([expect_media], actual.media_list)
+
+        # display_name と avatar は None を許容する
+        fetched_dict = self.make_image_dict()
+        fetched_dict["post"]["author"] |= {"display_name": None, "avatar": None}
+        actual = FeedEntry.create(fetched_dict)
+        self.assertIsNone(actual.display_name)
+        self.assertIsNone(actual.avatar)
+
+        # 生の JSON では値のない省略可能なフィールドはキーごと省略される
+        fetched_dict = self.make_raw_image_dict()
+        del fetched_dict["post"]["author"]["displayName"]
+        del fetched_dict["post"]["author"]["avatar"]
+        actual = FeedEntry.create(fetched_dict)
+        self.assertIsNone(actual.display_name)
+        self.assertIsNone(actual.avatar)
+        video_dict = self.make_video_dict()
+        del video_dict["post"]["embed"]["alt"]
+        actual = FeedEntry.create(video_dict)
+        self.assertEqual([expect_media], actual.media_list)
+
+        def make_error_dict(base_dict: dict, *key_list: str) -> dict:
+            fetched_dict = deepcopy(base_dict)
+            target = fetched_dict
+            for key in key_list[:-1]:
+                target = target[key]
+            del target[key_list[-1]]
+            return fetched_dict
+
+        image_dict = self.make_image_dict()
+        video_dict = self.make_video_dict()
+        error_dict_list = [
+            {},
+            make_error_dict(image_dict, "post", "author"),
+            make_error_dict(image_dict, "post", "record"),
+            make_error_dict(image_dict, "post", "uri"),
+            make_error_dict(image_dict, "post", "embed"),
+            make_error_dict(image_dict, "post", "record", "embed"),
+            make_error_dict(image_dict, "post", "record", "text"),
+            make_error_dict(image_dict, "post", "author", "handle"),
+            make_error_dict(image_dict, "post", "embed", "images"),
+            make_error_dict(image_dict, "post", "record", "embed", "images"),
+            make_error_dict(image_dict, "post", "record", "embed", "images", 0, "image"),
+            make_error_dict(video_dict, "post", "embed", "playlist"),
+            make_error_dict(video_dict, "post", "record", "embed", "video", "size"),
+        ]
+        for error_dict in error_dict_list:
+            with self.assertRaises(ValueError):
+                actual = FeedEntry.create(error_dict)
+
+    def test_prune_raw_entry(self):
+        image_dict = self.make_raw_image_dict()
+        video_dict = {
+            "post": image_dict["post"]
+            | {
+                "embed": {
+                    "$type": "app.bsky.embed.video#view",
+                    "cid": "video_cid",
+                    "playlist": "https://video.bsky.app/watch/did/video_cid/playlist.m3u8",
+                    "thumbnail": "https://video.bsky.app/watch/did/video_cid/thumbnail.jpg",
+                },
+                "record": image_dict["post"]["record"]
+                | {
+                    "embed": {
+                        "$type": "app.bsky.embed.video",
+                        "video": {"$type": "blob", "ref": {"$link": "video_cid"}, "mimeType": "video/mp4", "size": 1},
+                    }
+                },
+            },
+        }
+        for fetched_dict in [image_dict, video_dict]:
+            fetched_dict["post"] |= {"indexedAt": "2024-03-23T12:34:56.897Z", "viewer": {"like": "like_uri"}}
+            actual = prune_raw_entry(fetched_dict)
+            # FeedEntry の作成に必要な値のみ残り、同じ結果になる
+            self.assertEqual(FeedEntry.create(fetched_dict), FeedEntry.create(actual))
+            self.assertEqual({"uri", "author", "record", "embed"}, set(actual["post"]))
+            self.assertNotIn("$type", actual["post"]["embed"])
+            self.assertNotIn("$type", actual["post"]["record"])
+
+        actual = prune_raw_entry(image_dict)
+        self.assertEqual(
+            {"image": {"mimeType": "image/jpeg", "size": 100000}}, actual["post"]["record"]["embed"]["images"][0]
+        )
+        self.assertEqual(
+            {"alt": "alt_0", "fullsize": "https://cdn.bsky.app/media_id_0@jpeg"}, actual["post"]["embed"]["images"][0]
+        )
+
+        # 絞り込んでも必要な値がない場合は FeedEntry を作成できない
+        del image_dict["post"]["record"]["embed"]["images"][0]["image"]
+        with self.assertRaises(ValueError):
+            FeedEntry.create(prune_raw_entry(image_dict))
+        self.assertEqual({}, prune_raw_entry({"cursor": "cursor"}))
+
+
+if __name__ == "__main__":
+    if sys.argv:
+        del sys.argv[1:]
+    unittest.main(warnings="ignore")
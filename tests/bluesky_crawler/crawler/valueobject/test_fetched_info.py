@@ -4,6 +4,7 @@ import unittest
 from datetime import datetime
 
 import freezegun
+import orjson
 from mock import MagicMock
 
 from bluesky_crawler.crawler.valueobject.fetched_info import FetchedInfo
@@ -176,6 +177,24 @@ class TestFetchedInfo(unittest.TestCase):
         with self.assertRaises(ValueError):
             actual = FetchedInfo.create(fetched_dict)
 
+    def test_parse_build(self):
+        self.enterContext(freezegun.freeze_time("2024-03-23T12:34:56"))
+        fetched_dict = self.make_fetched_dict()
+        like_dict, user_dict, media_dict_list = FetchedInfo.parse(fetched_dict)
+        expect = FetchedInfo.create(fetched_dict)
+        self.assertEqual(expect.like.to_dict(), like_dict)
+        self.assertEqual(expect.user.to_dict(), user_dict)
+        self.assertEqual([media.to_dict() for media in expect.media_list], media_dict_list)
+
+        # parse の結果は組み込み型のみ（JSON を経由してリストになっても build できる）
+        parsed = orjson.loads(orjson.dumps(FetchedInfo.parse(fetched_dict)))
+        actual = FetchedInfo.build(parsed)
+        self.assertEqual(expect, actual)
+        self.assertEqual(expect.media_list[0].to_dict(), actual.media_list[0].to_dict())
+
+        with self.assertRaises(ValueError):
+            actual = FetchedInfo.build((like_dict, user_dict, []))
+
 
 if __name__ == "__main__":
     if sys.argv:
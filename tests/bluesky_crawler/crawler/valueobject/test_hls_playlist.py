@@ -0,0 +1,134 @@
+import sys
+import unittest
+
+from bluesky_crawler.crawler.valueobject.hls_playlist import HlsPlaylist, HlsVariant, parse_attribute_list
+
+BASE_URL = "https://video.bsky.app/watch/did%3Aplc%3Adummy/dummy_cid/playlist.m3u8"
+
+MASTER_PLAYLIST = """#EXTM3U
+#EXT-X-VERSION:3
+#EXT-X-STREAM-INF:BANDWIDTH=640000,RESOLUTION=640x360,CODECS="avc1.64001e,mp4a.40.2"
+360p/video.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=2560000,RESOLUTION=1280x720,CODECS="avc1.64001f,mp4a.40.2"
+720p/video.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=1280000,RESOLUTION=1280x720
+https://video.cdn.bsky.app/hls/720p_low/video.m3u8
+"""
+
+MEDIA_PLAYLIST = """#EXTM3U
+#EXT-X-VERSION:3
+#EXT-X-TARGETDURATION:6
+#EXT-X-MEDIA-SEQUENCE:0
+#EXTINF:6.000,
+video0.ts
+#EXTINF:6.000,
+video1.ts
+
+#EXTINF:2.500,
+video2.ts
+#EXT-X-ENDLIST
+"""
+
+FMP4_PLAYLIST = """#EXTM3U
+#EXT-X-VERSION:7
+#EXT-X-MAP:URI="init.mp4"
+#EXTINF:6.000,
+segment0.m4s
+#EXTINF:6.000,
+segment1.m4s
+#EXT-X-ENDLIST
+"""
+
+
+class TestHlsPlaylist(unittest.TestCase):
+    def test_parse_attribute_list(self):
+        actual = parse_attribute_list('BANDWIDTH=1280000,RESOLUTION=1280x720,CODECS="avc1.64001f,mp4a.40.2"')
+        expect = {"BANDWIDTH": "1280000", "RESOLUTION": "1280x720", "CODECS": "avc1.64001f,mp4a.40.2"}
+        self.assertEqual(expect, actual)
+        self.assertEqual({}, parse_attribute_list(""))
+
+    def test_init(self):
+        variant = HlsVariant("https://dummy/360p/video.m3u8", 640000, 640 * 360)
+        self.assertEqual("https://dummy/360p/video.m3u8", variant.url)
+        self.assertEqual(640000, variant.bandwidth)
+        self.assertEqual(640 * 360, variant.resolution)
+        with self.assertRaises(ValueError):
+            HlsVariant("", 0, 0)
+        with self.assertRaises(ValueError):
+            HlsVariant("https://dummy/360p/video.m3u8", -1, 0)
+        with self.assertRaises(ValueError):
+            HlsVariant("https://dummy/360p/video.m3u8", 0, -1)
+
+        playlist = HlsPlaylist([variant], None, [])
+        self.assertTrue(playlist.is_master())
+        self.assertFalse(playlist.is_fmp4())
+        playlist = HlsPlaylist([], "https://dummy/init.mp4", ["https://dummy/segment0.m4s"])
+        self.assertFalse(playlist.is_master())
+        self.assertTrue(playlist.is_fmp4())
+        with self.assertRaises(ValueError):
+            HlsPlaylist([], None, [])
+        with self.assertRaises(ValueError):
+            HlsPlaylist([variant], None, ["https://dummy/video0.ts"])
+        with self.assertRaises(ValueError):
+            HlsPlaylist("invalid", None, [])
+
+    def test_select_variant(self):
+        playlist = HlsPlaylist.create(MASTER_PLAYLIST, BASE_URL)
+        base = "https://video.bsky.app/watch/did%3Aplc%3Adummy/dummy_cid/"
+        # 解像度が同じ場合は帯域幅で比較する
+        self.assertEqual(HlsVariant(base + "720p/video.m3u8", 2560000, 1280 * 720), playlist.select_variant())
+        self.assertEqual(HlsVariant(base + "360p/video.m3u8", 640000, 640 * 360), playlist.select_variant("lowest"))
+        with self.assertRaises(ValueError):
+            playlist.select_variant("invalid")
+
+        playlist = HlsPlaylist.create(MEDIA_PLAYLIST, BASE_URL)
+        with self.assertRaises(ValueError):
+            playlist.select_variant()
+
+    def test_create(self):
+        base = "https://video.bsky.app/watch/did%3Aplc%3Adummy/dummy_cid/"
+        actual = HlsPlaylist.create(MASTER_PLAYLIST, BASE_URL)
+        expect = HlsPlaylist(
+            [
+                HlsVariant(base + "360p/video.m3u8", 640000, 640 * 360),
+                HlsVariant(base + "720p/video.m3u8", 2560000, 1280 * 720),
+                HlsVariant("https://video.cdn.bsky.app/hls/720p_low/video.m3u8", 1280000, 1280 * 720),
+            ],
+            None,
+            [],
+        )
+        self.assertEqual(expect, actual)
+
+        base_url = base + "720p/video.m3u8"
+        actual = HlsPlaylist.create(MEDIA_PLAYLIST, base_url)
+        expect = HlsPlaylist([], None, [base + f"720p/video{i}.ts" for i in range(3)])
+        self.assertEqual(expect, actual)
+
+        actual = HlsPlaylist.create(FMP4_PLAYLIST, base_url)
+        expect = HlsPlaylist([], base + "720p/init.mp4", [base + f"720p/segment{i}.m4s" for i in range(2)])
+        self.assertEqual(expect, actual)
+
+        # 暗号化なしの明示は許容する
+        actual = HlsPlaylist.create(MEDIA_PLAYLIST.replace("#EXT-X-ENDLIST", "#EXT-X-KEY:METHOD=NONE"), base_url)
+        self.assertEqual(3, len(actual.segment_url_list))
+
+        error_playlist_list = [
+            "",
+            "video0.ts",
+            "#EXTM3U\n#EXT-X-ENDLIST",
+            MEDIA_PLAYLIST.replace("#EXT-X-VERSION:3", '#EXT-X-KEY:METHOD=AES-128,URI="key"'),
+            MEDIA_PLAYLIST.replace("#EXT-X-VERSION:3", "#EXT-X-BYTERANGE:1000@0"),
+            FMP4_PLAYLIST.replace('URI="init.mp4"', 'URI="init.mp4",BYTERANGE="1000@0"'),
+            MASTER_PLAYLIST.replace(
+                "#EXT-X-VERSION:3", '#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="aac",NAME="audio",URI="audio.m3u8"'
+            ),
+        ]
+        for playlist_text in error_playlist_list:
+            with self.assertRaises(ValueError):
+                actual = HlsPlaylist.create(playlist_text, base_url)
+
+
+if __name__ == "__main__":
+    if sys.argv:
+        del sys.argv[1:]
+    unittest.main(warnings="ignore")
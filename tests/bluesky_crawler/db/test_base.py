@@ -1,34 +1,138 @@
 import sys
+import tempfile
 import unittest
+from pathlib import Path
 
 from mock import patch
 
-from bluesky_crawler.db.base import Base
+from bluesky_crawler.db.base import DEFAULT_PRAGMA, Base, engine_cache, make_pragma_statement_list
+from bluesky_crawler.db.like_db import LikeDB
+from bluesky_crawler.db.media_db import MediaDB
+from bluesky_crawler.db.model import Like, Media
 
 
 class ConcreteMobel(Base):
     def select(self):
         return []
 
-    def upsert(self, record):
+    def upsert(self, record, session=None):
         return []
 
 
 class TestBase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.enterContext(patch.dict(engine_cache, clear=True))
+        return super().setUp()
+
     def test_init(self):
         mock_create_engine = self.enterContext(patch("bluesky_crawler.db.base.create_engine"))
         mock_model_base = self.enterContext(patch("bluesky_crawler.db.base.ModelBase"))
+        mock_event = self.enterContext(patch("bluesky_crawler.db.base.event"))
+        mock_migrate = self.enterContext(patch("bluesky_crawler.db.base.migrate"))
         instance = ConcreteMobel()
 
         mock_create_engine.assert_called_once()
-        mock_create_engine.assert_called_once()
+        mock_model_base.metadata.create_all.assert_called_once_with(mock_create_engine.return_value)
+        mock_migrate.assert_called_once_with(mock_create_engine.return_value)
 
         db_path = "bksy_db.db"
         self.assertEqual(db_path, instance.db_path)
         self.assertEqual(f"sqlite:///{db_path}", instance.db_url)
+        self.assertEqual(mock_create_engine.return_value, instance.engine)
         self.assertEqual([], instance.select())
         self.assertEqual([], instance.upsert(None))
 
+        # 同じ db_path ではエンジンを共有する
+        another_instance = ConcreteMobel()
+        mock_create_engine.assert_called_once()
+        mock_model_base.metadata.create_all.assert_called_once()
+        self.assertIs(instance.engine, another_instance.engine)
+        self.assertIs(instance.session_factory, another_instance.session_factory)
+
+        # :memory: は共有しない
+        mock_create_engine.reset_mock()
+        memory_instance = ConcreteMobel(":memory:")
+        another_memory_instance = ConcreteMobel(":memory:")
+        self.assertEqual(2, mock_create_engine.call_count)
+        self.assertNotIn(":memory:", engine_cache)
+
+    def test_make_pragma_statement_list(self):
+        actual = make_pragma_statement_list(None)
+        expect = [f"PRAGMA {name}={value}" for name, value in DEFAULT_PRAGMA.items()]
+        self.assertEqual(expect, actual)
+
+        actual = make_pragma_statement_list({"journal_mode": "DELETE", "mmap_size": None})
+        expect = [
+            "PRAGMA journal_mode=DELETE",
+            "PRAGMA synchronous=NORMAL",
+            "PRAGMA cache_size=-65536",
+            "PRAGMA temp_store=MEMORY",
+        ]
+        self.assertEqual(expect, actual)
+
+        with self.assertRaises(ValueError):
+            actual = make_pragma_statement_list({"invalid_pragma": 0})
+        with self.assertRaises(ValueError):
+            actual = make_pragma_statement_list({"journal_mode": "WAL; DROP TABLE Media"})
+        with self.assertRaises(ValueError):
+            actual = make_pragma_statement_list({"temp_store": True})
+
+    def test_pragma(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = str(Path(tmp_dir) / "test.db")
+            instance = ConcreteMobel(db_path, {"synchronous": "FULL", "cache_size": -2000})
+            with instance.engine.connect() as connection:
+                self.assertEqual("wal", connection.exec_driver_sql("PRAGMA journal_mode").scalar())
+                self.assertEqual(2, connection.exec_driver_sql("PRAGMA synchronous").scalar())
+                self.assertEqual(-2000, connection.exec_driver_sql("PRAGMA cache_size").scalar())
+                self.assertEqual(2, connection.exec_driver_sql("PRAGMA temp_store").scalar())
+            instance.engine.dispose()
+
+    def test_transaction(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = str(Path(tmp_dir) / "test.db")
+            like_db = LikeDB(db_path)
+            media_db = MediaDB(db_path)
+            self.assertIs(like_db.engine, media_db.engine)
+
+            like = Like.create({
+                "post_id": "post_id_0",
+                "user_id": "user_id_0",
+                "url": "dummy_url",
+                "text": "dummy_text",
+                "created_at": "dummy_created_at",
+                "registered_at": "dummy_registered_at",
+            })
+            media = Media.create({
+                "post_id": "post_id_0",
+                "media_id": "media_id_0",
+                "media_index": 1,
+                "username": "dummy_username",
+                "alt_text": "dummy_alt_text",
+                "mime_type": "image/jpeg",
+                "size": 0,
+                "url": "dummy_url",
+                "created_at": "dummy_created_at",
+                "registered_at": "dummy_registered_at",
+            })
+
+            # 例外発生時はまとめてロールバックされる
+            with self.assertRaises(ValueError):
+                with media_db.transaction() as session:
+                    like_db.upsert(like, session)
+                    media_db.upsert(media, session)
+                    raise ValueError
+            self.assertEqual([], like_db.select())
+            self.assertEqual([], media_db.select())
+
+            # 正常終了時はまとめてコミットされる
+            with media_db.transaction() as session:
+                self.assertEqual([0], like_db.upsert(like, session))
+                self.assertEqual([0], media_db.upsert(media, session))
+            self.assertEqual([like], like_db.select())
+            self.assertEqual([media], media_db.select())
+            like_db.engine.dispose()
+
 
 if __name__ == "__main__":
     if sys.argv:
@@ -0,0 +1,100 @@
+import sys
+import unittest
+
+import freezegun
+
+from bluesky_crawler.db.crawl_state_db import CrawlStateDB
+from bluesky_crawler.db.model import CrawlState
+
+
+class TestCrawlStateDB(unittest.TestCase):
+    def setUp(self) -> None:
+        self.instance = self.get_instance()
+        self.instance.upsert([self.make_params()])
+        return super().setUp()
+
+    def make_params(self, index: int = 0) -> dict:
+        return {
+            "key": f"key_{index}",
+            "value": f"value_{index}",
+            "updated_at": "dummy_updated_at",
+        }
+
+    def get_instance(self) -> CrawlStateDB:
+        instance = CrawlStateDB(db_path=":memory:")
+        return instance
+
+    def test_init(self):
+        self.assertEqual(":memory:", self.instance.db_path)
+        self.assertEqual("sqlite:///:memory:", self.instance.db_url)
+
+    def test_select(self):
+        actual = self.instance.select()
+        expect = [CrawlState.create(self.make_params())]
+        self.assertEqual(expect, actual)
+
+    def test_upsert(self):
+        def get_record(index: int) -> CrawlState:
+            return CrawlState.create(self.make_params(index))
+
+        def get_updated_record(index: int) -> CrawlState:
+            record = get_record(index)
+            args_dict = record.to_dict() | {"value": f"updated_value_{index}"}
+            return CrawlState.create(args_dict)
+
+        def strict_check(e_list: list[CrawlState], a_list: list[CrawlState]) -> bool:
+            def strict_check_element(e: CrawlState, a: CrawlState) -> bool:
+                return (e.to_dict() | {"id": None}) == (a.to_dict() | {"id": None})
+
+            return all([strict_check_element(e, a) for e, a in zip(e_list, a_list)])
+
+        # insert, 単一
+        record = get_record(1)
+        actual = self.instance.upsert(record)
+        self.assertEqual([0], actual)
+        actual = self.instance.select()
+        expect = [get_record(0), get_record(1)]
+        self.assertTrue(strict_check(expect, actual))
+
+        # update, 単一
+        record = get_updated_record(1)
+        actual = self.instance.upsert(record)
+        self.assertEqual([1], actual)
+        actual = self.instance.select()
+        expect = [get_record(0), get_updated_record(1)]
+        self.assertTrue(strict_check(expect, actual))
+
+        # insert/update ミックス, 複数
+        record = [get_updated_record(0), get_record(2)]
+        actual = self.instance.upsert(record)
+        self.assertEqual([1, 0], actual)
+        actual = self.instance.select()
+        expect = [get_updated_record(0), get_updated_record(1), get_record(2)]
+        self.assertTrue(strict_check(expect, actual))
+
+        # 不正なrecord
+        with self.assertRaises(TypeError):
+            actual = self.instance.upsert("invalid_record")
+
+    def test_get_value(self):
+        self.assertEqual("value_0", self.instance.get_value("key_0"))
+        self.assertIsNone(self.instance.get_value("not_exist_key"))
+
+    def test_set_value(self):
+        self.enterContext(freezegun.freeze_time("2099-03-23T12:34:56"))
+        actual = self.instance.set_value("key_1", "value_1")
+        self.assertEqual(0, actual)
+        self.assertEqual("value_1", self.instance.get_value("key_1"))
+
+        actual = self.instance.set_value("key_1", "updated_value_1")
+        self.assertEqual(1, actual)
+        self.assertEqual("updated_value_1", self.instance.get_value("key_1"))
+
+        record = [r for r in self.instance.select() if r.key == "key_1"][0]
+        self.assertEqual("2099-03-23T12:34:56", record.updated_at)
+
+
+if __name__ == "__main__":
+    if sys.argv:
+        del sys.argv[1:]
+    unittest.main(warnings="ignore")
@@ -0,0 +1,115 @@
+import sys
+import unittest
+
+import freezegun
+import orjson
+
+from bluesky_crawler.db.failed_media_db import FailedMediaDB
+from bluesky_crawler.db.model import FailedMedia, Media
+
+
+class TestFailedMediaDB(unittest.TestCase):
+    def setUp(self) -> None:
+        self.instance = self.get_instance()
+        self.instance.upsert([self.make_params()])
+        return super().setUp()
+
+    def make_media(self, index: int = 0) -> Media:
+        return Media.create({
+            "post_id": f"post_id_{index}",
+            "media_id": f"media_id_{index}",
+            "media_index": 1,
+            "username": f"username_{index}",
+            "alt_text": f"alt_text_{index}",
+            "mime_type": "image/jpeg",
+            "size": 100000,
+            "url": f"https://cdn.bsky.app/img/feed_fullsize/plain/did:plc:dummy/media_id_{index}@jpeg",
+            "created_at": "2024-03-23T12:34:56.897Z",
+            "registered_at": "dummy_registered_at",
+        })
+
+    def make_params(self, index: int = 0, attempt_num: int = 1) -> dict:
+        media = self.make_media(index)
+        return {
+            "media_id": media.media_id,
+            "post_id": media.post_id,
+            "media": orjson.dumps(media.to_dict()).decode(),
+            "attempt_num": attempt_num,
+            "updated_at": "dummy_updated_at",
+        }
+
+    def get_instance(self) -> FailedMediaDB:
+        instance = FailedMediaDB(db_path=":memory:")
+        return instance
+
+    def test_init(self):
+        self.assertEqual(":memory:", self.instance.db_path)
+        self.assertEqual("sqlite:///:memory:", self.instance.db_url)
+
+    def test_select(self):
+        actual = self.instance.select()
+        expect = [FailedMedia.create(self.make_params())]
+        self.assertEqual(expect, actual)
+
+    def test_upsert(self):
+        def strict_check(e_list: list[FailedMedia], a_list: list[FailedMedia]) -> bool:
+            def strict_check_element(e: FailedMedia, a: FailedMedia) -> bool:
+                return (e.to_dict() | {"id": None}) == (a.to_dict() | {"id": None})
+
+            return len(e_list) == len(a_list) and all([strict_check_element(e, a) for e, a in zip(e_list, a_list)])
+
+        # insert, 単一
+        actual = self.instance.upsert(FailedMedia.create(self.make_params(1)))
+        self.assertEqual([0], actual)
+        expect = [FailedMedia.create(self.make_params(0)), FailedMedia.create(self.make_params(1))]
+        self.assertTrue(strict_check(expect, self.instance.select()))
+
+        # insert/update ミックス, 複数
+        actual = self.instance.upsert([self.make_params(0, 2), self.make_params(2)])
+        self.assertEqual([1, 0], actual)
+        expect = [
+            FailedMedia.create(self.make_params(0, 2)),
+            FailedMedia.create(self.make_params(1)),
+            FailedMedia.create(self.make_params(2)),
+        ]
+        self.assertTrue(strict_check(expect, self.instance.select()))
+
+        # 不正なrecord
+        with self.assertRaises(TypeError):
+            actual = self.instance.upsert("invalid_record")
+
+    def test_add_attempt(self):
+        self.enterContext(freezegun.freeze_time("2099-03-23T12:34:56"))
+        # 記録済のメディアは失敗した回数を増やし、未記録のメディアは1回目として記録する
+        actual = self.instance.add_attempt([self.make_media(0), self.make_media(1)])
+        self.assertEqual({"media_id_0": 2, "media_id_1": 1}, actual)
+        actual = self.instance.add_attempt([self.make_media(1)])
+        self.assertEqual({"media_id_1": 2}, actual)
+
+        record_dict = {record.media_id: record for record in self.instance.select()}
+        self.assertEqual(2, record_dict["media_id_0"].attempt_num)
+        self.assertEqual(2, record_dict["media_id_1"].attempt_num)
+        self.assertEqual("2099-03-23T12:34:56", record_dict["media_id_1"].updated_at)
+        self.assertEqual(self.make_media(1).to_dict(), record_dict["media_id_1"].to_media().to_dict())
+
+        self.assertEqual({}, self.instance.add_attempt([]))
+
+    def test_delete(self):
+        self.instance.upsert([self.make_params(1), self.make_params(2)])
+        actual = self.instance.delete(["media_id_0", "media_id_2", "not_exist_media_id"])
+        self.assertEqual(2, actual)
+        self.assertEqual([FailedMedia.create(self.make_params(1))], self.instance.select())
+
+        self.assertEqual(0, self.instance.delete([]))
+
+    def test_select_retry(self):
+        self.instance.upsert([self.make_params(1, 3), self.make_params(2, 4)])
+        actual = self.instance.select_retry(3)
+        self.assertEqual([self.make_media(1), self.make_media(2)], actual)
+        self.assertEqual([], self.instance.select_retry(5))
+
+
+if __name__ == "__main__":
+    if sys.argv:
+        del sys.argv[1:]
+    unittest.main(warnings="ignore")
@@ -95,6 +95,22 @@ class TestLikeDB(unittest.TestCase):
         ]
         self.assertTrue(strict_check(expect, actual))
 
+        # 同一キーを含む複数 → 後のレコードは更新扱い
+        record = [get_record(5), get_updated_record(5)]
+        actual = self.instance.upsert(record)
+        self.assertEqual([0, 1], actual)
+        actual = self.instance.select()
+        self.assertTrue(strict_check([get_updated_record(5)], actual[5:]))
+
+        # CHUNK_SIZE を超える件数の insert/update ミックス
+        num = LikeDB.CHUNK_SIZE + 10
+        record = [get_updated_record(i) for i in range(6)] + [get_record(i) for i in range(6, num)]
+        actual = self.instance.upsert(record)
+        self.assertEqual([1] * 6 + [0] * (num - 6), actual)
+        actual = self.instance.select()
+        self.assertEqual(num, len(actual))
+        self.assertTrue(strict_check(record, actual))
+
         # 不正なrecord
         with self.assertRaises(TypeError):
             actual = self.instance.upsert("invalid_record")
@@ -38,6 +38,37 @@ class TestMediaDB(unittest.TestCase):
         expect = [Media.create(self.make_params())]
         self.assertEqual(expect, actual)
 
+    def test_select_exist_media_id(self):
+        record = [Media.create(self.make_params(i)) for i in range(1, MediaDB.CHUNK_SIZE + 2)]
+        self.instance.upsert(record)
+
+        actual = self.instance.select_exist_media_id(["media_id_0", "media_id_1", "not_exist_media_id"])
+        self.assertEqual({"media_id_0", "media_id_1"}, actual)
+
+        # CHUNK_SIZE を超える件数
+        media_id_list = [f"media_id_{i}" for i in range(MediaDB.CHUNK_SIZE + 10)]
+        actual = self.instance.select_exist_media_id(media_id_list)
+        self.assertEqual({f"media_id_{i}" for i in range(MediaDB.CHUNK_SIZE + 2)}, actual)
+
+        actual = self.instance.select_exist_media_id([])
+        self.assertEqual(set(), actual)
+
+    def test_select_unverified(self):
+        record = [Media.create(self.make_params(i)) for i in range(1, 4)]
+        record[0].verified = True
+        record[2].verified = True
+        self.instance.upsert(record)
+
+        actual = self.instance.select_unverified()
+        self.assertEqual([Media.create(self.make_params(0)), Media.create(self.make_params(2))], actual)
+
+        # 検証済として更新したものは対象外になる
+        for media in actual:
+            media.verified = True
+        self.instance.upsert(actual)
+        actual = self.instance.select_unverified()
+        self.assertEqual([], actual)
+
     def test_upsert(self):
         def get_record(index: int) -> Media:
             return Media.create(self.make_params(index))
@@ -0,0 +1,79 @@
+import sqlite3
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+from mock import patch
+from sqlalchemy import inspect
+
+from bluesky_crawler.db.base import engine_cache, get_engine
+from bluesky_crawler.db.like_db import LikeDB
+from bluesky_crawler.db.media_db import MediaDB
+from bluesky_crawler.db.migration import migrate
+from bluesky_crawler.db.model import Base as ModelBase
+
+
+class TestMigration(unittest.TestCase):
+    def setUp(self) -> None:
+        self.enterContext(patch("bluesky_crawler.db.migration.logger"))
+        self.enterContext(patch.dict(engine_cache, clear=True))
+        self.tmp_dir = self.enterContext(tempfile.TemporaryDirectory())
+        self.db_path = str(Path(self.tmp_dir) / "legacy.db")
+        return super().setUp()
+
+    def make_legacy_db(self) -> None:
+        # created_at_epoch とインデックスが追加される前のスキーマ
+        connection = sqlite3.connect(self.db_path)
+        connection.executescript("""
+            CREATE TABLE "Like" (
+                id INTEGER NOT NULL, post_id VARCHAR(256) NOT NULL, user_id VARCHAR(256) NOT NULL,
+                url VARCHAR(256) NOT NULL, text VARCHAR(512), created_at VARCHAR(256) NOT NULL,
+                registered_at VARCHAR(256) NOT NULL, PRIMARY KEY (id), UNIQUE (post_id)
+            );
+            CREATE TABLE "Media" (
+                id INTEGER NOT NULL, post_id VARCHAR(256) NOT NULL, media_id VARCHAR(256) NOT NULL,
+                media_index INTEGER NOT NULL, username VARCHAR(256) NOT NULL, alt_text VARCHAR(512),
+                mime_type VARCHAR(256) NOT NULL, size INTEGER NOT NULL, url VARCHAR(512) NOT NULL,
+                created_at VARCHAR(256) NOT NULL, registered_at VARCHAR(256) NOT NULL,
+                PRIMARY KEY (id), UNIQUE (media_id)
+            );
+            INSERT INTO "Like" VALUES (1, 'post_id_0', 'user_id_0', 'url', 'text',
+                '2024-03-23T21:34:56.897000', 'registered_at');
+            INSERT INTO "Like" VALUES (2, 'post_id_1', 'user_id_1', 'url', 'text',
+                'invalid_created_at', 'registered_at');
+            INSERT INTO "Media" VALUES (1, 'post_id_0', 'media_id_0', 1, 'username', 'alt', 'image/jpeg', 0,
+                'url', '2024-03-23T21:34:56.897000', 'registered_at');
+        """)
+        connection.commit()
+        connection.close()
+
+    def test_migrate(self):
+        self.make_legacy_db()
+        engine, _ = get_engine(self.db_path)
+        inspector = inspect(engine)
+        for table in ModelBase.metadata.sorted_tables:
+            column_name_list = [c["name"] for c in inspector.get_columns(table.name)]
+            self.assertEqual([c.name for c in table.columns], column_name_list)
+            index_name_list = [i["name"] for i in inspector.get_indexes(table.name)]
+            for index in table.indexes:
+                self.assertIn(index.name, index_name_list)
+
+        like_list = LikeDB(self.db_path).select()
+        self.assertEqual([1711197296, None], [like.created_at_epoch for like in like_list])
+        media_list = MediaDB(self.db_path).select()
+        self.assertEqual([1711197296], [media.created_at_epoch for media in media_list])
+        # 既定値を持つカラムは既存レコードに既定値が入る
+        self.assertEqual([False], [media.verified for media in media_list])
+
+        # マイグレーション済の DB に再度実行しても変化しない
+        migrate(engine)
+        like_list = LikeDB(self.db_path).select()
+        self.assertEqual([1711197296, None], [like.created_at_epoch for like in like_list])
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    if sys.argv:
+        del sys.argv[1:]
+    unittest.main(warnings="ignore")
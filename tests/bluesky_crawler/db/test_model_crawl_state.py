@@ -0,0 +1,68 @@
+import sys
+import unittest
+
+from bluesky_crawler.db.model import CrawlState
+
+
+class TestModelCrawlState(unittest.TestCase):
+    def get_params(self) -> dict:
+        return {
+            "key": "dummy_key",
+            "value": "dummy_value",
+            "updated_at": "dummy_updated_at",
+        }
+
+    def test_init(self):
+        params = self.get_params()
+        instance = CrawlState(
+            params["key"],
+            params["value"],
+            params["updated_at"],
+        )
+        self.assertEqual(params["key"], instance.key)
+        self.assertEqual(params["value"], instance.value)
+        self.assertEqual(params["updated_at"], instance.updated_at)
+
+        another_instance = CrawlState(
+            params["key"],
+            params["value"],
+            params["updated_at"],
+        )
+        self.assertEqual(f"<CrawlState(key='{params["key"]}')>", repr(instance))
+        self.assertTrue(instance == another_instance)
+        self.assertEqual(hash(instance), hash(another_instance))
+        self.assertEqual(1, len({instance, another_instance}))
+        another_instance.key = "another_key"
+        self.assertTrue(instance != another_instance)
+        self.assertEqual(2, len({instance, another_instance}))
+
+    def test_create(self):
+        params = self.get_params()
+        instance = CrawlState.create(params)
+        another_instance = CrawlState(
+            params["key"],
+            params["value"],
+            params["updated_at"],
+        )
+        self.assertEqual(instance, another_instance)
+
+        with self.assertRaises(ValueError):
+            instance = CrawlState.create({"invalid_dict_key": "invalid_dict_value"})
+
+    def test_to_dict(self):
+        params = self.get_params()
+        instance = CrawlState.create(params)
+        self.assertEqual(
+            {
+                "key": "dummy_key",
+                "value": "dummy_value",
+                "updated_at": "dummy_updated_at",
+            },
+            instance.to_dict(),
+        )
+
+
+if __name__ == "__main__":
+    if sys.argv:
+        del sys.argv[1:]
+    unittest.main(warnings="ignore")
@@ -0,0 +1,94 @@
+import sys
+import unittest
+
+import orjson
+
+from bluesky_crawler.db.model import FailedMedia, Media
+
+
+class TestModelFailedMedia(unittest.TestCase):
+    def get_media_params(self) -> dict:
+        return {
+            "post_id": "dummy_post_id",
+            "media_id": "dummy_media_id",
+            "media_index": 1,
+            "username": "dummy_username",
+            "alt_text": "dummy_alt_text",
+            "mime_type": "image/jpeg",
+            "size": 100000,
+            "url": "https://cdn.bsky.app/img/feed_fullsize/plain/did:plc:dummy/dummy_media_id@jpeg",
+            "created_at": "2024-03-23T12:34:56.897Z",
+            "registered_at": "dummy_registered_at",
+        }
+
+    def get_params(self) -> dict:
+        return {
+            "media_id": "dummy_media_id",
+            "post_id": "dummy_post_id",
+            "media": orjson.dumps(self.get_media_params()).decode(),
+            "attempt_num": 1,
+            "updated_at": "dummy_updated_at",
+        }
+
+    def test_init(self):
+        params = self.get_params()
+        instance = FailedMedia(
+            params["media_id"],
+            params["post_id"],
+            params["media"],
+            params["attempt_num"],
+            params["updated_at"],
+        )
+        self.assertEqual(params["media_id"], instance.media_id)
+        self.assertEqual(params["post_id"], instance.post_id)
+        self.assertEqual(params["media"], instance.media)
+        self.assertEqual(params["attempt_num"], instance.attempt_num)
+        self.assertEqual(params["updated_at"], instance.updated_at)
+
+        another_instance = FailedMedia(
+            params["media_id"],
+            params["post_id"],
+            params["media"],
+            params["attempt_num"] + 1,
+            params["updated_at"],
+        )
+        self.assertEqual(f"<FailedMedia(media_id='{params['media_id']}', attempt_num=1)>", repr(instance))
+        self.assertTrue(instance == another_instance)
+        self.assertEqual(hash(instance), hash(another_instance))
+        self.assertEqual(1, len({instance, another_instance}))
+        another_instance.media_id = "another_media_id"
+        self.assertTrue(instance != another_instance)
+        self.assertEqual(2, len({instance, another_instance}))
+
+    def test_create(self):
+        params = self.get_params()
+        instance = FailedMedia.create(params)
+        another_instance = FailedMedia(
+            params["media_id"],
+            params["post_id"],
+            params["media"],
+            params["attempt_num"],
+            params["updated_at"],
+        )
+        self.assertEqual(instance, another_instance)
+
+        with self.assertRaises(ValueError):
+            instance = FailedMedia.create({"invalid_dict_key": "invalid_dict_value"})
+
+    def test_to_dict(self):
+        params = self.get_params()
+        instance = FailedMedia.create(params)
+        self.assertEqual(params, instance.to_dict())
+
+    def test_to_media(self):
+        instance = FailedMedia.create(self.get_params())
+        actual = instance.to_media()
+        expect = Media.create(self.get_media_params())
+        self.assertEqual(expect, actual)
+        self.assertEqual(expect.to_dict(), actual.to_dict())
+
+
+if __name__ == "__main__":
+    if sys.argv:
+        del sys.argv[1:]
+    unittest.main(warnings="ignore")
@@ -31,6 +31,10 @@ class TestModelLike(unittest.TestCase):
         self.assertEqual(params["text"], instance.text)
         self.assertEqual(params["created_at"], instance.created_at)
         self.assertEqual(params["registered_at"], instance.registered_at)
+        self.assertIsNone(instance.created_at_epoch)
+
+        instance = Like(*(params | {"created_at": "2024-03-23T21:34:56.897000"}).values())
+        self.assertEqual(1711197296, instance.created_at_epoch)
 
         another_instance = Like(
             params["post_id"],
@@ -42,8 +46,11 @@ class TestModelLike(unittest.TestCase):
         )
         self.assertEqual(f"<Like(post_id='{params["post_id"]}')>", repr(instance))
         self.assertTrue(instance == another_instance)
+        self.assertEqual(hash(instance), hash(another_instance))
+        self.assertEqual(1, len({instance, another_instance}))
         another_instance.post_id = "another_post_id"
         self.assertTrue(instance != another_instance)
+        self.assertEqual(2, len({instance, another_instance}))
 
     def test_create(self):
         params = self.get_params()
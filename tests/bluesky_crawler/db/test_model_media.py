@@ -43,6 +43,11 @@ class TestModelMedia(unittest.TestCase):
         self.assertEqual(params["url"], instance.url)
         self.assertEqual(params["created_at"], instance.created_at)
         self.assertEqual(params["registered_at"], instance.registered_at)
+        self.assertIsNone(instance.created_at_epoch)
+        self.assertFalse(instance.verified)
+
+        instance = Media(*(params | {"created_at": "2024-03-23T21:34:56.897000"}).values())
+        self.assertEqual(1711197296, instance.created_at_epoch)
 
         another_instance = Media(
             params["post_id"],
@@ -58,8 +63,11 @@ class TestModelMedia(unittest.TestCase):
         )
         self.assertEqual(f"<Media(media_id='{params["media_id"]}', post_id='{params["post_id"]}')>", repr(instance))
         self.assertTrue(instance == another_instance)
+        self.assertEqual(hash(instance), hash(another_instance))
+        self.assertEqual(1, len({instance, another_instance}))
         another_instance.media_id = "another_media_id"
         self.assertTrue(instance != another_instance)
+        self.assertEqual(2, len({instance, another_instance}))
 
     def test_create(self):
         params = self.get_params()
@@ -34,8 +34,11 @@ class TestModelUser(unittest.TestCase):
         )
         self.assertEqual(f"<User(user_id='{params["user_id"]}')>", repr(instance))
         self.assertTrue(instance == another_instance)
+        self.assertEqual(hash(instance), hash(another_instance))
+        self.assertEqual(1, len({instance, another_instance}))
         another_instance.user_id = "another_user_id"
         self.assertTrue(instance != another_instance)
+        self.assertEqual(2, len({instance, another_instance}))
 
     def test_create(self):
         params = self.get_params()
@@ -1,88 +1,742 @@
+import base64
+import inspect
 import sys
+import threading
+import time
 import unittest
 from collections import namedtuple
+from datetime import UTC, datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
 
+import freezegun
+import httpx
+import mock
+import orjson
+from atproto import Client, Session, SessionEvent, models
+from atproto_client.exceptions import BadRequestError, NetworkError, RequestException
+from atproto_client.models.common import XrpcError
+from atproto_client.request import Response
 from mock import call, patch
 
-from bluesky_crawler.manager.manager import BlueskyManager
+from bluesky_crawler.manager.manager import CREATE_SESSION_NSID, DEFAULT_RATE_LIMIT_CONFIG, FETCH_MODE_LIST
+from bluesky_crawler.manager.manager import BlueskyManager, RateLimitBudget, RateLimiter, check_client_compatibility
+from bluesky_crawler.manager.manager import get_account_list, is_jwt_expired
+
+
+class FakeXrpcServer:
+    """登録した順にレスポンスを返すローカルの XRPC サーバ
+
+    response_list に (ステータスコード, ヘッダ, ボディ) を登録しておくと、リクエストごとに先頭から1つずつ返す
+    受け取ったリクエストは (パス, ヘッダ) として request_list に記録する
+    """
+
+    def __init__(self) -> None:
+        self.response_list: list[tuple[int, dict, bytes]] = []
+        self.request_list: list[tuple[str, dict]] = []
+        fake_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                fake_server.request_list.append((self.path, dict(self.headers)))
+                status_code, headers, body = fake_server.response_list.pop(0)
+                self.send_response(status_code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args) -> None:
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def __enter__(self) -> "FakeXrpcServer":
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+
+class TestRateLimiter(unittest.TestCase):
+    def setUp(self) -> None:
+        self.enterContext(patch("bluesky_crawler.manager.manager.logger"))
+        # 待機した時間だけ時刻を進める
+        self.frozen_time = self.enterContext(freezegun.freeze_time("2099-03-23T12:34:56"))
+        self.mock_sleep = self.enterContext(patch("bluesky_crawler.manager.manager.time.sleep"))
+        self.mock_sleep.side_effect = lambda seconds: self.frozen_time.tick(seconds)
+        return super().setUp()
+
+    def get_sleep_list(self) -> list[float]:
+        return [sleep_call.args[0] for sleep_call in self.mock_sleep.call_args_list]
+
+    def test_init(self):
+        instance = RateLimiter()
+        self.assertEqual(DEFAULT_RATE_LIMIT_CONFIG, instance.rate_limit_config)
+        self.assertEqual({}, instance.bucket_dict)
+        instance = RateLimiter({"rate": 1})
+        self.assertEqual(DEFAULT_RATE_LIMIT_CONFIG | {"rate": 1}, instance.rate_limit_config)
+
+        error_config_list = [
+            {"rate": 0},
+            {"burst": 0},
+            {"max_retry": -1},
+            {"backoff_base": -1},
+            {"backoff_base": 10, "backoff_max": 5},
+            {"jitter": -0.1},
+            {"jitter": 1},
+        ]
+        for error_config in error_config_list:
+            with self.assertRaises(ValueError):
+                instance = RateLimiter(error_config)
+
+    def test_acquire(self):
+        instance = RateLimiter({"rate": 2, "burst": 2})
+        # burst 個までは待機せず、それ以降は 1 / rate 秒ずつ間隔を空ける
+        for _ in range(4):
+            instance.acquire("endpoint_a")
+        self.assertEqual([0.5, 0.5], self.get_sleep_list())
+
+        # エンドポイントごとに別のバケットとする
+        self.mock_sleep.reset_mock()
+        instance.acquire("endpoint_b")
+        self.mock_sleep.assert_not_called()
+
+        # 待機している間に補充される
+        self.frozen_time.tick(10)
+        for _ in range(2):
+            instance.acquire("endpoint_a")
+        self.mock_sleep.assert_not_called()
+
+    def test_update(self):
+        instance = RateLimiter({"rate": 5, "burst": 10})
+        now = time.time()
+        self.assertIsNone(instance.get_budget("endpoint"))
+
+        # ヘッダがない場合は何もしない
+        instance.update("endpoint", {"content-type": "application/json"})
+        self.assertIsNone(instance.get_budget("endpoint"))
+
+        headers = {
+            "RateLimit-Limit": "3000",
+            "RateLimit-Remaining": "2",
+            "RateLimit-Reset": str(int(now) + 60),
+            "RateLimit-Policy": "3000;w=300",
+        }
+        instance.update("endpoint", headers)
+        self.assertEqual(RateLimitBudget(3000, 2, now + 60), instance.get_budget("endpoint"))
+        bucket = instance.bucket_dict["endpoint"]
+        self.assertEqual(2, bucket.tokens)
+        # ratelimit-policy に合わせて補充速度を下げる（設定した rate より上げない）
+        self.assertEqual(5, bucket.rate)
+        instance.update("endpoint", headers | {"RateLimit-Policy": "60;w=60"})
+        self.assertEqual(1, bucket.rate)
+
+        # サーバ側の残りを使い切った場合は期間が切り替わるまで待機する
+        instance.update("endpoint", headers | {"RateLimit-Remaining": "0"})
+        self.assertEqual(RateLimitBudget(3000, 0, now + 60), instance.get_budget("endpoint"))
+        instance.acquire("endpoint")
+        self.assertEqual([60], self.get_sleep_list())
+        # 期間が切り替わった後は残りは不明
+        self.assertIsNone(instance.get_budget("endpoint"))
+
+    def test_get_wait_time(self):
+        instance = RateLimiter({"backoff_base": 1, "backoff_max": 60, "jitter": 0.1})
+        now = time.time()
+        self.assertEqual(7, instance.get_wait_time(429, {"Retry-After": "7"}, 0))
+        self.assertEqual(30, instance.get_wait_time(429, {"ratelimit-reset": str(int(now) + 30)}, 0))
+        self.assertEqual(60, instance.get_wait_time(429, {"ratelimit-reset": str(int(now) + 86400)}, 0))
+        self.assertEqual(0, instance.get_wait_time(429, {"ratelimit-reset": str(int(now) - 30)}, 0))
+
+        with patch("bluesky_crawler.manager.manager.random.uniform", return_value=1.05) as mock_uniform:
+            self.assertAlmostEqual(1.05, instance.get_wait_time(429, {}, 0))
+            self.assertAlmostEqual(4.2, instance.get_wait_time(503, {"ratelimit-reset": str(int(now) + 30)}, 2))
+            self.assertEqual(60, instance.get_wait_time(500, {}, 10))
+            mock_uniform.assert_called_with(0.9, 1.1)
+
+    def test_call(self):
+        instance = RateLimiter({"max_retry": 2, "backoff_base": 1, "jitter": 0})
+
+        def make_response(status_code: int) -> httpx.Response:
+            reset = str(int(time.time()) + 3600)
+            return httpx.Response(status_code, headers={"ratelimit-remaining": "100", "ratelimit-reset": reset})
+
+        Params = namedtuple("Params", ["status_code_list", "expect_status_code", "expect_sleep_list"])
+        params_list = [
+            Params([200], 200, []),
+            Params([429, 503, 200], 200, [300, 2]),  # 429 は ratelimit-reset まで（backoff_max まで）待機する
+            Params([500, 500, 500], 500, [1, 2]),
+            Params([400], 400, []),
+            Params([404], 404, []),
+        ]
+        for params in params_list:
+            self.mock_sleep.reset_mock()
+            send = mock.MagicMock(side_effect=[make_response(code) for code in params.status_code_list])
+            actual = instance.call("endpoint", send)
+            self.assertEqual(params.expect_status_code, actual.status_code)
+            self.assertEqual(len(params.status_code_list), send.call_count)
+            self.assertEqual(params.expect_sleep_list, self.get_sleep_list())
+            self.assertEqual(100, instance.get_budget("endpoint").remaining)
+
+        # atproto の例外はレスポンスを読み取って同様に再試行し、再試行しても失敗した場合は送出する
+        error = RequestException(Response(False, 503, b"", {}))
+        send = mock.MagicMock(side_effect=[error, Response(True, 200, b"", {})])
+        self.assertEqual(200, instance.call("endpoint", send).status_code)
+        send = mock.MagicMock(side_effect=[error] * 3)
+        with self.assertRaises(RequestException):
+            instance.call("endpoint", send)
+        self.assertEqual(3, send.call_count)
+
+        # レスポンスがない例外（接続の失敗など）はそのまま送出する
+        send = mock.MagicMock(side_effect=[NetworkError()])
+        with self.assertRaises(NetworkError):
+            instance.call("endpoint", send)
+        self.assertEqual(1, send.call_count)
+
+        # レスポンス以外（atproto のモデルなど）を返した場合は成功として扱う
+        self.mock_sleep.reset_mock()
+        send = mock.MagicMock(side_effect=[error, "dummy_model"])
+        self.assertEqual("dummy_model", instance.call("endpoint", send))
+        self.assertEqual(2, send.call_count)
 
 
 class TestBlueskyManager(unittest.TestCase):
+    def setUp(self) -> None:
+        self.enterContext(patch("bluesky_crawler.manager.manager.logger"))
+        self.session_file = Path("./config/__dummy_name_session.txt")
+        self.session_file.unlink(missing_ok=True)
+        self.addCleanup(self.session_file.unlink, missing_ok=True)
+        return super().setUp()
+
+    def make_jwt(self, exp: int | None, signature: str = "signature") -> str:
+        def encode(value: bytes) -> str:
+            return base64.urlsafe_b64encode(value).decode().rstrip("=")
+
+        payload = {"sub": "did:plc:dummy"} if exp is None else {"sub": "did:plc:dummy", "exp": exp}
+        header = orjson.dumps({"alg": "HS256", "typ": "JWT"})
+        return f"{encode(header)}.{encode(orjson.dumps(payload))}.{encode(signature.encode())}"
+
+    def make_session(self, access_exp: int, refresh_exp: int, access_name: str = "access") -> Session:
+        access_jwt = self.make_jwt(access_exp, access_name)
+        return Session(
+            "__dummy_name.bsky.social", "did:plc:dummy", access_jwt, self.make_jwt(refresh_exp), "https://pds.dummy/"
+        )
+
     def test_init(self):
         mock_client = self.enterContext(patch("bluesky_crawler.manager.manager.Client"))
-        mock_client.return_value.export_session_string.side_effect = lambda: "session_string"
         config_dict = {"bluesky": {"handle_name": "__dummy_name", "password": "dummy_password"}}
-        session_file = Path(f"./config/__dummy_name_session.txt")
-
-        def pre_run(first_init, reflesh_flag):
-            session_file.unlink(missing_ok=True)
-            if first_init:
-                return
-            session_file.touch()
-            if reflesh_flag:
-                session_file.write_text("old_session_string", encoding="utf8")
-            else:
-                session_file.write_text("session_string", encoding="utf8")
-
-        def post_run(first_init, reflesh_flag, instance: BlueskyManager):
-            handle = "__dummy_name.bsky.social"
-            session_string = None
-            if not first_init:
-                if reflesh_flag:
-                    session_string = "old_session_string"
-                else:
-                    session_string = "session_string"
+        now = int(time.time())
+
+        def pre_run(session_string: str | None) -> None:
+            mock_client.reset_mock()
+            self.session_file.unlink(missing_ok=True)
+            if session_string is not None:
+                self.session_file.write_text(session_string, encoding="utf8")
 
+        def post_run(session_string: str | None, is_loaded: bool, instance: BlueskyManager) -> None:
             self.assertEqual("__dummy_name", instance.handle_name)
             self.assertEqual("dummy_password", instance.password)
-            self.assertEqual(handle, instance.handle)
-            self.assertEqual(
-                [
-                    call(base_url="https://bsky.social"),
-                    call().login(handle, "dummy_password", session_string),
-                    call().export_session_string(),
-                ],
-                mock_client.mock_calls,
+            self.assertEqual("__dummy_name.bsky.social", instance.handle)
+            self.assertEqual(self.session_file, instance.session_file)
+            # ログインは行わない（通信しない）
+            expect_calls = [
+                call(base_url="https://bsky.social"),
+                call().on_session_change(mock.ANY),
+            ]
+            if is_loaded:
+                expect_calls.append(call()._import_session_string(session_string))
+            self.assertEqual(expect_calls, mock_client.mock_calls)
+
+        valid_session = self.make_session(now + 3600, now + 86400).encode()
+        access_expired_session = self.make_session(now - 3600, now + 86400).encode()
+        refresh_expired_session = self.make_session(now - 3600, now - 60).encode()
+        Params = namedtuple("Params", ["session_string", "is_loaded"])
+        params_list = [
+            Params(None, False),  # 初回
+            Params(valid_session, True),  # 保存したセッションを使う
+            Params(access_expired_session, True),  # アクセストークンの更新は API の呼び出し時に行う
+            Params(refresh_expired_session, False),  # リフレッシュトークンの期限切れ
+            Params("invalid_session_string", False),  # 壊れたセッションファイル
+        ]
+        for params in params_list:
+            pre_run(params.session_string)
+            instance = BlueskyManager(config_dict)
+            post_run(params.session_string, params.is_loaded, instance)
+            self.assertEqual("validated", instance.fetch_mode)
+
+        instance = BlueskyManager(config_dict | {"general": {"fetch_mode": "raw"}})
+        self.assertEqual("raw", instance.fetch_mode)
+        with self.assertRaises(ValueError):
+            instance = BlueskyManager(config_dict | {"general": {"fetch_mode": "invalid"}})
+
+        # 複数アカウントの場合は handle_name で指定する（指定しない場合は最初のアカウント）
+        account_list = [
+            {"handle_name": "__dummy_name", "password": "dummy_password"},
+            {"handle_name": "__dummy_name_2", "password": "dummy_password_2"},
+        ]
+        instance = BlueskyManager({"bluesky": account_list})
+        self.assertEqual("__dummy_name", instance.handle_name)
+        instance = BlueskyManager({"bluesky": account_list}, "__dummy_name_2")
+        self.assertEqual("__dummy_name_2", instance.handle_name)
+        self.assertEqual("dummy_password_2", instance.password)
+        self.assertEqual(Path("./config/__dummy_name_2_session.txt"), instance.session_file)
+        with self.assertRaises(ValueError):
+            instance = BlueskyManager({"bluesky": account_list}, "not_configured")
+
+    def test_check_client_compatibility(self):
+        # セッション管理に使う atproto の Client の非公開の属性が、インストールされた版に存在すること
+        client = Client(base_url="https://bsky.social")
+        check_client_compatibility(client)
+        signature_dict = {
+            "_import_session_string": ["session_string"],
+            "_get_and_set_session": ["login", "password", "auth_factor_token"],
+            "_refresh_and_set_session": [],
+        }
+        for name, expect in signature_dict.items():
+            self.assertEqual(expect, list(inspect.signature(getattr(client, name)).parameters), name)
+        with client._refresh_lock:
+            pass
+
+        # 存在しない場合は作成時に送出する
+        incompatible_client = mock.MagicMock(spec=["_import_session_string", "_get_and_set_session", "_refresh_lock"])
+        with self.assertRaises(RuntimeError):
+            check_client_compatibility(incompatible_client)
+        with patch("bluesky_crawler.manager.manager.Client", return_value=incompatible_client):
+            with self.assertRaises(RuntimeError):
+                BlueskyManager({"bluesky": {"handle_name": "__dummy_name", "password": "dummy_password"}})
+
+    def test_is_jwt_expired(self):
+        now = int(time.time())
+        self.assertFalse(is_jwt_expired(self.make_jwt(now + 3600)))
+        self.assertTrue(is_jwt_expired(self.make_jwt(now - 1)))
+        self.assertTrue(is_jwt_expired(self.make_jwt(now + 600), margin=900))
+        self.assertTrue(is_jwt_expired(self.make_jwt(None)))
+        self.assertTrue(is_jwt_expired("invalid_jwt"))
+
+    def test_save_session(self):
+        config_dict = {"bluesky": {"handle_name": "__dummy_name", "password": "dummy_password"}}
+        instance = BlueskyManager(config_dict)
+        instance.save_session("session_string")
+        self.assertEqual("session_string", self.session_file.read_text(encoding="utf8"))
+        mtime = self.session_file.stat().st_mtime_ns
+
+        # 変更がない場合は書き込まない
+        instance.save_session("session_string")
+        self.assertEqual(mtime, self.session_file.stat().st_mtime_ns)
+
+        # 一時ファイルに書き込んでから置き換える
+        with patch("bluesky_crawler.manager.manager.os.replace", side_effect=OSError("replace error")):
+            with self.assertRaises(OSError):
+                instance.save_session("new_session_string")
+        self.assertEqual("session_string", self.session_file.read_text(encoding="utf8"))
+        self.assertEqual([], list(self.session_file.parent.glob(f".{self.session_file.name}.*")))
+        instance.save_session("new_session_string")
+        self.assertEqual("new_session_string", self.session_file.read_text(encoding="utf8"))
+
+    def test_session(self):
+        # 実際の Client を使い、通信する部分のみを置き換える
+        config_dict = {"bluesky": {"handle_name": "__dummy_name", "password": "dummy_password"}}
+        now = int(time.time())
+        saved_session = self.make_session(now + 3600, now + 86400, "saved")
+        created_session = self.make_session(now + 7200, now + 86400, "created")
+        refreshed_session = self.make_session(now + 7200, now + 86400, "refreshed")
+
+        def pre_run(session: Session | None) -> BlueskyManager:
+            self.session_file.unlink(missing_ok=True)
+            if session is not None:
+                self.session_file.write_text(session.encode(), encoding="utf8")
+            instance = BlueskyManager(config_dict)
+            mock_create = self.enterContext(patch.object(instance.client, "_get_and_set_session"))
+            mock_create.side_effect = lambda login, password: instance.client._set_session(
+                SessionEvent.CREATE, created_session
             )
-            self.assertTrue(session_file.exists())
-            session_file.unlink(missing_ok=True)
-            mock_client.reset_mock()
+            mock_refresh = self.enterContext(patch.object(instance.client, "_refresh_and_set_session"))
+            mock_refresh.side_effect = lambda: instance.client._set_session(SessionEvent.REFRESH, refreshed_session)
+            return instance
 
-        Params = namedtuple("Params", ["first_init", "reflesh_flag"])
-        params_list = (
-            Params(True, False),  # 初回
-            Params(False, False),  # session_string使用（リフレッシュなし）
-            Params(False, True),  # session_string使用（リフレッシュあり）
-        )
+        # 保存したセッションを読み込む（書き込みはしない）
+        instance = pre_run(saved_session)
+        self.assertEqual(saved_session.encode(), instance.session.encode())
+        mtime = self.session_file.stat().st_mtime_ns
+        instance.ensure_session()
+        instance.client._get_and_set_session.assert_not_called()
+        instance.client._refresh_and_set_session.assert_not_called()
+        self.assertEqual(mtime, self.session_file.stat().st_mtime_ns)
 
-        try:
-            for params in params_list:
-                pre_run(params.first_init, params.reflesh_flag)
-                instance = BlueskyManager(config_dict)
-                post_run(params.first_init, params.reflesh_flag, instance)
-        finally:
-            session_file.unlink(missing_ok=True)
+        # セッションがない → ログインして保存する
+        instance = pre_run(None)
+        self.assertIsNone(instance.session)
+        instance.ensure_session()
+        instance.client._get_and_set_session.assert_called_once_with(instance.handle, instance.password)
+        self.assertEqual(created_session.encode(), instance.session.encode())
+        self.assertEqual(created_session.encode(), self.session_file.read_text(encoding="utf8"))
 
-    def test_get_actor_likes(self):
+        # アクセストークンの期限が近い → 更新して保存する
+        instance = pre_run(self.make_session(now + 600, now + 86400))
+        instance.ensure_session()
+        instance.client._get_and_set_session.assert_not_called()
+        instance.client._refresh_and_set_session.assert_called_once_with()
+        self.assertEqual(refreshed_session.encode(), self.session_file.read_text(encoding="utf8"))
+
+        # リフレッシュトークンが無効 → ログインし直す
+        instance = pre_run(self.make_session(now + 600, now + 86400))
+        instance.client._refresh_and_set_session.side_effect = BadRequestError()
+        instance.ensure_session()
+        instance.client._get_and_set_session.assert_called_once_with(instance.handle, instance.password)
+        self.assertEqual(created_session.encode(), self.session_file.read_text(encoding="utf8"))
+
+        # セッション読み込み後にリフレッシュトークンの期限が切れた → ログインし直す
+        instance = pre_run(saved_session)
+        instance.session = self.make_session(now + 3600, now - 60)
+        instance.ensure_session()
+        instance.client._get_and_set_session.assert_called_once_with(instance.handle, instance.password)
+
+    def test_login(self):
         mock_client = self.enterContext(patch("bluesky_crawler.manager.manager.Client"))
-        mock_client.return_value.export_session_string.side_effect = lambda: None
-        mock_client.return_value.app.bsky.feed.get_actor_likes.return_value.model_dump.side_effect = (
-            lambda: "get_actor_likes_model_dump"
-        )
+        mock_sleep = self.enterContext(patch("bluesky_crawler.manager.manager.time.sleep"))
+        rate_limit_config = {"max_retry": 2, "backoff_base": 1, "jitter": 0}
+        config_dict = {
+            "bluesky": {"handle_name": "__dummy_name", "password": "dummy_password"},
+            "general": {"rate_limit": rate_limit_config},
+        }
+        instance = BlueskyManager(config_dict)
+        mock_create = mock_client.return_value._get_and_set_session
+
+        def make_error(status_code: int) -> RequestException:
+            return RequestException(Response(False, status_code, b"", {}))
+
+        # レート制限・サーバエラー → general.rate_limit に従って待機して再試行する
+        mock_create.side_effect = [make_error(429), make_error(503), "dummy_session"]
+        instance.login()
+        self.assertEqual([call(instance.handle, instance.password)] * 3, mock_create.mock_calls)
+        self.assertEqual([call(1), call(2)], mock_sleep.mock_calls)
+        self.assertIn(CREATE_SESSION_NSID, instance.rate_limiter.bucket_dict)
+
+        # 再試行回数を超えた場合は送出する
+        mock_create.reset_mock()
+        mock_create.side_effect = [make_error(429)] * 3
+        with self.assertRaises(RequestException):
+            instance.login()
+        self.assertEqual(3, mock_create.call_count)
+
+        # 再試行の対象外のエラーは送出する
+        mock_create.reset_mock()
+        mock_create.side_effect = [make_error(401)]
+        with self.assertRaises(RequestException):
+            instance.login()
+        self.assertEqual(1, mock_create.call_count)
+
+    def test_get_account_list(self):
+        account = {"handle_name": "handle_name_0", "password": "password_0"}
+        self.assertEqual([account], get_account_list({"bluesky": account}))
+        account_list = [account, {"handle_name": "handle_name_1", "password": "password_1"}]
+        self.assertEqual(account_list, get_account_list({"bluesky": account_list}))
+        with self.assertRaises(ValueError):
+            get_account_list({"bluesky": []})
+        with self.assertRaises(ValueError):
+            get_account_list({"bluesky": [account, account]})
+
+    def test_get_actor_likes(self):
+        self.enterContext(patch("bluesky_crawler.manager.manager.Client"))
+        mock_get_actor_likes_page = self.enterContext(patch.object(BlueskyManager, "get_actor_likes_page"))
         config_dict = {"bluesky": {"handle_name": "__dummy_name", "password": "dummy_password"}}
         instance = BlueskyManager(config_dict)
-        mock_client.reset_mock()
+
+        def make_page(page_index: int, entry_num: int, is_last: bool) -> dict:
+            feed = [{"post": {"uri": f"uri_{page_index}_{i}"}} for i in range(entry_num)]
+            return {"feed": feed, "cursor": None if is_last else f"cursor_{page_index}"}
+
+        def pre_run(page_num: int) -> None:
+            mock_get_actor_likes_page.reset_mock()
+            mock_get_actor_likes_page.side_effect = [make_page(i, 3, i == page_num - 1) for i in range(page_num)]
+
+        def make_calls(cursor_list: list[str | None]) -> list:
+            return [call(cursor, 100) for cursor in cursor_list]
+
+        # last_post_uri 指定なし → 最新の1ページのみ
+        pre_run(3)
         actual = instance.get_actor_likes()
-        expect = "get_actor_likes_model_dump"
+        expect = {"feed": make_page(0, 3, False)["feed"], "cursor": "cursor_0"}
+        self.assertEqual(expect, actual)
+        self.assertEqual(make_calls([None]), mock_get_actor_likes_page.mock_calls)
+
+        # last_post_uri が2ページ目にある → 2ページ目の途中で打ち切り
+        pre_run(3)
+        actual = instance.get_actor_likes(last_post_uri="uri_1_1")
+        expect = {"feed": make_page(0, 3, False)["feed"] + [{"post": {"uri": "uri_1_0"}}], "cursor": "cursor_1"}
         self.assertEqual(expect, actual)
-        self.assertEqual(
-            [
-                call().app.bsky.feed.get_actor_likes(params={"actor": instance.handle, "limit": 100}),
-                call().app.bsky.feed.get_actor_likes().model_dump(),
-            ],
-            mock_client.mock_calls,
+        self.assertEqual(make_calls([None, "cursor_0"]), mock_get_actor_likes_page.mock_calls)
+
+        # last_post_uri が先頭 → 新規エントリなし
+        pre_run(3)
+        actual = instance.get_actor_likes(last_post_uri="uri_0_0")
+        expect = {"feed": [], "cursor": "cursor_0"}
+        self.assertEqual(expect, actual)
+        self.assertEqual(make_calls([None]), mock_get_actor_likes_page.mock_calls)
+
+        # last_post_uri が見つからない → 最終ページまで
+        pre_run(3)
+        actual = instance.get_actor_likes(last_post_uri="not_found_uri")
+        expect_feed = [entry for i in range(3) for entry in make_page(i, 3, i == 2)["feed"]]
+        expect = {"feed": expect_feed, "cursor": None}
+        self.assertEqual(expect, actual)
+        self.assertEqual(make_calls([None, "cursor_0", "cursor_1"]), mock_get_actor_likes_page.mock_calls)
+
+        # last_post_uri が見つからない → 最大ページ数で打ち切り
+        pre_run(3)
+        actual = instance.get_actor_likes(last_post_uri="not_found_uri", max_page_num=2)
+        expect_feed = [entry for i in range(2) for entry in make_page(i, 3, False)["feed"]]
+        expect = {"feed": expect_feed, "cursor": "cursor_1"}
+        self.assertEqual(expect, actual)
+        self.assertEqual(make_calls([None, "cursor_0"]), mock_get_actor_likes_page.mock_calls)
+
+    def test_iter_actor_likes(self):
+        self.enterContext(patch("bluesky_crawler.manager.manager.Client"))
+        mock_get_actor_likes = self.enterContext(patch.object(BlueskyManager, "get_actor_likes_page"))
+        config_dict = {"bluesky": {"handle_name": "__dummy_name", "password": "dummy_password"}}
+        instance = BlueskyManager(config_dict)
+
+        def make_page(page_index: int, entry_num: int, is_last: bool) -> dict:
+            feed = [{"post": {"uri": f"uri_{page_index}_{i}"}} for i in range(entry_num)]
+            return {"feed": feed, "cursor": None if is_last else f"cursor_{page_index}"}
+
+        page_list = [make_page(i, 3, i == 2) for i in range(3)]
+        mock_get_actor_likes.side_effect = page_list
+
+        # 次のページは要求されるまで取得しない
+        page_iter = instance.iter_actor_likes(last_post_uri="uri_2_1")
+        mock_get_actor_likes.assert_not_called()
+        self.assertEqual((page_list[0]["feed"], "cursor_0"), next(page_iter))
+        self.assertEqual(1, mock_get_actor_likes.call_count)
+        self.assertEqual((page_list[1]["feed"], "cursor_1"), next(page_iter))
+        self.assertEqual(2, mock_get_actor_likes.call_count)
+
+        # last_post_uri に到達したページは、それより新しいエントリのみ
+        self.assertEqual(([{"post": {"uri": "uri_2_0"}}], None), next(page_iter))
+        with self.assertRaises(StopIteration):
+            next(page_iter)
+        self.assertEqual(3, mock_get_actor_likes.call_count)
+
+    def test_get_actor_likes_page(self):
+        mock_client = self.enterContext(patch("bluesky_crawler.manager.manager.Client"))
+        mock_ensure_session = self.enterContext(patch.object(BlueskyManager, "ensure_session"))
+        mock_refresh_session = self.enterContext(patch.object(BlueskyManager, "refresh_session"))
+        mock_sleep = self.enterContext(patch("bluesky_crawler.manager.manager.time.sleep"))
+        mock_invoke_query = mock_client.return_value.invoke_query
+        config_dict = {"bluesky": {"handle_name": "__dummy_name", "password": "dummy_password"}}
+        instance = BlueskyManager(config_dict)
+
+        def make_response(cursor: str | None) -> Response:
+            return Response(True, 200, {"feed": [], "cursor": cursor}, {})
+
+        def make_error(error_class: type, status_code: int, error: str, headers: dict | None = None) -> Exception:
+            return error_class(Response(False, status_code, XrpcError(error=error, message="message"), headers or {}))
+
+        def make_call(cursor: str | None) -> call:
+            params = {"actor": instance.handle, "limit": 50}
+            if cursor:
+                params["cursor"] = cursor
+            return call(
+                "app.bsky.feed.getActorLikes",
+                params=models.AppBskyFeedGetActorLikes.Params(**params),
+                output_encoding="application/json",
+            )
+
+        for cursor in [None, "cursor"]:
+            mock_invoke_query.reset_mock()
+            mock_ensure_session.reset_mock()
+            mock_invoke_query.side_effect = [make_response("next_cursor")]
+            actual = instance.get_actor_likes_page(cursor, 50)
+            self.assertEqual({"feed": [], "cursor": "next_cursor"}, actual)
+            mock_ensure_session.assert_called_once_with()
+            self.assertEqual([make_call(cursor)], mock_invoke_query.mock_calls)
+        mock_refresh_session.assert_not_called()
+
+        # トークンが拒否された → セッションを更新して1回だけ再試行する
+        mock_invoke_query.reset_mock()
+        mock_invoke_query.side_effect = [make_error(BadRequestError, 400, "ExpiredToken"), make_response(None)]
+        actual = instance.get_actor_likes_page(None, 50)
+        self.assertEqual({"feed": [], "cursor": None}, actual)
+        self.assertEqual([make_call(None)] * 2, mock_invoke_query.mock_calls)
+        mock_refresh_session.assert_called_once_with()
+
+        # それ以外のエラーは送出する
+        mock_invoke_query.reset_mock()
+        mock_refresh_session.reset_mock()
+        mock_invoke_query.side_effect = [make_error(BadRequestError, 400, "InvalidRequest")]
+        with self.assertRaises(BadRequestError):
+            actual = instance.get_actor_likes_page(None, 50)
+        mock_refresh_session.assert_not_called()
+
+        # 429 / 5xx → 待機して再試行する
+        mock_invoke_query.reset_mock()
+        mock_invoke_query.side_effect = [
+            make_error(RequestException, 429, "RateLimitExceeded", {"retry-after": "7"}),
+            make_error(NetworkError, 502, "BadGateway"),
+            make_response(None),
+        ]
+        actual = instance.get_actor_likes_page(None, 50)
+        self.assertEqual({"feed": [], "cursor": None}, actual)
+        self.assertEqual(3, mock_invoke_query.call_count)
+        self.assertEqual(7, mock_sleep.call_args_list[0].args[0])
+        mock_refresh_session.assert_not_called()
+
+        # 再試行回数を超えた場合は送出する
+        mock_invoke_query.reset_mock()
+        max_retry = DEFAULT_RATE_LIMIT_CONFIG["max_retry"]
+        mock_invoke_query.side_effect = [make_error(RequestException, 503, "Unavailable")] * (max_retry + 1)
+        with self.assertRaises(RequestException):
+            actual = instance.get_actor_likes_page(None, 50)
+        self.assertEqual(max_retry + 1, mock_invoke_query.call_count)
+
+    def test_get_actor_likes_page_raw(self):
+        mock_client = self.enterContext(patch("bluesky_crawler.manager.manager.Client"))
+        mock_ensure_session = self.enterContext(patch.object(BlueskyManager, "ensure_session"))
+        mock_refresh_session = self.enterContext(patch.object(BlueskyManager, "refresh_session"))
+        mock_sleep = self.enterContext(patch("bluesky_crawler.manager.manager.time.sleep"))
+        session = Session(
+            "__dummy_name.bsky.social", "did:plc:dummy", "access_jwt", "refresh_jwt", "https://pds.dummy/"
+        )
+        refreshed_session = Session(
+            "__dummy_name.bsky.social", "did:plc:dummy", "new_access_jwt", "refresh_jwt", "https://pds.dummy/"
         )
+        config_dict = {
+            "bluesky": {"handle_name": "__dummy_name", "password": "dummy_password"},
+            "general": {"fetch_mode": "raw"},
+        }
+        page = {
+            "feed": [{"post": {"uri": "uri_0", "record": {"createdAt": "2024-03-23T12:34:56.897Z"}}}],
+            "cursor": "next_cursor",
+        }
+        # FeedEntry の作成に使わない値を含むレスポンス
+        response_page = {
+            "feed": [{"post": page["feed"][0]["post"] | {"indexedAt": "2024-03-23T12:34:56.897Z", "labels": []}}],
+            "cursor": "next_cursor",
+        }
+        request_list: list[httpx.Request] = []
+
+        def pre_run(response_list: list[tuple[int, bytes]]) -> BlueskyManager:
+            response_iter = iter(response_list)
+
+            def handler(request: httpx.Request) -> httpx.Response:
+                request_list.append(request)
+                status_code, content = next(response_iter)
+                return httpx.Response(status_code, content=content)
+
+            instance = BlueskyManager(config_dict)
+            instance.session = session
+            instance.http_client = httpx.Client(transport=httpx.MockTransport(handler))
+            request_list.clear()
+            mock_client.reset_mock()
+            mock_sleep.reset_mock()
+            mock_refresh_session.reset_mock()
+            mock_refresh_session.side_effect = lambda: setattr(instance, "session", refreshed_session)
+            return instance
+
+        # 生の JSON を辞書にし、 FeedEntry の作成に必要な値のみに絞り込んで返す
+        instance = pre_run([(200, orjson.dumps(response_page))] * 2)
+        for cursor in [None, "cursor"]:
+            request_list.clear()
+            actual = instance.get_actor_likes_page(cursor, 50)
+            self.assertEqual(page, actual)
+            self.assertEqual(1, len(request_list))
+            request = request_list[0]
+            self.assertEqual(
+                "https://pds.dummy/xrpc/app.bsky.feed.getActorLikes", str(request.url.copy_with(query=None))
+            )
+            expect_params = {"actor": instance.handle, "limit": "50"}
+            if cursor:
+                expect_params["cursor"] = cursor
+            self.assertEqual(expect_params, dict(request.url.params))
+            self.assertEqual("Bearer access_jwt", request.headers["Authorization"])
+        mock_client.return_value.app.bsky.feed.get_actor_likes.assert_not_called()
+        mock_refresh_session.assert_not_called()
+
+        # アクセストークンが拒否された → セッションを更新して1回だけ再試行する
+        expired = b'{"error":"ExpiredToken","message":"Token has expired"}'
+        instance = pre_run([(400, expired), (200, orjson.dumps(page))])
+        actual = instance.get_actor_likes_page(None, 50)
+        self.assertEqual(page, actual)
+        self.assertEqual(2, len(request_list))
+        self.assertEqual("Bearer new_access_jwt", request_list[1].headers["Authorization"])
+        mock_refresh_session.assert_called_once_with()
+
+        # 再試行しても拒否された場合は送出する
+        instance = pre_run([(400, expired), (400, expired)])
+        with self.assertRaises(httpx.HTTPStatusError):
+            actual = instance.get_actor_likes_page(None, 50)
+        self.assertEqual(2, len(request_list))
+
+        # 5xx → 待機して再試行する
+        instance = pre_run([(500, b'{"error":"InternalServerError"}'), (200, orjson.dumps(page))])
+        actual = instance.get_actor_likes_page(None, 50)
+        self.assertEqual(page, actual)
+        self.assertEqual(2, len(request_list))
+        mock_sleep.assert_called_once()
+        mock_refresh_session.assert_not_called()
+
+        # それ以外のエラーは送出する
+        instance = pre_run([(400, b"not json")])
+        with self.assertRaises(httpx.HTTPStatusError):
+            actual = instance.get_actor_likes_page(None, 50)
+        self.assertEqual(1, len(request_list))
+        mock_refresh_session.assert_not_called()
+
+    def test_get_actor_likes_page_fake_server(self):
+        # ローカルの XRPC サーバに対して、実際の Client / httpx.Client で取得する
+        frozen_time = self.enterContext(freezegun.freeze_time(datetime.now(UTC).replace(microsecond=0)))
+        mock_sleep = self.enterContext(patch("bluesky_crawler.manager.manager.time.sleep"))
+        mock_sleep.side_effect = lambda seconds: frozen_time.tick(seconds)
+        fake_server = self.enterContext(FakeXrpcServer())
+        now = int(time.time())
+        session = self.make_session(now + 3600, now + 86400)
+        session = Session(session.handle, session.did, session.access_jwt, session.refresh_jwt, fake_server.url)
+        self.session_file.write_text(session.encode(), encoding="utf8")
+
+        page = {"feed": [], "cursor": "next_cursor"}
+        for fetch_mode in FETCH_MODE_LIST:
+            now = int(time.time())
+            rate_limited_headers = {
+                "ratelimit-limit": "3000",
+                "ratelimit-remaining": "0",
+                "ratelimit-reset": str(now + 30),
+                "ratelimit-policy": "3000;w=300",
+            }
+            success_headers = rate_limited_headers | {"ratelimit-remaining": "2990", "ratelimit-reset": str(now + 300)}
+            mock_sleep.reset_mock()
+            fake_server.request_list.clear()
+            fake_server.response_list = [
+                (429, rate_limited_headers, b'{"error":"RateLimitExceeded","message":"Rate Limit Exceeded"}'),
+                (503, {}, b'{"error":"ServiceUnavailable","message":"Service Unavailable"}'),
+                (200, success_headers, orjson.dumps(page)),
+            ]
+            config_dict = {
+                "bluesky": {"handle_name": "__dummy_name", "password": "dummy_password"},
+                "general": {"fetch_mode": fetch_mode, "rate_limit": {"jitter": 0}},
+            }
+            instance = BlueskyManager(config_dict)
+            actual = instance.get_actor_likes_page("cursor", 50)
+            self.assertEqual(page, actual)
+
+            # 429 は ratelimit-reset まで、5xx は指数的に延ばしながら待機して再試行する
+            self.assertEqual([30, 2], [sleep_call.args[0] for sleep_call in mock_sleep.call_args_list])
+            self.assertEqual(3, len(fake_server.request_list))
+            for path, headers in fake_server.request_list:
+                self.assertTrue(path.startswith("/xrpc/app.bsky.feed.getActorLikes?"))
+                self.assertIn("cursor=cursor", path)
+                self.assertEqual(f"Bearer {session.access_jwt}", headers["Authorization"])
+            budget = instance.get_rate_limit_budget()
+            self.assertEqual(RateLimitBudget(3000, 2990, now + 300), budget)
 
 
 if __name__ == "__main__":
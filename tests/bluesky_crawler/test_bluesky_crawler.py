@@ -10,9 +10,32 @@ class TestBlueskyCrawler(unittest.TestCase):
     def test_main(self):
         mock_logger = self.enterContext(patch("bluesky_crawler.main.logger.info"))
         mock_crawler = self.enterContext(patch("bluesky_crawler.main.Crawler"))
+        mock_argv = self.enterContext(patch.object(sys, "argv", ["main.py"]))
         actual = main()
         self.assertEqual([call(), call().run()], mock_crawler.mock_calls)
 
+        mock_crawler.reset_mock()
+        mock_argv = self.enterContext(patch.object(sys, "argv", ["main.py", "--backfill"]))
+        actual = main()
+        self.assertEqual([call(), call().backfill()], mock_crawler.mock_calls)
+
+        mock_crawler.reset_mock()
+        mock_argv = self.enterContext(patch.object(sys, "argv", ["main.py", "--verify"]))
+        actual = main()
+        self.assertEqual([call(), call().verify()], mock_crawler.mock_calls)
+
+        mock_crawler.reset_mock()
+        mock_argv = self.enterContext(patch.object(sys, "argv", ["main.py", "--migrate-layout"]))
+        actual = main()
+        self.assertEqual([call(), call().migrate_layout()], mock_crawler.mock_calls)
+
+        mock_crawler.reset_mock()
+        mock_scheduler = self.enterContext(patch("bluesky_crawler.main.Scheduler"))
+        mock_argv = self.enterContext(patch.object(sys, "argv", ["main.py", "--daemon"]))
+        actual = main()
+        self.assertEqual([call()], mock_crawler.mock_calls)
+        self.assertEqual([call(mock_crawler.return_value), call().run()], mock_scheduler.mock_calls)
+
 
 if __name__ == "__main__":
     if sys.argv:
@@ -1,3 +1,4 @@
+import hashlib
 import sys
 import unittest
 from datetime import datetime, timedelta
@@ -5,7 +6,7 @@ from datetime import datetime, timedelta
 from freezegun import freeze_time
 from mock import call, patch
 
-from bluesky_crawler.util import find_values, to_jst
+from bluesky_crawler.util import find_values, to_epoch, to_jst, to_raw_cid
 
 
 class TestUtil(unittest.TestCase):
@@ -46,6 +47,24 @@ class TestUtil(unittest.TestCase):
         with self.assertRaises(ValueError):
             to_jst("invalid_datetime")
 
+    def test_to_epoch(self):
+        # タイムゾーン指定なしは JST とみなす
+        self.assertEqual(0, to_epoch("1970-01-01T09:00:00"))
+        self.assertEqual(1711197296, to_epoch("2024-03-23T21:34:56.897000"))
+        self.assertEqual(1711197296, to_epoch("2024-03-23T12:34:56.897+00:00"))
+        self.assertIsNone(to_epoch("invalid_datetime"))
+        self.assertIsNone(to_epoch(None))
+
+    def test_to_raw_cid(self):
+        # 空のバイト列の CIDv1 (raw, sha2-256)
+        actual = to_raw_cid(hashlib.sha256(b"").digest())
+        self.assertEqual("bafkreihdwdcefgh4dqkjv67uzcmw7ojee6xedzdetojuzjevtenxquvyku", actual)
+
+        with self.assertRaises(ValueError):
+            to_raw_cid(b"invalid_digest")
+        with self.assertRaises(ValueError):
+            to_raw_cid("invalid_digest")
+
 
 if __name__ == "__main__":
     if sys.argv: